@@ -0,0 +1,158 @@
+"""
+Social Scraper Ingest Admission
+/api/posts/batch 的准入控制：按行数计的令牌桶（每个客户端一个 + 全局一个）和写入队列深度
+
+- 令牌桶以 行/秒 补充，请求需要 posts + filtered + discovery 行。超过桶容量的大批次
+  在桶满时放行并把桶扣成负数（欠账），之后的请求按欠账等待，大批次不会被永久拒绝
+- 已放行但尚未写完的行数超过 max_queue_rows 时拒绝，等待时间按最近的写入吞吐估算。
+  只对线程服务器（轻量版 / 最简版）有意义：请求在数据库锁上排队，排队的行数会累积。
+  FastAPI 服务的写入在事件循环上一次做完、中途不让出，已放行未写完的最多是当前一批，
+  这项检查和 ingest_rows 队列深度实际不起作用，那里只靠令牌桶限流
+- 拒绝时返回需要等待的秒数，服务端据此回复 429 + Retry-After
+
+客户端由 X-Client-Id 请求头区分（扩展自动生成并持久化），缺省时按来源地址
+"""
+
+import math
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import metrics
+
+CLIENT_HEADER = "X-Client-Id"
+
+# 既没有 X-Client-Id 也拿不到来源地址（如 ASGI 测试客户端、Unix 套接字）的请求共用一个桶
+UNKNOWN_CLIENT = "unknown"
+
+REJECTED = metrics.REGISTRY.counter(
+    "ingest_rejected_total", "Ingest batches rejected by admission control", ("reason",)
+)
+ADMITTED_ROWS = metrics.REGISTRY.counter("ingest_admitted_rows_total", "Rows admitted for ingest")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, rows: int, now: float) -> float:
+        """需要等待多久才能放行 rows 行（0 表示可以立即放行）"""
+        self._refill(now)
+        needed = min(rows, self.burst)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def take(self, rows: int):
+        self.tokens -= rows
+
+    def idle(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class AdmissionController:
+    """
+    准入判断很快，用一把小锁保证检查和扣减的原子性；
+    线程服务器应在获取数据库锁之前调用 admit，被拒绝的请求不用排队
+    """
+
+    def __init__(
+        self,
+        client_rate: float = 200.0,
+        client_burst: float = 2000.0,
+        global_rate: float = 1000.0,
+        global_burst: float = 5000.0,
+        max_queue_rows: int = 10000
+    ):
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.max_queue_rows = max_queue_rows
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.clients: Dict[str, TokenBucket] = {}
+        self.queued_rows = 0
+        self._throughput: Optional[float] = None
+        self._lock = threading.Lock()
+        metrics.QUEUE_DEPTH.set_function(lambda: {("ingest_rows",): self.queued_rows}, source="admission")
+
+    @classmethod
+    def from_env(cls) -> Optional["AdmissionController"]:
+        """INGEST_ADMISSION=off 时返回 None"""
+        if os.getenv("INGEST_ADMISSION", "on") == "off":
+            return None
+        return cls(
+            client_rate=float(os.getenv("INGEST_CLIENT_RATE", "200")),
+            client_burst=float(os.getenv("INGEST_CLIENT_BURST", "2000")),
+            global_rate=float(os.getenv("INGEST_GLOBAL_RATE", "1000")),
+            global_burst=float(os.getenv("INGEST_GLOBAL_BURST", "5000")),
+            max_queue_rows=int(os.getenv("INGEST_MAX_QUEUE_ROWS", "10000"))
+        )
+
+    def _client_bucket(self, client: str, now: float) -> TokenBucket:
+        bucket = self.clients.get(client)
+        if bucket is None:
+            if len(self.clients) >= 1000:
+                self.clients = {k: b for k, b in self.clients.items() if not b.idle(now)}
+            bucket = self.clients[client] = TokenBucket(self.client_rate, self.client_burst)
+        return bucket
+
+    def admit(self, client: str, rows: int) -> Tuple[bool, float, str]:
+        """
+        返回 (是否放行, 建议等待秒数, 拒绝原因 client / global / queue)
+
+        放行后必须在写入结束时调用 done(rows, seconds)
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.queued_rows and self.queued_rows + rows > self.max_queue_rows:
+                # 按最近吞吐估算排在前面的行写完所需时间
+                throughput = self._throughput or self.global_bucket.rate
+                REJECTED.inc(1, "queue")
+                return False, self.queued_rows / throughput, "queue"
+
+            bucket = self._client_bucket(client, now)
+            waits = (
+                (bucket.wait_time(rows, now), "client"),
+                (self.global_bucket.wait_time(rows, now), "global"),
+            )
+            wait, reason = max(waits)
+            if wait > 0:
+                REJECTED.inc(1, reason)
+                return False, wait, reason
+
+            bucket.take(rows)
+            self.global_bucket.take(rows)
+            self.queued_rows += rows
+        ADMITTED_ROWS.inc(rows)
+        return True, 0.0, ""
+
+    def done(self, rows: int, seconds: float):
+        """一个放行的批次写完（无论成败）"""
+        with self._lock:
+            self.queued_rows = max(0, self.queued_rows - rows)
+            if rows and seconds > 0:
+                rate = rows / seconds
+                self._throughput = rate if self._throughput is None else 0.8 * self._throughput + 0.2 * rate
+
+
+def batch_rows(data: Dict) -> int:
+    if not isinstance(data, dict):
+        return 0
+    return sum(len(data.get(key) or []) for key in ("posts", "filtered", "discovery"))
+
+
+def client_key(client_id: Optional[str], address: Optional[str]) -> str:
+    """准入计数的客户端：X-Client-Id，缺省时用来源地址"""
+    return (client_id or address or UNKNOWN_CLIENT)[:64]
+
+
+def retry_after(seconds: float) -> str:
+    """Retry-After 只能是整数秒，向上取整保证按时重试时已有足够令牌"""
+    return str(max(1, math.ceil(seconds)))
@@ -0,0 +1,130 @@
+"""
+Social Scraper Keyword Alerts
+服务端关键词警报：所有规则的关键词编译为一个 Aho-Corasick 自动机，单次扫描帖子内容
+"""
+
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, Iterable, List, Optional, Set
+
+
+class AhoCorasick:
+    """
+    多模式子串匹配自动机
+
+    匹配代价只与文本长度和命中数有关，与关键词数量无关
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[str]] = [[]]
+
+        for pattern in set(patterns):
+            if pattern:
+                self._insert(pattern)
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def _insert(self, pattern: str):
+        node = 0
+        for char in pattern:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(pattern)
+
+    def _build(self):
+        """BFS 计算失败指针，并把后缀节点的输出合并进来"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def search(self, text: str) -> Set[str]:
+        """返回文本中出现过的全部模式"""
+        found: Set[str] = set()
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+
+class AlertMatcher:
+    """
+    警报规则匹配器
+
+    规则变更时整体重建自动机；匹配语义与扩展 KeywordAlertManager.checkPost 一致
+    （标题 + 正文小写后做子串匹配，分类/平台限制只在帖子带有对应字段时生效）
+    """
+
+    def __init__(self):
+        self.rules: Dict[str, Dict[str, Any]] = {}
+        self._keyword_rules: Dict[str, List[str]] = {}
+        self._automaton = AhoCorasick([])
+
+    def rebuild(self, rules: List[Dict[str, Any]]):
+        self.rules = {rule["id"]: rule for rule in rules if rule.get("enabled", True)}
+        self._keyword_rules = {}
+        for rule in self.rules.values():
+            for keyword in rule.get("keywords") or []:
+                self._keyword_rules.setdefault(keyword.lower(), []).append(rule["id"])
+        self._automaton = AhoCorasick(self._keyword_rules)
+
+    def match(self, post: Dict[str, Any], category: Optional[str] = None) -> List[Dict[str, Any]]:
+        """扫描一条帖子，返回触发记录"""
+        if not self._keyword_rules:
+            return []
+        text = f"{post.get('title') or ''} {post.get('content') or ''}".lower()
+        found = self._automaton.search(text)
+        if not found:
+            return []
+
+        matched: Dict[str, List[str]] = {}
+        for keyword in found:
+            for rule_id in self._keyword_rules[keyword]:
+                matched.setdefault(rule_id, []).append(keyword)
+
+        platform = post.get("platform", "twitter")
+        triggers = []
+        for rule_id, keywords in matched.items():
+            rule = self.rules[rule_id]
+            if rule.get("categories") and category and category not in rule["categories"]:
+                continue
+            if rule.get("platforms") and platform not in rule["platforms"]:
+                continue
+            triggers.append({
+                "id": f"{rule_id}:{post['id']}",
+                "alertId": rule_id,
+                "postId": post["id"],
+                "matchedKeywords": sorted(keywords),
+                "priority": rule.get("priority", "medium"),
+                "platform": platform,
+                "matchedAt": datetime.now()
+            })
+        return triggers
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "rules": len(self.rules),
+            "keywords": len(self._keyword_rules),
+            "states": len(self._automaton)
+        }
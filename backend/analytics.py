@@ -0,0 +1,259 @@
+"""
+Social Scraper Engagement Analytics
+互动数据（score / replies）的分布统计：列式批量取数，NumPy 向量化计算
+"""
+
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from loguru import logger
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖
+    np = None
+
+
+METRICS = ("score", "replies")
+PERCENTILES = (50, 75, 90, 95, 99)
+GROUP_COLUMNS = {"platform": "p.platform", "author": "p.author"}
+ARROW_CHUNK_SIZE = 1_000_000
+
+
+def _log_edges(max_value: float) -> "np.ndarray":
+    """互动数长尾分布，用 0,1,2,5,10,20,50,... 的对数刻度分箱"""
+    edges = [0, 1, 2]
+    step = 5
+    while edges[-1] <= max_value:
+        edges.append(step)
+        step = step * 2 if str(step)[0] in "15" else step * 5 // 2
+    return np.array(edges, dtype=np.float64)
+
+
+def _fetch_columns(conn, query: str, params: Dict[str, Any], columns: List[str]) -> Dict[str, Any]:
+    """
+    按列取回查询结果
+
+    有 pyarrow 时走 Arrow 零拷贝转 NumPy；否则逐行读取（慢，仅作兜底）
+    """
+    result = conn.execute(query, params)
+    try:
+        table = result.get_as_arrow(ARROW_CHUNK_SIZE)
+    except (ImportError, ModuleNotFoundError):
+        table = None
+
+    if table is not None:
+        import pyarrow.compute as pc
+
+        data = {}
+        for i, name in enumerate(columns):
+            column = table.column(i)
+            if name in METRICS:
+                data[name] = pc.fill_null(column, 0).to_numpy().astype(np.int64, copy=False)
+            else:
+                # 字符串列字典编码后只需整数分组
+                encoded = pc.fill_null(column, "").combine_chunks().dictionary_encode()
+                data[name] = (encoded.indices.to_numpy(), encoded.dictionary.to_pylist())
+        return data
+
+    rows = []
+    while result.has_next():
+        rows.append(result.get_next())
+    data = {}
+    for i, name in enumerate(columns):
+        values = [row[i] for row in rows]
+        if name in METRICS:
+            data[name] = np.array([v or 0 for v in values], dtype=np.int64)
+        else:
+            labels, codes = np.unique(np.array([v or "" for v in values], dtype=object), return_inverse=True)
+            data[name] = (codes, list(labels))
+    return data
+
+
+def _summary(values: "np.ndarray") -> Dict[str, Any]:
+    if values.size == 0:
+        return {"count": 0}
+    pct = np.percentile(values, PERCENTILES)
+    edges = _log_edges(float(values.max()))
+    counts, _ = np.histogram(values, bins=edges)
+    below = int((values < 0).sum())
+    return {
+        "count": int(values.size),
+        "sum": int(values.sum()),
+        "mean": round(float(values.mean()), 3),
+        "std": round(float(values.std()), 3),
+        "min": int(values.min()),
+        "max": int(values.max()),
+        "percentiles": {f"p{q}": float(v) for q, v in zip(PERCENTILES, pct)},
+        "histogram": {
+            "edges": edges.astype(int).tolist(),
+            "counts": counts.tolist(),
+            "negative": below
+        }
+    }
+
+
+def _top_indices(values: "np.ndarray", k: int) -> "np.ndarray":
+    """
+    Top-K 下标（降序）
+
+    先用 partition 求第 k 大的阈值再筛候选，比整体 argpartition 快
+    """
+    k = min(k, values.size)
+    threshold = np.partition(values, values.size - k)[values.size - k]
+    candidates = np.flatnonzero(values >= threshold)
+    order = np.argsort(values[candidates], kind="stable")[::-1]
+    return candidates[order[:k]]
+
+
+def _sorted_by_group(codes: "np.ndarray", values: "np.ndarray") -> "np.ndarray":
+    """按 (分组, 值) 排序后的值；能打包成单个 int64 键时用一次 np.sort 代替 lexsort"""
+    low = int(values.min())
+    spread = int(values.max()) - low
+    if spread < 1 << 32 and len(codes) and int(codes.max()) < 1 << 31:
+        keys = (codes.astype(np.int64) << 32) | (values - low)
+        keys.sort()
+        return (keys & 0xFFFFFFFF) + low
+    return values[np.lexsort((values, codes))]
+
+
+def _top_posts(conn, where: str, params: Dict[str, Any], data: Dict[str, Any], k: int) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    各指标的 Top-K 帖子
+
+    批量取数不带 id（字符串列转换占大头）。各指标第 k 大的阈值由向量化
+    partition 求出，再按指标各发一条带阈值的 ORDER BY ... LIMIT k 查询取回帖子；
+    阈值处并列很多时（如大量 replies = 0）结果行数仍以 k 为上限
+    """
+    top: Dict[str, List[Dict[str, Any]]] = {metric: [] for metric in METRICS}
+    n = data["score"].size
+    if n == 0 or k <= 0:
+        return top
+    k = min(k, n)
+    for metric in METRICS:
+        threshold = int(np.partition(data[metric], n - k)[n - k])
+        query = f"""
+        MATCH (p:Post) WHERE {where} AND p.{metric} >= $min_value
+        RETURN p.id, p.{metric}
+        ORDER BY p.{metric} DESC
+        LIMIT {int(k)}
+        """
+        result = conn.execute(query, dict(params, min_value=threshold))
+        while result.has_next():
+            post_id, value = result.get_next()
+            top[metric].append({"id": post_id, "value": value})
+    return top
+
+
+def _group_stats(codes: "np.ndarray", labels: List[str], data: Dict[str, Any], k: int, sort_by: str) -> List[Dict[str, Any]]:
+    """
+    分组统计：计数/求和用 bincount，分组分位数用一次排序后按组边界插值
+    """
+    n_groups = len(labels)
+    counts = np.bincount(codes, minlength=n_groups)
+    nonempty = counts > 0
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    stats: Dict[str, Dict[str, Any]] = {}
+    for metric in METRICS:
+        values = data[metric]
+        sums = np.bincount(codes, weights=values, minlength=n_groups)
+        ordered = _sorted_by_group(codes, values)
+        span = np.maximum(counts - 1, 0)
+        pct = {}
+        for q in (50, 90, 99):
+            pos = starts + span * (q / 100)
+            lo = np.floor(pos).astype(np.int64)
+            hi = np.minimum(lo + 1, starts + span)
+            frac = pos - lo
+            lo, hi = np.minimum(lo, len(ordered) - 1), np.minimum(hi, len(ordered) - 1)
+            pct[f"p{q}"] = ordered[lo] * (1 - frac) + ordered[hi] * frac
+        stats[metric] = {
+            "sum": sums,
+            "mean": np.divide(sums, counts, out=np.zeros(n_groups), where=nonempty),
+            "max": ordered[np.minimum(starts + span, len(ordered) - 1)],
+            **pct
+        }
+
+    key = stats[sort_by]["sum"] if sort_by in METRICS else counts.astype(np.float64)
+    key = np.where(nonempty, key, -np.inf)
+    k = min(k, int(nonempty.sum()))
+    if k <= 0:
+        return []
+    top = _top_indices(key, k)
+
+    groups = []
+    for g in top:
+        item = {"key": labels[g], "posts": int(counts[g])}
+        for metric in METRICS:
+            s = stats[metric]
+            item[metric] = {
+                "sum": int(s["sum"][g]),
+                "mean": round(float(s["mean"][g]), 3),
+                "max": int(s["max"][g]),
+                "p50": float(s["p50"][g]),
+                "p90": float(s["p90"][g]),
+                "p99": float(s["p99"][g])
+            }
+        groups.append(item)
+    return groups
+
+
+def engagement_stats(
+    conn,
+    since: datetime,
+    until: datetime,
+    platform: Optional[str] = None,
+    author: Optional[str] = None,
+    group_by: Optional[str] = None,
+    top_k: int = 10,
+    sort_by: str = "score"
+) -> Dict[str, Any]:
+    """
+    时间窗口内的互动分布
+
+    一次查询取回所需列，之后的百分位、直方图和分组统计全部向量化完成
+    """
+    if np is None:
+        raise RuntimeError("Engagement analytics requires numpy: pip install numpy")
+    if group_by is not None and group_by not in GROUP_COLUMNS:
+        raise ValueError(f"Unsupported group_by: {group_by}")
+
+    conditions = ["p.timestamp >= $since", "p.timestamp < $until"]
+    params: Dict[str, Any] = {"since": since, "until": until}
+    if platform:
+        conditions.append("p.platform = $platform")
+        params["platform"] = platform
+    if author:
+        conditions.append("p.author = $author")
+        params["author"] = author
+
+    columns = ["score", "replies"]
+    returns = ["p.score", "p.replies"]
+    if group_by:
+        columns.append(group_by)
+        returns.append(GROUP_COLUMNS[group_by])
+    where = " AND ".join(conditions)
+    query = f"MATCH (p:Post) WHERE {where} RETURN {', '.join(returns)}"
+
+    started = datetime.now()
+    data = _fetch_columns(conn, query, params, columns)
+    total = int(data["score"].size)
+
+    result: Dict[str, Any] = {
+        "posts": total,
+        "metrics": {},
+        "topPosts": _top_posts(conn, where, params, data, top_k)
+    }
+    for metric in METRICS:
+        result["metrics"][metric] = _summary(data[metric])
+
+    if group_by and total:
+        group_codes, group_labels = data[group_by]
+        result["groupBy"] = group_by
+        result["groups"] = _group_stats(group_codes, group_labels, data, top_k, sort_by)
+
+    elapsed = (datetime.now() - started).total_seconds() * 1000
+    result["elapsedMs"] = round(elapsed, 1)
+    logger.debug(f"Engagement analytics over {result['posts']} posts in {elapsed:.0f}ms")
+    return result
@@ -0,0 +1,340 @@
+"""
+Social Scraper Author Graph
+作者互动图：入库时抽取 @提及、回复和引用对象，增量维护作者影响力（PageRank）
+"""
+
+import json
+import os
+import re
+from collections import Counter, deque
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from loguru import logger
+
+from entities import MENTION_RE, REDDIT_USER_RE
+
+
+_HANDLE = r"[A-Za-z0-9_]{1,30}"
+_RETWEET_RE = re.compile(rf"^\s*RT @({_HANDLE}):")
+_LEADING_RE = re.compile(rf"^\s*((?:@{_HANDLE}[\s,]+)+)")
+
+# 扩展未来可能在 metadata 中带上的结构化字段
+REPLY_KEYS = ("inReplyTo", "replyTo", "replyToAuthor")
+QUOTE_KEYS = ("quotedAuthor", "quoteAuthor", "retweetedFrom")
+
+# 引用/转发是比提及更强的背书
+KIND_WEIGHTS = {"mention": 1.0, "reply": 1.0, "quote": 2.0}
+KIND_PRIORITY = {"mention": 0, "reply": 1, "quote": 2}
+
+
+def author_id(platform: str, handle: str) -> str:
+    return f"{platform}:{handle.strip().lstrip('@').lower()}"
+
+
+def _metadata_handle(metadata: Any, keys: Tuple[str, ...]) -> Optional[str]:
+    if not isinstance(metadata, dict):
+        return None
+    for key in keys:
+        value = metadata.get(key)
+        if isinstance(value, dict):
+            value = value.get("author") or value.get("handle")
+        if isinstance(value, str) and value.strip().lstrip("@"):
+            return value
+    return None
+
+
+def extract_interactions(post: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """
+    返回 [(kind, handle)]，kind 为 mention / reply / quote
+
+    "RT @x:" 视为引用，正文开头连续的 @x 视为回复对象（Twitter 回复格式），
+    其余 @x 为提及；Reddit 的 u/x 视为提及。同一对象只保留最强的一种关系
+    """
+    content = post.get("content") or ""
+    metadata = post.get("metadata")
+    found: Dict[str, str] = {}
+
+    def add(kind: str, handle: str):
+        key = handle.strip().lstrip("@").lower()
+        if key and KIND_PRIORITY[kind] >= KIND_PRIORITY.get(found.get(key, "mention"), 0):
+            found[key] = kind
+
+    for match in MENTION_RE.finditer(content):
+        add("mention", match.group(1))
+    if post.get("platform") == "reddit":
+        for match in REDDIT_USER_RE.finditer(content):
+            add("mention", match.group(1))
+
+    retweet = _RETWEET_RE.match(content)
+    if retweet:
+        add("quote", retweet.group(1))
+    else:
+        leading = _LEADING_RE.match(content)
+        if leading:
+            for handle in MENTION_RE.findall(leading.group(1)):
+                add("reply", handle)
+
+    reply_to = _metadata_handle(metadata, REPLY_KEYS)
+    if reply_to:
+        add("reply", reply_to)
+    quoted = _metadata_handle(metadata, QUOTE_KEYS)
+    if quoted:
+        add("quote", quoted)
+
+    own = (post.get("author") or "").strip().lstrip("@").lower()
+    return [(kind, handle) for handle, kind in found.items() if handle != own]
+
+
+class InfluenceGraph:
+    """
+    带权有向图上的增量 PageRank
+
+    使用未归一化形式 x = (1-d) + d·Σ x_u·w_uv/W_u，新作者只需在自身注入
+    (1-d) 的残差。边权变化时按变化量把 d·x_u·Δ(w_uv/W_u) 记入邻居残差，
+    再从残差超过阈值的节点开始局部推送（forward push），只触及受影响的
+    区域，不必整图重算
+    """
+
+    def __init__(self, damping: float = 0.85, tolerance: float = 1e-4, path: Optional[Path] = None):
+        self.damping = damping
+        self.tolerance = tolerance
+        self.path = Path(path) if path else None
+        self._out: Dict[str, Dict[str, float]] = {}
+        self._total: Dict[str, float] = {}
+        self._rank: Dict[str, float] = {}
+        self._residual: Dict[str, float] = {}
+        self._queue: deque = deque()
+        self._queued: set = set()
+        self.pushes = 0
+
+    def __len__(self) -> int:
+        return len(self._rank)
+
+    def rank(self, node: str) -> float:
+        return self._rank.get(node, 0.0) + self._residual.get(node, 0.0)
+
+    def _bump(self, node: str, amount: float):
+        r = self._residual.get(node, 0.0) + amount
+        self._residual[node] = r
+        if abs(r) > self.tolerance and node not in self._queued:
+            self._queued.add(node)
+            self._queue.append(node)
+
+    def add_node(self, node: str):
+        if node not in self._rank:
+            self._rank[node] = 0.0
+            self._bump(node, 1 - self.damping)
+
+    def add_edges(self, src: str, weights: Dict[str, float]):
+        """给 src 的出边累加权重，并把出边分布的变化折算进邻居残差"""
+        self.add_node(src)
+        for dst in weights:
+            self.add_node(dst)
+        out = self._out.setdefault(src, {})
+        old_total = self._total.get(src, 0.0)
+        old_share = {dst: w / old_total for dst, w in out.items()} if old_total else {}
+        for dst, w in weights.items():
+            out[dst] = out.get(dst, 0.0) + w
+        total = old_total + sum(weights.values())
+        self._total[src] = total
+
+        mass = self.damping * self._rank[src]
+        if mass:
+            for dst, w in out.items():
+                delta = w / total - old_share.get(dst, 0.0)
+                if delta:
+                    self._bump(dst, mass * delta)
+
+    def propagate(self) -> set:
+        """推送残差直到全部低于阈值，返回得分有变化的节点"""
+        changed = set()
+        d, out_edges, totals = self.damping, self._out, self._total
+        while self._queue:
+            node = self._queue.popleft()
+            self._queued.discard(node)
+            r = self._residual.get(node, 0.0)
+            if abs(r) <= self.tolerance:
+                continue
+            self._residual[node] = 0.0
+            self._rank[node] += r
+            changed.add(node)
+            self.pushes += 1
+            out = out_edges.get(node)
+            if out:
+                scale = d * r / totals[node]
+                for dst, w in out.items():
+                    self._bump(dst, scale * w)
+        return changed
+
+    def top(self, k: int = 10) -> List[Tuple[str, float]]:
+        return sorted(((n, self.rank(n)) for n in self._rank), key=lambda item: item[1], reverse=True)[:k]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "authors": len(self._rank),
+            "edges": sum(len(out) for out in self._out.values()),
+            "pending": len(self._queue),
+            "pushes": self.pushes
+        }
+
+    # ========== 持久化 ==========
+
+    def save(self):
+        if not self.path:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "damping": self.damping,
+                "out": self._out,
+                "rank": self._rank,
+                "residual": {n: r for n, r in self._residual.items() if r}
+            }, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def load(self) -> int:
+        if not self.path or not self.path.exists():
+            return 0
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("damping") != self.damping:
+                logger.info("Author graph damping changed, ranks will be rebuilt")
+                return 0
+            self._out = data["out"]
+            self._total = {src: sum(out.values()) for src, out in self._out.items()}
+            self._rank = data["rank"]
+            for node, r in data["residual"].items():
+                self._bump(node, r)
+            logger.info(f"Loaded author graph with {len(self._rank)} authors from {self.path}")
+        except Exception as e:
+            logger.warning(f"Failed to load author graph: {e}")
+            self._out, self._total, self._rank, self._residual = {}, {}, {}, {}
+        return len(self._rank)
+
+
+class AuthorGraph:
+    """
+    入库时的作者互动累积器
+
+    observe 只在内存中累计本批次的作者与互动计数；drain 把增量并入
+    影响力图、做一次局部推送，返回需要写库的作者、MENTIONS 边和新得分
+    """
+
+    def __init__(self, damping: float = 0.85, tolerance: float = 1e-4, path: Optional[Path] = None):
+        self.graph = InfluenceGraph(damping=damping, tolerance=tolerance, path=path)
+        self._authors: Dict[str, Dict[str, Any]] = {}
+        self._edges: Counter = Counter()
+
+    def _author(self, platform: str, handle: str) -> Dict[str, Any]:
+        aid = author_id(platform, handle)
+        row = self._authors.get(aid)
+        if row is None:
+            row = self._authors[aid] = {
+                "id": aid,
+                "handle": handle.strip().lstrip("@").lower(),
+                "platform": platform,
+                "displayName": "",
+                "posts": 0,
+                "mentioned": 0
+            }
+        return row
+
+    def observe(self, post: Dict[str, Any]):
+        handle = (post.get("author") or "").strip()
+        if not handle.lstrip("@"):
+            return
+        platform = post.get("platform", "twitter")
+        row = self._author(platform, handle)
+        row["posts"] += 1
+        row["displayName"] = post.get("authorDisplayName") or row["displayName"]
+        for kind, target in extract_interactions(post):
+            self._author(platform, target)["mentioned"] += 1
+            self._edges[(row["id"], author_id(platform, target), kind)] += 1
+
+    def drain(self) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+        """返回 (authors, mentions, influence)，并清空批次累积"""
+        authors, self._authors = list(self._authors.values()), {}
+        edges, self._edges = self._edges, Counter()
+
+        for row in authors:
+            self.graph.add_node(row["id"])
+        by_source: Dict[str, Dict[str, float]] = {}
+        for (src, dst, kind), count in edges.items():
+            weights = by_source.setdefault(src, {})
+            weights[dst] = weights.get(dst, 0.0) + KIND_WEIGHTS[kind] * count
+        for src, weights in by_source.items():
+            self.graph.add_edges(src, weights)
+
+        changed = self.graph.propagate()
+        mentions = [
+            {"src": src, "dst": dst, "kind": kind, "count": count}
+            for (src, dst, kind), count in edges.items()
+        ]
+        influence = [{"id": node, "influence": self.graph.rank(node)} for node in changed]
+        return authors, mentions, influence
+
+    def rebuild(self, nodes: List[str], edges: List[Tuple[str, str, str, int]]):
+        """状态文件缺失时从库中的 MENTIONS 边重建影响力"""
+        for node in nodes:
+            self.graph.add_node(node)
+        by_source: Dict[str, Dict[str, float]] = {}
+        for src, dst, kind, count in edges:
+            weights = by_source.setdefault(src, {})
+            weights[dst] = weights.get(dst, 0.0) + KIND_WEIGHTS.get(kind, 1.0) * count
+        for src, weights in by_source.items():
+            self.graph.add_edges(src, weights)
+        return self.graph.propagate()
+
+    def stats(self) -> Dict[str, Any]:
+        return self.graph.stats()
+
+    def save(self):
+        self.graph.save()
+
+    def load(self) -> int:
+        return self.graph.load()
+
+
+UPSERT_AUTHORS = """
+UNWIND $rows AS r
+MERGE (a:Author {id: r.id})
+ON CREATE SET a.handle = r.handle, a.platform = r.platform, a.displayName = r.displayName,
+              a.postCount = r.posts, a.mentionedCount = r.mentioned, a.influence = 0.0,
+              a.firstSeen = $now, a.lastSeen = $now
+ON MATCH SET a.postCount = a.postCount + r.posts,
+             a.mentionedCount = a.mentionedCount + r.mentioned,
+             a.displayName = CASE WHEN r.displayName = '' THEN a.displayName ELSE r.displayName END,
+             a.lastSeen = $now
+"""
+
+# MENTIONS 边逐条写：先累加已有边，不存在时再创建。UNWIND 之后按主键 MATCH 两端会对每行
+# 扫描 Author 表（见 entities.py），单行 MERGE 关系也比这两步慢
+BUMP_MENTIONS = """
+MATCH (a:Author {id: $src})-[m:MENTIONS]->(b:Author {id: $dst})
+WHERE m.kind = $kind
+SET m.count = m.count + $count, m.lastAt = $now
+RETURN count(m)
+"""
+
+CREATE_MENTIONS = """
+MATCH (a:Author {id: $src}), (b:Author {id: $dst})
+CREATE (a)-[:MENTIONS {kind: $kind, count: $count, firstAt: $now, lastAt: $now}]->(b)
+"""
+
+# Kuzu 0.6 之前用：逐条复用预编译语句更新已有的边会报 Write-write conflict
+MERGE_MENTIONS = """
+UNWIND $rows AS r
+MATCH (a:Author {id: r.src}), (b:Author {id: r.dst})
+MERGE (a)-[m:MENTIONS {kind: r.kind}]->(b)
+ON CREATE SET m.count = r.count, m.firstAt = $now, m.lastAt = $now
+ON MATCH SET m.count = m.count + r.count, m.lastAt = $now
+"""
+
+UPDATE_INFLUENCE = """
+UNWIND $rows AS r
+MATCH (a:Author {id: r.id})
+SET a.influence = r.influence
+"""
@@ -0,0 +1,816 @@
+"""
+Social Scraper Backfill
+把扩展导出的历史 JSON 批量导入 Kuzu（离线执行，后端须先停止）
+
+1. 暂存：进程池并行解析输入文件，校验并规范化为入库形式（与 add_post 等方法一致），
+   每 --chunk-rows 行写一组暂存文件（有 pyarrow 时为 Parquet，否则为 CSV）
+2. 导入：按输入顺序把暂存文件合并成不超过 --chunk-rows 条帖子的块，与库中已有主键去重后
+   经 COPY 写入 Post / FilteredPost / DiscoveryResult 及其关系；暂存和导入同时进行
+3. 收尾：补建实体索引、重建情感分桶（--no-index 跳过）
+
+每块导入后更新检查点文件，中断后重新执行同一命令从下一块继续；块内各表分别按已有主键去重，
+重复导入同一块不会写出重复行。COPY 的使用限制见 bulk.py：迁移在单独的会话里执行，
+导入会话中只有查询、COPY 和删除，情感分桶的 MERGE 放在最后。
+近重复链接、事件聚类、作者图和关键词警报不在导入时计算。
+
+支持的输入（均可为 .gz）：
+- .json：BatchPostRequest（posts / filtered / discovery）、扩展存储导出
+  （posts / filteredPosts，可带外层 social_scraper_v2_data）或帖子数组
+- .jsonl / .ndjson：每行一个上述对象或单个帖子
+
+用法:
+    python backfill.py run ./exports --db-path ./database/twitter_scraper --workers 4
+    python backfill.py status --db-path ./database/twitter_scraper
+"""
+
+import gzip
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+from database import parse_timestamp
+from corpus import POST_COLUMNS, FILTERED_COLUMNS, DISCOVERY_COLUMNS
+import bulk
+
+STORAGE_KEY = "social_scraper_v2_data"
+INPUT_SUFFIXES = (".json", ".jsonl", ".ndjson")
+CHECKPOINT_VERSION = 1
+
+# 暂存文件中的表 -> (节点表, 列顺序)
+TABLES = {
+    "posts": ("Post", POST_COLUMNS),
+    "filtered": ("FilteredPost", FILTERED_COLUMNS),
+    "discovery": ("DiscoveryResult", DISCOVERY_COLUMNS),
+}
+# 指向 Post 的关系
+RELATIONS = {"filtered": "FILTERED_FROM", "discovery": "ANALYZED"}
+
+# Parquet 暂存文件的列类型（其余为字符串）
+TIMESTAMP_COLUMNS = {"timestamp", "scrapedAt", "filteredAt", "analyzedAt"}
+INT_COLUMNS = {"score", "replies"}
+FLOAT_COLUMNS = {"relevanceScore"}
+BOOL_COLUMNS = {"raw"}
+
+
+# ========== 规范化 ==========
+
+def _required(raw: Dict[str, Any], key: str) -> str:
+    value = raw.get(key)
+    if value is None or str(value).strip() == "":
+        raise ValueError(f"missing {key}")
+    return str(value).strip()
+
+
+def _text(value: Any) -> str:
+    return "" if value is None else str(value)
+
+
+def normalize_post(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """扩展的 Post（或 BatchPostRequest 中的帖子）-> Post 行，不合法时抛出 ValueError"""
+    if not isinstance(raw.get("content", ""), str):
+        raise ValueError("content must be a string")
+    timestamp = parse_timestamp(raw.get("timestamp"))
+    score = raw.get("score")
+    if score is None:
+        score = raw.get("upvotes")
+    metadata = raw.get("metadata")
+    return {
+        "id": _required(raw, "id"),
+        "platform": raw.get("platform") or "twitter",
+        "author": _text(raw.get("author")),
+        "authorDisplayName": _text(raw.get("authorDisplayName")),
+        "content": _text(raw.get("content")),
+        "title": _text(raw.get("title")),
+        "url": _text(raw.get("url")),
+        "timestamp": timestamp,
+        "score": int(score or 0),
+        "replies": int(raw.get("replies") or 0),
+        "raw": bool(raw.get("raw", False)),
+        "scrapedAt": parse_timestamp(raw.get("scrapedAt")) or timestamp,
+        "metadata": str(metadata if isinstance(metadata, dict) else {})
+    }
+
+
+def normalize_filtered(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """FilteredPost 行；扩展存储中的筛选结果就是帖子本身（没有 postId），id 取 fp_<帖子 id>"""
+    if raw.get("postId"):
+        row_id, post_id = _required(raw, "id"), _required(raw, "postId")
+    else:
+        post_id = _required(raw, "id")
+        row_id = f"fp_{post_id}"
+    keywords = raw.get("keywords")
+    return {
+        "id": row_id,
+        "postId": post_id,
+        "relevanceScore": float(raw.get("relevanceScore") or 0),
+        "category": raw.get("category") or "other",
+        "subCategory": _text(raw.get("subCategory")),
+        "reason": _text(raw.get("reason")),
+        "summary": _text(raw.get("summary")),
+        "keywords": str(keywords if isinstance(keywords, list) else []),
+        "filteredAt": parse_timestamp(raw.get("filteredAt") or raw.get("scrapedAt"))
+    }
+
+
+def normalize_discovery(raw: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": _required(raw, "id"),
+        "postId": _required(raw, "postId"),
+        "sentiment": str(raw.get("sentiment") or {}),
+        "kolProfile": str(raw.get("kolProfile") or {}),
+        "trendData": str(raw.get("trendData") or {}),
+        "alertTrigger": str(raw.get("alertTrigger") or []),
+        "analyzedAt": parse_timestamp(raw.get("analyzedAt"))
+    }
+
+
+def _records(document: Any) -> Iterator[Tuple[str, Any]]:
+    """一个 JSON 值 -> (表, 原始行)"""
+    if isinstance(document, list):
+        for item in document:
+            yield from _records(item)
+        return
+    if not isinstance(document, dict):
+        yield "invalid", "not a JSON object"
+        return
+    if isinstance(document.get(STORAGE_KEY), dict):
+        document = document[STORAGE_KEY]
+    if any(key in document for key in ("posts", "filtered", "filteredPosts", "discovery")):
+        for item in document.get("posts") or []:
+            yield "posts", item
+        for item in (document.get("filtered") or []) + (document.get("filteredPosts") or []):
+            # 扩展存储中的 FilteredPost 包含完整帖子
+            if isinstance(item, dict) and not item.get("postId"):
+                yield "posts", item
+            yield "filtered", item
+        for item in document.get("discovery") or []:
+            yield "discovery", item
+    elif "postId" in document and "relevanceScore" in document:
+        yield "filtered", document
+    elif "postId" in document:
+        yield "discovery", document
+    else:
+        yield "posts", document
+
+
+def read_records(path: str) -> Iterator[Tuple[str, Any]]:
+    """按文件类型读取输入；JSON 行格式逐行解析，无法解析的行或文件记为 invalid"""
+    opener = gzip.open if path.endswith(".gz") else open
+    name = path[:-3] if path.endswith(".gz") else path
+    with opener(path, "rt", encoding="utf-8") as f:
+        if name.endswith(".json"):
+            try:
+                document = json.load(f)
+            except ValueError as e:
+                yield "invalid", f"unreadable JSON document ({e})"
+                return
+            yield from _records(document)
+            return
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                document = json.loads(line)
+            except ValueError:
+                yield "invalid", "malformed JSON line"
+                continue
+            yield from _records(document)
+
+
+NORMALIZERS = {"posts": normalize_post, "filtered": normalize_filtered, "discovery": normalize_discovery}
+
+
+# ========== 暂存文件 ==========
+
+def default_stage_format() -> str:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return "csv"
+    return "parquet"
+
+
+def _part_path(parts_dir: Path, part: str, table: str, fmt: str) -> Path:
+    return parts_dir / f"{part}.{table}.{fmt}"
+
+
+def write_stage(path: Path, rows: List[Dict[str, Any]], columns, fmt: str) -> int:
+    if fmt == "csv":
+        return bulk.write_csv(str(path), rows, columns)
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet staging requires pyarrow: pip install pyarrow (or use --stage-format csv)")
+
+    def arrow_type(column):
+        if column in TIMESTAMP_COLUMNS:
+            return pa.timestamp("us")
+        if column in INT_COLUMNS:
+            return pa.int64()
+        if column in FLOAT_COLUMNS:
+            return pa.float64()
+        if column in BOOL_COLUMNS:
+            return pa.bool_()
+        return pa.string()
+
+    schema = pa.schema([(column, arrow_type(column)) for column in columns])
+    pq.write_table(pa.Table.from_pylist(rows, schema=schema), str(path), compression="zstd")
+    return len(rows)
+
+
+def _parse_cell(column: str, value: str) -> Any:
+    if value == "":
+        return None
+    if column in TIMESTAMP_COLUMNS:
+        return parse_timestamp(value)
+    if column in INT_COLUMNS:
+        return int(value)
+    if column in FLOAT_COLUMNS:
+        return float(value)
+    if column in BOOL_COLUMNS:
+        return value == "true"
+    return value
+
+
+def read_stage(path: Path, columns, fmt: str) -> List[Dict[str, Any]]:
+    """暂存文件 -> 行（CSV 按列恢复类型，与 Parquet 读出的一致）"""
+    if not path.exists():
+        return []
+    if fmt == "csv":
+        import csv
+        with open(path, newline="", encoding="utf-8") as f:
+            return [
+                {column: _parse_cell(column, value) for column, value in zip(columns, row)}
+                for row in csv.reader(f)
+            ]
+    import pyarrow.parquet as pq
+    return pq.read_table(str(path)).to_pylist()
+
+
+def stage_file(index: int, path: str, parts_dir: str, chunk_rows: int, fmt: str) -> Dict[str, Any]:
+    """
+    暂存一个输入文件（在工作进程中执行）
+
+    每满 chunk_rows 行写一组暂存文件，部分内按主键去重；返回暂存结果和统计
+    """
+    parts_dir = Path(parts_dir)
+    parts: List[Dict[str, Any]] = []
+    buffers: Dict[str, Dict[str, Dict[str, Any]]] = {table: {} for table in TABLES}
+    invalid = duplicates = 0
+    errors: List[str] = []
+    started = time.perf_counter()
+
+    def flush():
+        if not any(buffers.values()):
+            return
+        part = f"{index:06d}-{len(parts):04d}"
+        counts = {}
+        for table, rows in buffers.items():
+            _, columns = TABLES[table]
+            counts[table] = len(rows)
+            if rows:
+                write_stage(_part_path(parts_dir, part, table, fmt), list(rows.values()), columns, fmt)
+            buffers[table] = {}
+        parts.append({"name": part, **counts})
+
+    for table, raw in read_records(path):
+        try:
+            if table == "invalid":
+                raise ValueError(raw)
+            if not isinstance(raw, dict):
+                raise ValueError("not a JSON object")
+            row = NORMALIZERS[table](raw)
+        except (TypeError, ValueError) as e:
+            invalid += 1
+            if len(errors) < 5:
+                errors.append(f"{table}: {e}")
+            continue
+        if row["id"] in buffers[table]:
+            duplicates += 1
+            continue
+        buffers[table][row["id"]] = row
+        if len(buffers[table]) >= chunk_rows:
+            flush()
+    flush()
+
+    return {
+        "index": index,
+        "path": path,
+        "parts": parts,
+        "invalid": invalid,
+        "duplicates": duplicates,
+        "errors": errors,
+        "bytes": os.path.getsize(path),
+        "seconds": time.perf_counter() - started
+    }
+
+
+# ========== 检查点 ==========
+
+class Checkpoint:
+    """
+    导入进度（JSON 文件，每次原子替换）
+
+    inputs 记录每个输入文件的序号、大小和暂存结果，loaded 为已导入的暂存部分；
+    entities_pending 表示有 COPY 导入的帖子还没有建实体索引
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.data: Dict[str, Any] = {
+            "version": CHECKPOINT_VERSION,
+            "inputs": {},
+            "loaded": [],
+            "counts": {"posts": 0, "filtered": 0, "discovery": 0, "duplicates": 0, "orphans": 0, "invalid": 0},
+            "indexed": False,
+            "entities_pending": False
+        }
+        if path.exists():
+            self.data = json.loads(path.read_text(encoding="utf-8"))
+        self._loaded = set(self.data["loaded"])
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.data, ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def register(self, paths: List[str]) -> List[Tuple[int, str]]:
+        """给输入文件分配序号（已登记的保持原序号，新文件排在后面），返回 (序号, 路径)"""
+        inputs = self.data["inputs"]
+        next_index = max((entry["index"] for entry in inputs.values()), default=0) + 1
+        ordered = []
+        for path in paths:
+            stat = os.stat(path)
+            entry = inputs.get(path)
+            if entry is not None and (entry["size"], entry["mtime"]) != (stat.st_size, stat.st_mtime):
+                if any(part["name"] in self._loaded for part in entry.get("parts") or []):
+                    raise RuntimeError(f"{path} changed after it was partly imported, move it aside or use a new --stage-dir")
+                entry.update(size=stat.st_size, mtime=stat.st_mtime, parts=None)
+            if entry is None:
+                entry = inputs[path] = {"index": next_index, "size": stat.st_size, "mtime": stat.st_mtime, "parts": None}
+                next_index += 1
+            ordered.append((entry["index"], path))
+        return sorted(ordered)
+
+    def staged(self, path: str) -> Optional[List[Dict[str, Any]]]:
+        return self.data["inputs"][path]["parts"]
+
+    def record_stage(self, result: Dict[str, Any]):
+        self.data["inputs"][result["path"]]["parts"] = result["parts"]
+        self.data["counts"]["invalid"] += result["invalid"]
+        # 暂存时部分内合并掉的重复行
+        self.data["counts"]["duplicates"] += result["duplicates"]
+        self.save()
+
+    def is_loaded(self, part: str) -> bool:
+        return part in self._loaded
+
+    def record_chunk(self, parts: List[str], counts: Dict[str, int], entities_pending: bool):
+        self.data["loaded"].extend(parts)
+        self._loaded.update(parts)
+        for key, value in counts.items():
+            self.data["counts"][key] += value
+        self.data["indexed"] = False
+        self.data["entities_pending"] = entities_pending
+        self.save()
+
+
+# ========== 导入 ==========
+
+def pending_wal(db_path: str) -> int:
+    """数据库 WAL 中尚未写入检查点的字节数"""
+    wal = Path(db_path) / ".wal"
+    return wal.stat().st_size if wal.exists() else 0
+
+
+def existing_ids(conn, label: str, ids: List[str], chunk: int = 50000) -> set:
+    """库中已有的主键（UNWIND 后按等值连接，走哈希连接而不是逐行扫描）"""
+    found = set()
+    for i in range(0, len(ids), chunk):
+        result = conn.execute(
+            f"UNWIND $ids AS i MATCH (n:{label}) WHERE n.id = i RETURN n.id",
+            {"ids": ids[i:i + chunk]}
+        )
+        while result.has_next():
+            found.add(result.get_next()[0])
+    return found
+
+
+def linked_ids(conn, label: str, relation: str, ids: List[str]) -> set:
+    """已经有指向 Post 的关系的节点"""
+    found = set()
+    for i in range(0, len(ids), 50000):
+        result = conn.execute(
+            f"UNWIND $ids AS i MATCH (n:{label})-[:{relation}]->(:Post) WHERE n.id = i RETURN n.id",
+            {"ids": ids[i:i + 50000]}
+        )
+        while result.has_next():
+            found.add(result.get_next()[0])
+    return found
+
+
+class Loader:
+    """
+    导入会话
+
+    COPY 会立即触发检查点，检查点向非空节点表追加的行太少时会写坏数据（见 bulk.py），因此：
+    - 开始时 WAL 为空：节点表每次 COPY 至少 bulk.MIN_APPEND_ROWS 行，不够时并入下一块；
+      最后剩下的少量行先补建实体索引再 CREATE，之后不再 COPY
+    - WAL 中有上次会话留下的写入：全部走 UNWIND CREATE，实体索引逐块增量写入（与入库路径一致）
+    """
+
+    def __init__(self, db_path: str, stage_dir: Path, fmt: str, copy: bool, index: bool = True):
+        import kuzu
+
+        self.parts_dir = stage_dir / "parts"
+        self.load_dir = stage_dir / "load"
+        self.format = fmt
+        self.index = index
+        self.copy = copy
+        self.load_dir.mkdir(parents=True, exist_ok=True)
+        self.db = kuzu.Database(str(db_path))
+        self.conn = kuzu.Connection(self.db)
+        # 已经用 entities.backfill 整体重建过实体索引
+        self.entities_rebuilt = False
+
+    def close(self):
+        self.conn.close()
+        self.db.close()
+
+    def _is_empty(self, label: str) -> bool:
+        return not self.conn.execute(f"MATCH (n:{label}) RETURN n.id LIMIT 1").has_next()
+
+    def _copy(self, table: str, rows: List[Dict[str, Any]], columns) -> int:
+        if not rows:
+            return 0
+        path = self.load_dir / f"{table.lower()}.{self.format}"
+        write_stage(path, rows, columns, self.format)
+        try:
+            bulk.copy_file(self.conn, table, str(path))
+        finally:
+            path.unlink()
+        return len(rows)
+
+    def _create(self, table: str, rows: List[Dict[str, Any]], chunk: int = 10000) -> int:
+        """UNWIND CREATE；筛选和发现性结果连同指向 Post 的边一起建（比先建节点再连边快）"""
+        label, columns = TABLES[table]
+        # 整列为空时参数推断不出类型，不写这些列（默认为 NULL）
+        columns = [column for column in columns if any(row[column] is not None for row in rows)]
+        properties = ", ".join(f"{column}: row.{column}" for column in columns)
+        if table in RELATIONS:
+            query = (
+                f"UNWIND $rows AS row MATCH (p:Post) WHERE p.id = row.postId "
+                f"CREATE (n:{label} {{{properties}}})-[:{RELATIONS[table]}]->(p)"
+            )
+        else:
+            query = f"UNWIND $rows AS row CREATE (n:{label} {{{properties}}})"
+        for i in range(0, len(rows), chunk):
+            self.conn.execute(query, {"rows": [{column: row[column] for column in columns} for row in rows[i:i + chunk]]})
+        return len(rows)
+
+    def _link(self, table: str, rows: Dict[str, Dict[str, Any]], copy: bool):
+        """补上缺少的指向 Post 的关系（COPY 导入的节点，或上次中断在节点和关系之间时）"""
+        label, _ = TABLES[table]
+        relation = RELATIONS[table]
+        linked = linked_ids(self.conn, label, relation, list(rows))
+        edges = [{"from": key, "to": row["postId"]} for key, row in rows.items() if key not in linked]
+        if copy:
+            self._copy(relation, edges, ("from", "to"))
+            return
+        # 两个端点分开按等值连接匹配，比在同一个 MATCH 中匹配两端快得多
+        query = (
+            f"UNWIND $rows AS row MATCH (p:Post) WHERE p.id = row.target WITH p, row "
+            f"MATCH (n:{label}) WHERE n.id = row.source CREATE (n)-[:{relation}]->(p)"
+        )
+        edges = [{"source": edge["from"], "target": edge["to"]} for edge in edges]
+        for i in range(0, len(edges), 10000):
+            self.conn.execute(query, {"rows": edges[i:i + 10000]})
+
+    def _index_posts(self, posts: List[Dict[str, Any]]):
+        import entities
+
+        if self.index and posts:
+            entities.store(self.conn, entities.extract_batch(posts))
+
+    def load_chunk(self, parts: List[str], final: bool = False) -> Optional[Dict[str, int]]:
+        """
+        导入一块（若干暂存部分），返回新写入 / 跳过的行数
+
+        COPY 模式下有表新增行太少、又不是最后一块时不写入，返回 None（由调用方并入下一块）
+        """
+        rows: Dict[str, Dict[str, Dict[str, Any]]] = {table: {} for table in TABLES}
+        # 块内 ID 重复的行只保留第一条，其余同样计为重复
+        collapsed = 0
+        for part in parts:
+            for table, (_, columns) in TABLES.items():
+                for row in read_stage(_part_path(self.parts_dir, part, table, self.format), columns, self.format):
+                    if row["id"] in rows[table]:
+                        collapsed += 1
+                    else:
+                        rows[table][row["id"]] = row
+
+        counts = {"posts": 0, "filtered": 0, "discovery": 0, "duplicates": collapsed, "orphans": 0}
+        fresh: Dict[str, List[Dict[str, Any]]] = {}
+        for table, (label, _) in TABLES.items():
+            present = existing_ids(self.conn, label, list(rows[table]))
+            counts["duplicates"] += len(present)
+            fresh[table] = [row for key, row in rows[table].items() if key not in present]
+
+        # 目标帖子既不在库中也不在本块中的行不导入
+        posts = {row["id"] for row in fresh["posts"]}
+        for table in RELATIONS:
+            targets = list({row["postId"] for row in rows[table].values()} - posts)
+            posts |= existing_ids(self.conn, "Post", targets)
+            orphans = {key for key, row in rows[table].items() if row["postId"] not in posts}
+            counts["orphans"] += sum(1 for row in fresh[table] if row["id"] in orphans)
+            fresh[table] = [row for row in fresh[table] if row["id"] not in orphans]
+            rows[table] = {key: row for key, row in rows[table].items() if key not in orphans}
+
+        if not self.copy:
+            for table in TABLES:
+                counts[table] = self._create(table, fresh[table])
+            for table in RELATIONS:
+                self._link(table, rows[table], copy=False)
+            self._index_posts(fresh["posts"])
+            return counts
+
+        small = [
+            table for table, (label, _) in TABLES.items()
+            if 0 < len(fresh[table]) < bulk.MIN_APPEND_ROWS and not self._is_empty(label)
+        ]
+        if small and not final:
+            return None
+
+        for table, (label, columns) in TABLES.items():
+            if table not in small:
+                counts[table] = self._copy(label, fresh[table], columns)
+        for table in RELATIONS:
+            if table not in small:
+                self._link(table, rows[table], copy=True)
+        if not small:
+            return counts
+
+        # 最后剩下的少量行：先用 COPY 重建实体索引，之后只 CREATE
+        if self.index:
+            import entities
+            entities.backfill(self.conn)
+            self.entities_rebuilt = True
+        self.copy = False
+        for table in small:
+            counts[table] = self._create(table, fresh[table])
+        for table in RELATIONS:
+            if table in small:
+                self._link(table, rows[table], copy=False)
+        if "posts" in small:
+            self._index_posts(fresh["posts"])
+        return counts
+
+
+def find_inputs(paths: List[str]) -> List[str]:
+    """展开目录，按路径排序"""
+    found = []
+    for path in paths:
+        p = Path(path)
+        if p.is_dir():
+            found.extend(
+                str(f.resolve()) for f in p.rglob("*")
+                if f.is_file() and re.sub(r"\.gz$", "", f.name).endswith(INPUT_SUFFIXES)
+            )
+        elif p.is_file():
+            found.append(str(p.resolve()))
+        else:
+            raise FileNotFoundError(path)
+    return sorted(set(found))
+
+
+def default_stage_dir(db_path: str) -> Path:
+    return Path(f"{str(db_path).rstrip('/')}.backfill")
+
+
+def prepare_database(db_path: str):
+    """在单独的会话中建库 / 执行迁移（迁移中的 CREATE/MERGE 不能和 COPY 在同一会话）"""
+    import kuzu
+    import migrations
+
+    db = kuzu.Database(str(db_path))
+    conn = kuzu.Connection(db)
+    try:
+        applied = migrations.upgrade(conn)
+        if applied:
+            logger.info(f"Applied {len(applied)} migration(s) before backfill")
+    finally:
+        conn.close()
+        db.close()
+
+
+def build_indexes(loader: Loader, checkpoint: Checkpoint):
+    """补建实体索引并重建情感分桶（能 COPY 时全部用 COPY，结束后 WAL 为空，下次导入仍可用 COPY）"""
+    import entities
+    import rollups
+
+    if checkpoint.data.get("entities_pending"):
+        if loader.copy:
+            entities.backfill(loader.conn)
+            checkpoint.data["entities_pending"] = False
+        else:
+            logger.warning(
+                "Entity index not rebuilt: parts imported by an earlier COPY run are not indexed and the "
+                "database has pending WAL writes; rerun after a checkpoint to rebuild it"
+            )
+    loader.conn.execute("MATCH (b:SentimentBucket) DELETE b")
+    rollups.backfill(loader.conn, copy=loader.copy)
+    checkpoint.data["indexed"] = not checkpoint.data.get("entities_pending")
+    checkpoint.save()
+
+
+def run_backfill(
+    inputs: List[str],
+    db_path: str,
+    stage_dir: Optional[Path] = None,
+    workers: int = 0,
+    chunk_rows: int = 100_000,
+    stage_format: Optional[str] = None,
+    index: bool = True,
+    keep_stage: bool = False
+) -> Dict[str, Any]:
+    """暂存并导入 inputs，返回检查点中的累计统计"""
+    stage_dir = stage_dir or default_stage_dir(db_path)
+    checkpoint = Checkpoint(stage_dir / "checkpoint.json")
+    fmt = checkpoint.data.setdefault("format", stage_format or default_stage_format())
+    if stage_format and stage_format != fmt:
+        raise RuntimeError(f"{stage_dir} was staged as {fmt}, resume with --stage-format {fmt} or use a new --stage-dir")
+    if fmt == "parquet" and default_stage_format() != "parquet":
+        raise RuntimeError("Parquet staging requires pyarrow: pip install pyarrow (or use --stage-format csv)")
+    parts_dir = stage_dir / "parts"
+    parts_dir.mkdir(parents=True, exist_ok=True)
+
+    ordered = checkpoint.register(find_inputs(inputs))
+    checkpoint.save()
+    total_bytes = sum(os.path.getsize(path) for _, path in ordered)
+    logger.info(f"Backfill: {len(ordered)} input files ({total_bytes / 1e6:.1f} MB), staging as {fmt} into {stage_dir}")
+
+    # 须在迁移之前检查：迁移本身也会写 WAL
+    copy = pending_wal(db_path) == 0
+    prepare_database(db_path)
+    loader = Loader(db_path, stage_dir, fmt, copy=copy, index=index)
+    if copy:
+        logger.info("Loading with COPY")
+    else:
+        logger.info("Database has pending WAL writes from an earlier session, loading with UNWIND CREATE")
+
+    started = time.perf_counter()
+    staged_bytes = 0
+    session = {"posts": 0, "filtered": 0, "discovery": 0, "duplicates": 0, "orphans": 0}
+    pending: List[Dict[str, Any]] = []
+    window = {"posts": chunk_rows, "parts": 64}
+    chunks = 0
+
+    def load(parts: List[Dict[str, Any]], final: bool = False) -> bool:
+        nonlocal chunks
+        names = [part["name"] for part in parts]
+        chunk_started = time.perf_counter()
+        indexed = index and not loader.copy
+        counts = loader.load_chunk(names, final=final)
+        if counts is None:
+            logger.debug(f"Chunk of {len(names)} parts too small for COPY, merging with the next one")
+            return False
+        if loader.entities_rebuilt:
+            entities_pending = False
+        else:
+            entities_pending = checkpoint.data.get("entities_pending") or not indexed
+        checkpoint.record_chunk(names, counts, entities_pending)
+        for key, value in counts.items():
+            session[key] += value
+        chunks += 1
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"Chunk {chunks}: +{counts['posts']} posts, +{counts['filtered']} filtered, "
+            f"+{counts['discovery']} discovery, {counts['duplicates']} duplicates skipped "
+            f"in {time.perf_counter() - chunk_started:.1f}s | "
+            f"{session['posts'] / elapsed:.0f} posts/s, {staged_bytes / elapsed / 1e6:.1f} MB/s staged"
+        )
+        if not keep_stage:
+            for name in names:
+                for table in TABLES:
+                    _part_path(parts_dir, name, table, fmt).unlink(missing_ok=True)
+        return True
+
+    def queue(parts: List[Dict[str, Any]]):
+        pending.extend(part for part in parts if not checkpoint.is_loaded(part["name"]))
+        # 多留一块再导入，最后一块不会太小（太小时只能走 CREATE，见 Loader）
+        while sum(part["posts"] for part in pending) >= 2 * window["posts"] or len(pending) >= 2 * window["parts"]:
+            # 凑满一块：帖子数达到 chunk_rows（小文件很多时最多 64 个部分）；块太小没有导入时放大再凑
+            size, take = 0, 0
+            while take < len(pending) and take < window["parts"] and (
+                take == 0 or size + pending[take]["posts"] <= window["posts"]
+            ):
+                size += pending[take]["posts"]
+                take += 1
+            if load(pending[:take]):
+                del pending[:take]
+                window.update(posts=chunk_rows, parts=64)
+            else:
+                window.update(posts=window["posts"] + chunk_rows, parts=window["parts"] + 64)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers or None) as pool:
+            futures = {}
+            for number, path in ordered:
+                if checkpoint.staged(path) is None:
+                    futures[number] = pool.submit(stage_file, number, path, str(parts_dir), chunk_rows, fmt)
+            # 按输入顺序取结果，工作进程继续暂存后面的文件
+            for number, path in ordered:
+                if number in futures:
+                    result = futures.pop(number).result()
+                    checkpoint.record_stage(result)
+                    staged_bytes += result["bytes"]
+                    for error in result["errors"]:
+                        logger.warning(f"{path}: {error}")
+                    if result["invalid"]:
+                        logger.warning(f"{path}: {result['invalid']} invalid rows skipped")
+                queue(checkpoint.staged(path))
+        if pending:
+            load(pending, final=True)
+
+        if index and not checkpoint.data["indexed"]:
+            index_started = time.perf_counter()
+            build_indexes(loader, checkpoint)
+            logger.info(f"Indexes and sentiment rollups rebuilt in {time.perf_counter() - index_started:.1f}s")
+    finally:
+        loader.close()
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Backfill session: {session['posts']} posts, {session['filtered']} filtered, "
+        f"{session['discovery']} discovery in {elapsed:.1f}s ({session['posts'] / max(elapsed, 1e-9):.0f} posts/s)"
+    )
+    return checkpoint.data["counts"]
+
+
+# ========== CLI ==========
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Backfill historical extension exports into KuzuDB")
+    parser.add_argument("action", choices=["run", "status"], help="Action to perform")
+    parser.add_argument("inputs", nargs="*", help="Input files or directories (.json / .jsonl / .ndjson, optionally .gz)")
+    parser.add_argument("--db-path", default="./database/twitter_scraper", help="KuzuDB path")
+    parser.add_argument("--stage-dir", help="Staging directory with the checkpoint (default: <db-path>.backfill)")
+    parser.add_argument("--workers", type=int, default=0, help="Staging processes (default: CPU count)")
+    parser.add_argument("--chunk-rows", type=int, default=100_000, help="Posts per staged part and per COPY chunk")
+    parser.add_argument("--stage-format", choices=["parquet", "csv"], help="Staged file format (default: parquet if pyarrow is installed)")
+    parser.add_argument("--no-index", action="store_true", help="Skip entity index and sentiment rollups")
+    parser.add_argument("--keep-stage", action="store_true", help="Keep staged files after they are imported")
+    args = parser.parse_args()
+
+    stage_dir = Path(args.stage_dir) if args.stage_dir else default_stage_dir(args.db_path)
+
+    if args.action == "status":
+        path = stage_dir / "checkpoint.json"
+        if not path.exists():
+            print(f"No backfill checkpoint at {path}")
+            sys.exit(1)
+        data = Checkpoint(path).data
+        inputs = data["inputs"].values()
+        staged = [entry for entry in inputs if entry["parts"] is not None]
+        parts = [part["name"] for entry in staged for part in entry["parts"]]
+        loaded = set(data["loaded"])
+        print(f"Inputs: {len(staged)}/{len(inputs)} staged ({data.get('format')})")
+        print(f"Parts:  {sum(1 for name in parts if name in loaded)}/{len(parts)} imported")
+        print(f"Rows:   {data['counts']}")
+        print(f"Index:  {'built' if data['indexed'] else 'pending'}"
+              f"{' (entity index pending)' if data.get('entities_pending') else ''}")
+        return
+
+    if not args.inputs:
+        parser.error("run needs at least one input file or directory")
+    try:
+        counts = run_backfill(
+            args.inputs,
+            args.db_path,
+            stage_dir=stage_dir,
+            workers=args.workers,
+            chunk_rows=args.chunk_rows,
+            stage_format=args.stage_format,
+            index=not args.no_index,
+            keep_stage=args.keep_stage
+        )
+    except RuntimeError as e:
+        # Kuzu 的错误，如文件锁（后端还在运行）
+        print(f"[ERROR] {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"[OK] Imported totals: {counts}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
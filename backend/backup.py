@@ -0,0 +1,487 @@
+"""
+Social Scraper Backup
+运行中的数据库在线快照、增量备份与带校验的恢复
+
+    <db-path>.backups/               KUZU_BACKUP_DIR 可覆盖
+        CURRENT                      最新快照名
+        20261019-101500-000001/      快照：数据库文件 + MANIFEST.json（大小、mtime、sha256、耗时）
+
+快照分两步，写入只在第二步暂停：
+1. 不暂停：与上一代快照的清单比较，没有变化的文件硬链接上一代（增量），有变化的文件预先复制
+   （文件系统支持时用 reflink 写时复制）
+2. 暂停写入：重新取文件签名，只处理预复制之后又变化的文件；WAL 在两次检查点之间只追加，
+   数据文件没有变化（没有发生检查点）时只补复制 WAL 新增的尾部
+关闭自动检查点时（Kuzu 0.5，见 database.py）运行期间只有 WAL 在变，暂停时间取决于
+第一步期间新写入的 WAL，通常是毫秒级。快照不主动 CHECKPOINT：这些版本的检查点会写坏
+少量追加行，快照带着 WAL，打开时回放。
+
+暂停的方式由调用方决定：capture 在数据库锁内执行。FastAPI 服务的请求在事件循环线程上访问数据库，
+capture 在循环中同步执行，挡住请求；清理分片在线程中执行并持有同一把锁（见 cleanup.py），
+循环最多等一个分片。轻量版同样在数据库锁内执行。
+
+快照只包含数据库目录；<db-path>.state 中的内存索引（近重复、趋势等）不在快照内，
+恢复时连同原数据库一起移到一边，启动后重新积累（作者图自动重建）。
+
+用法（restore 须先停止后端）：
+    python backup.py snapshot --db-path ./database/twitter_scraper
+    python backup.py list --db-path ./database/twitter_scraper
+    python backup.py verify 20261019-101500-000001 --db-path ./database/twitter_scraper
+    python backup.py restore 20261019-101500-000001 --db-path ./database/twitter_scraper
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from contextlib import nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+CURRENT = "CURRENT"
+MANIFEST = "MANIFEST.json"
+MANIFEST_VERSION = 1
+WAL = ".wal"
+# 不属于数据库内容的文件
+SKIP_FILES = {".lock", MANIFEST}
+# Linux FICLONE ioctl（btrfs / XFS / overlay 上的 reflink）
+FICLONE = 0x40049409
+
+# 校验时统计行数的节点表
+COUNT_TABLES = ("Post", "FilteredPost", "DiscoveryResult")
+
+
+def backup_root(db_path: str) -> Path:
+    """快照目录，KUZU_BACKUP_DIR 可覆盖"""
+    path = Path(db_path)
+    return Path(os.getenv("KUZU_BACKUP_DIR") or path.parent / f"{path.name}.backups")
+
+
+def file_signature(path: Path) -> Dict[str, Tuple[int, int]]:
+    """目录中各文件的 (大小, mtime_ns)"""
+    signature = {}
+    for entry in os.scandir(path):
+        if entry.is_file() and entry.name not in SKIP_FILES:
+            stat = entry.stat()
+            signature[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return signature
+
+
+def clone_file(src: str, dst: str) -> bool:
+    """复制文件，文件系统支持时用 reflink（写时复制，不占额外空间），返回是否 reflink"""
+    if fcntl is not None and sys.platform.startswith("linux"):
+        try:
+            with open(src, "rb") as source, open(dst, "wb") as target:
+                fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            shutil.copystat(src, dst)
+            return True
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+    return False
+
+
+def _append_tail(src: str, dst: str, offset: int):
+    """dst 截断到 offset 后补上 src 从 offset 开始的内容（只追加的 WAL）"""
+    with open(src, "rb") as source, open(dst, "r+b") as target:
+        target.truncate(offset)
+        target.seek(offset)
+        source.seek(offset)
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    shutil.copystat(src, dst)
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def current_snapshot(root: Path) -> Optional[str]:
+    try:
+        return (Path(root) / CURRENT).read_text(encoding="utf-8").strip() or None
+    except OSError:
+        return None
+
+
+def read_manifest(snapshot: Path) -> Dict[str, Any]:
+    path = Path(snapshot) / MANIFEST
+    if not path.exists():
+        raise RuntimeError(f"{snapshot} has no {MANIFEST}")
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def list_snapshots(root: Path) -> List[Dict[str, Any]]:
+    """按时间排序的快照清单摘要"""
+    root = Path(root)
+    if not root.exists():
+        return []
+    snapshots = []
+    for path in sorted(p for p in root.iterdir() if p.is_dir() and not p.name.startswith(".")):
+        try:
+            manifest = read_manifest(path)
+        except (RuntimeError, ValueError):
+            continue
+        snapshots.append({key: value for key, value in manifest.items() if key != "files"})
+    return snapshots
+
+
+def database_in_use(db_path: str) -> bool:
+    """是否有进程以读写方式打开着数据库（Kuzu 在 .lock 上持有 POSIX 记录锁）"""
+    lock = Path(db_path) / ".lock"
+    if fcntl is None or not lock.exists():
+        return False
+    with open(lock, "r+b") as f:
+        try:
+            fcntl.lockf(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        fcntl.lockf(f, fcntl.LOCK_UN)
+    return False
+
+
+class SnapshotJob:
+    """
+    一次快照
+
+    prepare / finish 不访问数据库，可以在工作线程中执行；capture 必须在写入暂停时调用
+    """
+
+    def __init__(self, db_path: str, root: Path, checksums: bool = True, keep: int = 0):
+        self.db_path = Path(db_path)
+        self.root = Path(root)
+        self.checksums = checksums
+        self.keep = keep
+        self.name: Optional[str] = None
+        self.previous: Optional[str] = None
+        self.unchanged = False
+        self.pause_ms = 0.0
+        self._previous_files: Dict[str, Dict[str, Any]] = {}
+        self._staging: Optional[Path] = None
+        self._before: Dict[str, Tuple[int, int]] = {}
+        self._linked: set = set()
+        self._reflinked = 0
+        self._signature: Dict[str, Tuple[int, int]] = {}
+        self._started = 0.0
+
+    def _previous_signature(self) -> Dict[str, Tuple[int, int]]:
+        return {name: (item["size"], item["mtime_ns"]) for name, item in self._previous_files.items()}
+
+    def _copy(self, name: str):
+        target = self._staging / name
+        if target.exists():
+            target.unlink()
+        self._linked.discard(name)
+        if clone_file(str(self.db_path / name), str(target)):
+            self._reflinked += 1
+
+    def prepare(self):
+        """不暂停写入：硬链接没有变化的文件，预复制有变化的文件"""
+        self._started = time.perf_counter()
+        if not self.db_path.is_dir():
+            raise RuntimeError(f"Database not found: {self.db_path}")
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.previous = current_snapshot(self.root)
+        if self.previous is not None:
+            try:
+                self._previous_files = read_manifest(self.root / self.previous)["files"]
+            except (RuntimeError, ValueError):
+                self.previous = None
+
+        self._before = file_signature(self.db_path)
+        if self.previous is not None and self._before == self._previous_signature():
+            return
+
+        now = datetime.now()
+        self.name = f"{now:%Y%m%d-%H%M%S}-{now.microsecond:06d}"
+        self._staging = self.root / f".{self.name}"
+        self._staging.mkdir()
+        previous_signature = self._previous_signature()
+        for name, signature in self._before.items():
+            if previous_signature.get(name) == signature:
+                try:
+                    os.link(self.root / self.previous / name, self._staging / name)
+                    self._linked.add(name)
+                    continue
+                except OSError:
+                    pass
+            self._copy(name)
+
+    def capture(self):
+        """写入暂停期间调用：补上预复制之后的变化"""
+        paused = time.perf_counter()
+        after = file_signature(self.db_path)
+        if self._staging is None:
+            # prepare 时没有变化；之后的写入留给下一次快照
+            self.unchanged = True
+            self._signature = after
+            self.pause_ms = (time.perf_counter() - paused) * 1000
+            return
+
+        changed = [name for name, signature in after.items() if self._before.get(name) != signature]
+        removed = [name for name in self._before if name not in after]
+        # 只有 WAL 变长、没有其他文件变化说明两步之间没有检查点，WAL 前面的内容不变
+        wal_only = not removed and changed == [WAL] and WAL in self._before and WAL not in self._linked
+        for name in changed:
+            if wal_only and after[name][0] >= self._before[name][0]:
+                _append_tail(str(self.db_path / name), str(self._staging / name), self._before[name][0])
+            else:
+                self._copy(name)
+        for name in removed:
+            (self._staging / name).unlink()
+            self._linked.discard(name)
+        for entry in os.scandir(self.db_path):
+            if entry.is_dir():
+                shutil.copytree(entry.path, self._staging / entry.name)
+        self._signature = after
+        self.pause_ms = (time.perf_counter() - paused) * 1000
+
+    def finish(self) -> Dict[str, Any]:
+        """写清单、发布为 CURRENT，返回快照摘要"""
+        if self.unchanged:
+            manifest = read_manifest(self.root / self.previous)
+            return {**{key: value for key, value in manifest.items() if key != "files"},
+                    "unchanged": True, "pause_ms": round(self.pause_ms, 2)}
+
+        files = {}
+        total = copied = 0
+        for name, (size, mtime_ns) in self._signature.items():
+            path = self._staging / name
+            item = {"size": size, "mtime_ns": mtime_ns, "sha256": None, "linked": name in self._linked}
+            if self.checksums:
+                previous = self._previous_files.get(name, {})
+                item["sha256"] = previous.get("sha256") if item["linked"] and previous.get("sha256") else _sha256(path)
+            files[name] = item
+            total += size
+            if not item["linked"]:
+                copied += size
+        # 只读打开需要锁文件，每个快照各自一个
+        (self._staging / ".lock").touch()
+
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "name": self.name,
+            "created": datetime.now().isoformat(),
+            "source": str(self.db_path.resolve()),
+            "base": self.previous,
+            "files": files,
+            "bytes": total,
+            "copied_bytes": copied,
+            "linked_files": len(self._linked),
+            "reflinked_files": self._reflinked,
+            "pause_ms": round(self.pause_ms, 2),
+            "duration_ms": round((time.perf_counter() - self._started) * 1000, 2)
+        }
+        (self._staging / MANIFEST).write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+
+        snapshot = self.root / self.name
+        self._staging.rename(snapshot)
+        pointer = self.root / f"{CURRENT}.tmp"
+        pointer.write_text(self.name, encoding="utf-8")
+        os.replace(pointer, self.root / CURRENT)
+        self._prune()
+        logger.info(
+            f"Snapshot {self.name}: {total / 1e6:.1f} MB ({copied / 1e6:.1f} MB copied), "
+            f"writes paused {self.pause_ms:.1f}ms, {manifest['duration_ms']:.0f}ms total"
+        )
+        return {key: value for key, value in manifest.items() if key != "files"}
+
+    def abort(self):
+        if self._staging is not None:
+            shutil.rmtree(self._staging, ignore_errors=True)
+
+    def _prune(self):
+        if self.keep <= 0:
+            return
+        snapshots = sorted(p for p in self.root.iterdir() if p.is_dir() and not p.name.startswith("."))
+        for old in snapshots[:-self.keep]:
+            # 仍被读进程打开的文件在 Windows 上删不掉，留到下次再删
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def take_snapshot(db_path: str, root: Path, lock=None, checksums: bool = True, keep: int = 0) -> Dict[str, Any]:
+    """
+    同步执行一次快照
+
+    lock 为暂停写入时持有的锁（轻量版服务的数据库锁）；为空时调用方须保证期间没有写入
+    """
+    job = SnapshotJob(db_path, root, checksums=checksums, keep=keep)
+    try:
+        job.prepare()
+        with lock or nullcontext():
+            job.capture()
+        return job.finish()
+    except Exception:
+        job.abort()
+        raise
+
+
+async def take_snapshot_async(
+    db_path: str, root: Path, lock=None, checksums: bool = True, keep: int = 0
+) -> Dict[str, Any]:
+    """
+    在事件循环中执行快照（FastAPI 服务）
+
+    复制和校验和放到线程中；capture 在循环中持有 lock（与清理分片线程共用的数据库锁）同步执行，
+    期间循环上的请求和持锁的线程都不会写库
+    """
+    loop = asyncio.get_running_loop()
+    job = SnapshotJob(db_path, root, checksums=checksums, keep=keep)
+    try:
+        await loop.run_in_executor(None, job.prepare)
+        with lock or nullcontext():
+            job.capture()
+        return await loop.run_in_executor(None, job.finish)
+    except Exception:
+        job.abort()
+        raise
+
+
+# ========== 校验与恢复 ==========
+
+def count_rows(path: Path) -> Dict[str, Any]:
+    """只读打开数据库（回放 WAL），返回 Schema 版本和各表行数"""
+    import kuzu
+    import migrations
+
+    db = kuzu.Database(str(path), buffer_pool_size=256 * 1024 * 1024, read_only=True)
+    conn = kuzu.Connection(db)
+    try:
+        counts = {}
+        for table in COUNT_TABLES:
+            result = conn.execute(f"MATCH (n:{table}) RETURN count(n)")
+            counts[table] = result.get_next()[0]
+            # 结果对象不能活过数据库
+            result.close()
+        return {"schema_version": migrations.current_version(conn), "counts": counts}
+    finally:
+        conn.close()
+        db.close()
+
+
+def verify_snapshot(snapshot: Path, open_db: bool = True) -> Dict[str, Any]:
+    """按清单校验文件大小和 sha256，open_db 时再只读打开并统计行数；有问题时抛出 RuntimeError"""
+    snapshot = Path(snapshot)
+    manifest = read_manifest(snapshot)
+    problems = []
+    for name, item in manifest["files"].items():
+        path = snapshot / name
+        if not path.is_file():
+            problems.append(f"{name}: missing")
+        elif path.stat().st_size != item["size"]:
+            problems.append(f"{name}: size {path.stat().st_size} != {item['size']}")
+        elif item.get("sha256") and _sha256(path) != item["sha256"]:
+            problems.append(f"{name}: checksum mismatch")
+    extra = set(file_signature(snapshot)) - set(manifest["files"])
+    problems.extend(f"{name}: not in manifest" for name in sorted(extra))
+    if problems:
+        raise RuntimeError(f"Snapshot {snapshot.name} failed verification: " + "; ".join(problems))
+
+    report = {"name": manifest["name"], "files": len(manifest["files"]), "bytes": manifest["bytes"]}
+    if open_db:
+        try:
+            report.update(count_rows(snapshot))
+        except Exception as e:
+            raise RuntimeError(f"Snapshot {snapshot.name} cannot be opened: {e}")
+    return report
+
+
+def restore_snapshot(snapshot: Path, db_path: str) -> Dict[str, Any]:
+    """
+    校验快照后恢复到 db_path
+
+    文件复制（不硬链接，恢复后的库会被原地写入）到临时目录，只读打开核对行数后才替换；
+    原数据库和 .state 目录改名为 *.pre-restore-<时间> 保留
+    """
+    snapshot = Path(snapshot)
+    db_path = Path(db_path)
+    if database_in_use(str(db_path)):
+        raise RuntimeError(f"{db_path} is open by another process, stop the backend before restoring")
+
+    started = time.perf_counter()
+    report = verify_snapshot(snapshot)
+    manifest = read_manifest(snapshot)
+
+    staging = db_path.parent / f".{db_path.name}.restoring"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    try:
+        for name in manifest["files"]:
+            clone_file(str(snapshot / name), str(staging / name))
+        (staging / ".lock").touch()
+        restored = count_rows(staging)
+        if restored != {key: report[key] for key in ("schema_version", "counts")}:
+            raise RuntimeError(f"Restored copy does not match the snapshot: {restored}")
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    suffix = f"pre-restore-{datetime.now():%Y%m%d-%H%M%S}"
+    moved = []
+    for path in (db_path, db_path.parent / f"{db_path.name}.state"):
+        if path.exists():
+            aside = path.parent / f"{path.name}.{suffix}"
+            path.rename(aside)
+            moved.append(str(aside))
+    staging.rename(db_path)
+    logger.info(f"Restored {snapshot.name} into {db_path} in {time.perf_counter() - started:.1f}s")
+    return {**report, "restored_to": str(db_path), "moved_aside": moved}
+
+
+def _resolve(root: Path, name: Optional[str]) -> Path:
+    name = name or current_snapshot(root)
+    if name is None:
+        raise RuntimeError(f"No snapshots under {root}")
+    path = Path(name) if Path(name).is_dir() else root / name
+    if not path.is_dir():
+        raise RuntimeError(f"Snapshot not found: {name}")
+    return path
+
+
+# ========== CLI ==========
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Snapshot, verify and restore the KuzuDB database")
+    parser.add_argument("action", choices=["snapshot", "list", "verify", "restore"], help="Action to perform")
+    parser.add_argument("snapshot", nargs="?", help="Snapshot name or directory (default: latest)")
+    parser.add_argument("--db-path", default="./database/twitter_scraper", help="KuzuDB path")
+    parser.add_argument("--root", help="Snapshot directory (default: KUZU_BACKUP_DIR or <db-path>.backups)")
+    parser.add_argument("--keep", type=int, default=int(os.getenv("BACKUP_KEEP", "0")),
+                        help="Snapshots to keep after a new one (0 = all)")
+    args = parser.parse_args()
+
+    root = Path(args.root) if args.root else backup_root(args.db_path)
+    try:
+        if args.action == "snapshot":
+            # 后端运行时由它暂停写入：POST /api/snapshots
+            if database_in_use(args.db_path):
+                raise RuntimeError(f"{args.db_path} is open by the backend, use POST /api/snapshots instead")
+            result = take_snapshot(args.db_path, root, keep=args.keep)
+        elif args.action == "list":
+            result = {"root": str(root), "current": current_snapshot(root), "snapshots": list_snapshots(root)}
+        elif args.action == "verify":
+            result = verify_snapshot(_resolve(root, args.snapshot))
+        else:
+            result = restore_snapshot(_resolve(root, args.snapshot), args.db_path)
+    except RuntimeError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
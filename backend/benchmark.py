@@ -0,0 +1,589 @@
+"""
+Social Scraper Benchmarks
+数据层与 HTTP 接口基准：在临时目录构建 1 万 / 10 万 / 100 万帖子的 Kuzu 库，
+测量各批大小的入库吞吐、SocialScraperKG 读方法与 HTTP 接口的 p50/p95/p99 延迟、
+并发持久连接下的 HTTP 吞吐（轻量版 / 最小版同时测量 --threaded 旧服务器作对照）、
+内存峰值和启动耗时，结果写成 JSON 便于对比，并可按阈值检查回归。
+入库时按调用方记录每条语句摊到每篇帖子的耗时，多个规模一起运行时检查其随库规模的增长
+（--max-growth），按主键建边退化成扫表这类问题不依赖基线也能发现
+
+用法:
+    python benchmark.py run --sizes 10k,100k,1m --output bench.json
+    python benchmark.py run --sizes 10k,100k --ingest-posts 500 --server none --max-growth 3
+    python benchmark.py run --sizes 10k --baseline bench.json --threshold 0.2
+    python benchmark.py compare bench-old.json bench-new.json --threshold 0.2
+"""
+
+import asyncio
+import http.client
+import json
+import os
+import platform as platform_info
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+from loguru import logger
+
+BACKEND_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+import corpus
+import metrics
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+INGEST_BATCH_SIZES = (1, 10, 100, 1000)
+PERCENTILES = (50, 95, 99)
+
+# 回归判定的绝对噪声下限，低于此差值的波动忽略
+NOISE_FLOOR = {"ms": 1.0, "s": 0.05, "mb": 10.0, "per_s": 0.0}
+
+# 入库语句每篇帖子耗时低于此值（毫秒）时不记录，也不参与增长检查
+STATEMENT_FLOOR_MS = 0.05
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """线性插值分位数，sorted_values 须已排序"""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def latency_summary(samples_ms: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples_ms)
+    summary = {f"p{q}_ms": round(percentile(ordered, q), 3) for q in PERCENTILES}
+    summary["mean_ms"] = round(sum(ordered) / len(ordered), 3) if ordered else 0.0
+    summary["samples"] = len(ordered)
+    return summary
+
+
+def max_rss_mb() -> Optional[float]:
+    """进程内存峰值（Linux 单位 KB，macOS 为字节）"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# ========== 数据集 ==========
+
+def build_database(db_path: Path, posts: int, seed: int) -> Dict[str, Any]:
+    """用合成语料经 COPY 批量构建基准库，并补建实体索引与情感分桶"""
+    started = time.perf_counter()
+    counts = corpus.build_database(str(db_path), corpus.CorpusGenerator(posts, corpus.CorpusConfig(seed=seed)))
+    return {**counts, "total_s": round(time.perf_counter() - started, 2)}
+
+
+# ========== 数据层 ==========
+
+def _time_calls(func: Callable[[], Any], repeat: int, budget_s: float) -> Tuple[List[float], Any]:
+    """先预热一次（查询编译、缓存），再重复调用直到次数或时间预算用完，返回各次耗时（毫秒）"""
+    result = func()
+    samples = []
+    deadline = time.perf_counter() + budget_s
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - started) * 1000)
+        if time.perf_counter() > deadline and len(samples) >= 5:
+            break
+    return samples, result
+
+
+def bench_ingest(kg, seed: int, posts_per_size: int, existing: int) -> Tuple[Dict[str, Any], str]:
+    """经完整入库路径（去重、趋势、警报、聚类、索引）的吞吐，返回 (结果, 首条入库帖子 ID)"""
+    results = {}
+    offset = existing
+    sample_post = None
+    ingested = 0
+    before = metrics.QUERY_SECONDS.snapshots()
+    for size in INGEST_BATCH_SIZES:
+        total = max(size, posts_per_size - posts_per_size % size)
+        generator = corpus.CorpusGenerator(
+            total, corpus.CorpusConfig(seed=seed + size, days=1.0, end=datetime.now()), offset=offset
+        )
+        offset += total
+        ingested += total
+        batches = [corpus.to_request(batch)["posts"] for batch in generator.batches(size)]
+        sample_post = sample_post or batches[0][0]["id"]
+        samples = []
+        started = time.perf_counter()
+        for posts in batches:
+            t = time.perf_counter()
+            asyncio.run(kg.add_posts_batch(posts))
+            samples.append((time.perf_counter() - t) * 1000)
+        elapsed = time.perf_counter() - started
+        results[f"batch_{size}"] = {
+            "posts": total,
+            "posts_per_s": round(total / elapsed, 1),
+            **latency_summary(samples)
+        }
+        logger.info(f"Ingest batch={size}: {total / elapsed:.0f} posts/s")
+
+    # 按调用方统计的语句耗时（metrics.TimedConnection），摊到每篇帖子
+    statements = {}
+    for (name,), (_, seconds) in metrics.QUERY_SECONDS.snapshots().items():
+        per_post_ms = (seconds - before.get((name,), (0, 0.0))[1]) * 1000 / ingested
+        if per_post_ms >= STATEMENT_FLOOR_MS:
+            statements[name] = {"per_post_ms": round(per_post_ms, 3)}
+    results["statements"] = statements
+    return results, sample_post
+
+
+def read_methods(kg, sample_post: str, sample_author: str) -> Dict[str, Callable[[], Any]]:
+    now = datetime.now()
+    return {
+        "get_stats": lambda: kg.get_stats(),
+        "get_post_by_id": lambda: kg.get_post_by_id(sample_post),
+        "get_recent_posts": lambda: kg.get_recent_posts(hours=24, limit=100),
+        "get_filtered_posts": lambda: kg.get_filtered_posts(limit=50),
+        "get_filtered_posts_category": lambda: kg.get_filtered_posts(category="tech", limit=50),
+        "get_discovery_stats": lambda: kg.get_discovery_stats(),
+        "get_sentiment_timeseries": lambda: kg.get_sentiment_timeseries(granularity="hour", end=now),
+        "get_engagement_analytics": lambda: kg.get_engagement_analytics(hours=24),
+        "get_engagement_analytics_grouped": lambda: kg.get_engagement_analytics(hours=168, group_by="platform"),
+        "get_events": lambda: kg.get_events(),
+        "get_related_posts": lambda: kg.get_related_posts(sample_post),
+        "get_alert_rules": lambda: kg.get_alert_rules(),
+        "get_alert_matches": lambda: kg.get_alert_matches(),
+        "get_cleanup_rules": lambda: kg.get_cleanup_rules(),
+        "get_authors": lambda: kg.get_authors(),
+        "get_author": lambda: kg.get_author(sample_author),
+        "get_hashtag_posts": lambda: kg.get_entity_posts("hashtag", "market", hours=6),
+        "get_top_domains": lambda: kg.get_top_entities("domain", hours=24),
+    }
+
+
+def bench_reads(kg, repeat: int, budget_s: float, sample_post: str, sample_author: str) -> Dict[str, Any]:
+    results = {}
+    for name, factory in read_methods(kg, sample_post, sample_author).items():
+        try:
+            samples, _ = _time_calls(lambda: asyncio.run(factory()), repeat, budget_s)
+            results[name] = latency_summary(samples)
+        except Exception as e:
+            results[name] = {"error": str(e)}
+    return results
+
+
+# ========== HTTP ==========
+
+HTTP_ENDPOINTS = (
+    "/health",
+    "/api/stats",
+    "/api/posts?hours=24&limit=100",
+    "/api/posts/filtered?limit=50",
+    "/api/posts/{post}/related",
+    "/api/discovery/stats",
+    "/api/trends?window=6h",
+    "/api/analytics/engagement?hours=24",
+    "/api/events",
+    "/api/alerts",
+    "/api/authors",
+    "/api/hashtags/top",
+    "/api/hashtags/market/posts",
+    "/api/domains/top",
+)
+
+# 吞吐测量的请求：轻量接口、一次数据库查询、CORS 预检
+THROUGHPUT_REQUESTS = (
+    ("GET", "/"),
+    ("GET", "/api/stats"),
+    ("OPTIONS", "/api/posts/batch"),
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get(url: str, timeout: float = 30.0) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def bench_throughput(port: int, method: str, path: str, clients: int, seconds: float) -> Dict[str, Any]:
+    """
+    clients 个客户端各用一条 http.client 连接连续请求 seconds 秒
+
+    服务端支持持久连接时整个过程复用连接；HTTP/1.0 服务端每个请求后关闭，客户端重新连接
+    """
+    headers = {"Origin": "chrome-extension://benchmark"}
+    if method == "OPTIONS":
+        headers.update({"Access-Control-Request-Method": "POST", "Access-Control-Request-Headers": "content-type"})
+    counts = [0] * clients
+    connects = [0] * clients
+    errors = [0] * clients
+    deadline = time.perf_counter() + seconds
+
+    def client(index: int):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        while time.perf_counter() < deadline:
+            if conn.sock is None:
+                connects[index] += 1
+            try:
+                conn.request(method, path, headers=headers)
+                conn.getresponse().read()
+                counts[index] += 1
+            except (OSError, http.client.HTTPException):
+                errors[index] += 1
+                conn.close()
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "requests_per_s": round(sum(counts) / elapsed, 1),
+        "connections": sum(connects),
+        "errors": sum(errors)
+    }
+
+
+def bench_http(
+    db_path: Path,
+    server: str,
+    repeat: int,
+    budget_s: float,
+    sample_post: str,
+    extra_args: Tuple[str, ...] = (),
+    endpoints: bool = True,
+    throughput_s: float = 3.0,
+    clients: int = 8
+) -> Dict[str, Any]:
+    """启动服务进程，测量就绪耗时、各接口延迟和并发吞吐"""
+    port = _free_port()
+    script = {"full": "server.py", "lite": "server_lite.py", "minimal": "server_minimal.py"}[server]
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, script, "--port", str(port), "--db-path", str(db_path), *extra_args],
+        cwd=str(BACKEND_DIR),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        ready_ms = None
+        while time.perf_counter() - started < 300:
+            if process.poll() is not None:
+                return {"error": f"{script} exited with code {process.returncode}"}
+            try:
+                if _get(base + "/health", timeout=2) == 200:
+                    ready_ms = (time.perf_counter() - started) * 1000
+                    break
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                time.sleep(0.05)
+        if ready_ms is None:
+            return {"error": f"{script} not ready after 300s"}
+
+        result = {"server": server, "ready_ms": round(ready_ms, 1)}
+        if endpoints:
+            result["endpoints"] = {}
+            for path in HTTP_ENDPOINTS:
+                url = base + path.format(post=sample_post)
+                statuses = set()
+                samples, _ = _time_calls(lambda: statuses.add(_get(url)), repeat, budget_s)
+                result["endpoints"][path] = {**latency_summary(samples), "status": sorted(statuses)}
+        if throughput_s > 0:
+            result["throughput"] = {
+                f"{method} {path}": bench_throughput(port, method, path, clients, throughput_s)
+                for method, path in THROUGHPUT_REQUESTS
+            }
+        return result
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+# ========== 单个规模 ==========
+
+def bench_size(posts: int, args) -> Dict[str, Any]:
+    """在临时目录中完成一个规模的全部测量（由 run 在子进程中调用）"""
+    from database import SocialScraperKG
+
+    workdir = Path(tempfile.mkdtemp(prefix=f"bench-{posts}-", dir=args.workdir))
+    db_path = workdir / "db"
+    result: Dict[str, Any] = {"posts": posts}
+    try:
+        result["build"] = build_database(db_path, posts, args.seed)
+        result["memory"] = {"after_build_mb": max_rss_mb()}
+
+        started = time.perf_counter()
+        kg = SocialScraperKG(str(db_path))
+        asyncio.run(kg.init())
+        result["startup"] = {"kg_init_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+        result["ingest"], sample_post = bench_ingest(kg, args.seed, args.ingest_posts, posts)
+        result["memory"]["after_ingest_mb"] = max_rss_mb()
+
+        authors = asyncio.run(kg.get_authors(limit=1))["authors"]
+        sample_author = authors[0]["id"] if authors else "twitter:user0"
+        result["reads"] = bench_reads(kg, args.repeat, args.budget, sample_post, sample_author)
+        result["memory"]["after_reads_mb"] = max_rss_mb()
+        asyncio.run(kg.close())
+
+        # 重新打开一次，测量带旁路状态的冷启动
+        started = time.perf_counter()
+        kg = SocialScraperKG(str(db_path))
+        asyncio.run(kg.init())
+        result["startup"]["kg_reopen_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        asyncio.run(kg.close())
+
+        if args.server != "none":
+            http = bench_http(
+                db_path, args.server, args.repeat, args.budget, sample_post,
+                throughput_s=args.throughput, clients=args.clients
+            )
+            result["http"] = http
+            if "ready_ms" in http:
+                result["startup"]["http_ready_ms"] = http["ready_ms"]
+            if args.server in ("lite", "minimal") and args.throughput > 0:
+                # 对照：原来的每请求一个连接的多线程服务器
+                result["http_threaded"] = bench_http(
+                    db_path, args.server, args.repeat, args.budget, sample_post,
+                    extra_args=("--threaded",), endpoints=False,
+                    throughput_s=args.throughput, clients=args.clients
+                )
+        result["memory"]["max_rss_mb"] = max_rss_mb()
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+# ========== 回归检查 ==========
+
+def _unit(key: str) -> Optional[str]:
+    if key.endswith("_ms"):
+        return "ms"
+    if key.endswith("_mb"):
+        return "mb"
+    if key.endswith("per_s"):
+        return "per_s"
+    if key.endswith("_s"):
+        return "s"
+    return None
+
+
+def flatten(report: Dict[str, Any]) -> Dict[str, float]:
+    """把结果展开为 {"100000.reads.get_stats.p95_ms": 1.2} 形式，只保留可比较的数值"""
+    flat = {}
+
+    def walk(prefix: str, value: Any):
+        if isinstance(value, dict):
+            for key, child in value.items():
+                walk(f"{prefix}.{key}" if prefix else str(key), child)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and _unit(prefix):
+            flat[prefix] = float(value)
+
+    walk("", report.get("results", {}))
+    return flat
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """
+    返回超过阈值的回归项
+
+    延迟、耗时和内存越小越好，吞吐（per_s）越大越好；
+    差值低于 NOISE_FLOOR 的波动不计
+    """
+    old, new = flatten(baseline), flatten(current)
+    regressions = []
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key], new[key]
+        unit = _unit(key)
+        if unit == "per_s":
+            worse, delta = after < before * (1 - threshold), before - after
+        else:
+            worse, delta = after > before * (1 + threshold), after - before
+        if worse and delta > NOISE_FLOOR[unit]:
+            change = (after - before) / before if before else float("inf")
+            regressions.append({"metric": key, "baseline": before, "current": after, "change": round(change, 3)})
+    return regressions
+
+
+def check_growth(report: Dict[str, Any], max_growth: float) -> List[Dict[str, Any]]:
+    """
+    比较最小和最大规模下每条入库语句摊到每篇帖子的耗时，返回增长超过 max_growth 倍的语句
+
+    与规模无关的语句应基本持平；按主键查找退化成扫表时耗时随库规模线性增长
+    """
+    sizes = sorted(
+        (int(size), result) for size, result in report.get("results", {}).items()
+        if "ingest" in result
+    )
+    if len(sizes) < 2:
+        return []
+    (small, first), (large, last) = sizes[0], sizes[-1]
+    old = first["ingest"].get("statements", {})
+    new = last["ingest"].get("statements", {})
+    growth = []
+    for name in sorted(new):
+        after = new[name]["per_post_ms"]
+        before = old.get(name, {}).get("per_post_ms", STATEMENT_FLOOR_MS)
+        if after > before * max_growth:
+            growth.append({
+                "metric": f"ingest.statements.{name}.per_post_ms",
+                "baseline": before, "current": after, "sizes": (small, large),
+                "change": round(after / before, 1)
+            })
+    return growth
+
+
+def _report_growth(growth: List[Dict[str, Any]], max_growth: float) -> int:
+    if not growth:
+        print(f"No ingest statement grew more than {max_growth:g}x with database size")
+        return 0
+    print(f"{len(growth)} ingest statement(s) grew more than {max_growth:g}x with database size:")
+    for g in growth:
+        small, large = g["sizes"]
+        print(f"  {g['metric']}: {g['baseline']:g} ms @ {small} -> {g['current']:g} ms @ {large} ({g['change']:g}x)")
+    return 1
+
+
+def _report_regressions(regressions: List[Dict[str, Any]], threshold: float) -> int:
+    if not regressions:
+        print(f"No regressions above {threshold:.0%}")
+        return 0
+    print(f"{len(regressions)} regression(s) above {threshold:.0%}:")
+    for r in regressions:
+        print(f"  {r['metric']}: {r['baseline']:g} -> {r['current']:g} ({r['change']:+.1%})")
+    return 1
+
+
+def _metadata() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=str(BACKEND_DIR),
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    try:
+        import kuzu
+        kuzu_version = kuzu.__version__
+    except (ImportError, AttributeError):
+        kuzu_version = None
+    return {
+        "createdAt": datetime.now().isoformat(),
+        "commit": commit,
+        "python": platform_info.python_version(),
+        "kuzu": kuzu_version,
+        "platform": platform_info.platform(),
+        "cpus": os.cpu_count()
+    }
+
+
+# ========== CLI ==========
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Social Scraper backend benchmarks")
+    sub = parser.add_subparsers(dest="action", required=True)
+
+    run = sub.add_parser("run", help="Run benchmarks for one or more dataset sizes")
+    run.add_argument("--sizes", default="10k,100k,1m", help="Comma separated post counts, e.g. 10k,100k,1m")
+    run.add_argument("--output", default="benchmark-results.json", help="JSON results path")
+    run.add_argument("--seed", type=int, default=42)
+    run.add_argument("--repeat", type=int, default=50, help="Max calls per read method / endpoint")
+    run.add_argument("--budget", type=float, default=10.0, help="Max seconds per read method / endpoint")
+    run.add_argument("--ingest-posts", type=int, default=2000, help="Posts ingested per batch size")
+    run.add_argument("--server", choices=["lite", "full", "minimal", "none"], default="lite",
+                     help="Server variant for HTTP benchmarks")
+    run.add_argument("--throughput", type=float, default=3.0,
+                     help="Seconds per HTTP throughput measurement (0 to skip)")
+    run.add_argument("--clients", type=int, default=8, help="Concurrent clients for HTTP throughput")
+    run.add_argument("--workdir", default=None, help="Parent directory for temporary databases")
+    run.add_argument("--keep", action="store_true", help="Keep generated databases")
+    run.add_argument("--baseline", help="Compare against an earlier results file")
+    run.add_argument("--threshold", type=float, default=0.2, help="Relative regression threshold")
+    run.add_argument("--max-growth", type=float, default=3.0,
+                     help="Max growth of per-post ingest statement cost from the smallest to the largest size "
+                          "(0 to skip)")
+    # 单个规模在独立子进程中运行，内存峰值互不影响
+    run.add_argument("--single", type=int, help=argparse.SUPPRESS)
+
+    cmp_parser = sub.add_parser("compare", help="Compare two results files")
+    cmp_parser.add_argument("baseline")
+    cmp_parser.add_argument("current")
+    cmp_parser.add_argument("--threshold", type=float, default=0.2)
+
+    args = parser.parse_args()
+
+    if args.action == "compare":
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.current, encoding="utf-8") as f:
+            current = json.load(f)
+        sys.exit(_report_regressions(compare(baseline, current, args.threshold), args.threshold))
+
+    if args.single is not None:
+        logger.remove()
+        logger.add(sys.stderr, level="WARNING")
+        print(json.dumps(bench_size(args.single, args), default=str))
+        return
+
+    report = {"meta": _metadata(), "config": {
+        "seed": args.seed, "repeat": args.repeat, "budget": args.budget,
+        "ingestPosts": args.ingest_posts, "server": args.server,
+        "throughput": args.throughput, "clients": args.clients
+    }, "results": {}}
+    for size in (corpus.parse_count(s) for s in args.sizes.split(",") if s.strip()):
+        print(f"[INFO] Benchmarking {size} posts...")
+        command = [sys.executable, __file__, "run", "--single", str(size)] + [
+            arg for arg in sys.argv[2:] if not arg.startswith("--single")
+        ]
+        completed = subprocess.run(command, cwd=str(BACKEND_DIR), capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr[-2000:])
+            report["results"][str(size)] = {"error": f"exit code {completed.returncode}"}
+            continue
+        report["results"][str(size)] = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(f"[OK] {size} posts done")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    print(f"[OK] Results written to {args.output}")
+
+    status = 0
+    if args.max_growth > 0:
+        status |= _report_growth(check_growth(report, args.max_growth), args.max_growth)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        status |= _report_regressions(compare(baseline, report, args.threshold), args.threshold)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
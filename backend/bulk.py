@@ -0,0 +1,113 @@
+"""
+Social Scraper Bulk Loading
+通过 Kuzu COPY FROM 批量写入
+
+Kuzu 中 UNWIND + MATCH 按主键建边时，每行都要扫描端点表，
+开销随表规模线性增长；COPY 直接走主键索引，耗时基本与表规模无关。
+
+使用限制（Kuzu 0.5）：
+- COPY 只能在自动事务模式下执行，不能放进显式事务
+- COPY 会触发检查点，而检查点会把本次打开数据库后经 CREATE/MERGE
+  追加到已有数据的表中的行的字符串列写坏。因此 COPY 只用于迁移和离线
+  导入这类"打开库后只做 COPY 和 DELETE"的场景，入库路径节点用 UNWIND、边逐条建（见 entities.py）
+- 检查点向已有数据、主键为字符串的节点表追加不足一个向量（2048 行）的行时
+  （无论行来自 COPY 还是 CREATE），有时整批都会被写成最后一行的副本；
+  追加导入时小批量改用 UNWIND CREATE，并且之后不再 COPY
+"""
+
+import csv
+import os
+import tempfile
+from datetime import datetime
+from typing import Dict, Any, Iterable, Optional, Sequence
+
+# 向非空节点表 COPY 追加时每批至少的行数（见上）
+MIN_APPEND_ROWS = 2048
+
+
+def _cell(value: Any) -> Any:
+    if value is None:
+        return ""  # Kuzu 把空字段读为 NULL
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+def _posix_path(path: str) -> str:
+    """Kuzu 的路径字面量里反斜杠需要转义，统一用正斜杠"""
+    return path.replace("\\", "/").replace("'", "\\'")
+
+
+class CsvSpool:
+    """
+    边扫描边把行追加到临时 CSV，扫描结束后一次 COPY
+
+    columns 须与表定义的列顺序一致；关系表前两列为 FROM / TO 节点主键
+    """
+
+    def __init__(self, table: str, columns: Sequence[str], tmp_dir: Optional[str] = None):
+        self.table = table
+        self.columns = tuple(columns)
+        self.count = 0
+        if tmp_dir:
+            os.makedirs(tmp_dir, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix=f"{table.lower()}-", suffix=".csv", dir=tmp_dir)
+        self._file = os.fdopen(fd, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+
+    def write(self, rows: Iterable[Dict[str, Any]]):
+        for row in rows:
+            self._writer.writerow([_cell(row.get(column)) for column in self.columns])
+            self.count += 1
+
+    def copy(self, conn) -> int:
+        """COPY 进表并删除临时文件，返回行数"""
+        try:
+            self._file.close()
+            if self.count:
+                copy_file(conn, self.table, self.path)
+        finally:
+            self.discard()
+        return self.count
+
+    def discard(self):
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def write_csv(path: str, rows: Iterable[Dict[str, Any]], columns: Sequence[str]) -> int:
+    """把 rows 按 columns 顺序写成无表头 CSV（可直接 COPY），返回行数"""
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        for row in rows:
+            writer.writerow([_cell(row.get(column)) for column in columns])
+            count += 1
+    return count
+
+
+def copy_file(conn, table: str, path: str):
+    """COPY 一个无表头 CSV 或 Parquet 文件（按扩展名区分）进 table"""
+    options = "" if path.endswith(".parquet") else " (HEADER=false)"
+    conn.execute(f"COPY {table} FROM '{_posix_path(path)}'{options}")
+
+
+def copy_rows(
+    conn,
+    table: str,
+    rows: Iterable[Dict[str, Any]],
+    columns: Sequence[str],
+    tmp_dir: Optional[str] = None
+) -> int:
+    """把 rows 写成临时 CSV 后 COPY 进 table（注意模块说明中的使用限制）"""
+    spool = CsvSpool(table, columns, tmp_dir)
+    try:
+        spool.write(rows)
+    except Exception:
+        spool.discard()
+        raise
+    return spool.copy(conn)
@@ -0,0 +1,527 @@
+"""
+Social Scraper Cleanup Engine
+把 CleanupRule 编译成参数化的批量语句，并在后台按规则间隔分片执行
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from loguru import logger
+
+from database import SocialScraperKG
+import metrics
+
+
+DEFAULT_INTERVAL_MINUTES = 60
+
+# 每次候选查询取出的行数
+CANDIDATE_ROWS = 1000
+
+
+# ========== 规则编译 ==========
+
+@dataclass(frozen=True)
+class TargetSpec:
+    """可清理的节点表"""
+    label: str
+    time_column: str
+    columns: Tuple[str, ...]
+    score_column: Optional[str] = None
+    score_type: type = float
+
+
+TARGETS: Dict[str, TargetSpec] = {
+    "Post": TargetSpec(
+        label="Post",
+        time_column="scrapedAt",
+        score_column="score",
+        score_type=int,
+        columns=("id", "platform", "author", "authorDisplayName", "content", "title",
+                 "url", "timestamp", "score", "replies", "raw", "scrapedAt", "metadata")
+    ),
+    "FilteredPost": TargetSpec(
+        label="FilteredPost",
+        time_column="filteredAt",
+        score_column="relevanceScore",
+        columns=("id", "postId", "relevanceScore", "category", "subCategory",
+                 "reason", "summary", "keywords", "filteredAt")
+    ),
+    "DiscoveryResult": TargetSpec(
+        label="DiscoveryResult",
+        time_column="analyzedAt",
+        columns=("id", "postId", "sentiment", "kolProfile", "trendData",
+                 "alertTrigger", "analyzedAt")
+    ),
+    "ArchivedPost": TargetSpec(
+        label="ArchivedPost",
+        time_column="archivedAt",
+        columns=("id", "originalId", "platform", "author", "content",
+                 "archivedAt", "reason", "metadata")
+    ),
+}
+
+# 条件：返回 WHERE 片段和参数
+CONDITIONS = {
+    "age_days": lambda spec, threshold: (
+        f"n.{spec.time_column} < $cutoff",
+        {"cutoff": datetime.now() - timedelta(days=threshold)}
+    ),
+    "relevance_below": lambda spec, threshold: (
+        f"n.{spec.score_column} < $threshold",
+        {"threshold": spec.score_type(threshold)}
+    ),
+    "score_below": lambda spec, threshold: (
+        f"n.{spec.score_column} < $threshold",
+        {"threshold": spec.score_type(threshold)}
+    ),
+}
+
+# 只能作用于带分数列的表
+SCORE_CONDITIONS = {"relevance_below", "score_below"}
+
+EXPORT_FORMATS = ("jsonl", "parquet")
+
+
+class RuleCompileError(ValueError):
+    """规则无法编译"""
+
+
+class ExportSink:
+    """流式导出：每个分片追加写入，规则结束时关闭"""
+
+    def __init__(self, path: Path, fmt: str, columns: Tuple[str, ...]):
+        self.path = path
+        self.format = fmt
+        self.columns = columns
+        self.rows = 0
+        self._file = None
+        self._writer = None
+
+    def write(self, rows: List[list]):
+        if not rows:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.format == "jsonl":
+            if self._file is None:
+                self._file = gzip.open(self.path, "wt", encoding="utf-8")
+            for row in rows:
+                record = dict(zip(self.columns, row))
+                self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        else:
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise RuntimeError("Parquet export requires pyarrow: pip install pyarrow")
+            table = pa.Table.from_pylist([
+                {column: _plain(value) for column, value in zip(self.columns, row)}
+                for row in rows
+            ])
+            if self._writer is None:
+                # 首批全为空的列推断不出类型，按字符串处理
+                schema = pa.schema([
+                    pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f
+                    for f in table.schema
+                ])
+                self._writer = pq.ParquetWriter(str(self.path), schema, compression="zstd")
+            self._writer.write_table(table.cast(self._writer.schema))
+        self.rows += len(rows)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def _plain(value):
+    """Parquet 不接受混合类型，时间统一转为字符串"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class CompiledRule:
+    """
+    编译后的清理规则
+
+    候选查询按时间顺序一次取出一批 id（全表扫描的开销分摊到多个分片），
+    分片再逐行按主键处理：按主键匹配走索引，耗时与表规模基本无关，
+    而 WHERE n.id IN $ids 每次都要扫描整张表。逐行语句重新检查条件，
+    取出后不再满足条件的行跳过
+    """
+
+    def __init__(self, rule: Dict[str, Any], export_dir: Path):
+        self.rule = rule
+        self.rule_id = rule["id"]
+
+        self.spec = TARGETS.get(rule["targetType"])
+        if self.spec is None:
+            raise RuleCompileError(f"Unsupported targetType: {rule['targetType']}")
+
+        condition = CONDITIONS.get(rule["condition"])
+        if condition is None:
+            raise RuleCompileError(f"Unsupported condition: {rule['condition']}")
+        if rule["condition"] in SCORE_CONDITIONS and self.spec.score_column is None:
+            raise RuleCompileError(f"{rule['targetType']} has no score column for {rule['condition']}")
+        self.where, self.params = condition(self.spec, rule["threshold"])
+
+        # action: archive / delete / export[:jsonl|:parquet]
+        action, _, fmt = rule["action"].partition(":")
+        self.action = action
+        self.sink: Optional[ExportSink] = None
+        if action == "archive":
+            if self.spec.label != "Post":
+                raise RuleCompileError("archive is only supported for Post, use export instead")
+        elif action == "export":
+            fmt = fmt or "jsonl"
+            if fmt not in EXPORT_FORMATS:
+                raise RuleCompileError(f"Unsupported export format: {fmt}")
+            suffix = ".jsonl.gz" if fmt == "jsonl" else ".parquet"
+            stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            path = export_dir / f"{self.spec.label}_{self.rule_id}_{stamp}{suffix}"
+            self.sink = ExportSink(path, fmt, self.spec.columns)
+        elif action != "delete":
+            raise RuleCompileError(f"Unsupported action: {rule['action']}")
+
+        label, order = self.spec.label, self.spec.time_column
+        self.count_query = f"MATCH (n:{label}) WHERE {self.where} RETURN count(n)"
+        self._candidates = (
+            f"MATCH (n:{label}) WHERE {self.where} "
+            f"WITH n ORDER BY n.{order} LIMIT {CANDIDATE_ROWS} RETURN n.id"
+        )
+        row = f"MATCH (n:{label} {{id: $id}}) WHERE {self.where}"
+        self._delete_row = f"{row} DETACH DELETE n RETURN n.id"
+        self._archive_row = f"""
+            {row}
+            MERGE (ap:ArchivedPost {{id: concat('archived_', n.id)}})
+            ON CREATE SET ap.originalId = n.id,
+                          ap.platform = n.platform,
+                          ap.author = n.author,
+                          ap.content = n.content,
+                          ap.archivedAt = $archivedAt,
+                          ap.reason = $reason,
+                          ap.metadata = n.metadata
+            RETURN n.id
+            """
+        self._export_row = f"{row} RETURN " + ", ".join(f"n.{column}" for column in self.spec.columns)
+        self._drop_row = f"MATCH (n:{label} {{id: $id}}) DETACH DELETE n"
+        self._pending: List[str] = []
+        self._exhausted = False
+
+    @property
+    def done(self) -> bool:
+        return self._exhausted and not self._pending
+
+    def count(self, kg: SocialScraperKG) -> int:
+        """Dry run 行数"""
+        result = kg.conn.execute(self.count_query, self.params)
+        return result.get_next()[0] if result.has_next() else 0
+
+    def run_slice(self, kg: SocialScraperKG, limit: int) -> List[str]:
+        """处理最多 limit 个候选行，返回实际处理的 id（内存索引由调用方清理，见 forget）"""
+        if not self._pending and not self._exhausted:
+            self._pending = [row[0] for row in self._rows(kg, self._candidates, self.params)]
+            self._exhausted = len(self._pending) < CANDIDATE_ROWS
+        batch, self._pending = self._pending[:limit], self._pending[limit:]
+
+        if self.action == "delete":
+            return [
+                row[0] for row_id in batch
+                for row in self._rows(kg, self._delete_row, dict(self.params, id=row_id))
+            ]
+
+        if self.action == "archive":
+            params = dict(self.params, archivedAt=datetime.now(),
+                          reason=f"Rule {self.rule_id}: {self.rule['condition']} {self.rule['threshold']}")
+            ids = [
+                row[0] for row_id in batch
+                for row in self._rows(kg, self._archive_row, dict(params, id=row_id))
+            ]
+        else:
+            rows = [
+                row for row_id in batch
+                for row in self._rows(kg, self._export_row, dict(self.params, id=row_id))
+            ]
+            # 先落盘再删除
+            self.sink.write(rows)
+            ids = [row[0] for row in rows]
+
+        for row_id in ids:
+            kg.conn.execute(self._drop_row, {"id": row_id})
+        return ids
+
+    @staticmethod
+    def _rows(kg: SocialScraperKG, query: str, params: Dict[str, Any]) -> List[list]:
+        result = kg.conn.execute(query, params)
+        rows = []
+        while result.has_next():
+            rows.append(result.get_next())
+        return rows
+
+    def forget(self, kg: SocialScraperKG, ids: List[str]):
+        """从入库用的内存索引中移除已处理的帖子"""
+        if self.spec.label == "Post" and ids:
+            kg.forget_posts(ids)
+
+    def close(self) -> Optional[str]:
+        """结束规则，返回导出文件路径"""
+        if self.sink is None:
+            return None
+        self.sink.close()
+        return str(self.sink.path) if self.sink.rows else None
+
+
+def default_export_dir(kg: SocialScraperKG) -> Path:
+    return Path(os.getenv("CLEANUP_EXPORT_DIR", str(kg.db_path.parent / "exports")))
+
+
+async def estimate_rule(kg: SocialScraperKG, rule: Dict[str, Any]) -> Optional[int]:
+    """Dry run - 用聚合查询统计规则会影响的行数，不修改数据"""
+    try:
+        return CompiledRule(rule, default_export_dir(kg)).count(kg)
+    except RuleCompileError as e:
+        logger.warning(f"Cleanup rule {rule['id']} skipped: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Failed to estimate cleanup rule {rule['id']}: {e}")
+        return None
+
+
+# ========== 调度 ==========
+
+class CleanupScheduler:
+    """
+    清理调度器
+
+    每个 tick 只在 slice_budget_ms 时间预算内执行分片，分片行数从 1 行开始，
+    按实测吞吐自适应（不超过 max_slice_rows）。规则处理完毕后更新
+    CleanupRule.lastRun，下次按 intervalMinutes 再执行。
+
+    分片在工作线程中执行，不占用事件循环；lock 为访问数据库时持有的锁
+    （轻量版服务的数据库锁），只在每个分片和读写规则期间持有。
+    """
+
+    def __init__(
+        self,
+        kg: SocialScraperKG,
+        max_slice_rows: int = 500,
+        slice_budget_ms: float = 50.0,
+        poll_interval: float = 5.0,
+        busy_interval: float = 0.5,
+        lock=None
+    ):
+        self.kg = kg
+        self.max_slice_rows = max_slice_rows
+        self.slice_budget_ms = slice_budget_ms
+        self.poll_interval = poll_interval
+        self.busy_interval = busy_interval
+        self.lock = lock or nullcontext()
+
+        self.export_dir = default_export_dir(kg)
+
+        self._rows_per_ms: Dict[str, float] = {}
+        self._forced: set = set()
+        self._progress: Dict[str, Dict[str, Any]] = {}
+        self._reports: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._slice: Optional[asyncio.Future] = None
+        self._stopping = False
+        metrics.QUEUE_DEPTH.set_function(
+            lambda: {("cleanup_rules",): len(self._forced | set(self._progress))}, source="cleanup"
+        )
+
+    def _is_due(self, rule: Dict[str, Any], now: datetime) -> bool:
+        if rule["id"] in self._forced or rule["id"] in self._progress:
+            return True
+        if rule.get("lastRun") is None:
+            return True
+        interval = rule.get("intervalMinutes") or DEFAULT_INTERVAL_MINUTES
+        return now - rule["lastRun"] >= timedelta(minutes=interval)
+
+    def trigger(self, rule_ids: List[str]):
+        """标记规则立即执行（下一个 tick 开始处理）"""
+        self._forced.update(rule_ids)
+
+    async def tick(self) -> bool:
+        """
+        执行一个时间片
+
+        返回 True 表示还有未完成的工作
+        """
+        deadline = time.perf_counter() + self.slice_budget_ms / 1000
+        now = datetime.now()
+        with self.lock:
+            rules = await self.kg.get_cleanup_rules(enabled_only=True)
+        due = [rule for rule in rules if self._is_due(rule, now)]
+
+        for rule in due:
+            progress = self._progress.get(rule["id"])
+            if progress is None:
+                try:
+                    compiled = CompiledRule(rule, self.export_dir)
+                except RuleCompileError as e:
+                    logger.warning(f"Cleanup rule {rule['id']} skipped: {e}")
+                    self._reports[rule["id"]] = {"error": str(e), "finishedAt": now.isoformat()}
+                    with self.lock:
+                        await self.kg.mark_cleanup_rule_run(rule["id"])
+                    self._forced.discard(rule["id"])
+                    continue
+                progress = self._progress[rule["id"]] = {
+                    "compiled": compiled,
+                    "affected": 0,
+                    "slices": 0,
+                    "elapsed": 0.0,
+                    "startedAt": now
+                }
+
+            while not self._stopping and time.perf_counter() < deadline:
+                limit = self._slice_rows(rule["id"])
+                started = time.perf_counter()
+                try:
+                    affected = await self._run_slice(progress["compiled"], limit)
+                except Exception as e:
+                    await self._finish_rule(rule, progress, error=str(e))
+                    break
+                elapsed = time.perf_counter() - started
+                self._observe(rule["id"], affected, elapsed)
+                progress["affected"] += affected
+                progress["slices"] += 1
+                progress["elapsed"] += elapsed
+                if progress["compiled"].done:
+                    await self._finish_rule(rule, progress)
+                    break
+            else:
+                return True
+
+        return False
+
+    async def _run_slice(self, compiled: CompiledRule, limit: int) -> int:
+        """在工作线程中持锁执行分片，再在当前线程清理内存索引（入库也在这里访问它们）"""
+        def run():
+            with self.lock:
+                # close 之后导出文件已关闭，不再执行
+                if self._stopping:
+                    return []
+                return compiled.run_slice(self.kg, limit)
+
+        # shield：停止调度时等分片执行完再关闭导出文件
+        self._slice = asyncio.get_running_loop().run_in_executor(None, run)
+        ids = await asyncio.shield(self._slice)
+        self._slice = None
+        with self.lock:
+            compiled.forget(self.kg, ids)
+        return len(ids)
+
+    def _slice_rows(self, rule_id: str) -> int:
+        """按实测吞吐估算能在一个时间片内完成的行数，没有实测值时只处理 1 行"""
+        rate = self._rows_per_ms.get(rule_id)
+        if rate is None:
+            return 1
+        return max(1, min(self.max_slice_rows, int(rate * self.slice_budget_ms)))
+
+    def _observe(self, rule_id: str, rows: int, elapsed: float):
+        if rows <= 0:
+            return
+        rate = rows / max(elapsed * 1000, 0.001)
+        previous = self._rows_per_ms.get(rule_id)
+        self._rows_per_ms[rule_id] = rate if previous is None else 0.5 * previous + 0.5 * rate
+
+    async def _finish_rule(self, rule: Dict[str, Any], progress: Dict[str, Any], error: Optional[str] = None):
+        output = progress["compiled"].close()
+        with self.lock:
+            await self.kg.mark_cleanup_rule_run(rule["id"])
+        self._forced.discard(rule["id"])
+        self._progress.pop(rule["id"], None)
+
+        report = {
+            "targetType": rule["targetType"],
+            "action": rule["action"],
+            "affected": progress["affected"],
+            "slices": progress["slices"],
+            "elapsedMs": round(progress["elapsed"] * 1000, 1),
+            "finishedAt": datetime.now().isoformat()
+        }
+        if output:
+            report["output"] = output
+        if error:
+            report["error"] = error
+            logger.error(f"Cleanup rule {rule['id']} failed after {progress['affected']} rows: {error}")
+        else:
+            logger.info(
+                f"Cleanup rule {rule['id']} finished: {progress['affected']} rows "
+                f"in {progress['slices']} slices, {report['elapsedMs']}ms"
+            )
+        self._reports[rule["id"]] = report
+
+    async def run_forever(self):
+        """调度循环"""
+        logger.info("Cleanup scheduler started")
+        while not self._stopping:
+            try:
+                busy = await self.tick()
+            except Exception as e:
+                logger.error(f"Cleanup tick failed: {e}")
+                busy = False
+            # 还有剩余工作时只让出较短时间，给写入请求留出空隙
+            await asyncio.sleep(self.busy_interval if busy else self.poll_interval)
+        logger.info("Cleanup scheduler stopped")
+
+    def start(self) -> asyncio.Task:
+        """在当前事件循环中启动调度"""
+        self._stopping = False
+        self._task = asyncio.create_task(self.run_forever())
+        return self._task
+
+    async def stop(self):
+        """停止调度"""
+        self._stopping = True
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._slice is not None:
+            await asyncio.wait([self._slice])
+            self._slice = None
+        self.close()
+
+    def close(self):
+        """
+        关闭未完成规则的导出文件（写入结尾），之后不再执行分片
+
+        不在事件循环中运行调度时（轻量版）由调用方持有数据库锁调用，保证没有分片在执行
+        """
+        self._stopping = True
+        for progress in self._progress.values():
+            progress["compiled"].close()
+        self._progress.clear()
+
+    def status(self) -> Dict[str, Any]:
+        """调度状态"""
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "pending": sorted(self._forced),
+            "in_progress": {
+                rule_id: {
+                    "affected": p["affected"],
+                    "slices": p["slices"],
+                    "elapsedMs": round(p["elapsed"] * 1000, 1),
+                    "startedAt": p["startedAt"].isoformat()
+                }
+                for rule_id, p in self._progress.items()
+            },
+            "last_runs": self._reports
+        }
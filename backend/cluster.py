@@ -0,0 +1,341 @@
+"""
+Social Scraper Cluster Mode
+单写多读部署：一个写进程负责入库和清理，N 个读进程以只读方式服务查询
+
+Kuzu 同一时刻只允许一个进程以读写方式打开数据库，而且读写进程持有排他文件锁，
+只读进程无法与它同时打开同一目录。因此写进程定期把数据库目录发布为快照：
+
+    <db-path>.snapshots/
+        CURRENT                 当前快照名
+        20261019-101500-000001/ 快照（未变化的文件与上一代硬链接，只复制有变化的文件）
+
+- 写进程（SERVER_ROLE=writer）每 SNAPSHOT_INTERVAL 秒检查一次，数据库文件有变化时
+  发布新快照。检查点会重写数据文件，快照随之要复制整个数据文件（文件系统支持 reflink
+  时是写时复制，几乎不花时间；不支持时是完整复制，会警告），因此自动检查点开启时
+  （Kuzu >= 0.6）只在 WAL 超过 SNAPSHOT_CHECKPOINT_MB 时才在发布前 CHECKPOINT，其余
+  发布只复制 WAL、数据文件硬链接上一代，读进程打开时回放这段 WAL。
+  关闭自动检查点时（Kuzu 0.5，见 database.py）快照带着完整 WAL，读进程打开时回放。
+  快照的复制和清单见 backup.py，写入只在最后补复制 WAL 尾部时暂停
+- 读进程（SERVER_ROLE=reader，uvicorn --workers N 共享监听端口）只读打开 CURRENT 指向的
+  快照，检测到新快照后打开新库再切换，旧库延迟关闭
+- 路由进程把写请求和依赖写进程内存状态的 GET（趋势、相似帖子、事件流、指标等）
+  转发给写进程，其余 GET 转发给读进程池；读进程不可用时退回写进程
+
+读进程看到的数据比写进程滞后最多 SNAPSHOT_INTERVAL + SNAPSHOT_POLL 秒。
+
+用法：
+    python cluster.py --port 8769 --readers 4 --db-path ./data/knowledge_graph
+"""
+
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from loguru import logger
+
+from database import SocialScraperKG
+import backup
+
+CURRENT = backup.CURRENT
+
+# 没有 reflink 时一次快照完整复制超过该大小就警告（只警告一次）
+FULL_COPY_WARN_BYTES = 64 * 1024 * 1024
+
+# 这些 GET 依赖写进程的内存状态或只在写进程上有意义
+WRITER_PATHS = {
+    "/health",
+    "/metrics",
+    "/debug/slow-queries",
+    "/api/trends",
+    "/api/events/stream",
+    "/api/cleanup/status",
+    "/api/snapshots",
+}
+
+
+def snapshot_root(db_path: str) -> Path:
+    """快照目录，KUZU_SNAPSHOT_DIR 可覆盖"""
+    path = Path(db_path)
+    return Path(os.getenv("KUZU_SNAPSHOT_DIR") or path.parent / f"{path.name}.snapshots")
+
+
+class SnapshotPublisher:
+    """
+    写进程中定期发布数据库快照
+
+    publish 在启动时同步调用；定期发布用 publish_async：复制放到线程中，检查点和补复制在循环中
+    同步执行。lock 是与清理分片线程共用的数据库锁（见 cleanup.py），检查点和补复制期间持有。
+    WAL 不小于 checkpoint_mb 时才在发布前检查点
+    """
+
+    def __init__(
+        self,
+        kg: SocialScraperKG,
+        root: Path,
+        interval: float = 10.0,
+        keep: int = 3,
+        lock=None,
+        checkpoint_mb: float = 8.0
+    ):
+        self.kg = kg
+        self.root = Path(root)
+        self.interval = interval
+        self.keep = keep
+        self.lock = lock
+        self.checkpoint_bytes = int(checkpoint_mb * 1024 * 1024)
+        self.published = 0
+        self._warned = False
+        self._task: Optional[asyncio.Task] = None
+
+    def _checkpoint(self):
+        if not self.kg.auto_checkpoint:
+            return
+        wal = Path(self.kg.db_path) / backup.WAL
+        if wal.exists() and wal.stat().st_size >= self.checkpoint_bytes:
+            self.kg.conn.execute("CHECKPOINT")
+
+    def _published(self, result: Dict[str, Any]) -> Optional[Path]:
+        if result.get("unchanged"):
+            return None
+        self.published += 1
+        copied = result.get("copied_bytes", 0)
+        if not self._warned and not result.get("reflinked_files") and copied >= FULL_COPY_WARN_BYTES:
+            self._warned = True
+            logger.warning(
+                f"Snapshot {result['name']} fully copied {copied / 1e6:.0f} MB: {self.root} does not support "
+                f"reflink, every checkpoint copies the whole data file. Put snapshots on Btrfs / XFS "
+                f"(KUZU_SNAPSHOT_DIR, same filesystem as the database) or raise SNAPSHOT_CHECKPOINT_MB / SNAPSHOT_INTERVAL"
+            )
+        return self.root / result["name"]
+
+    def publish(self) -> Optional[Path]:
+        """数据库文件有变化时发布新快照，返回快照目录（启动时同步调用）"""
+        with self.lock or nullcontext():
+            self._checkpoint()
+        return self._published(
+            backup.take_snapshot(str(self.kg.db_path), self.root, lock=self.lock, checksums=False, keep=self.keep)
+        )
+
+    async def publish_async(self) -> Optional[Path]:
+        """同 publish，复制放到线程中，写入只在补复制 WAL 尾部时暂停（见 backup.py）"""
+        with self.lock or nullcontext():
+            self._checkpoint()
+        return self._published(
+            await backup.take_snapshot_async(
+                str(self.kg.db_path), self.root, lock=self.lock, checksums=False, keep=self.keep
+            )
+        )
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.publish_async()
+            except Exception as e:
+                logger.error(f"Failed to publish snapshot: {e}")
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+class SnapshotWatcher:
+    """读进程中跟踪 CURRENT，发现新快照后打开并切换"""
+
+    def __init__(self, root: Path, poll: float = 1.0, grace: float = 5.0):
+        self.root = Path(root)
+        self.poll = poll
+        self.grace = grace
+        self.kg: Optional[SocialScraperKG] = None
+        self.name: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def current(self) -> Optional[str]:
+        try:
+            return (self.root / CURRENT).read_text(encoding="utf-8").strip() or None
+        except OSError:
+            return None
+
+    async def _open(self, name: str) -> SocialScraperKG:
+        kg = SocialScraperKG(str(self.root / name), read_only=True)
+        # 打开时要回放 WAL，放到线程里避免阻塞事件循环
+        await asyncio.get_running_loop().run_in_executor(None, asyncio.run, kg.init())
+        return kg
+
+    async def open_latest(self, timeout: float = 120.0) -> SocialScraperKG:
+        """等待写进程发布第一个快照并打开"""
+        deadline = time.monotonic() + timeout
+        while (name := self.current()) is None:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"No snapshot published under {self.root}")
+            await asyncio.sleep(self.poll)
+        self.kg = await self._open(name)
+        self.name = name
+        return self.kg
+
+    async def run(self, on_swap: Callable[[SocialScraperKG], None]):
+        while True:
+            await asyncio.sleep(self.poll)
+            name = self.current()
+            if name is None or name == self.name:
+                continue
+            try:
+                kg = await self._open(name)
+            except Exception as e:
+                logger.error(f"Failed to open snapshot {name}: {e}")
+                continue
+            old, self.kg, self.name = self.kg, kg, name
+            on_swap(kg)
+            logger.info(f"Switched to snapshot {name}")
+            if old is not None:
+                asyncio.get_running_loop().call_later(self.grace, lambda db=old: asyncio.ensure_future(db.close()))
+
+    def start(self, on_swap: Callable[[SocialScraperKG], None]):
+        self._task = asyncio.get_running_loop().create_task(self.run(on_swap))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.kg is not None:
+            await self.kg.close()
+
+
+def routes_to_writer(method: str, path: str) -> bool:
+    if method not in ("GET", "HEAD", "OPTIONS"):
+        return True
+    return path in WRITER_PATHS or (path.startswith("/api/posts/") and path.endswith("/related"))
+
+
+class Router:
+    """
+    按请求行把连接转发给写进程或读进程池
+
+    每个连接只转发一个请求：请求头改写为 Connection: close，上游响应后两端一起关闭
+    """
+
+    def __init__(self, writer: Tuple[str, int], reader: Tuple[str, int]):
+        self.writer = writer
+        self.reader = reader
+
+    async def _pipe(self, source: asyncio.StreamReader, sink: asyncio.StreamWriter):
+        try:
+            while chunk := await source.read(65536):
+                sink.write(chunk)
+                await sink.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+    async def handle(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter):
+        upstream_writer = None
+        try:
+            head = await client_reader.readuntil(b"\r\n\r\n")
+            request_line, _, header_block = head[:-4].partition(b"\r\n")
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            path = urlsplit(target).path
+
+            upstreams = [self.writer] if routes_to_writer(method, path) else [self.reader, self.writer]
+            for host, port in upstreams:
+                try:
+                    upstream_reader, upstream_writer = await asyncio.open_connection(host, port)
+                    break
+                except OSError:
+                    continue
+            else:
+                client_writer.write(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                await client_writer.drain()
+                return
+
+            headers = [
+                line for line in header_block.split(b"\r\n")
+                if line and not line.lower().startswith(b"connection:")
+            ]
+            upstream_writer.write(b"\r\n".join([request_line, *headers, b"Connection: close", b"", b""]))
+            request_body = asyncio.ensure_future(self._pipe(client_reader, upstream_writer))
+            await self._pipe(upstream_reader, client_writer)
+            request_body.cancel()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, ConnectionError):
+            pass
+        finally:
+            for writer in (upstream_writer, client_writer):
+                if writer is not None:
+                    writer.close()
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle, host, port)
+        logger.info(f"Router listening on {host}:{port} (writer {self.writer[1]}, readers {self.reader[1]})")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    """启动写进程、读进程池和路由"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Social Scraper single-writer / multi-reader deployment")
+    parser.add_argument("--host", default="127.0.0.1", help="Router host")
+    parser.add_argument("--port", type=int, default=8769, help="Router port")
+    parser.add_argument("--writer-port", type=int, help="Writer port (default: port + 1)")
+    parser.add_argument("--reader-port", type=int, help="Reader pool port (default: port + 2)")
+    parser.add_argument("--readers", type=int, default=2, help="Reader worker processes")
+    parser.add_argument("--db-path", default="./database/twitter_scraper", help="KuzuDB path")
+    parser.add_argument("--snapshot-interval", type=float, default=10.0, help="Seconds between snapshots")
+    args = parser.parse_args()
+
+    writer_port = args.writer_port or args.port + 1
+    reader_port = args.reader_port or args.port + 2
+    env = {
+        **os.environ,
+        "KUZU_DB_PATH": args.db_path,
+        "SNAPSHOT_INTERVAL": str(args.snapshot_interval),
+    }
+    uvicorn = [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1"]
+    backend_dir = Path(__file__).parent
+    processes = [
+        subprocess.Popen(
+            uvicorn + ["--port", str(writer_port)],
+            cwd=backend_dir,
+            env={**env, "SERVER_ROLE": "writer"}
+        ),
+        subprocess.Popen(
+            uvicorn + ["--port", str(reader_port), "--workers", str(args.readers)],
+            cwd=backend_dir,
+            env={**env, "SERVER_ROLE": "reader"}
+        ),
+    ]
+    router = Router(("127.0.0.1", writer_port), ("127.0.0.1", reader_port))
+    # 作为服务运行时收到 SIGTERM 也要先停掉子进程
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        asyncio.run(router.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        logger.info("Shutting down...")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
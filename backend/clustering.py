@@ -0,0 +1,370 @@
+"""
+Social Scraper Event Clustering
+入库时的在线事件聚类：按内容相似度、共享关键词和时间接近程度把帖子归入活跃事件
+"""
+
+import json
+import math
+import os
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from dedup import tokenize
+from trends import STOP_WORDS, extract_topics
+
+
+MAX_TERMS = 64          # 事件质心保留的词项数
+MAX_KEYWORDS = 24       # 事件参与倒排索引的关键词数
+MAX_CANDIDATES = 50     # 每条帖子最多比较的候选事件数
+MAX_AUTHORS = 1000      # 作者去重集合的上限（超出后只计数）
+
+
+def _terms(text: str) -> Counter:
+    return Counter(
+        t for t in tokenize(text)
+        if t not in STOP_WORDS and (len(t) > 2 or not t.isascii())
+    )
+
+
+def _norm(weights: Dict[str, float]) -> float:
+    return math.sqrt(sum(w * w for w in weights.values()))
+
+
+class ActiveEvent:
+    """内存中的活跃事件：质心、关键词计数和聚合值"""
+
+    __slots__ = (
+        "id", "title", "terms", "keywords", "started_at", "last_at",
+        "post_count", "authors", "author_count", "platforms",
+        "score_sum", "replies_sum", "persisted", "pending", "norm", "top"
+    )
+
+    def __init__(self, event_id: str, title: str, started_at: datetime):
+        self.id = event_id
+        self.title = title
+        self.terms: Dict[str, float] = {}
+        self.keywords: Counter = Counter()
+        self.started_at = started_at
+        self.last_at = started_at
+        self.post_count = 0
+        self.authors: Set[str] = set()
+        self.author_count = 0
+        self.platforms: Set[str] = set()
+        self.score_sum = 0
+        self.replies_sum = 0
+        self.persisted = False
+        # 尚未写入 CONTAINS_POST 的成员 [(post_id, similarity)]
+        self.pending: List[Tuple[str, float]] = []
+        # 质心范数和索引关键词在每次加入帖子后更新，比较时直接使用
+        self.norm = 0.0
+        self.top: Set[str] = set()
+
+    def refresh(self):
+        self.norm = _norm(self.terms)
+        self.top = set(self.top_keywords())
+
+    def top_keywords(self, n: int = MAX_KEYWORDS) -> List[str]:
+        return [k for k, _ in self.keywords.most_common(n)]
+
+    def row(self, status: str = "open") -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "title": self.title,
+            "keywords": self.top_keywords(8),
+            "status": status,
+            "startedAt": self.started_at,
+            "lastPostAt": self.last_at,
+            "postCount": self.post_count,
+            "authorCount": self.author_count,
+            "platforms": sorted(self.platforms),
+            "scoreSum": self.score_sum,
+            "repliesSum": self.replies_sum
+        }
+
+
+class EventClusterer:
+    """
+    在线单遍聚类
+
+    候选事件通过关键词倒排索引查找，每条帖子只与共享关键词的活跃事件比较，
+    代价与活跃事件数相关而与历史帖子总数无关。事件在第二条帖子加入时才落库，
+    避免为孤立帖子建事件；超过 window_hours 没有新帖子的事件关闭。
+    持续有新帖子的话题也只在一个事件里累积 max_age_hours（0 不限制），之后关闭，
+    后续帖子另开新事件，避免一个事件无限增长、永远不关闭。
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.3,
+        window_hours: float = 6.0,
+        max_active: int = 2000,
+        min_posts: int = 2,
+        max_age_hours: float = 48.0,
+        path: Optional[Path] = None
+    ):
+        self.threshold = threshold
+        self.window = window_hours * 3600
+        self.max_age = max_age_hours * 3600
+        self.max_active = max_active
+        self.min_posts = min_posts
+        self.path = path
+
+        self._active: Dict[str, ActiveEvent] = {}
+        self._index: Dict[str, Set[str]] = {}
+        self._stream_time: Optional[datetime] = None
+        self._dirty: Set[str] = set()
+        self._closed: List[str] = []
+        self._final: List[Tuple[Dict[str, Any], List[Tuple[str, float]]]] = []
+        self._last_sweep: Optional[datetime] = None
+
+        self.assigned = 0
+        self.opened = 0
+
+    def __len__(self) -> int:
+        return len(self._active)
+
+    # ========== 聚类 ==========
+
+    def _score(self, event: ActiveEvent, terms: Counter, term_norm: float,
+               keywords: List[str], timestamp: datetime) -> float:
+        """内容余弦 0.6 + 关键词重合 0.4，再按时间间隔衰减"""
+        dot = sum(weight * event.terms.get(term, 0.0) for term, weight in terms.items())
+        cosine = dot / (term_norm * event.norm) if term_norm and event.norm else 0.0
+        top = event.top
+        overlap = len(top.intersection(keywords)) / min(len(keywords), len(top)) if keywords and top else 0.0
+        gap = abs((timestamp - event.last_at).total_seconds())
+        decay = math.exp(-gap / self.window)
+        return (0.6 * cosine + 0.4 * overlap) * decay
+
+    def observe(self, post: Dict[str, Any], timestamp: Optional[datetime] = None) -> Optional[str]:
+        """入库时调用，返回帖子归入的事件 id（孤立帖子返回 None）"""
+        timestamp = timestamp or datetime.now()
+        if self._stream_time is None or timestamp > self._stream_time:
+            self._stream_time = timestamp
+
+        text = f"{post.get('title') or ''} {post.get('content') or ''}"
+        # 话题标签与同名关键词视为同一个词
+        keywords = list(dict.fromkeys(topic.lstrip("#") for _, topic in extract_topics(text)))
+        if not keywords:
+            return None
+        terms = _terms(text)
+        term_norm = _norm(terms)
+
+        shared: Counter = Counter()
+        for keyword in keywords:
+            for event_id in self._index.get(keyword, ()):
+                shared[event_id] += 1
+
+        best, best_score = None, self.threshold
+        for event_id, _ in shared.most_common(MAX_CANDIDATES):
+            event = self._active[event_id]
+            if self.max_age and (timestamp - event.started_at).total_seconds() > self.max_age:
+                continue
+            score = self._score(event, terms, term_norm, keywords, timestamp)
+            if score >= best_score:
+                best, best_score = event, score
+
+        if best is None:
+            content = post.get("title") or post.get("content") or ""
+            best = ActiveEvent(f"event_{uuid.uuid4().hex[:16]}", content[:120], timestamp)
+            self._active[best.id] = best
+            self.opened += 1
+            best_score = 1.0
+        else:
+            self.assigned += 1
+
+        self._join(best, post, terms, keywords, timestamp, best_score)
+        self._expire()
+        return best.id if best.post_count >= self.min_posts else None
+
+    def _join(self, event: ActiveEvent, post: Dict[str, Any], terms: Counter,
+              keywords: List[str], timestamp: datetime, similarity: float):
+        before = event.top
+
+        for term, weight in terms.items():
+            event.terms[term] = event.terms.get(term, 0.0) + weight
+        if len(event.terms) > MAX_TERMS * 2:
+            kept = sorted(event.terms.items(), key=lambda item: item[1], reverse=True)[:MAX_TERMS]
+            event.terms = dict(kept)
+        event.keywords.update(keywords)
+        if len(event.keywords) > MAX_KEYWORDS * 4:
+            event.keywords = Counter(dict(event.keywords.most_common(MAX_KEYWORDS * 2)))
+
+        event.post_count += 1
+        event.last_at = max(event.last_at, timestamp)
+        event.started_at = min(event.started_at, timestamp)
+        author = post.get("author")
+        if author and author not in event.authors:
+            event.author_count += 1
+            if len(event.authors) < MAX_AUTHORS:
+                event.authors.add(author)
+        event.platforms.add(post.get("platform", "twitter"))
+        event.score_sum += post.get("score") or 0
+        event.replies_sum += post.get("replies") or 0
+        event.pending.append((post["id"], round(similarity, 4)))
+        if event.post_count >= self.min_posts:
+            self._dirty.add(event.id)
+
+        event.refresh()
+        after = event.top
+        for keyword in before - after:
+            self._unindex(keyword, event.id)
+        for keyword in after - before:
+            self._index.setdefault(keyword, set()).add(event.id)
+
+    def _unindex(self, keyword: str, event_id: str):
+        ids = self._index.get(keyword)
+        if ids is not None:
+            ids.discard(event_id)
+            if not ids:
+                del self._index[keyword]
+
+    def _close(self, event: ActiveEvent):
+        for keyword in event.top:
+            self._unindex(keyword, event.id)
+        del self._active[event.id]
+        if event.id in self._dirty:
+            # 关闭前还有未写入的变更，随关闭状态一并写入
+            self._dirty.discard(event.id)
+            self._final.append((event.row("closed"), event.pending))
+        elif event.persisted:
+            self._closed.append(event.id)
+
+    def _expire(self):
+        """关闭超出时间窗口或存续超过 max_age 的事件；活跃事件过多时关闭最久未更新的"""
+        # 全量扫描活跃事件，按流时间每分钟一次或超出上限时执行
+        if (self._last_sweep is not None and len(self._active) <= self.max_active
+                and (self._stream_time - self._last_sweep).total_seconds() < 60):
+            return
+        self._last_sweep = self._stream_time
+        now = self._stream_time.timestamp()
+        horizon = now - self.window
+        oldest = now - self.max_age if self.max_age else float("-inf")
+        stale, alive = [], []
+        for e in self._active.values():
+            if e.last_at.timestamp() < horizon or e.started_at.timestamp() < oldest:
+                stale.append(e)
+            else:
+                alive.append(e)
+        overflow = len(alive) - self.max_active
+        if overflow > 0:
+            # 一次多关闭 10%，避免每条新帖子都触发全量排序
+            alive.sort(key=lambda e: e.last_at)
+            stale.extend(alive[:overflow + self.max_active // 10])
+        for event in stale:
+            self._close(event)
+
+    # ========== 落库 ==========
+
+    def drain(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[str]]:
+        """取出待写入的变更：(事件行, CONTAINS_POST 行, 已关闭的事件 id)"""
+        changes = [(self._active[event_id].row(), self._active[event_id].pending) for event_id in self._dirty]
+        changes.extend(self._final)
+        events, links = [], []
+        for row, pending in changes:
+            events.append(row)
+            links.extend({"eventId": row["id"], "postId": post_id, "similarity": similarity}
+                         for post_id, similarity in pending)
+        for event_id in self._dirty:
+            self._active[event_id].pending = []
+        drained = (events, links, self._closed)
+        self._dirty, self._closed, self._final = set(), [], []
+        return drained
+
+    def committed(self, event_ids: List[str]):
+        for event_id in event_ids:
+            event = self._active.get(event_id)
+            if event is not None:
+                event.persisted = True
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "active": len(self._active),
+            "persisted": sum(1 for e in self._active.values() if e.persisted),
+            "assigned": self.assigned,
+            "opened": self.opened
+        }
+
+    # ========== 持久化 ==========
+
+    def save(self):
+        if not self.path:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        data = []
+        for e in self._active.values():
+            data.append({
+                "id": e.id, "title": e.title, "terms": e.terms, "keywords": dict(e.keywords),
+                "startedAt": e.started_at.isoformat(), "lastAt": e.last_at.isoformat(),
+                "postCount": e.post_count, "authors": sorted(e.authors), "authorCount": e.author_count,
+                "platforms": sorted(e.platforms), "scoreSum": e.score_sum, "repliesSum": e.replies_sum,
+                "persisted": e.persisted
+            })
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"streamTime": self._stream_time.isoformat() if self._stream_time else None,
+                       "events": data}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def load(self) -> int:
+        if not self.path or not self.path.exists():
+            return 0
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("streamTime"):
+                self._stream_time = datetime.fromisoformat(data["streamTime"])
+            for item in data.get("events", []):
+                event = ActiveEvent(item["id"], item["title"], datetime.fromisoformat(item["startedAt"]))
+                event.terms = item["terms"]
+                event.keywords = Counter(item["keywords"])
+                event.last_at = datetime.fromisoformat(item["lastAt"])
+                event.post_count = item["postCount"]
+                event.authors = set(item["authors"])
+                event.author_count = item["authorCount"]
+                event.platforms = set(item["platforms"])
+                event.score_sum = item["scoreSum"]
+                event.replies_sum = item["repliesSum"]
+                event.persisted = item["persisted"]
+                event.refresh()
+                self._active[event.id] = event
+                for keyword in event.top:
+                    self._index.setdefault(keyword, set()).add(event.id)
+            logger.info(f"Loaded {len(self._active)} active events from {self.path}")
+        except Exception as e:
+            logger.warning(f"Failed to load active events: {e}")
+        return len(self._active)
+
+
+UPSERT_EVENTS = """
+UNWIND $rows AS r
+MERGE (e:Event {id: r.id})
+ON CREATE SET e.createdAt = $now
+SET e.title = r.title,
+    e.keywords = r.keywords,
+    e.status = r.status,
+    e.startedAt = r.startedAt,
+    e.lastPostAt = r.lastPostAt,
+    e.postCount = r.postCount,
+    e.authorCount = r.authorCount,
+    e.platforms = r.platforms,
+    e.scoreSum = r.scoreSum,
+    e.repliesSum = r.repliesSum
+"""
+
+# 逐条执行：UNWIND 之后按主键 MATCH 会对每行扫描 Post 表（见 entities.py）
+LINK_POSTS = """
+MATCH (e:Event {id: $eventId}), (p:Post {id: $postId})
+CREATE (e)-[:CONTAINS_POST {similarity: $similarity, addedAt: $now}]->(p)
+"""
+
+CLOSE_EVENTS = """
+MATCH (e:Event)
+WHERE e.id IN $ids
+SET e.status = 'closed'
+"""
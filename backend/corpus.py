@@ -0,0 +1,564 @@
+"""
+Social Scraper Synthetic Corpus
+确定性的推文 / Reddit 合成语料，用于容量规划和压测
+
+- 负载结构与 BatchPostRequest 一致（posts / filtered / discovery）
+- 中英混合正文，长度按平台取对数正态分布；作者活跃度服从幂律（Zipf）
+- 近重复帖子、转发、回复、话题标签、链接和每 6 小时一轮的突发话题
+- 情感与分类分布可配置
+
+每个批次由 (seed, 批次序号) 单独播种，同一 seed 与 --end 得到逐字节相同的输出，
+任意批次都可独立生成；全程流式，内存占用与总量无关
+
+用法:
+    python corpus.py ndjson --posts 1m --batch-size 100 --output batches.ndjson.gz
+    python corpus.py json --posts 10k --batch-size 100 --output ./batches
+    python corpus.py kuzu --posts 10m --db-path ./database/loadtest
+"""
+
+import gzip
+import json
+import math
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+
+# ========== 词表 ==========
+
+# 分类 id 与扩展 DEFAULT_CATEGORIES 一致
+TOPICS: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    "startup": (
+        ("launch", "startup", "funding", "seed", "round", "MVP", "founder", "product", "waitlist", "pivot", "YC", "beta"),
+        ("创业", "新品", "融资", "发布", "天使轮", "创始人", "产品", "内测", "估值", "团队"),
+    ),
+    "insight": (
+        ("insight", "analysis", "trend", "opinion", "thread", "lesson", "framework", "mental", "model", "takeaway"),
+        ("洞察", "分析", "趋势", "观点", "复盘", "思考", "方法论", "经验", "总结", "认知"),
+    ),
+    "tech": (
+        ("tutorial", "tool", "library", "code", "release", "open", "source", "API", "rust", "python", "GPU", "agent"),
+        ("教程", "工具", "技术", "开发", "开源", "模型", "框架", "部署", "性能", "代码"),
+    ),
+    "research": (
+        ("research", "data", "report", "study", "survey", "paper", "benchmark", "dataset", "results", "arxiv"),
+        ("研究", "数据", "报告", "论文", "实验", "样本", "结论", "基准", "调查", "统计"),
+    ),
+    "news": (
+        ("news", "announce", "breaking", "update", "official", "confirmed", "earthquake", "election", "policy"),
+        ("新闻", "公告", "速报", "官方", "确认", "地震", "选举", "政策", "突发", "通报"),
+    ),
+    "business": (
+        ("business", "market", "investment", "revenue", "earnings", "stock", "bitcoin", "crypto", "growth"),
+        ("商业", "市场", "投资", "盈利", "财报", "股价", "比特币", "增长", "营收", "行业"),
+    ),
+    "design": (
+        ("design", "UX", "product", "interface", "figma", "typography", "layout", "prototype", "color"),
+        ("设计", "产品", "体验", "界面", "交互", "原型", "配色", "排版", "视觉", "用户"),
+    ),
+    "other": (
+        ("today", "weekend", "coffee", "music", "game", "trailer", "movie", "travel", "photo", "cat"),
+        ("今天", "周末", "咖啡", "音乐", "游戏", "电影", "旅行", "照片", "猫", "日常"),
+    ),
+}
+
+FILLER_EN = ("the", "a", "this", "is", "and", "for", "with", "new", "just", "really", "now", "we", "our", "on", "it")
+FILLER_CN = ("这个", "我们", "真的", "刚刚", "已经", "大家", "一下", "还是", "可以", "非常")
+
+# 与扩展 SentimentAnalyzer 的词表一致，情感标签与正文用词相符
+SENTIMENT_WORDS = {
+    "positive": (("great", "awesome", "amazing", "love", "impressive", "breakthrough"), ("突破", "优秀", "推荐", "强大", "棒")),
+    "negative": (("bad", "terrible", "broken", "disappointing", "scam", "outage"), ("糟糕", "失望", "崩溃", "垃圾", "骗局")),
+    "neutral": ((), ()),
+}
+
+FIRST_NAMES = ("alex", "sam", "jordan", "taylor", "chris", "kim", "lee", "max", "nina", "omar", "yuki", "li", "wei", "ana")
+LAST_NAMES = ("chen", "smith", "wang", "garcia", "kim", "nguyen", "patel", "zhang", "ito", "brown", "liu", "silva")
+CN_SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何林罗高"
+CN_GIVEN = "伟芳娜敏静丽强磊军洋勇艳杰涛明超秀霞平刚桂"
+SUBREDDITS = ("technology", "programming", "MachineLearning", "startups", "investing", "worldnews",
+              "design", "China", "gaming", "datascience", "CryptoCurrency", "LocalLLaMA")
+DOMAINS = ("github.com", "youtube.com", "arxiv.org", "medium.com", "nytimes.com", "bilibili.com",
+           "weibo.com", "zhihu.com", "techcrunch.com", "substack.com", "bloomberg.com", "sspai.com")
+
+LABELS = ("positive", "negative", "neutral")
+CATEGORIES = tuple(TOPICS)
+
+# Kuzu 表的 COPY 列顺序，须与迁移中的表定义一致
+POST_COLUMNS = ("id", "platform", "author", "authorDisplayName", "content", "title", "url",
+                "timestamp", "score", "replies", "raw", "scrapedAt", "metadata")
+FILTERED_COLUMNS = ("id", "postId", "relevanceScore", "category", "subCategory",
+                    "reason", "summary", "keywords", "filteredAt")
+DISCOVERY_COLUMNS = ("id", "postId", "sentiment", "kolProfile", "trendData", "alertTrigger", "analyzedAt")
+
+AUTHOR_OFFSET = 5
+TWITTER_ID_BASE = 1_800_000_000_000_000_000
+REDDIT_ID_BASE = 36 ** 6
+
+
+def parse_count(text: str) -> int:
+    """10k / 2.5m / 1000 -> 数量"""
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def _base36(n: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    out = ""
+    while n:
+        n, r = divmod(n, 36)
+        out = digits[r] + out
+    return out or "0"
+
+
+@dataclass
+class CorpusConfig:
+    """语料分布参数（比例均为 0~1）"""
+    seed: int = 42
+    end: datetime = field(default_factory=lambda: datetime.now().replace(minute=0, second=0, microsecond=0))
+    days: float = 7.0
+    authors: int = 0                 # 作者池大小，0 时按总量自动取
+    author_exponent: float = 1.1     # Zipf 指数，越大头部作者越集中
+    reddit_share: float = 0.25
+    cjk_share: float = 0.35
+    duplicate_rate: float = 0.05
+    retweet_rate: float = 0.06
+    reply_rate: float = 0.12
+    hashtag_rate: float = 0.3
+    mention_rate: float = 0.15
+    link_rate: float = 0.2
+    burst_rate: float = 0.1
+    filtered_rate: float = 0.25
+    discovery_rate: float = 0.5      # 占 filtered 的比例
+    sentiment_weights: Tuple[float, float, float] = (0.35, 0.2, 0.45)
+    category_weights: Tuple[float, ...] = (0.1, 0.15, 0.25, 0.1, 0.15, 0.1, 0.05, 0.1)
+
+
+class CorpusGenerator:
+    """
+    按批次生成 BatchPostRequest 形状的数据
+
+    帖子序号决定 ID 和时间位置（总量内从旧到新），作者由 Zipf 采样的排名
+    确定性地派生，跨批次保持一致
+    """
+
+    def __init__(self, total: int, config: Optional[CorpusConfig] = None, offset: int = 0):
+        self.total = total
+        self.offset = offset  # 帖子序号起点，追加到已有语料之后时避免 ID 冲突
+        self.config = config or CorpusConfig()
+        self.authors = self.config.authors or min(2_000_000, max(1_000, total // 8))
+        self._author_cache: Dict[int, Dict[str, Any]] = {}
+        self._start = self.config.end - timedelta(days=self.config.days)
+
+    # ---------- 作者 ----------
+
+    def _author_rank(self, rng: random.Random) -> int:
+        """
+        Zipf-Mandelbrot 分布的连续近似（逆变换采样），0 为最活跃的作者
+
+        偏移量避免头部一个作者独占过多帖子
+        """
+        n, s = self.authors, self.config.author_exponent
+        a, b = AUTHOR_OFFSET + 1, n + AUTHOR_OFFSET + 1
+        u = rng.random()
+        if abs(s - 1.0) < 1e-9:
+            x = a * (b / a) ** u
+        else:
+            x = (a ** (1 - s) + u * (b ** (1 - s) - a ** (1 - s))) ** (1 / (1 - s))
+        return min(n - 1, int(x - a))
+
+    def author(self, rank: int) -> Dict[str, Any]:
+        cached = self._author_cache.get(rank)
+        if cached:
+            return cached
+        rng = random.Random(f"{self.config.seed}:author:{rank}")
+        platform = "reddit" if rng.random() < self.config.reddit_share else "twitter"
+        cjk = rng.random() < self.config.cjk_share
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        if platform == "reddit":
+            handle = f"{rng.choice(FIRST_NAMES)}_{rng.choice(TOPICS[rng.choice(CATEGORIES)][0]).lower()}{rank}"
+        else:
+            handle = f"{first}{last}{rank}"
+            if len(handle) > 15:  # Twitter 用户名上限 15 个字符
+                handle = f"{first}_{rank}"
+        if cjk:
+            display = rng.choice(CN_SURNAMES) + "".join(rng.choices(CN_GIVEN, k=rng.randint(1, 2)))
+        else:
+            display = f"{first.title()} {last.title()}"
+        author = {
+            "rank": rank,
+            "handle": handle,
+            "displayName": display,
+            "platform": platform,
+            "cjk": cjk,
+            "category": rng.choices(CATEGORIES, weights=self.config.category_weights)[0],
+        }
+        if rank < 50_000:  # 头部作者出现最频繁，只缓存这部分
+            self._author_cache[rank] = author
+        return author
+
+    # ---------- 正文 ----------
+
+    def _text(self, rng: random.Random, category: str, cjk: bool, length: int, label: str) -> str:
+        en_words, cn_words = TOPICS[category]
+        pos_en, pos_cn = SENTIMENT_WORDS[label]
+        parts: List[str] = []
+        size = 0
+        while size < length:
+            if cjk and rng.random() < 0.8:
+                chunk = "".join(rng.choice(cn_words if rng.random() < 0.6 else FILLER_CN)
+                                for _ in range(rng.randint(2, 6)))
+                if pos_cn and rng.random() < 0.3:
+                    chunk += rng.choice(pos_cn)
+                chunk += rng.choice("，。！？") if rng.random() < 0.5 else ""
+                size += len(chunk)
+            else:
+                words = [rng.choice(en_words if rng.random() < 0.5 else FILLER_EN) for _ in range(rng.randint(3, 10))]
+                if pos_en and rng.random() < 0.3:
+                    words.append(rng.choice(pos_en))
+                chunk = " ".join(words)
+                size += len(chunk) + 1
+            parts.append(chunk)
+        text = (" " if not cjk else "").join(parts)
+        if len(text) > length:
+            text = text[:length]
+            if not cjk and " " in text:
+                text = text.rsplit(" ", 1)[0]  # 不截断单词
+        return text.strip()
+
+    @staticmethod
+    def _lognormal_length(rng: random.Random, median: float, sigma: float, low: int, high: int) -> int:
+        return max(low, min(high, int(rng.lognormvariate(math.log(median), sigma))))
+
+    def _burst(self, position: int) -> Tuple[str, str]:
+        """每 6 小时一轮的突发话题（话题词, 分类）"""
+        slot = int(position / max(1, self.total) * self.config.days * 4)
+        rng = random.Random(f"{self.config.seed}:burst:{slot}")
+        category = rng.choice(CATEGORIES[:-1])
+        words = TOPICS[category][0] + TOPICS[category][1]
+        return f"{rng.choice(words)}{slot}", category
+
+    # ---------- 批次 ----------
+
+    def batch(self, number: int, size: int) -> Dict[str, List[Dict[str, Any]]]:
+        """第 number 个批次（从 0 开始），包含第 [number*size, number*size+size) 条帖子"""
+        cfg = self.config
+        rng = random.Random(f"{cfg.seed}:batch:{number}")
+        first = number * size
+        posts, filtered, discovery = [], [], []
+        span = cfg.days * 86_400
+
+        for position in range(first, min(first + size, self.total)):
+            index = self.offset + position
+            author = self.author(self._author_rank(rng))
+            platform = author["platform"]
+            label = rng.choices(LABELS, weights=cfg.sentiment_weights)[0]
+            burst_topic, burst_category = self._burst(position)
+            bursting = rng.random() < cfg.burst_rate
+            category = burst_category if bursting else (
+                author["category"] if rng.random() < 0.6
+                else rng.choices(CATEGORIES, weights=cfg.category_weights)[0]
+            )
+            cjk = author["cjk"] if rng.random() < 0.9 else not author["cjk"]
+            metadata: Dict[str, Any] = {"lang": "zh" if cjk else "en"}
+
+            offset = position / max(1, self.total) * span + rng.uniform(-1800, 1800)
+            timestamp = self._start + timedelta(seconds=int(min(span, max(0.0, offset))))
+            scraped_at = timestamp + timedelta(seconds=rng.randint(5, 3600))
+
+            if platform == "twitter":
+                title = ""
+                length = self._lognormal_length(rng, 60 if cjk else 120, 0.6, 8, 140 if cjk else 280)
+            else:
+                title = self._text(rng, category, cjk, self._lognormal_length(rng, 30 if cjk else 60, 0.4, 8, 300), label)
+                length = 0 if rng.random() < 0.3 else self._lognormal_length(rng, 150 if cjk else 350, 1.0, 20, 10_000)
+                metadata["subreddit"] = rng.choice(SUBREDDITS)
+            content = self._text(rng, category, cjk, length, label) if length else ""
+
+            if posts and rng.random() < cfg.duplicate_rate:
+                # 近重复：转载同批次中的某条并做少量改动
+                source = rng.choice(posts)
+                content = f"{source['content']} {rng.choice(('🔥', '+1', '转发', 'via', '!!'))}"
+                title = source["title"] if platform == "reddit" else ""
+            elif platform == "twitter" and rng.random() < cfg.retweet_rate:
+                original = self.author(self._author_rank(rng))
+                content = f"RT @{original['handle']}: {content}"[:280]
+                metadata["retweetedFrom"] = original["handle"]
+            elif platform == "twitter" and rng.random() < cfg.reply_rate:
+                target = self.author(self._author_rank(rng))
+                content = f"@{target['handle']} {content}"[:280]
+                metadata["inReplyTo"] = target["handle"]
+
+            extras = []
+            if bursting or rng.random() < cfg.hashtag_rate:
+                tag = burst_topic if bursting else rng.choice(TOPICS[category][1 if cjk else 0])
+                extras.append(f"#{tag}#" if cjk and rng.random() < 0.5 else f"#{tag}")
+            if rng.random() < cfg.mention_rate:
+                mentioned = self.author(self._author_rank(rng))
+                extras.append(f"u/{mentioned['handle']}" if platform == "reddit" else f"@{mentioned['handle']}")
+            if rng.random() < cfg.link_rate:
+                domain = DOMAINS[min(len(DOMAINS) - 1, int(rng.paretovariate(1.2)) - 1)]
+                extras.append(f"https://{domain}/{_base36(rng.getrandbits(32))}")
+            if extras:
+                content = f"{content} {' '.join(extras)}".strip()
+
+            if platform == "twitter":
+                post_id = str(TWITTER_ID_BASE + index)
+                url = f"https://x.com/{author['handle']}/status/{post_id}"
+            else:
+                short = _base36(REDDIT_ID_BASE + index)
+                post_id = f"t3_{short}"
+                url = f"https://www.reddit.com/r/{metadata['subreddit']}/comments/{short}/"
+
+            score = int(rng.paretovariate(1.2)) - 1 + (50 if author["rank"] < 100 else 0)
+            posts.append({
+                "id": post_id,
+                "platform": platform,
+                "author": author["handle"],
+                "authorDisplayName": author["displayName"],
+                "content": content,
+                "title": title,
+                "url": url,
+                "timestamp": timestamp,
+                "score": score,
+                "replies": int(score * rng.uniform(0.02, 0.3)),
+                "raw": False,
+                "scrapedAt": scraped_at,
+                "metadata": metadata,
+            })
+
+            if rng.random() >= cfg.filtered_rate:
+                continue
+            filtered_at = scraped_at + timedelta(seconds=rng.randint(1, 120))
+            fp_category = category if rng.random() < 0.9 else rng.choice(CATEGORIES)
+            keywords = rng.sample(TOPICS[fp_category][1 if cjk else 0], k=rng.randint(2, 4))
+            filtered.append({
+                "id": f"fp_{post_id}",
+                "postId": post_id,
+                "relevanceScore": round(min(10.0, max(0.0, rng.gauss(6.5, 1.8))), 1),
+                "category": fp_category,
+                "subCategory": "",
+                "reason": f"{fp_category}: {', '.join(keywords)}",
+                "summary": (title or content)[:80],
+                "keywords": keywords,
+                "filteredAt": filtered_at,
+            })
+
+            if rng.random() >= cfg.discovery_rate:
+                continue
+            sign = {"positive": 1, "negative": -1, "neutral": 0}[label]
+            result = {
+                "id": f"dr_{post_id}",
+                "postId": post_id,
+                "sentiment": {
+                    "sentiment": label,
+                    "confidence": round(rng.uniform(0.5, 0.99), 2),
+                    "score": round(sign * rng.uniform(0.1, 1.0) if sign else rng.uniform(-0.1, 0.1), 3),
+                    "keywords": keywords[:2],
+                },
+                "kolProfile": {},
+                "trendData": {},
+                "alertTrigger": [],
+                "analyzedAt": filtered_at + timedelta(seconds=rng.randint(1, 30)),
+            }
+            if author["rank"] < 500:
+                kol_score = max(10, 100 - author["rank"] // 5)
+                result["kolProfile"] = {
+                    "username": author["handle"],
+                    "displayName": author["displayName"],
+                    "platform": platform,
+                    "kolScore": kol_score,
+                    "level": "top" if kol_score >= 90 else "influential" if kol_score >= 70 else "notable",
+                    "metrics": {"avgEngagement": score, "postFrequency": round(rng.uniform(1, 20), 1),
+                                "reachScore": kol_score, "consistencyScore": round(rng.uniform(40, 95), 1)},
+                    "categories": [author["category"]],
+                    "recentPosts": rng.randint(5, 50),
+                }
+            if bursting:
+                result["trendData"] = {
+                    "topic": burst_topic,
+                    "category": burst_category,
+                    "heatScore": rng.randint(60, 100),
+                    "growthRate": round(rng.uniform(50, 500), 1),
+                    "postCount": rng.randint(20, 2000),
+                    "timeWindow": "6h",
+                    "relatedTopics": rng.sample(TOPICS[burst_category][0], k=2),
+                    "sentiment": label,
+                }
+            discovery.append(result)
+
+        return {"posts": posts, "filtered": filtered, "discovery": discovery}
+
+    def batches(self, size: int, start: int = 0) -> Iterator[Dict[str, List[Dict[str, Any]]]]:
+        for number in range(start, math.ceil(self.total / size)):
+            yield self.batch(number, size)
+
+
+# ========== 输出格式 ==========
+
+def to_request(batch: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """转为 POST /api/posts/batch 的 JSON 负载（时间为 ISO 字符串）"""
+    def encode(row: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v.isoformat() if isinstance(v, datetime) else v for k, v in row.items()}
+    return {key: [encode(row) for row in rows] for key, rows in batch.items()}
+
+
+def to_storage(batch: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+    """转为库中存储形式：字典/列表字段与 add_post 等方法一样以 str() 保存"""
+    posts = [{**p, "metadata": str(p["metadata"])} for p in batch["posts"]]
+    filtered = [{**f, "keywords": str(f["keywords"])} for f in batch["filtered"]]
+    discovery = [
+        {**d, **{key: str(d[key]) for key in ("sentiment", "kolProfile", "trendData", "alertTrigger")}}
+        for d in batch["discovery"]
+    ]
+    return {"posts": posts, "filtered": filtered, "discovery": discovery}
+
+
+def _open_output(path: str):
+    if path == "-":
+        return sys.stdout
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+
+def write_ndjson(generator: CorpusGenerator, output: str, batch_size: int) -> int:
+    """每行一个 BatchPostRequest，可用于按行回放 HTTP 入库"""
+    count = 0
+    f = _open_output(output)
+    try:
+        for batch in generator.batches(batch_size):
+            f.write(json.dumps(to_request(batch), ensure_ascii=False, separators=(",", ":")))
+            f.write("\n")
+            count += len(batch["posts"])
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    return count
+
+
+def write_json(generator: CorpusGenerator, output: str, batch_size: int) -> int:
+    """每个批次一个 batch-000001.json 文件"""
+    directory = Path(output)
+    directory.mkdir(parents=True, exist_ok=True)
+    count = 0
+    for number, batch in enumerate(generator.batches(batch_size)):
+        with open(directory / f"batch-{number + 1:06d}.json", "w", encoding="utf-8") as f:
+            json.dump(to_request(batch), f, ensure_ascii=False)
+        count += len(batch["posts"])
+    return count
+
+
+def load_kuzu(
+    conn,
+    generator: CorpusGenerator,
+    chunk: int = 100_000,
+    tmp_dir: Optional[str] = None,
+    progress: bool = False
+) -> Dict[str, int]:
+    """
+    经 COPY 批量写入 Post / FilteredPost / DiscoveryResult 及其关系
+
+    须在刚打开的库上执行、期间不做 CREATE/MERGE（见 bulk.py）；
+    帖子 ID 与库中已有数据重复时 COPY 报错
+    """
+    import bulk
+
+    counts = {"posts": 0, "filtered": 0, "discovery": 0}
+    started = time.perf_counter()
+    for batch in generator.batches(chunk):
+        rows = to_storage(batch)
+        bulk.copy_rows(conn, "Post", rows["posts"], POST_COLUMNS, tmp_dir)
+        bulk.copy_rows(conn, "FilteredPost", rows["filtered"], FILTERED_COLUMNS, tmp_dir)
+        bulk.copy_rows(conn, "DiscoveryResult", rows["discovery"], DISCOVERY_COLUMNS, tmp_dir)
+        bulk.copy_rows(conn, "FILTERED_FROM", ({"from": f["id"], "to": f["postId"]} for f in rows["filtered"]),
+                       ("from", "to"), tmp_dir)
+        bulk.copy_rows(conn, "ANALYZED", ({"from": d["id"], "to": d["postId"]} for d in rows["discovery"]),
+                       ("from", "to"), tmp_dir)
+        for key in counts:
+            counts[key] += len(rows[key])
+        if progress:
+            elapsed = time.perf_counter() - started
+            logger.info(f"Loaded {counts['posts']}/{generator.total} posts ({counts['posts'] / elapsed:.0f}/s)")
+    return counts
+
+
+def build_database(db_path: str, generator: CorpusGenerator, index: bool = True, progress: bool = False) -> Dict[str, Any]:
+    """建库（执行迁移）、批量导入，并按需补建实体索引和情感分桶"""
+    import kuzu
+    import migrations
+    import entities
+    import rollups
+
+    db = kuzu.Database(str(db_path))
+    conn = kuzu.Connection(db)
+    try:
+        migrations.upgrade(conn)
+        counts = load_kuzu(conn, generator, progress=progress)
+        if index:
+            # 实体索引只用 COPY，须在情感分桶的 MERGE 之前执行
+            entities.backfill(conn)
+            rollups.backfill(conn)
+    finally:
+        conn.close()
+        db.close()
+    return counts
+
+
+# ========== CLI ==========
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic Twitter/Reddit corpus")
+    parser.add_argument("format", choices=["ndjson", "json", "kuzu"], help="Output format")
+    parser.add_argument("--posts", default="10k", help="Number of posts, e.g. 10k, 1m, 20m")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end", help="ISO time of the newest post (default: current hour)")
+    parser.add_argument("--days", type=float, default=7.0, help="Time span covered by the corpus")
+    parser.add_argument("--authors", type=int, default=0, help="Author pool size (default: posts / 8)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Posts per request batch (ndjson/json)")
+    parser.add_argument("--output", default="-", help="Output file (ndjson, .gz compresses, - for stdout) or directory (json)")
+    parser.add_argument("--db-path", help="KuzuDB path (kuzu)")
+    parser.add_argument("--no-index", action="store_true", help="Skip entity index and sentiment rollups (kuzu)")
+    parser.add_argument("--duplicate-rate", type=float, default=0.05)
+    parser.add_argument("--cjk-share", type=float, default=0.35)
+    parser.add_argument("--reddit-share", type=float, default=0.25)
+    args = parser.parse_args()
+
+    config = CorpusConfig(
+        seed=args.seed,
+        days=args.days,
+        authors=args.authors,
+        duplicate_rate=args.duplicate_rate,
+        cjk_share=args.cjk_share,
+        reddit_share=args.reddit_share,
+    )
+    if args.end:
+        config.end = datetime.fromisoformat(args.end)
+    generator = CorpusGenerator(parse_count(args.posts), config)
+
+    started = time.perf_counter()
+    if args.format == "kuzu":
+        if not args.db_path:
+            parser.error("--db-path is required for kuzu output")
+        counts = build_database(args.db_path, generator, index=not args.no_index, progress=True)
+        print(f"[OK] Loaded {counts} into {args.db_path} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        return
+    if args.format == "json" and args.output == "-":
+        parser.error("--output directory is required for json output")
+    writer = write_ndjson if args.format == "ndjson" else write_json
+    count = writer(generator, args.output, args.batch_size)
+    print(f"[OK] Wrote {count} posts in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,218 +3,197 @@ Social Scraper Knowledge Graph Schema
 基于 KuzuDB 的社交媒体情报存储
 """
 
-from datetime import datetime
+import os
+import time
+from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 from pathlib import Path
 
 import kuzu
 from loguru import logger
 
+import migrations
+from dedup import NearDuplicateIndex
+from trends import TrendEngine
+import rollups
+import analytics
+from alerts import AlertMatcher
+from events import EventBus
+from related import RelatedPostsIndex
+import clustering
+import authors
+import entities
+import metrics
+from slowlog import SlowQueryLog
+
+KUZU_VERSION = tuple(int(part) for part in kuzu.__version__.split(".")[:2])
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """扩展发送的时间可能是 ISO 字符串或毫秒时间戳，统一转为 datetime"""
+    if value is None or value == "" or isinstance(value, datetime):
+        return value or None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000 if value > 1e11 else value)
+    text = str(value).strip()
+    if text.endswith("Z"):
+        text = text[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(text)
+    # Kuzu TIMESTAMP 不带时区，统一存为本地时间
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def configure_checkpoint(conn, db_path: Path) -> bool:
+    """
+    Kuzu 0.6 之前的检查点会把追加到未满节点组的少量新行的字符串列写坏
+    （新行都变成最后一行的值），这些版本上默认关闭自动检查点，改动留在 WAL 中、
+    重启时回放，WAL 只增不减。0.6 起默认开启，并在打开时把旧版本留下的 WAL
+    合并进数据文件。KUZU_AUTO_CHECKPOINT=on/off 可强制指定；返回是否开启。
+    读写打开数据库的入口（服务、迁移命令行）都应调用
+    """
+    setting = os.getenv("KUZU_AUTO_CHECKPOINT", "auto")
+    if setting == "auto":
+        setting = "on" if KUZU_VERSION >= (0, 6) else "off"
+    wal = Path(db_path) / ".wal"
+    wal_mb = (wal.stat().st_size if wal.exists() else 0) / 1024 / 1024
+    if setting == "off":
+        conn.execute("CALL auto_checkpoint=false")
+        logger.warning(
+            f"Kuzu {kuzu.__version__} auto checkpoint disabled, {wal_mb:.1f} MB WAL is replayed "
+            f"on every restart; upgrade to kuzu>=0.6 (opens this database in place) to fold it"
+        )
+        return False
+    if setting == "on" and wal_mb > 0:
+        started = time.perf_counter()
+        conn.execute("CHECKPOINT")
+        logger.info(f"Checkpointed {wal_mb:.1f} MB WAL in {time.perf_counter() - started:.2f}s")
+    return setting == "on"
+
 
 class SocialScraperKG:
     """Social Scraper KuzuDB 管理器"""
     
-    def __init__(self, db_path: str = "./database/twitter_scraper"):
+    def __init__(self, db_path: str = "./database/twitter_scraper", read_only: bool = False):
         self.db_path = Path(db_path)
+        self.read_only = read_only
+        self.auto_checkpoint = True
         self.db = None
         self.conn = None
         
-    async def init(self):
-        """初始化数据库连接和 Schema"""
-        try:
-            self.db = kuzu.Database(str(self.db_path))
-            self.conn = kuzu.Connection(self.db)
-            await self._create_schema()
-            logger.info(f"SocialScraperKG initialized at {self.db_path}")
-        except Exception as e:
-            logger.error(f"Failed to initialize SocialScraperKG: {e}")
-            raise
-    
-    async def _create_schema(self):
-        """创建 Social Scraper 专用 Schema"""
+        # 持久化的内存索引等旁路状态
+        self.state_dir = self.db_path.parent / f"{self.db_path.name}.state"
         
-        # 1. Post 表 - 原始抓取池（只存储精选内容）
-        post_schema = """
-        CREATE NODE TABLE IF NOT EXISTS Post (
-            id STRING,
-            platform STRING,
-            author STRING,
-            authorDisplayName STRING,
-            content STRING,
-            title STRING,
-            url STRING,
-            timestamp TIMESTAMP,
-            score INT64,
-            replies INT64,
-            raw BOOLEAN,
-            scrapedAt TIMESTAMP,
-            metadata STRING,
-            PRIMARY KEY (id)
-        )
-        """
+        # 近重复检测：link 记录 DUPLICATE_OF 关系，drop 直接丢弃，off 关闭
+        self.dedup_mode = os.getenv("DEDUP_MODE", "link")
+        self.dedup: Optional[NearDuplicateIndex] = None
+        if self.dedup_mode != "off":
+            self.dedup = NearDuplicateIndex(
+                similarity=float(os.getenv("DEDUP_SIMILARITY", "0.9")),
+                capacity=int(os.getenv("DEDUP_CAPACITY", "100000")),
+                path=self.state_dir / "simhash.json"
+            )
         
-        # 2. FilteredPost 表 - LLM 筛选后
-        filtered_post_schema = """
-        CREATE NODE TABLE IF NOT EXISTS FilteredPost (
-            id STRING,
-            postId STRING,
-            relevanceScore DOUBLE,
-            category STRING,
-            subCategory STRING,
-            reason STRING,
-            summary STRING,
-            keywords STRING,
-            filteredAt TIMESTAMP,
-            PRIMARY KEY (id)
-        )
-        """
+        # 服务端趋势计数
+        self.trends = TrendEngine(path=self.state_dir / "trends.json")
         
-        # 3. DiscoveryResult 表 - 发现性分析结果
-        discovery_schema = """
-        CREATE NODE TABLE IF NOT EXISTS DiscoveryResult (
-            id STRING,
-            postId STRING,
-            sentiment STRING,
-            kolProfile STRING,
-            trendData STRING,
-            alertTrigger STRING,
-            analyzedAt TIMESTAMP,
-            PRIMARY KEY (id)
-        )
-        """
+        # 情感分桶需要帖子的平台和分类
+        self.post_context = rollups.PostContextCache()
         
-        # 4. Source 表 - 频道配置
-        source_schema = """
-        CREATE NODE TABLE IF NOT EXISTS Source (
-            id STRING,
-            name STRING,
-            type STRING,
-            config STRING,
-            enabled BOOLEAN,
-            lastFetched TIMESTAMP,
-            fetchInterval INTEGER,
-            PRIMARY KEY (id)
-        )
-        """
+        # 关键词警报自动机
+        self.alerts = AlertMatcher()
         
-        # 5. CleanupRule 表 - 清理规则
-        cleanup_rule_schema = """
-        CREATE NODE TABLE IF NOT EXISTS CleanupRule (
-            id STRING,
-            targetType STRING,
-            condition STRING,
-            threshold INTEGER,
-            action STRING,
-            enabled BOOLEAN,
-            lastRun TIMESTAMP,
-            PRIMARY KEY (id)
-        )
-        """
+        # 入库事件广播（SSE 实时推送）
+        self.events = EventBus.from_env()
         
-        # 6. ArchivedPost 表 - 归档帖子
-        archived_post_schema = """
-        CREATE NODE TABLE IF NOT EXISTS ArchivedPost (
-            id STRING,
-            originalId STRING,
-            platform STRING,
-            author STRING,
-            content STRING,
-            archivedAt TIMESTAMP,
-            reason STRING,
-            metadata STRING,
-            PRIMARY KEY (id)
-        )
-        """
+        # 慢查询日志（SLOW_QUERY_MS=off 关闭）
+        self.slow_queries = SlowQueryLog.from_env(None if read_only else self.state_dir / "slow_queries.jsonl")
         
-        # 关系表
-        relationships = [
-            """
-            CREATE REL TABLE IF NOT EXISTS FILTERED_FROM (
-                FROM FilteredPost TO Post
-            )
-            """,
-            """
-            CREATE REL TABLE IF NOT EXISTS ANALYZED (
-                FROM DiscoveryResult TO Post
-            )
-            """,
-            """
-            CREATE REL TABLE IF NOT EXISTS CONTAINS_POST (
-                FROM Event TO Post
-            )
-            """,
-            """
-            CREATE REL TABLE IF NOT EXISTS ARCHIVED_FROM (
-                FROM ArchivedPost TO Post
+        # 在线事件聚类（EVENT_CLUSTERING=off 关闭）
+        self.clusterer: Optional[clustering.EventClusterer] = None
+        if os.getenv("EVENT_CLUSTERING", "on") != "off":
+            self.clusterer = clustering.EventClusterer(
+                threshold=float(os.getenv("EVENT_THRESHOLD", "0.3")),
+                window_hours=float(os.getenv("EVENT_WINDOW_HOURS", "6")),
+                max_age_hours=float(os.getenv("EVENT_MAX_HOURS", "48")),
+                path=self.state_dir / "events.json"
             )
-            """
-        ]
-        
-        schemas = [
-            post_schema,
-            filtered_post_schema,
-            discovery_schema,
-            source_schema,
-            cleanup_rule_schema,
-            archived_post_schema
-        ] + relationships
         
-        for schema in schemas:
+        # 离线相似帖子索引（需要 numpy，RELATED_INDEX=off 关闭）
+        self.related: Optional[RelatedPostsIndex] = None
+        if os.getenv("RELATED_INDEX", "on") != "off":
             try:
-                self.conn.execute(schema)
-                logger.debug(f"Created schema: {schema[:50]}...")
-            except Exception as e:
-                logger.warning(f"Schema may already exist: {e}")
+                self.related = RelatedPostsIndex(
+                    path=self.state_dir / "related",
+                    dim=int(os.getenv("RELATED_DIM", "256"))
+                )
+            except RuntimeError as e:
+                logger.warning(f"Related posts index disabled: {e}")
         
-        # 初始化默认清理规则
-        await self._init_default_cleanup_rules()
-    
-    async def _init_default_cleanup_rules(self):
-        """初始化默认清理规则"""
-        default_rules = [
-            {
-                "id": "rule_001",
-                "targetType": "Post",
-                "condition": "age_days",
-                "threshold": 90,
-                "action": "archive",
-                "enabled": True
-            },
-            {
-                "id": "rule_002",
-                "targetType": "FilteredPost",
-                "condition": "relevance_below",
-                "threshold": 3,
-                "action": "delete",
-                "enabled": True
-            },
-            {
-                "id": "rule_003",
-                "targetType": "DiscoveryResult",
-                "condition": "age_days",
-                "threshold": 365,
-                "action": "export",
-                "enabled": True
-            }
-        ]
+        # 作者提及/回复图与增量影响力（AUTHOR_GRAPH=off 关闭）
+        self.authors: Optional[authors.AuthorGraph] = None
+        if os.getenv("AUTHOR_GRAPH", "on") != "off":
+            self.authors = authors.AuthorGraph(
+                damping=float(os.getenv("AUTHOR_DAMPING", "0.85")),
+                path=self.state_dir / "authors.json"
+            )
         
-        for rule in default_rules:
-            try:
-                query = """
-                CREATE (r:CleanupRule {
-                    id: $id,
-                    targetType: $targetType,
-                    condition: $condition,
-                    threshold: $threshold,
-                    action: $action,
-                    enabled: $enabled,
-                    lastRun: NULL
-                })
-                """
-                self.conn.execute(query, rule)
-                logger.debug(f"Created cleanup rule: {rule['id']}")
-            except Exception as e:
-                logger.warning(f"Cleanup rule may already exist: {e}")
+        # 只读副本（见 cluster.py）只服务查询，不需要入库用的内存索引
+        if read_only:
+            self.dedup = self.clusterer = self.related = self.authors = None
+        
+    async def init(self):
+        """初始化数据库连接和 Schema"""
+        try:
+            self.db = kuzu.Database(str(self.db_path), read_only=self.read_only)
+            self.conn = metrics.TimedConnection(kuzu.Connection(self.db), self.slow_queries)
+            if self.read_only:
+                await self._check_schema()
+                logger.info(f"SocialScraperKG opened read-only at {self.db_path}")
+                return
+            self._configure_checkpoint()
+            await self._migrate()
+            if self.dedup is not None:
+                self.dedup.load()
+            self.trends.load()
+            if self.related is not None:
+                self.related.load()
+            if self.clusterer is not None:
+                self.clusterer.load()
+            if self.authors is not None and self.authors.load() == 0:
+                await self._rebuild_author_graph()
+            await self.reload_alert_rules()
+            metrics.QUEUE_DEPTH.set_function(
+                lambda: {("sse_buffered",): self.events.buffered()}, source="events"
+            )
+            logger.info(f"SocialScraperKG initialized at {self.db_path}")
+        except Exception as e:
+            logger.error(f"Failed to initialize SocialScraperKG: {e}")
+            raise
+    
+    def _configure_checkpoint(self):
+        self.auto_checkpoint = configure_checkpoint(self.conn, self.db_path)
+    
+    async def _check_schema(self):
+        """只读打开时不能迁移，版本落后直接报错"""
+        version = migrations.current_version(self.conn)
+        if version < migrations.latest_version():
+            raise RuntimeError(f"Read-only database at schema version {version}, writer must migrate first")
+    
+    async def _migrate(self):
+        """检查 Schema 版本，落后时执行待迁移项"""
+        version = migrations.current_version(self.conn)
+        latest = migrations.latest_version()
+        if version >= latest:
+            return
+        
+        if os.getenv("KUZU_AUTO_MIGRATE", "1") == "0":
+            raise RuntimeError(
+                f"Schema version {version} is behind {latest}, "
+                f"run: python migrations.py upgrade --db-path {self.db_path}"
+            )
+        applied = migrations.upgrade(self.conn)
+        logger.info(f"Schema migrated from version {version} to {applied[-1].version}")
     
     # ========== Post 操作方法 ==========
     
@@ -247,14 +226,16 @@ class SocialScraperKG:
                 "content": post.get("content", ""),
                 "title": post.get("title", ""),
                 "url": post.get("url", ""),
-                "timestamp": post.get("timestamp"),
+                "timestamp": parse_timestamp(post.get("timestamp")),
                 "score": post.get("score", 0),
                 "replies": post.get("replies", 0),
                 "raw": post.get("raw", False),
-                "scrapedAt": post.get("scrapedAt"),
+                "scrapedAt": parse_timestamp(post.get("scrapedAt")),
                 "metadata": str(post.get("metadata", {}))
             })
             
+            metrics.ROWS_WRITTEN.inc(1, "Post")
+            self.post_context.update(post["id"], platform=post.get("platform", "twitter"))
             logger.debug(f"Added post: {post['id']}")
             return True
         except Exception as e:
@@ -262,14 +243,96 @@ class SocialScraperKG:
             return False
     
     async def add_posts_batch(self, posts: List[Dict[str, Any]]) -> int:
-        """批量添加帖子"""
+        """批量添加帖子（先经过近重复检测，入库后做趋势计数和警报匹配）"""
+        metrics.BATCH_SIZE.observe(len(posts), "posts")
         success_count = 0
+        duplicate_count = 0
+        triggers = []
+        stored = []
         for post in posts:
-            if await self.add_post(post):
-                success_count += 1
-        logger.info(f"Batch added {success_count}/{len(posts)} posts")
+            fingerprint, match = None, None
+            if self.dedup is not None:
+                fingerprint, match = self.dedup.check(post["id"], post.get("content", ""))
+            
+            if match and self.dedup_mode == "drop":
+                duplicate_count += 1
+                self.dedup.drop(post["id"], match[0])
+                logger.debug(f"Dropped near-duplicate post {post['id']} of {match[0]}")
+                continue
+            
+            if not await self.add_post(post):
+                continue
+            success_count += 1
+            stored.append(post)
+            self.trends.observe(post.get("content", ""), parse_timestamp(post.get("timestamp")))
+            triggers.extend(self.alerts.match(post))
+            if self.related is not None:
+                self.related.add(post["id"], f"{post.get('title') or ''} {post.get('content', '')}")
+            if self.clusterer is not None:
+                self.clusterer.observe(post, parse_timestamp(post.get("timestamp")))
+            if self.authors is not None:
+                self.authors.observe(post)
+            self.events.publish("post", self._post_summary(post, match))
+            
+            if match:
+                duplicate_count += 1
+                await self.link_duplicate(post["id"], match[0], match[1])
+            elif fingerprint is not None:
+                # 只索引代表帖，重复链都指向最早的原帖
+                self.dedup.add(post["id"], fingerprint)
+        
+        if stored:
+            await self._index_entities(stored)
+            self.trends.maybe_save()
+        alert_count = await self.add_alert_matches(triggers) if triggers else 0
+        if self.clusterer is not None:
+            await self._flush_events()
+        if self.authors is not None:
+            await self._flush_authors()
+        self.events.publish("stats", {
+            "posts": success_count,
+            "duplicates": duplicate_count,
+            "alerts": alert_count
+        })
+        
+        logger.info(f"Batch added {success_count}/{len(posts)} posts ({duplicate_count} near-duplicates)")
         return success_count
     
+    @staticmethod
+    def _post_summary(post: Dict[str, Any], duplicate_of: Optional[tuple] = None) -> Dict[str, Any]:
+        """推送给实时订阅者的帖子摘要"""
+        content = post.get("content") or ""
+        return {
+            "id": post["id"],
+            "platform": post.get("platform", "twitter"),
+            "author": post.get("author", ""),
+            "authorDisplayName": post.get("authorDisplayName", ""),
+            "title": post.get("title") or "",
+            "excerpt": content[:200],
+            "url": post.get("url", ""),
+            "timestamp": post.get("timestamp"),
+            "score": post.get("score", 0),
+            "duplicateOf": duplicate_of[0] if duplicate_of else None
+        }
+    
+    async def link_duplicate(self, post_id: str, original_id: str, similarity: float) -> bool:
+        """记录近重复关系"""
+        try:
+            query = """
+            MATCH (dup:Post {id: $post_id}), (orig:Post {id: $original_id})
+            CREATE (dup)-[:DUPLICATE_OF {similarity: $similarity}]->(orig)
+            """
+            self.conn.execute(query, {
+                "post_id": post_id,
+                "original_id": original_id,
+                "similarity": similarity
+            })
+            metrics.ROWS_WRITTEN.inc(1, "DUPLICATE_OF")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to link duplicate {post_id} -> {original_id}: {e}")
+            return False
+    
     async def get_post_by_id(self, post_id: str) -> Optional[Dict]:
         """根据 ID 查询帖子"""
         try:
@@ -302,16 +365,16 @@ class SocialScraperKG:
     async def get_recent_posts(self, hours: int = 24, limit: int = 100) -> List[Dict]:
         """获取最近的帖子"""
         try:
-            query = """
+            query = f"""
             MATCH (p:Post)
-            WHERE p.scrapedAt > datetime_subtract(timestamp(), interval $hours hour)
+            WHERE p.scrapedAt > $since
             RETURN p.id, p.platform, p.author, p.content, p.url,
                    p.timestamp, p.score, p.replies, p.scrapedAt
             ORDER BY p.scrapedAt DESC
-            LIMIT $limit
+            LIMIT {int(limit)}
             """
             
-            result = self.conn.execute(query, {"hours": hours, "limit": limit})
+            result = self.conn.execute(query, {"since": datetime.now() - timedelta(hours=hours)})
             posts = []
             while result.has_next():
                 row = result.get_next()
@@ -333,8 +396,18 @@ class SocialScraperKG:
     
     # ========== FilteredPost 操作方法 ==========
     
+    def _dropped_duplicate(self, post_id: Optional[str], kind: str) -> bool:
+        """帖子在 drop 模式下作为近重复被丢弃时，它的筛选 / 分析结果也不入库"""
+        original = self.dedup.dropped(post_id) if self.dedup is not None else None
+        if original is None:
+            return False
+        logger.debug(f"Skipped {kind} for dropped near-duplicate post {post_id} of {original}")
+        return True
+    
     async def add_filtered_post(self, filtered: Dict[str, Any]) -> bool:
         """添加筛选后的帖子"""
+        if self._dropped_duplicate(filtered.get("postId"), "filtered post"):
+            return False
         try:
             query = """
             CREATE (fp:FilteredPost {
@@ -359,7 +432,7 @@ class SocialScraperKG:
                 "reason": filtered.get("reason", ""),
                 "summary": filtered.get("summary", ""),
                 "keywords": str(filtered.get("keywords", [])),
-                "filteredAt": filtered.get("filteredAt")
+                "filteredAt": parse_timestamp(filtered.get("filteredAt"))
             })
             
             # 创建关系
@@ -368,6 +441,16 @@ class SocialScraperKG:
             CREATE (fp)-[:FILTERED_FROM]->(p)
             """
             self.conn.execute(rel_query, {"fp_id": filtered["id"], "post_id": filtered["postId"]})
+            metrics.ROWS_WRITTEN.inc(1, "FilteredPost")
+            metrics.ROWS_WRITTEN.inc(1, "FILTERED_FROM")
+            self.post_context.update(filtered["postId"], category=filtered.get("category", "other"))
+            self.events.publish("filtered", {
+                "postId": filtered["postId"],
+                "platform": (self.post_context.get(filtered["postId"]) or {}).get("platform"),
+                "category": filtered.get("category", "other"),
+                "relevanceScore": filtered.get("relevanceScore", 0),
+                "summary": filtered.get("summary", "")
+            })
             
             logger.debug(f"Added filtered post: {filtered['id']}")
             return True
@@ -379,24 +462,24 @@ class SocialScraperKG:
         """获取筛选后的帖子"""
         try:
             if category:
-                query = """
+                query = f"""
                 MATCH (fp:FilteredPost)
                 WHERE fp.category = $category
                 RETURN fp.id, fp.postId, fp.relevanceScore, fp.category, 
                        fp.reason, fp.summary, fp.filteredAt
                 ORDER BY fp.relevanceScore DESC
-                LIMIT $limit
+                LIMIT {int(limit)}
                 """
-                result = self.conn.execute(query, {"category": category, "limit": limit})
+                result = self.conn.execute(query, {"category": category})
             else:
-                query = """
+                query = f"""
                 MATCH (fp:FilteredPost)
                 RETURN fp.id, fp.postId, fp.relevanceScore, fp.category,
                        fp.reason, fp.summary, fp.filteredAt
                 ORDER BY fp.filteredAt DESC
-                LIMIT $limit
+                LIMIT {int(limit)}
                 """
-                result = self.conn.execute(query, {"limit": limit})
+                result = self.conn.execute(query)
             
             posts = []
             while result.has_next():
@@ -419,6 +502,8 @@ class SocialScraperKG:
     
     async def add_discovery_result(self, result: Dict[str, Any]) -> bool:
         """添加发现性分析结果"""
+        if self._dropped_duplicate(result.get("postId"), "discovery result"):
+            return False
         try:
             query = """
             CREATE (dr:DiscoveryResult {
@@ -439,7 +524,7 @@ class SocialScraperKG:
                 "kolProfile": str(result.get("kolProfile", {})),
                 "trendData": str(result.get("trendData", {})),
                 "alertTrigger": str(result.get("alertTrigger", [])),
-                "analyzedAt": result.get("analyzedAt")
+                "analyzedAt": parse_timestamp(result.get("analyzedAt"))
             })
             
             # 创建关系
@@ -448,6 +533,10 @@ class SocialScraperKG:
             CREATE (dr)-[:ANALYZED]->(p)
             """
             self.conn.execute(rel_query, {"dr_id": result["id"], "post_id": result["postId"]})
+            metrics.ROWS_WRITTEN.inc(1, "DiscoveryResult")
+            metrics.ROWS_WRITTEN.inc(1, "ANALYZED")
+            
+            await self._rollup_sentiment(result)
             
             logger.debug(f"Added discovery result: {result['id']}")
             return True
@@ -455,29 +544,122 @@ class SocialScraperKG:
             logger.error(f"Failed to add discovery result: {e}")
             return False
     
+    async def _post_context(self, post_id: str) -> Dict[str, str]:
+        """帖子的平台和分类，优先读缓存"""
+        context = self.post_context.get(post_id)
+        if context and "platform" in context and "category" in context:
+            metrics.CACHE_REQUESTS.inc(1, "post_context", "hit")
+            return context
+        
+        metrics.CACHE_REQUESTS.inc(1, "post_context", "miss")
+        query = """
+        MATCH (p:Post {id: $id})
+        OPTIONAL MATCH (fp:FilteredPost)-[:FILTERED_FROM]->(p)
+        RETURN p.platform, fp.category
+        LIMIT 1
+        """
+        result = self.conn.execute(query, {"id": post_id})
+        if result.has_next():
+            platform, category = result.get_next()
+            self.post_context.update(post_id, platform=platform, category=category)
+        return self.post_context.get(post_id) or {}
+    
+    async def _rollup_sentiment(self, result: Dict[str, Any]):
+        """更新情感小时桶和天桶"""
+        analyzed_at = parse_timestamp(result.get("analyzedAt")) or datetime.now()
+        label, score = rollups.parse_sentiment(result.get("sentiment"))
+        context = await self._post_context(result["postId"])
+        rows = rollups.bucket_rows(
+            analyzed_at,
+            context.get("category", "other"),
+            context.get("platform", "unknown"),
+            label,
+            score
+        )
+        self.conn.execute(rollups.UPSERT_BUCKETS, {"rows": rows})
+        metrics.ROWS_WRITTEN.inc(len(rows), "SentimentBucket")
+    
+    async def get_sentiment_timeseries(
+        self,
+        granularity: str = "hour",
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        category: Optional[str] = None,
+        platform: Optional[str] = None,
+        group_by: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """按时间桶读取情感计数，只扫描范围内的桶"""
+        try:
+            default_start, default_end = rollups.default_range(granularity, end)
+            params = {
+                "granularity": granularity,
+                "since": rollups.bucket_start(start or default_start, granularity),
+                "until": end or default_end
+            }
+            query = """
+            MATCH (b:SentimentBucket)
+            WHERE b.granularity = $granularity
+              AND b.bucketStart >= $since AND b.bucketStart <= $until
+            """
+            if category:
+                query += " AND b.category = $category"
+                params["category"] = category
+            if platform:
+                query += " AND b.platform = $platform"
+                params["platform"] = platform
+            query += """
+            RETURN b.bucketStart, b.category, b.platform, b.positive,
+                   b.negative, b.neutral, b.scoreSum, b.count
+            """
+            result = self.conn.execute(query, params)
+            rows = []
+            while result.has_next():
+                rows.append(result.get_next())
+            return rollups.aggregate_buckets(rows, group_by)
+        except Exception as e:
+            logger.error(f"Failed to get sentiment timeseries: {e}")
+            return []
+    
+    async def get_engagement_analytics(
+        self,
+        hours: int = 24,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        platform: Optional[str] = None,
+        author: Optional[str] = None,
+        group_by: Optional[str] = None,
+        top_k: int = 10,
+        sort_by: str = "score"
+    ) -> Dict[str, Any]:
+        """score / replies 的分位数、直方图和 Top-K（缺少 numpy 时抛出 RuntimeError）"""
+        until = end or datetime.now()
+        since = start or until - timedelta(hours=hours)
+        stats = analytics.engagement_stats(
+            self.conn, since, until,
+            platform=platform, author=author, group_by=group_by,
+            top_k=top_k, sort_by=sort_by
+        )
+        stats.update({"since": since.isoformat(), "until": until.isoformat()})
+        return stats
+    
     async def get_discovery_stats(self) -> Dict[str, Any]:
         """获取发现性分析统计"""
         try:
             stats = {}
             
-            # 情感分布
+            # 情感分布（读天桶汇总，不扫描 DiscoveryResult）
             sentiment_query = """
-            MATCH (dr:DiscoveryResult)
-            WHERE dr.sentiment IS NOT NULL
-            RETURN dr.sentiment
+            MATCH (b:SentimentBucket)
+            WHERE b.granularity = 'day'
+            RETURN sum(b.positive), sum(b.negative), sum(b.neutral)
             """
             result = self.conn.execute(sentiment_query)
-            sentiments = {"positive": 0, "negative": 0, "neutral": 0}
-            while result.has_next():
-                row = result.get_next()
-                sentiment_str = str(row[0])
-                if "positive" in sentiment_str.lower():
-                    sentiments["positive"] += 1
-                elif "negative" in sentiment_str.lower():
-                    sentiments["negative"] += 1
-                else:
-                    sentiments["neutral"] += 1
-            stats["sentiments"] = sentiments
+            row = result.get_next() if result.has_next() else [0, 0, 0]
+            stats["sentiments"] = {
+                "positive": row[0] or 0,
+                "negative": row[1] or 0,
+                "neutral": row[2] or 0
+            }
             
             # KOL 数量
             kol_query = """
@@ -504,6 +686,559 @@ class SocialScraperKG:
             logger.error(f"Failed to get discovery stats: {e}")
             return {}
     
+    # ========== 事件聚类 ==========
+    
+    async def _flush_events(self):
+        """把本批次聚类产生的事件变更写入 Event / CONTAINS_POST"""
+        events, links, closed = self.clusterer.drain()
+        try:
+            now = datetime.now()
+            if events:
+                self.conn.execute(clustering.UPSERT_EVENTS, {"rows": events, "now": now})
+                self.clusterer.committed([row["id"] for row in events])
+                metrics.ROWS_WRITTEN.inc(len(events), "Event")
+            if links:
+                statement = self.conn.prepare(clustering.LINK_POSTS)
+                for row in links:
+                    self.conn.execute(statement, dict(row, now=now))
+                metrics.ROWS_WRITTEN.inc(len(links), "CONTAINS_POST")
+            if closed:
+                self.conn.execute(clustering.CLOSE_EVENTS, {"ids": closed})
+        except Exception as e:
+            logger.error(f"Failed to store event clusters: {e}")
+    
+    async def get_events(
+        self,
+        status: Optional[str] = None,
+        min_posts: int = 2,
+        limit: int = 20,
+        offset: int = 0
+    ) -> Dict[str, Any]:
+        """分页获取事件（按最近帖子时间倒序）"""
+        try:
+            where = "WHERE e.postCount >= $minPosts"
+            params: Dict[str, Any] = {"minPosts": min_posts}
+            if status:
+                where += " AND e.status = $status"
+                params["status"] = status
+            
+            total = self.conn.execute(f"MATCH (e:Event) {where} RETURN count(*)", params).get_next()[0]
+            query = f"""
+            MATCH (e:Event) {where}
+            RETURN e.id, e.title, e.keywords, e.status, e.startedAt, e.lastPostAt,
+                   e.postCount, e.authorCount, e.platforms, e.scoreSum, e.repliesSum
+            ORDER BY e.lastPostAt DESC
+            SKIP {int(offset)} LIMIT {int(limit)}
+            """
+            result = self.conn.execute(query, params)
+            events = []
+            while result.has_next():
+                events.append(self._event_row(result.get_next()))
+            return {"events": events, "total": total}
+        except Exception as e:
+            logger.error(f"Failed to get events: {e}")
+            return {"events": [], "total": 0}
+    
+    async def get_event(self, event_id: str, limit: int = 50) -> Optional[Dict[str, Any]]:
+        """事件详情及其帖子"""
+        result = self.conn.execute("""
+            MATCH (e:Event {id: $id})
+            RETURN e.id, e.title, e.keywords, e.status, e.startedAt, e.lastPostAt,
+                   e.postCount, e.authorCount, e.platforms, e.scoreSum, e.repliesSum
+        """, {"id": event_id})
+        if not result.has_next():
+            return None
+        event = self._event_row(result.get_next())
+        
+        result = self.conn.execute(f"""
+            MATCH (e:Event {{id: $id}})-[c:CONTAINS_POST]->(p:Post)
+            RETURN p.id, p.platform, p.author, p.content, p.url, p.timestamp, p.score, c.similarity
+            ORDER BY p.timestamp
+            LIMIT {int(limit)}
+        """, {"id": event_id})
+        posts = []
+        while result.has_next():
+            row = result.get_next()
+            posts.append({
+                "id": row[0],
+                "platform": row[1],
+                "author": row[2],
+                "excerpt": (row[3] or "")[:200],
+                "url": row[4],
+                "timestamp": row[5],
+                "score": row[6],
+                "similarity": row[7]
+            })
+        event["posts"] = posts
+        return event
+    
+    @staticmethod
+    def _event_row(row: list) -> Dict[str, Any]:
+        return {
+            "id": row[0],
+            "title": row[1],
+            "keywords": row[2] or [],
+            "status": row[3],
+            "startedAt": row[4],
+            "lastPostAt": row[5],
+            "postCount": row[6],
+            "authorCount": row[7],
+            "platforms": row[8] or [],
+            "scoreSum": row[9],
+            "repliesSum": row[10]
+        }
+    
+    # ========== 话题标签 / 提及 / 链接域名 ==========
+    
+    async def _index_entities(self, posts: List[Dict[str, Any]]):
+        """整批抽取话题标签、@提及和链接域名并建立索引关系"""
+        try:
+            batch = entities.extract_batch(posts)
+            entities.store(self.conn, batch)
+            metrics.ROWS_WRITTEN.inc(len(batch["hashtags"]), "Hashtag")
+            metrics.ROWS_WRITTEN.inc(len(batch["domains"]), "Domain")
+            for table, (key, _, _) in entities.REL_TABLES.items():
+                metrics.ROWS_WRITTEN.inc(len(batch[key]), table)
+        except Exception as e:
+            logger.error(f"Failed to index post entities: {e}")
+    
+    async def get_entity_posts(
+        self,
+        kind: str,
+        key: str,
+        hours: int = 6,
+        platform: Optional[str] = None,
+        limit: int = 50
+    ) -> List[Dict]:
+        """
+        包含某话题标签 / 提及某作者 / 链接到某域名的近期帖子
+        
+        从实体节点主键出发沿关系表取帖子，不扫描 content
+        """
+        label, rel = entities.KINDS[kind]
+        if kind == "hashtag":
+            key = entities.normalize_tag(key)
+        elif kind == "mention":
+            key = authors.author_id(platform or "twitter", key)
+        else:
+            key = entities.normalize_domain(f"https://{key}") or key.lower()
+        query = f"""
+        MATCH (p:Post)-[r:{rel}]->(n:{label} {{id: $key}})
+        WHERE r.at >= $since
+        RETURN p.id, p.platform, p.author, p.content, p.url, p.timestamp, p.score, p.replies
+        ORDER BY r.at DESC
+        LIMIT {int(limit)}
+        """
+        try:
+            result = self.conn.execute(query, {"key": key, "since": datetime.now() - timedelta(hours=hours)})
+            posts = []
+            while result.has_next():
+                row = result.get_next()
+                posts.append({
+                    "id": row[0],
+                    "platform": row[1],
+                    "author": row[2],
+                    "content": row[3],
+                    "url": row[4],
+                    "timestamp": row[5],
+                    "score": row[6],
+                    "replies": row[7]
+                })
+            return posts
+        except Exception as e:
+            logger.error(f"Failed to get posts for {kind} {key}: {e}")
+            return []
+    
+    async def get_top_entities(
+        self,
+        kind: str,
+        hours: int = 24,
+        platform: Optional[str] = None,
+        limit: int = 20
+    ) -> List[Dict]:
+        """时间窗口内被最多帖子引用的话题标签 / 作者 / 域名"""
+        label, rel = entities.KINDS[kind]
+        where = "r.at >= $since"
+        params: Dict[str, Any] = {"since": datetime.now() - timedelta(hours=hours)}
+        if platform:
+            where += " AND p.platform = $platform"
+            params["platform"] = platform
+        query = f"""
+        MATCH (p:Post)-[r:{rel}]->(n:{label})
+        WHERE {where}
+        RETURN n.id, count(*) AS posts, max(r.at) AS lastAt
+        ORDER BY posts DESC, n.id
+        LIMIT {int(limit)}
+        """
+        try:
+            result = self.conn.execute(query, params)
+            items = []
+            while result.has_next():
+                row = result.get_next()
+                items.append({"id": row[0], "posts": row[1], "lastAt": row[2]})
+            return items
+        except Exception as e:
+            logger.error(f"Failed to get top {kind}s: {e}")
+            return []
+    
+    # ========== 作者影响力 ==========
+    
+    async def _flush_authors(self):
+        """把本批次的作者、MENTIONS 边和更新后的影响力写入库"""
+        rows, mentions, influence = self.authors.drain()
+        try:
+            now = datetime.now()
+            if rows:
+                self.conn.execute(authors.UPSERT_AUTHORS, {"rows": rows, "now": now})
+                metrics.ROWS_WRITTEN.inc(len(rows), "Author")
+            if mentions:
+                metrics.ROWS_WRITTEN.inc(self._store_mentions(mentions, now), "MENTIONS")
+            if influence:
+                self.conn.execute(authors.UPDATE_INFLUENCE, {"rows": influence})
+        except Exception as e:
+            logger.error(f"Failed to store author graph: {e}")
+    
+    def _store_mentions(self, mentions: List[Dict[str, Any]], now: datetime) -> int:
+        """写 MENTIONS 边，单条失败只跳过这一条（不影响后面的影响力更新），返回写入条数"""
+        if KUZU_VERSION < (0, 6):
+            # Kuzu 0.5 复用预编译语句更新已有的边会报 Write-write conflict，整批 MERGE；
+            # 失败时整条语句回滚，再逐条重试
+            try:
+                self.conn.execute(authors.MERGE_MENTIONS, {"rows": mentions, "now": now})
+                return len(mentions)
+            except Exception as e:
+                logger.warning(f"Failed to merge {len(mentions)} MENTIONS edges, retrying one by one: {e}")
+            bump, create = authors.BUMP_MENTIONS, authors.CREATE_MENTIONS
+        else:
+            bump = self.conn.prepare(authors.BUMP_MENTIONS)
+            create = self.conn.prepare(authors.CREATE_MENTIONS)
+        stored = 0
+        for row in mentions:
+            params = dict(row, now=now)
+            try:
+                if not self.conn.execute(bump, params).get_next()[0]:
+                    self.conn.execute(create, params)
+                stored += 1
+            except Exception as e:
+                logger.error(f"Failed to store MENTIONS {row['src']} -> {row['dst']}: {e}")
+        return stored
+
+    async def _rebuild_author_graph(self):
+        """状态文件缺失时从 Author / MENTIONS 重建影响力并回写"""
+        result = self.conn.execute("MATCH (a:Author) RETURN a.id")
+        nodes = []
+        while result.has_next():
+            nodes.append(result.get_next()[0])
+        if not nodes:
+            return
+        result = self.conn.execute("MATCH (a:Author)-[m:MENTIONS]->(b:Author) RETURN a.id, b.id, m.kind, m.count")
+        edges = []
+        while result.has_next():
+            edges.append(tuple(result.get_next()))
+        changed = self.authors.rebuild(nodes, edges)
+        self.conn.execute(authors.UPDATE_INFLUENCE, {
+            "rows": [{"id": node, "influence": self.authors.graph.rank(node)} for node in changed]
+        })
+        logger.info(f"Rebuilt author influence for {len(nodes)} authors from {len(edges)} edges")
+    
+    async def get_authors(
+        self,
+        platform: Optional[str] = None,
+        sort_by: str = "influence",
+        limit: int = 20,
+        offset: int = 0
+    ) -> Dict[str, Any]:
+        """按影响力（或被提及数、发帖数）排序的作者"""
+        order = {"influence": "a.influence", "mentioned": "a.mentionedCount", "posts": "a.postCount"}[sort_by]
+        where, params = "", {}
+        if platform:
+            where, params = "WHERE a.platform = $platform", {"platform": platform}
+        try:
+            total = self.conn.execute(f"MATCH (a:Author) {where} RETURN count(*)", params).get_next()[0]
+            result = self.conn.execute(f"""
+                MATCH (a:Author) {where}
+                RETURN a.id, a.handle, a.platform, a.displayName, a.postCount,
+                       a.mentionedCount, a.influence, a.lastSeen
+                ORDER BY {order} DESC, a.id
+                SKIP {int(offset)} LIMIT {int(limit)}
+            """, params)
+            rows = []
+            while result.has_next():
+                rows.append(self._author_row(result.get_next()))
+            return {"authors": rows, "total": total}
+        except Exception as e:
+            logger.error(f"Failed to get authors: {e}")
+            return {"authors": [], "total": 0}
+    
+    async def get_author(self, author_id: str, limit: int = 20) -> Optional[Dict[str, Any]]:
+        """作者详情：提及其最多的作者和其最常提及的作者"""
+        result = self.conn.execute("""
+            MATCH (a:Author {id: $id})
+            RETURN a.id, a.handle, a.platform, a.displayName, a.postCount,
+                   a.mentionedCount, a.influence, a.lastSeen
+        """, {"id": author_id})
+        if not result.has_next():
+            return None
+        author = self._author_row(result.get_next())
+        for key, pattern in (
+            ("mentionedBy", "(o:Author)-[m:MENTIONS]->(a:Author {id: $id})"),
+            ("mentions", "(a:Author {id: $id})-[m:MENTIONS]->(o:Author)")
+        ):
+            result = self.conn.execute(f"""
+                MATCH {pattern}
+                RETURN o.id, o.handle, m.kind, m.count, o.influence, m.lastAt
+                ORDER BY m.count DESC, o.influence DESC
+                LIMIT {int(limit)}
+            """, {"id": author_id})
+            edges = []
+            while result.has_next():
+                row = result.get_next()
+                edges.append({
+                    "id": row[0],
+                    "handle": row[1],
+                    "kind": row[2],
+                    "count": row[3],
+                    "influence": row[4],
+                    "lastAt": row[5]
+                })
+            author[key] = edges
+        return author
+    
+    @staticmethod
+    def _author_row(row: list) -> Dict[str, Any]:
+        return {
+            "id": row[0],
+            "handle": row[1],
+            "platform": row[2],
+            "displayName": row[3],
+            "postCount": row[4],
+            "mentionedCount": row[5],
+            "influence": round(row[6] or 0.0, 4),
+            "lastSeen": row[7]
+        }
+    
+    # ========== 相似帖子 ==========
+    
+    def forget_posts(self, post_ids: List[str]):
+        """帖子被归档/删除后，同步移出内存索引"""
+        if not post_ids:
+            return
+        if self.related is not None:
+            self.related.remove(post_ids)
+        if self.dedup is not None:
+            self.dedup.remove(post_ids)
+    
+    async def get_related_posts(self, post_id: str, k: int = 10, min_similarity: float = 0.2) -> Optional[List[Dict]]:
+        """
+        相似帖子（post_id 也可以是 FilteredPost 的 id）
+        
+        帖子不在索引中时返回 None
+        """
+        if self.related is None:
+            raise RuntimeError("Related posts index is disabled")
+        neighbours = self.related.related(post_id, k=k, min_similarity=min_similarity)
+        if neighbours is None:
+            result = self.conn.execute(
+                "MATCH (fp:FilteredPost {id: $id}) RETURN fp.postId", {"id": post_id}
+            )
+            if not result.has_next():
+                return None
+            neighbours = self.related.related(result.get_next()[0], k=k, min_similarity=min_similarity)
+            if neighbours is None:
+                return None
+        if not neighbours:
+            return []
+        
+        similarity = dict(neighbours)
+        query = """
+        MATCH (p:Post)
+        WHERE p.id IN $ids
+        RETURN p.id, p.platform, p.author, p.content, p.url, p.timestamp, p.score
+        """
+        result = self.conn.execute(query, {"ids": list(similarity)})
+        posts = []
+        while result.has_next():
+            row = result.get_next()
+            posts.append({
+                "id": row[0],
+                "platform": row[1],
+                "author": row[2],
+                "excerpt": (row[3] or "")[:200],
+                "url": row[4],
+                "timestamp": row[5],
+                "score": row[6],
+                "similarity": similarity[row[0]]
+            })
+        posts.sort(key=lambda post: post["similarity"], reverse=True)
+        return posts
+    
+    # ========== 关键词警报操作方法 ==========
+    
+    async def get_alert_rules(self, enabled_only: bool = False) -> List[Dict]:
+        """获取警报规则"""
+        try:
+            query = """
+            MATCH (r:AlertRule)
+            RETURN r.id, r.name, r.keywords, r.action, r.enabled, r.priority,
+                   r.categories, r.platforms, r.createdAt, r.triggeredCount
+            """
+            result = self.conn.execute(query)
+            rules = []
+            while result.has_next():
+                row = result.get_next()
+                if enabled_only and not row[4]:
+                    continue
+                rules.append({
+                    "id": row[0],
+                    "name": row[1],
+                    "keywords": row[2] or [],
+                    "action": row[3],
+                    "enabled": row[4],
+                    "priority": row[5],
+                    "categories": row[6] or [],
+                    "platforms": row[7] or [],
+                    "createdAt": row[8],
+                    "triggeredCount": row[9] or 0
+                })
+            return rules
+        except Exception as e:
+            logger.error(f"Failed to get alert rules: {e}")
+            return []
+    
+    async def reload_alert_rules(self):
+        """规则变更后重建自动机"""
+        rules = await self.get_alert_rules(enabled_only=True)
+        self.alerts.rebuild(rules)
+        logger.debug(f"Alert automaton rebuilt: {self.alerts.stats()}")
+    
+    async def save_alert_rule(self, rule: Dict[str, Any]) -> bool:
+        """新建或更新警报规则"""
+        try:
+            query = """
+            MERGE (r:AlertRule {id: $id})
+            ON CREATE SET r.createdAt = $now, r.triggeredCount = 0
+            SET r.name = $name,
+                r.keywords = $keywords,
+                r.action = $action,
+                r.enabled = $enabled,
+                r.priority = $priority,
+                r.categories = $categories,
+                r.platforms = $platforms
+            """
+            self.conn.execute(query, {
+                "id": rule["id"],
+                "name": rule.get("name", ""),
+                "keywords": [k.lower() for k in rule.get("keywords", [])],
+                "action": rule.get("action", "notify"),
+                "enabled": rule.get("enabled", True),
+                "priority": rule.get("priority", "medium"),
+                "categories": rule.get("categories") or [],
+                "platforms": rule.get("platforms") or [],
+                "now": datetime.now()
+            })
+            await self.reload_alert_rules()
+            return True
+        except Exception as e:
+            logger.error(f"Failed to save alert rule {rule.get('id')}: {e}")
+            return False
+    
+    async def delete_alert_rule(self, rule_id: str) -> bool:
+        """删除警报规则（保留历史触发记录）"""
+        try:
+            self.conn.execute("MATCH (r:AlertRule {id: $id}) DELETE r", {"id": rule_id})
+            await self.reload_alert_rules()
+            return True
+        except Exception as e:
+            logger.error(f"Failed to delete alert rule {rule_id}: {e}")
+            return False
+    
+    async def add_alert_matches(self, triggers: List[Dict[str, Any]]) -> int:
+        """批量写入警报触发记录（重复入库的帖子不重复计数）"""
+        try:
+            result = self.conn.execute(
+                "MATCH (m:AlertMatch) WHERE m.id IN $ids RETURN m.id",
+                {"ids": [t["id"] for t in triggers]}
+            )
+            existing = set()
+            while result.has_next():
+                existing.add(result.get_next()[0])
+            triggers = [t for t in triggers if t["id"] not in existing]
+            if not triggers:
+                return 0
+            
+            query = """
+            UNWIND $rows AS row
+            CREATE (m:AlertMatch {
+                id: row.id,
+                alertId: row.alertId,
+                postId: row.postId,
+                matchedKeywords: row.matchedKeywords,
+                priority: row.priority,
+                platform: row.platform,
+                matchedAt: row.matchedAt
+            })
+            """
+            self.conn.execute(query, {"rows": triggers})
+            
+            # 逐条建边，UNWIND 之后按主键 MATCH 会扫描 Post 表
+            rel_query = self.conn.prepare("""
+            MATCH (m:AlertMatch {id: $id}), (p:Post {id: $postId})
+            CREATE (m)-[:ALERTED]->(p)
+            """)
+            for trigger in triggers:
+                self.conn.execute(rel_query, {"id": trigger["id"], "postId": trigger["postId"]})
+            metrics.ROWS_WRITTEN.inc(len(triggers), "AlertMatch")
+            metrics.ROWS_WRITTEN.inc(len(triggers), "ALERTED")
+            
+            counts: Dict[str, int] = {}
+            for trigger in triggers:
+                counts[trigger["alertId"]] = counts.get(trigger["alertId"], 0) + 1
+            count_query = """
+            UNWIND $rows AS row
+            MATCH (r:AlertRule {id: row.id})
+            SET r.triggeredCount = r.triggeredCount + row.n
+            """
+            self.conn.execute(count_query, {"rows": [{"id": k, "n": v} for k, v in counts.items()]})
+            
+            self.events.publish_many("alert", triggers)
+            logger.info(f"Stored {len(triggers)} alert matches")
+            return len(triggers)
+        except Exception as e:
+            logger.error(f"Failed to store alert matches: {e}")
+            return 0
+    
+    async def get_alert_matches(self, alert_id: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """获取最近的警报触发记录"""
+        try:
+            query = "MATCH (m:AlertMatch)"
+            params = {}
+            if alert_id:
+                query += " WHERE m.alertId = $alertId"
+                params["alertId"] = alert_id
+            query += f"""
+            RETURN m.id, m.alertId, m.postId, m.matchedKeywords, m.priority,
+                   m.platform, m.matchedAt
+            ORDER BY m.matchedAt DESC
+            LIMIT {int(limit)}
+            """
+            result = self.conn.execute(query, params)
+            matches = []
+            while result.has_next():
+                row = result.get_next()
+                matches.append({
+                    "id": row[0],
+                    "alertId": row[1],
+                    "postId": row[2],
+                    "matchedKeywords": row[3],
+                    "priority": row[4],
+                    "platform": row[5],
+                    "matchedAt": row[6]
+                })
+            return matches
+        except Exception as e:
+            logger.error(f"Failed to get alert matches: {e}")
+            return []
+    
     # ========== 清理操作方法 ==========
     
     async def get_cleanup_rules(self, enabled_only: bool = True) -> List[Dict]:
@@ -514,13 +1249,13 @@ class SocialScraperKG:
                 MATCH (r:CleanupRule)
                 WHERE r.enabled = true
                 RETURN r.id, r.targetType, r.condition, r.threshold, 
-                       r.action, r.enabled, r.lastRun
+                       r.action, r.enabled, r.lastRun, r.intervalMinutes
                 """
             else:
                 query = """
                 MATCH (r:CleanupRule)
                 RETURN r.id, r.targetType, r.condition, r.threshold,
-                       r.action, r.enabled, r.lastRun
+                       r.action, r.enabled, r.lastRun, r.intervalMinutes
                 """
             
             result = self.conn.execute(query)
@@ -534,83 +1269,115 @@ class SocialScraperKG:
                     "threshold": row[3],
                     "action": row[4],
                     "enabled": row[5],
-                    "lastRun": row[6]
+                    "lastRun": row[6],
+                    "intervalMinutes": row[7]
                 })
             return rules
         except Exception as e:
             logger.error(f"Failed to get cleanup rules: {e}")
             return []
     
-    async def archive_old_posts(self, days: int = 90) -> int:
-        """归档旧帖子"""
+    async def mark_cleanup_rule_run(self, rule_id: str, run_at: Optional[datetime] = None) -> bool:
+        """更新规则的 lastRun"""
         try:
-            # 查询符合条件的帖子
             query = """
-            MATCH (p:Post)
-            WHERE p.scrapedAt < datetime_subtract(timestamp(), interval $days day)
-            RETURN p.id, p.platform, p.author, p.content, p.metadata
+            MATCH (r:CleanupRule {id: $id})
+            SET r.lastRun = $lastRun
             """
-            result = self.conn.execute(query, {"days": days})
+            self.conn.execute(query, {"id": rule_id, "lastRun": run_at or datetime.now()})
+            return True
+        except Exception as e:
+            logger.error(f"Failed to mark cleanup rule {rule_id}: {e}")
+            return False
+    
+    async def archive_old_posts(self, days: int = 90, limit: Optional[int] = None) -> int:
+        """
+        归档旧帖子
+        
+        limit 不为空时只处理最旧的 limit 条，供调度器分片执行
+        """
+        try:
+            cutoff = datetime.now() - timedelta(days=days)
             
-            archived_count = 0
+            # 选出本批次的帖子（Kuzu 的 LIMIT 不支持参数）
+            select_query = """
+            MATCH (p:Post)
+            WHERE p.scrapedAt < $cutoff
+            RETURN p.id
+            ORDER BY p.scrapedAt
+            """
+            if limit is not None:
+                select_query += f" LIMIT {int(limit)}"
+            result = self.conn.execute(select_query, {"cutoff": cutoff})
+            ids = []
             while result.has_next():
-                row = result.get_next()
-                post_id = row[0]
-                
-                # 移动到归档表
-                archive_query = """
-                CREATE (ap:ArchivedPost {
-                    id: $id,
-                    originalId: $originalId,
-                    platform: $platform,
-                    author: $author,
-                    content: $content,
-                    archivedAt: timestamp(),
-                    reason: $reason,
-                    metadata: $metadata
-                })
-                """
-                self.conn.execute(archive_query, {
-                    "id": f"archived_{post_id}",
-                    "originalId": post_id,
-                    "platform": row[1],
-                    "author": row[2],
-                    "content": row[3],
-                    "reason": f"Auto-archive after {days} days",
-                    "metadata": row[4]
-                })
-                
-                # 删除原帖子（关联数据会级联删除）
-                delete_query = """
-                MATCH (p:Post {id: $id})
-                DELETE p
-                """
-                self.conn.execute(delete_query, {"id": post_id})
-                
-                archived_count += 1
+                ids.append(result.get_next()[0])
+            if not ids:
+                return 0
+            
+            # 整批写入归档表
+            archive_query = """
+            MATCH (p:Post)
+            WHERE p.id IN $ids
+            MERGE (ap:ArchivedPost {id: concat('archived_', p.id)})
+            ON CREATE SET ap.originalId = p.id,
+                          ap.platform = p.platform,
+                          ap.author = p.author,
+                          ap.content = p.content,
+                          ap.archivedAt = $archivedAt,
+                          ap.reason = $reason,
+                          ap.metadata = p.metadata
+            """
+            self.conn.execute(archive_query, {
+                "ids": ids,
+                "archivedAt": datetime.now(),
+                "reason": f"Auto-archive after {days} days"
+            })
+            metrics.ROWS_WRITTEN.inc(len(ids), "ArchivedPost")
+            
+            # 删除原帖子及其关系
+            delete_query = """
+            MATCH (p:Post)
+            WHERE p.id IN $ids
+            DETACH DELETE p
+            """
+            self.conn.execute(delete_query, {"ids": ids})
+            self.forget_posts(ids)
             
-            logger.info(f"Archived {archived_count} old posts")
-            return archived_count
+            logger.info(f"Archived {len(ids)} old posts")
+            return len(ids)
         except Exception as e:
             logger.error(f"Failed to archive old posts: {e}")
             return 0
     
-    async def delete_low_relevance_posts(self, threshold: float = 3.0) -> int:
+    async def delete_low_relevance_posts(self, threshold: float = 3.0, limit: Optional[int] = None) -> int:
         """删除低相关度帖子"""
         try:
             query = """
             MATCH (fp:FilteredPost)
             WHERE fp.relevanceScore < $threshold
-            DELETE fp
             """
-            result = self.conn.execute(query, {"threshold": threshold})
-            deleted = result.get_summary()
+            if limit is not None:
+                query += f" WITH fp ORDER BY fp.relevanceScore LIMIT {int(limit)}"
+            query += """
+            DETACH DELETE fp
+            RETURN count(*)
+            """
+            result = self.conn.execute(query, {"threshold": float(threshold)})
+            deleted = result.get_next()[0] if result.has_next() else 0
             logger.info(f"Deleted {deleted} low relevance posts")
             return deleted
         except Exception as e:
             logger.error(f"Failed to delete low relevance posts: {e}")
             return 0
     
+    def get_slow_queries(self, limit: int = 50, query: Optional[str] = None) -> Dict[str, Any]:
+        """最近的慢查询记录（不访问数据库）"""
+        if self.slow_queries is None:
+            return {"enabled": False, "queries": [], "count": 0}
+        entries = self.slow_queries.entries(limit, query)
+        return {"enabled": True, **self.slow_queries.stats(), "queries": entries, "count": len(entries)}
+    
     async def get_stats(self) -> Dict[str, int]:
         """获取统计信息"""
         try:
@@ -644,6 +1411,19 @@ class SocialScraperKG:
     async def close(self):
         """关闭数据库连接"""
         try:
+            if self.dedup is not None:
+                self.dedup.save()
+            if not self.read_only:
+                self.trends.save()
+            if self.related is not None:
+                self.related.save()
+            if self.clusterer is not None:
+                self.clusterer.save()
+            if self.authors is not None:
+                self.authors.save()
+            if self.conn and self.auto_checkpoint and not self.read_only:
+                # 干净关闭时合并 WAL，下次启动不用回放
+                self.conn.execute("CHECKPOINT")
             if self.conn:
                 self.conn.close()
             if self.db:
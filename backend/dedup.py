@@ -0,0 +1,275 @@
+"""
+Social Scraper Near-Duplicate Detection
+基于 SimHash + 分段 LSH 的近重复内容检测（转推、引用链、复制粘贴刷屏）
+"""
+
+import hashlib
+import json
+import os
+import re
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+
+FINGERPRINT_BITS = 64
+
+# drop 模式下记住最近丢弃的帖子数，用来跳过它们随后到达的筛选 / 分析结果
+DROPPED_CAPACITY = 10_000
+
+# 转推前缀、链接、@提及不参与指纹计算
+_NOISE_RE = re.compile(r"^rt\s+@\w+:?|https?://\S+|@\w+", re.IGNORECASE)
+_WORD_RE = re.compile(r"[a-z0-9_#]+")
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """英文按词，CJK 按字符二元组"""
+    text = _NOISE_RE.sub(" ", text.lower())
+    features = _WORD_RE.findall(text)
+    for run in _CJK_RE.findall(text):
+        if len(run) == 1:
+            features.append(run)
+        else:
+            features.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return features
+
+
+def _feature_hash(feature: str) -> int:
+    # 内置 hash() 每个进程的种子不同，持久化后无法复用
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+
+
+def simhash(features: List[str]) -> int:
+    """64 位 SimHash，按特征词频加权"""
+    weights = [0] * FINGERPRINT_BITS
+    for feature, count in Counter(features).items():
+        h = _feature_hash(feature)
+        for bit in range(FINGERPRINT_BITS):
+            if h >> bit & 1:
+                weights[bit] += count
+            else:
+                weights[bit] -= count
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+class NearDuplicateIndex:
+    """
+    最近帖子的 SimHash LSH 索引
+
+    指纹切成 max_distance + 1 段，两个汉明距离不超过 max_distance 的指纹
+    至少有一段完全相同（鸽巢原理），因此只需比较同段桶内的候选。
+    容量有上限，超出时淘汰最早加入的帖子。
+    drop 模式下丢弃的帖子记在 dropped 中（有界），供入库跳过其依附的行。
+
+    持久化为快照 + 追加日志：新增和移除每 save_every 条追加到日志（淘汰在回放时按容量
+    重新发生，不必记录），save 重写快照并清空日志，只在关闭时调用
+    """
+
+    def __init__(
+        self,
+        similarity: float = 0.9,
+        capacity: int = 100_000,
+        min_features: int = 4,
+        path: Optional[Path] = None,
+        save_every: int = 1000
+    ):
+        if not 0 < similarity <= 1:
+            raise ValueError("similarity must be in (0, 1]")
+        self.similarity = similarity
+        self.max_distance = int((1 - similarity) * FINGERPRINT_BITS)
+        self.capacity = capacity
+        self.min_features = min_features
+        self.path = path
+        self.save_every = save_every
+
+        bands = self.max_distance + 1
+        width = FINGERPRINT_BITS // bands
+        self._bands: List[Tuple[int, int]] = [
+            (i * width, width if i < bands - 1 else FINGERPRINT_BITS - i * width)
+            for i in range(bands)
+        ]
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._buckets: List[Dict[int, Set[str]]] = [{} for _ in self._bands]
+        self._dropped: "OrderedDict[str, str]" = OrderedDict()
+        self._pending: List[list] = []
+        self._logged = 0
+
+        self.checked = 0
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _keys(self, fingerprint: int):
+        for i, (shift, width) in enumerate(self._bands):
+            yield i, fingerprint >> shift & ((1 << width) - 1)
+
+    def fingerprint(self, text: str) -> Optional[int]:
+        """内容过短时返回 None（不参与去重）"""
+        features = tokenize(text or "")
+        if len(features) < self.min_features:
+            return None
+        return simhash(features)
+
+    def find(self, fingerprint: int, exclude: Optional[str] = None) -> Optional[Tuple[str, float]]:
+        """查找最相似的已知帖子，返回 (post_id, similarity)"""
+        best_id, best_distance = None, self.max_distance + 1
+        seen = set()
+        for i, key in self._keys(fingerprint):
+            for post_id in self._buckets[i].get(key, ()):
+                if post_id in seen or post_id == exclude:
+                    continue
+                seen.add(post_id)
+                distance = (self._entries[post_id] ^ fingerprint).bit_count()
+                if distance < best_distance:
+                    best_id, best_distance = post_id, distance
+        if best_id is None:
+            return None
+        return best_id, 1 - best_distance / FINGERPRINT_BITS
+
+    def add(self, post_id: str, fingerprint: int):
+        self._insert(post_id, fingerprint)
+        self._log(["+", post_id, format(fingerprint, "x")])
+
+    def _insert(self, post_id: str, fingerprint: int):
+        if post_id in self._entries:
+            self._remove(post_id)
+        self._entries[post_id] = fingerprint
+        for i, key in self._keys(fingerprint):
+            self._buckets[i].setdefault(key, set()).add(post_id)
+        while len(self._entries) > self.capacity:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, post_id: str):
+        fingerprint = self._entries.pop(post_id)
+        for i, key in self._keys(fingerprint):
+            bucket = self._buckets[i].get(key)
+            if bucket is not None:
+                bucket.discard(post_id)
+                if not bucket:
+                    del self._buckets[i][key]
+
+    def remove(self, post_ids: List[str]):
+        """帖子被归档/删除后移出索引，之后的相似内容不再判为它的重复"""
+        for post_id in post_ids:
+            self._dropped.pop(post_id, None)
+            if post_id in self._entries:
+                self._remove(post_id)
+                self._log(["-", post_id])
+
+    def drop(self, post_id: str, original_id: str):
+        """记录 drop 模式下丢弃的帖子"""
+        self._dropped.pop(post_id, None)
+        self._dropped[post_id] = original_id
+        while len(self._dropped) > DROPPED_CAPACITY:
+            self._dropped.popitem(last=False)
+
+    def dropped(self, post_id: str) -> Optional[str]:
+        """帖子最近被作为近重复丢弃时返回原帖 ID"""
+        return self._dropped.get(post_id)
+
+    def check(self, post_id: str, text: str) -> Tuple[Optional[int], Optional[Tuple[str, float]]]:
+        """返回 (指纹, 近重复命中)；命中为 None 表示不是重复内容"""
+        # 重新提交的帖子以本次结果为准
+        self._dropped.pop(post_id, None)
+        fingerprint = self.fingerprint(text)
+        if fingerprint is None:
+            return None, None
+        self.checked += 1
+        match = self.find(fingerprint, exclude=post_id)
+        if match:
+            self.duplicates += 1
+        return fingerprint, match
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "similarity": self.similarity,
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "dropped": len(self._dropped)
+        }
+
+    # ========== 持久化 ==========
+
+    @property
+    def log_path(self) -> Path:
+        return self.path.with_suffix(".log")
+
+    def _log(self, record: list):
+        if not self.path:
+            return
+        self._pending.append(record)
+        if len(self._pending) >= self.save_every:
+            self.flush()
+
+    def flush(self):
+        """把尚未写出的新增 / 移除追加到日志"""
+        if not self.path or not self._pending:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in self._pending)
+        self._logged += len(self._pending)
+        self._pending = []
+
+    def save(self):
+        """原子写入索引快照并清空日志（压缩，关闭时调用）"""
+        if not self.path:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "bits": FINGERPRINT_BITS,
+                "entries": [[post_id, format(fp, "x")] for post_id, fp in self._entries.items()]
+            }, f)
+        os.replace(tmp, self.path)
+        # 快照已包含日志中的全部改动；在这之间崩溃时回放日志也只是重复同样的改动
+        if self.log_path.exists():
+            self.log_path.unlink()
+        self._pending = []
+        self._logged = 0
+
+    def load(self) -> int:
+        """加载快照并回放日志，返回加载的条目数"""
+        if not self.path:
+            return 0
+        try:
+            if self.path.exists():
+                with open(self.path, encoding="utf-8") as f:
+                    data = json.load(f)
+                for post_id, fp in data.get("entries", [])[-self.capacity:]:
+                    self._insert(post_id, int(fp, 16))
+            if self.log_path.exists():
+                self._replay()
+            if self._entries:
+                logger.info(f"Loaded {len(self._entries)} fingerprints from {self.path}")
+        except Exception as e:
+            logger.warning(f"Failed to load near-duplicate index: {e}")
+        # 多次未正常关闭时日志会一直增长，超过容量就在启动时压缩
+        if self._logged > self.capacity:
+            self.save()
+        return len(self._entries)
+
+    def _replay(self):
+        with open(self.log_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 崩溃时写了一半的最后一行
+                    continue
+                if record[0] == "+":
+                    self._insert(record[1], int(record[2], 16))
+                elif record[1] in self._entries:
+                    self._remove(record[1])
+                self._logged += 1
@@ -0,0 +1,303 @@
+"""
+Social Scraper Entity Extraction
+入库时抽取话题标签、@提及和链接域名，写成与 Post 相连的索引节点，
+按标签/域名查询时走主键和邻接表，不再对 content 做全表 LIKE
+"""
+
+import re
+import unicodedata
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from loguru import logger
+
+import bulk as bulk_loader
+
+
+MENTION_RE = re.compile(r"(?<![\w@/.])@([A-Za-z0-9_]{1,30})")
+REDDIT_USER_RE = re.compile(r"(?<![\w/])/?u/([A-Za-z0-9_-]{3,20})")
+
+# 一次扫描同时识别三类实体；链接在前，链接里的 # 和 @ 不会被误识别。
+# 话题支持微博式 #话题# 和 #tag（\w 覆盖中日韩文字），全角＃同样识别
+_ENTITY_RE = re.compile(
+    r"(?P<url>https?://[^\s<>\"'　-〿！-／]+)"
+    r"|[#＃](?P<topic>[^\s#＃,.!?;:，。！？；：、]{1,30})[#＃]"
+    r"|[#＃](?P<tag>[^\W_]\w{0,63})"
+    r"|(?<![\w@/.])@(?P<mention>[A-Za-z0-9_]{1,30})"
+)
+_URL_TRAILING = ".,;:!?)]}'\""
+_DOMAIN_PREFIXES = ("www.", "m.", "mobile.")
+
+
+def normalize_tag(tag: str) -> str:
+    """NFKC 归一（全角转半角）后小写，去掉前导 #"""
+    return unicodedata.normalize("NFKC", tag).lstrip("#").strip().lower()
+
+
+def normalize_domain(url: str) -> Optional[str]:
+    """链接的主机名：小写、去端口，去掉 www./m./mobile. 前缀"""
+    try:
+        host = urlsplit(url.rstrip(_URL_TRAILING)).hostname
+    except ValueError:
+        return None
+    if not host:
+        return None
+    host = host.rstrip(".")
+    for prefix in _DOMAIN_PREFIXES:
+        if host.startswith(prefix) and host.count(".") > 1:
+            host = host[len(prefix):]
+            break
+    return host if "." in host else None
+
+
+def extract_entities(text: str, platform: str = "twitter") -> Dict[str, List[Tuple[str, str]]]:
+    """
+    返回 {"hashtags": [tag], "mentions": [handle], "links": [(domain, url)]}
+
+    同一帖子内去重，保持出现顺序
+    """
+    hashtags: Dict[str, None] = {}
+    mentions: Dict[str, None] = {}
+    links: Dict[str, str] = {}
+    for match in _ENTITY_RE.finditer(text or ""):
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "url":
+            url = value.rstrip(_URL_TRAILING)
+            domain = normalize_domain(url)
+            if domain and domain not in links:
+                links[domain] = url
+        elif kind == "mention":
+            mentions.setdefault(value.lower())
+        else:
+            tag = normalize_tag(value)
+            if tag and not tag.isdigit():
+                hashtags.setdefault(tag)
+    if platform == "reddit":
+        for match in REDDIT_USER_RE.finditer(text or ""):
+            mentions.setdefault(match.group(1).lower())
+    return {
+        "hashtags": list(hashtags),
+        "mentions": list(mentions),
+        "links": list(links.items())
+    }
+
+
+def extract_batch(posts: Iterable[Dict[str, Any]], now: Optional[datetime] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    整批抽取，返回可直接 UNWIND 写库的行
+
+    节点行按批次聚合计数；边行的 at 取帖子时间，缺失时用入库时间
+    """
+    from authors import author_id
+    from database import parse_timestamp  # 避免循环导入
+
+    now = now or datetime.now()
+    tag_counts: Counter = Counter()
+    domain_counts: Counter = Counter()
+    first: Dict[Tuple[str, str], datetime] = {}
+    seen: Dict[Tuple[str, str], datetime] = {}
+    tagged, linked, mentioned, authors = [], [], [], {}
+
+    for post in posts:
+        platform = post.get("platform", "twitter")
+        try:
+            at = parse_timestamp(post.get("timestamp")) or now
+        except ValueError:
+            at = now
+        found = extract_entities(f"{post.get('title') or ''} {post.get('content') or ''}", platform)
+        for tag in found["hashtags"]:
+            tag_counts[tag] += 1
+            first[("tag", tag)] = min(at, first.get(("tag", tag), at))
+            seen[("tag", tag)] = max(at, seen.get(("tag", tag), at))
+            tagged.append({"post": post["id"], "key": tag, "at": at})
+        for domain, url in found["links"]:
+            domain_counts[domain] += 1
+            first[("domain", domain)] = min(at, first.get(("domain", domain), at))
+            seen[("domain", domain)] = max(at, seen.get(("domain", domain), at))
+            linked.append({"post": post["id"], "key": domain, "url": url, "at": at})
+        for handle in found["mentions"]:
+            aid = author_id(platform, handle)
+            authors[aid] = {"id": aid, "handle": handle, "platform": platform}
+            mentioned.append({"post": post["id"], "key": aid, "at": at})
+
+    return {
+        "hashtags": [{"id": t, "count": c, "first": first[("tag", t)], "at": seen[("tag", t)]}
+                     for t, c in tag_counts.items()],
+        "domains": [{"id": d, "count": c, "first": first[("domain", d)], "at": seen[("domain", d)]}
+                    for d, c in domain_counts.items()],
+        "authors": list(authors.values()),
+        "tagged": tagged,
+        "linked": linked,
+        "mentioned": mentioned
+    }
+
+
+UPSERT_HASHTAGS = """
+UNWIND $rows AS r
+MERGE (h:Hashtag {id: r.id})
+ON CREATE SET h.postCount = r.count, h.firstSeen = r.first, h.lastSeen = r.at
+ON MATCH SET h.postCount = h.postCount + r.count,
+             h.firstSeen = CASE WHEN r.first < h.firstSeen THEN r.first ELSE h.firstSeen END,
+             h.lastSeen = CASE WHEN r.at > h.lastSeen THEN r.at ELSE h.lastSeen END
+"""
+
+UPSERT_DOMAINS = """
+UNWIND $rows AS r
+MERGE (d:Domain {id: r.id})
+ON CREATE SET d.postCount = r.count, d.firstSeen = r.first, d.lastSeen = r.at
+ON MATCH SET d.postCount = d.postCount + r.count,
+             d.firstSeen = CASE WHEN r.first < d.firstSeen THEN r.first ELSE d.firstSeen END,
+             d.lastSeen = CASE WHEN r.at > d.lastSeen THEN r.at ELSE d.lastSeen END
+"""
+
+# 只补建缺失的作者，计数和影响力由作者图维护
+ENSURE_AUTHORS = """
+UNWIND $rows AS r
+MERGE (a:Author {id: r.id})
+ON CREATE SET a.handle = r.handle, a.platform = r.platform, a.displayName = '',
+              a.postCount = 0, a.mentionedCount = 0, a.influence = 0.0,
+              a.firstSeen = $now, a.lastSeen = $now
+"""
+
+# 逐条建边：单行参数的主键 MATCH 走索引；UNWIND 之后的 MATCH 对每一行都扫描端点表，
+# 成本随 Post 表线性增长
+LINK_HASHTAGS = """
+MATCH (p:Post {id: $post}), (h:Hashtag {id: $key})
+CREATE (p)-[:TAGGED {at: $at}]->(h)
+"""
+
+LINK_DOMAINS = """
+MATCH (p:Post {id: $post}), (d:Domain {id: $key})
+CREATE (p)-[:LINKS_TO {url: $url, at: $at}]->(d)
+"""
+
+LINK_MENTIONED = """
+MATCH (p:Post {id: $post}), (a:Author {id: $key})
+CREATE (p)-[:MENTIONED {at: $at}]->(a)
+"""
+
+# kind -> (节点表, 关系表)
+KINDS = {
+    "hashtag": ("Hashtag", "TAGGED"),
+    "domain": ("Domain", "LINKS_TO"),
+    "mention": ("Author", "MENTIONED"),
+}
+
+
+# 离线导入时的 COPY 列顺序，须与迁移中的表定义一致
+NODE_COLUMNS = ("id", "postCount", "firstSeen", "lastSeen")
+AUTHOR_COLUMNS = ("id", "handle", "platform", "displayName", "postCount", "mentionedCount",
+                  "influence", "firstSeen", "lastSeen")
+
+# 关系表 -> (批次中的键, COPY 列顺序, 逐条建边语句)
+REL_TABLES = {
+    "TAGGED": ("tagged", ("post", "key", "at"), LINK_HASHTAGS),
+    "LINKS_TO": ("linked", ("post", "key", "url", "at"), LINK_DOMAINS),
+    "MENTIONED": ("mentioned", ("post", "key", "at"), LINK_MENTIONED),
+}
+
+
+def store(conn, batch: Dict[str, List[Dict[str, Any]]], chunk: int = 1000):
+    """
+    入库时先 MERGE 实体节点再逐条建边
+
+    节点一律走 UNWIND：入库前已有 CREATE/MERGE，此时 COPY 触发的检查点会写坏数据（见 bulk.py）；
+    边用预编译的单行语句，每条边只做两次主键查找
+    """
+    now = datetime.now()
+    for query, key in (
+        (UPSERT_HASHTAGS, "hashtags"),
+        (UPSERT_DOMAINS, "domains"),
+        (ENSURE_AUTHORS, "authors"),
+    ):
+        rows = batch[key]
+        for i in range(0, len(rows), chunk):
+            params = {"rows": rows[i:i + chunk]}
+            if key == "authors":
+                params["now"] = now
+            conn.execute(query, params)
+
+    for key, _, query in REL_TABLES.values():
+        rows = batch[key]
+        if rows:
+            statement = conn.prepare(query)
+            for row in rows:
+                conn.execute(statement, row)
+
+
+def _merge_nodes(target: Dict[str, Dict[str, Any]], rows: List[Dict[str, Any]]):
+    for row in rows:
+        node = target.get(row["id"])
+        if node is None:
+            target[row["id"]] = {"id": row["id"], "postCount": row["count"],
+                                 "firstSeen": row["first"], "lastSeen": row["at"]}
+        else:
+            node["postCount"] += row["count"]
+            node["firstSeen"] = min(node["firstSeen"], row["first"])
+            node["lastSeen"] = max(node["lastSeen"], row["at"])
+
+
+def backfill(conn, chunk: int = 50000, tmp_dir: Optional[str] = None) -> int:
+    """
+    从已有帖子补建实体索引（迁移时执行一次，需在自动事务模式下运行）
+
+    扫描时节点在内存中聚合、边行写入临时 CSV，扫描结束后全部用 COPY 导入，
+    期间不做 CREATE/MERGE。先清掉上次中断留下的边和节点，保证可重复执行
+    """
+    for label, table in KINDS.values():
+        conn.execute(f"MATCH (:Post)-[r:{table}]->(:{label}) DELETE r")
+    for label in ("Hashtag", "Domain"):
+        conn.execute(f"MATCH (n:{label}) DELETE n")
+
+    existing = set()
+    result = conn.execute("MATCH (a:Author) RETURN a.id")
+    while result.has_next():
+        existing.add(result.get_next()[0])
+
+    now = datetime.now()
+    hashtags: Dict[str, Dict[str, Any]] = {}
+    domains: Dict[str, Dict[str, Any]] = {}
+    new_authors: Dict[str, Dict[str, Any]] = {}
+    spools = {
+        table: bulk_loader.CsvSpool(table, columns, tmp_dir)
+        for table, (_, columns, _) in REL_TABLES.items()
+    }
+    processed = 0
+    try:
+        result = conn.execute("MATCH (p:Post) RETURN p.id, p.platform, p.title, p.content, p.timestamp")
+        posts = []
+        while result.has_next():
+            post_id, platform, title, content, timestamp = result.get_next()
+            posts.append({"id": post_id, "platform": platform or "twitter", "title": title,
+                          "content": content, "timestamp": timestamp})
+            if len(posts) >= chunk or not result.has_next():
+                batch = extract_batch(posts, now)
+                _merge_nodes(hashtags, batch["hashtags"])
+                _merge_nodes(domains, batch["domains"])
+                for row in batch["authors"]:
+                    if row["id"] not in existing:
+                        new_authors[row["id"]] = row
+                for table, (key, _, _) in REL_TABLES.items():
+                    spools[table].write(batch[key])
+                processed += len(posts)
+                posts = []
+
+        bulk_loader.copy_rows(conn, "Hashtag", hashtags.values(), NODE_COLUMNS, tmp_dir)
+        bulk_loader.copy_rows(conn, "Domain", domains.values(), NODE_COLUMNS, tmp_dir)
+        bulk_loader.copy_rows(conn, "Author", (
+            {**row, "displayName": "", "postCount": 0, "mentionedCount": 0, "influence": 0.0,
+             "firstSeen": now, "lastSeen": now}
+            for row in new_authors.values()
+        ), AUTHOR_COLUMNS, tmp_dir)
+        for spool in spools.values():
+            spool.copy(conn)
+    finally:
+        for spool in spools.values():
+            spool.discard()
+
+    if processed:
+        logger.info(f"Backfilled hashtag/mention/domain index from {processed} posts")
+    return processed
@@ -0,0 +1,300 @@
+"""
+Social Scraper Event Bus
+入库事件的进程内广播：新帖子摘要、警报触发和计数增量，供 SSE 实时推送
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Iterable, List, NamedTuple, Optional
+
+
+class Event(NamedTuple):
+    id: str
+    type: str
+    data: Dict[str, Any]
+    payload: str  # 预先序列化，所有客户端共用
+
+
+class Subscription:
+    """
+    单个客户端的有界事件缓冲
+
+    缓冲满说明客户端消费过慢，此时直接断开（dropped），
+    客户端带 Last-Event-ID 重连后从历史中补发
+    """
+
+    def __init__(self, bus: "EventBus", filters: Dict[str, Any], maxsize: int):
+        self.bus = bus
+        self.filters = filters
+        self.maxsize = maxsize
+        self.closed = False
+        self.dropped = False
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def matches(self, event: Event) -> bool:
+        types = self.filters.get("types")
+        if types and event.type not in types:
+            return False
+        if event.type == "stats":
+            return True
+        for key in ("platform", "category"):
+            wanted = self.filters.get(key)
+            # 设置了过滤条件时，不带该字段的事件（如尚未筛选的帖子没有分类）不推送
+            if wanted and event.data.get(key) != wanted:
+                return False
+        return True
+
+    def deliver(self, event: Event):
+        with self._cond:
+            if self.closed or not self.matches(event):
+                return
+            if len(self._queue) >= self.maxsize:
+                self.dropped = True
+                self.closed = True
+            else:
+                self._queue.append(event)
+            self._cond.notify_all()
+        self._wake()
+
+    def _wake(self):
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    def _drain(self) -> List[Event]:
+        events = list(self._queue)
+        self._queue.clear()
+        return events
+
+    def get(self, timeout: float) -> List[Event]:
+        """阻塞等待事件（线程服务器使用），超时返回空列表"""
+        with self._cond:
+            if not self._queue and not self.closed:
+                self._cond.wait(timeout)
+            return self._drain()
+
+    async def aget(self, timeout: float) -> List[Event]:
+        """异步等待事件（FastAPI 使用），超时返回空列表"""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+        with self._cond:
+            if self._queue or self.closed:
+                return self._drain()
+            self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        with self._cond:
+            return self._drain()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        self._wake()
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """
+    事件广播
+
+    最近 history 条事件保存在环形缓冲中用于断线续传。事件 ID 形如
+    "<启动标识>-<序号>"，重启后旧 ID 无法续传，客户端会收到 reset 事件。
+    max_streams 限制 serve_sse 同时输出的事件流数（每个占用一个工作线程）。
+    """
+
+    def __init__(self, history: int = 5000, client_buffer: int = 1000, max_streams: int = 32):
+        self.client_buffer = client_buffer
+        self.max_streams = max_streams
+        self._history: deque = deque(maxlen=history)
+        self._subscribers: List[Subscription] = []
+        self._lock = threading.Lock()
+        self._boot = format(int(time.time()), "x")
+        self._seq = 0
+        self.published = 0
+        self.dropped_clients = 0
+        self.rejected_clients = 0
+        self._streams = 0
+
+    @classmethod
+    def from_env(cls) -> "EventBus":
+        return cls(
+            history=int(os.getenv("EVENTS_HISTORY", "5000")),
+            client_buffer=int(os.getenv("EVENTS_CLIENT_BUFFER", "1000")),
+            # 默认不超过工作线程数（httpcore.MAX_THREADS）的一半，其余留给普通请求
+            max_streams=int(os.getenv("EVENTS_MAX_STREAMS", str(max(1, int(os.getenv("HTTP_THREADS", "64")) // 2))))
+        )
+
+    def publish(self, event_type: str, data: Dict[str, Any]) -> Event:
+        with self._lock:
+            self._seq += 1
+            event_id = f"{self._boot}-{self._seq}"
+            event = Event(event_id, event_type, data, json.dumps(data, ensure_ascii=False, default=str))
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+            self.published += 1
+        for sub in subscribers:
+            sub.deliver(event)
+            if sub.dropped and sub.closed:
+                self._remove(sub, dropped=True)
+        return event
+
+    def publish_many(self, event_type: str, items: Iterable[Dict[str, Any]]):
+        for data in items:
+            self.publish(event_type, data)
+
+    def subscribe(
+        self,
+        last_event_id: Optional[str] = None,
+        platform: Optional[str] = None,
+        category: Optional[str] = None,
+        types: Optional[Iterable[str]] = None
+    ) -> Subscription:
+        """
+        注册客户端；带 last_event_id 时先补发其后的历史事件
+
+        历史已被覆盖或 ID 来自上一次启动时，先放入一条 reset 事件，
+        提示客户端重新拉取快照
+        """
+        filters = {"platform": platform, "category": category, "types": set(types) if types else None}
+        sub = Subscription(self, filters, self.client_buffer)
+        with self._lock:
+            if last_event_id:
+                for event in self._replay(last_event_id):
+                    if sub.matches(event) or event.type == "reset":
+                        sub._queue.append(event)
+            self._subscribers.append(sub)
+        return sub
+
+    def _replay(self, last_event_id: str) -> List[Event]:
+        boot, _, seq = last_event_id.partition("-")
+        seq = int(seq) if seq.isdigit() else -1
+        history = list(self._history)
+        oldest = int(history[0].id.partition("-")[2]) if history else self._seq + 1
+        if boot == self._boot and seq >= 0 and seq + 1 >= oldest:
+            return [e for e in history if int(e.id.partition("-")[2]) > seq]
+        # reset 不带 ID，客户端的 Last-Event-ID 仍以真实事件为准
+        data = {"reason": "history unavailable", "lastEventId": last_event_id}
+        return [Event("", "reset", data, json.dumps(data))] + history
+
+    def open_stream(self) -> bool:
+        """占用一个事件流名额，已满时返回 False"""
+        with self._lock:
+            if self._streams >= self.max_streams:
+                self.rejected_clients += 1
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self):
+        with self._lock:
+            self._streams -= 1
+
+    def unsubscribe(self, sub: Subscription):
+        self._remove(sub)
+
+    def _remove(self, sub: Subscription, dropped: bool = False):
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+                if dropped:
+                    self.dropped_clients += 1
+
+    def buffered(self) -> int:
+        """各订阅者缓冲中尚未发送的事件总数"""
+        return sum(len(sub._queue) for sub in list(self._subscribers))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "history": len(self._history),
+            "droppedClients": self.dropped_clients,
+            "streams": self._streams,
+            "rejectedClients": self.rejected_clients
+        }
+
+
+def format_sse(event: Event) -> str:
+    prefix = f"id: {event.id}\n" if event.id else ""
+    return f"{prefix}event: {event.type}\ndata: {event.payload}\n\n"
+
+
+def format_dropped(last_event_id: Optional[str]) -> str:
+    """慢消费者被断开前的最后一条消息"""
+    data = json.dumps({"reason": "client buffer overflow", "lastEventId": last_event_id})
+    return f"event: dropped\ndata: {data}\n\n"
+
+
+def serve_sse(handler, bus: EventBus, params: Dict[str, List[str]], keepalive: float = 15.0):
+    """
+    在 BaseHTTPRequestHandler 中输出事件流（轻量版服务器使用）
+
+    会一直占用当前请求线程直到客户端断开，服务器需要是多线程的。同时输出的事件流
+    超过 bus.max_streams 时返回 503，避免长连接占满工作线程池
+    """
+    def param(name):
+        return params.get(name, [None])[0]
+
+    if not bus.open_stream():
+        body = json.dumps({"error": "Too many event stream clients", "limit": bus.max_streams}).encode()
+        handler.send_response(503)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.send_header('Retry-After', str(int(keepalive)))
+        handler.send_header('Access-Control-Allow-Origin', '*')
+        handler.end_headers()
+        handler.wfile.write(body)
+        return
+
+    try:
+        _stream(handler, bus, param, keepalive)
+    finally:
+        bus.close_stream()
+
+
+def _stream(handler, bus: EventBus, param, keepalive: float):
+    types = param('types')
+    sub = bus.subscribe(
+        last_event_id=handler.headers.get('Last-Event-ID') or param('last_event_id'),
+        platform=param('platform'),
+        category=param('category'),
+        types=types.split(',') if types else None
+    )
+    handler.send_response(200)
+    handler.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+    handler.send_header('Cache-Control', 'no-cache')
+    handler.send_header('Access-Control-Allow-Origin', '*')
+    handler.end_headers()
+
+    last_id = None
+    try:
+        handler.wfile.write(b"retry: 3000\n\n")
+        handler.wfile.flush()
+        while True:
+            events = sub.get(timeout=keepalive)
+            chunk = "".join(format_sse(e) for e in events)
+            last_id = next((e.id for e in reversed(events) if e.id), last_id)
+            if sub.dropped:
+                chunk += format_dropped(last_id)
+            handler.wfile.write((chunk or ": keepalive\n\n").encode())
+            handler.wfile.flush()
+            if sub.dropped:
+                break
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        sub.close()
@@ -0,0 +1,382 @@
+"""
+Social Scraper Export
+/api/export 的流式导出：Post / FilteredPost / DiscoveryResult 按节点内部偏移分片读取，
+逐页编码（JSONL / CSV / Parquet）并压缩后写出，内存占用只和分页大小有关
+
+- Kuzu 的查询结果会整体物化，不能一次查出全表；按 offset(ID(n)) 区间分片，
+  每片最多 EXPORT_PAGE_ROWS 行，不需要排序，也不依赖 SKIP
+- 时间范围作用在实体自己的时间列上（scrapedAt / filteredAt / analyzedAt），
+  平台和分类需要时经 FILTERED_FROM / ANALYZED 关联到 Post / FilteredPost 过滤
+- join 时附带关联节点的列（post.* / filtered.* / discovery.*），没有关联的为空
+- 分片之间不是同一快照：导出期间写入或删除的行可能出现也可能不出现
+"""
+
+import csv
+import io
+import json
+import os
+import zlib
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from cleanup import TARGETS
+from database import SocialScraperKG, parse_timestamp
+import metrics
+
+PAGE_ROWS = int(os.getenv("EXPORT_PAGE_ROWS", "10000"))
+
+# 请求中的实体名 -> 节点表
+ENTITIES = {"posts": "Post", "filtered": "FilteredPost", "discovery": "DiscoveryResult"}
+FORMATS = ("jsonl", "csv", "parquet")
+# Parquet 总是按列 zstd 压缩，忽略 compress
+COMPRESSIONS = ("gzip", "none")
+
+ALIASES = {"Post": "p", "FilteredPost": "f", "DiscoveryResult": "d"}
+JOIN_PREFIXES = {"Post": "post", "FilteredPost": "filtered", "DiscoveryResult": "discovery"}
+# 指向 Post 的关系
+POST_RELATIONS = {"FilteredPost": "FILTERED_FROM", "DiscoveryResult": "ANALYZED"}
+
+CONTENT_TYPES = {
+    "jsonl": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+EXPORT_ROWS = metrics.REGISTRY.counter("export_rows_total", "Rows streamed by /api/export", ("entity", "format"))
+
+
+def _flag(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value or "").lower() in ("1", "true", "yes", "on")
+
+
+def _plain(value):
+    """JSON / CSV 中时间统一为 ISO 字符串"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class ExportJob:
+    """一次导出请求：校验参数并生成分片查询；参数不合法时抛出 ValueError"""
+
+    def __init__(
+        self,
+        entity: str = "posts",
+        fmt: str = "jsonl",
+        compress: str = "gzip",
+        since: Any = None,
+        until: Any = None,
+        platform: Optional[str] = None,
+        category: Optional[str] = None,
+        join: Any = False,
+        page_rows: int = PAGE_ROWS
+    ):
+        if entity not in ENTITIES:
+            raise ValueError(f"entity must be one of {', '.join(ENTITIES)}")
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        if compress not in COMPRESSIONS:
+            raise ValueError(f"compress must be one of {', '.join(COMPRESSIONS)}")
+        try:
+            since, until = parse_timestamp(since), parse_timestamp(until)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid time range: {e}")
+
+        self.entity = entity
+        self.label = ENTITIES[entity]
+        self.format = fmt
+        self.compress = "none" if fmt == "parquet" else compress
+        self.page_rows = max(1, int(page_rows))
+
+        spec = TARGETS[self.label]
+        alias = ALIASES[self.label]
+        self.columns: List[str] = list(spec.columns)
+        self._types: List[Tuple[str, str]] = [(self.label, column) for column in spec.columns]
+        returns = [f"{alias}.{column}" for column in spec.columns]
+
+        where = [f"offset(ID({alias})) >= $lo", f"offset(ID({alias})) < $hi"]
+        self.params: Dict[str, Any] = {}
+        if since is not None:
+            where.append(f"{alias}.{spec.time_column} >= $since")
+            self.params["since"] = since
+        if until is not None:
+            where.append(f"{alias}.{spec.time_column} < $until")
+            self.params["until"] = until
+
+        # 过滤需要的关联节点（MATCH），以及只为附带列而关联的节点（OPTIONAL MATCH）
+        required: Dict[str, Optional[str]] = {}
+        if platform:
+            self.params["platform"] = platform
+            if self.label == "Post":
+                where.append("p.platform = $platform")
+            else:
+                required["Post"] = "p.platform = $platform"
+        if category:
+            self.params["category"] = category
+            if self.label == "FilteredPost":
+                where.append("f.category = $category")
+            else:
+                if self.label == "DiscoveryResult":
+                    required.setdefault("Post", None)
+                required["FilteredPost"] = "f.category = $category"
+
+        self.join = _flag(join)
+        joined = []
+        if self.join:
+            joined = ["FilteredPost", "DiscoveryResult"] if self.label == "Post" else ["Post"]
+
+        clauses = [f"MATCH ({alias}:{self.label}) WHERE {' AND '.join(where)}"]
+        for label, condition in required.items():
+            clause = f"MATCH {self._pattern(label)}"
+            clauses.append(f"{clause} WHERE {condition}" if condition else clause)
+        for label in joined:
+            if label not in required:
+                clauses.append(f"OPTIONAL MATCH {self._pattern(label)}")
+            for column in TARGETS[label].columns:
+                self.columns.append(f"{JOIN_PREFIXES[label]}.{column}")
+                self._types.append((label, column))
+                returns.append(f"{ALIASES[label]}.{column}")
+
+        clauses.append("RETURN " + ", ".join(returns))
+        self.query = "\n".join(clauses)
+        self._max_offset = f"MATCH ({alias}:{self.label}) RETURN max(offset(ID({alias})))"
+
+    @classmethod
+    def from_query(cls, params: Dict[str, Any]) -> "ExportJob":
+        """查询字符串参数（format 对应 fmt）"""
+        return cls(
+            entity=params.get("entity") or "posts",
+            fmt=params.get("format") or "jsonl",
+            compress=params.get("compress") or "gzip",
+            since=params.get("since"),
+            until=params.get("until"),
+            platform=params.get("platform"),
+            category=params.get("category"),
+            join=params.get("join")
+        )
+
+    def _pattern(self, label: str) -> str:
+        """从实体节点（或已绑定的 p）到关联节点的路径"""
+        if label == "Post":
+            return f"({ALIASES[self.label]})-[:{POST_RELATIONS[self.label]}]->(p:Post)"
+        return f"({ALIASES[label]}:{label})-[:{POST_RELATIONS[label]}]->(p)"
+
+    @property
+    def content_type(self) -> str:
+        if self.compress == "gzip":
+            return "application/gzip"
+        return CONTENT_TYPES[self.format]
+
+    @property
+    def filename(self) -> str:
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        suffix = ".gz" if self.compress == "gzip" else ""
+        return f"{self.label}_{stamp}.{self.format}{suffix}"
+
+    def headers(self) -> Dict[str, str]:
+        return {"Content-Disposition": f'attachment; filename="{self.filename}"'}
+
+    def slices(self, kg: SocialScraperKG) -> Iterator[Tuple[int, int]]:
+        """实体表的偏移区间（最大偏移只查一次，之后新增的行不在本次导出中）"""
+        result = kg.conn.execute(self._max_offset)
+        top = result.get_next()[0] if result.has_next() else None
+        if top is None:
+            return
+        for lo in range(0, top + 1, self.page_rows):
+            yield lo, lo + self.page_rows
+
+    def fetch(self, kg: SocialScraperKG, lo: int, hi: int) -> List[list]:
+        result = kg.conn.execute(self.query, dict(self.params, lo=lo, hi=hi))
+        rows = []
+        while result.has_next():
+            rows.append(result.get_next())
+        return rows
+
+    def column_types(self, kg: SocialScraperKG) -> List[str]:
+        """导出列的 Kuzu 类型（Parquet schema 用）"""
+        tables = {}
+        for label in {label for label, _ in self._types}:
+            result = kg.conn.execute(f"CALL table_info('{label}') RETURN name, type")
+            types = {}
+            while result.has_next():
+                name, kind = result.get_next()
+                types[name] = kind
+            tables[label] = types
+        return [tables[label][column] for label, column in self._types]
+
+
+# ========== 编码 ==========
+
+class JsonlEncoder:
+    def __init__(self, columns: List[str]):
+        self.columns = columns
+
+    def start(self) -> bytes:
+        return b""
+
+    def encode(self, rows: List[list]) -> bytes:
+        lines = [
+            json.dumps(dict(zip(self.columns, map(_plain, row))), ensure_ascii=False, default=str)
+            for row in rows
+        ]
+        return ("\n".join(lines) + "\n").encode("utf-8") if lines else b""
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class CsvEncoder:
+    def __init__(self, columns: List[str]):
+        self.columns = columns
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def _take(self) -> bytes:
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def start(self) -> bytes:
+        self._writer.writerow(self.columns)
+        return self._take()
+
+    def encode(self, rows: List[list]) -> bytes:
+        self._writer.writerows([_plain(value) for value in row] for row in rows)
+        return self._take()
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class _ChunkSink:
+    """ParquetWriter 的输出：收集写出的字节，由 take() 取走"""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ParquetEncoder:
+    """每页一个 row group；schema 取自 Kuzu 表结构，空导出也是合法的 Parquet 文件"""
+
+    # Kuzu 类型 -> pyarrow 类型工厂名，其他类型按字符串处理
+    TYPES = {
+        "INT64": "int64",
+        "DOUBLE": "float64",
+        "BOOL": "bool_",
+    }
+
+    def __init__(self, columns: List[str], kuzu_types: List[str]):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow: pip install pyarrow")
+        self._pa = pa
+        self.columns = columns
+        self.schema = pa.schema([
+            pa.field(column, self._arrow_type(pa, kind))
+            for column, kind in zip(columns, kuzu_types)
+        ])
+        self._sink = _ChunkSink()
+        self._writer = pq.ParquetWriter(self._sink, self.schema, compression="zstd")
+
+    @classmethod
+    def _arrow_type(cls, pa, kind: str):
+        if kind == "TIMESTAMP":
+            return pa.timestamp("us")
+        return getattr(pa, cls.TYPES.get(kind, "string"))()
+
+    def start(self) -> bytes:
+        return self._sink.take()
+
+    def encode(self, rows: List[list]) -> bytes:
+        if rows:
+            columns = list(zip(*rows))
+            table = self._pa.Table.from_arrays(
+                [self._pa.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+                schema=self.schema
+            )
+            self._writer.write_table(table)
+        return self._sink.take()
+
+    def finish(self) -> bytes:
+        self._writer.close()
+        return self._sink.take()
+
+
+def encoder_for(job: ExportJob, kg: SocialScraperKG):
+    if job.format == "parquet":
+        return ParquetEncoder(job.columns, job.column_types(kg))
+    if job.format == "csv":
+        return CsvEncoder(job.columns)
+    return JsonlEncoder(job.columns)
+
+
+# ========== 输出 ==========
+
+def stream(current_kg: Callable[[], SocialScraperKG], job: ExportJob, lock=None) -> Iterator[bytes]:
+    """
+    打开导出：先建好编码器、算好分片（缺少 pyarrow 等错误在写出响应头之前抛出），
+    返回逐页产出编码、压缩后字节块的迭代器
+
+    每页重新取 current_kg()（读进程切换快照后旧连接会被关闭，快照之间节点偏移不变）；
+    lock 只在每页查询期间持有（轻量版服务的数据库锁），编码和写出时其他请求可以访问数据库
+    """
+    lock = lock or nullcontext()
+    with lock:
+        encoder = encoder_for(job, current_kg())
+        slices = list(job.slices(current_kg()))
+    return _chunks(current_kg, job, lock, encoder, slices)
+
+
+def _chunks(current_kg, job: ExportJob, lock, encoder, slices: List[Tuple[int, int]]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if job.compress == "gzip" else None
+
+    def emit(data: bytes) -> bytes:
+        return compressor.compress(data) if compressor and data else data
+
+    chunk = emit(encoder.start())
+    if chunk:
+        yield chunk
+    rows_total = 0
+    try:
+        for lo, hi in slices:
+            with lock:
+                rows = job.fetch(current_kg(), lo, hi)
+            rows_total += len(rows)
+            chunk = emit(encoder.encode(rows))
+            if chunk:
+                yield chunk
+        tail = emit(encoder.finish())
+        if compressor:
+            tail += compressor.flush()
+        if tail:
+            yield tail
+    finally:
+        EXPORT_ROWS.inc(rows_total, job.entity, job.format)
@@ -0,0 +1,401 @@
+"""
+Social Scraper HTTP Core
+基于 asyncio streams 的 HTTP/1.1 服务器，供无依赖的轻量版 / 最小版服务使用
+
+- 持久连接和管线化：同一连接上的请求按顺序读取、按顺序回复，空闲超时后关闭
+- 请求头、请求体有大小上限，超出时返回 431 / 413 并关闭连接；支持 chunked 请求体和 Expect: 100-continue
+- CORS 预检直接返回预先生成的响应（带 Access-Control-Max-Age），不进入处理器
+- 处理器沿用 BaseHTTPRequestHandler 子类（do_GET / send_response / send_header / wfile），
+  在线程中运行，可以持有数据库锁、阻塞等待；响应先缓冲，结束后补上 Content-Length 一次写出。
+  处理器调用 wfile.flush() 时改为流式输出（SSE、导出），该连接在处理器返回后关闭；
+  流式写出等待发送缓冲降到水位线以下，慢客户端不会让响应在内存中堆积
+"""
+
+import asyncio
+import concurrent.futures
+import io
+import json
+import os
+import queue
+import socket
+import threading
+from http import HTTPStatus
+from http.client import HTTPException, parse_headers
+from typing import Dict, Optional, Tuple
+
+import metrics
+
+MAX_HEADER_BYTES = int(os.getenv("HTTP_MAX_HEADER_BYTES", str(64 * 1024)))
+MAX_BODY_BYTES = int(os.getenv("HTTP_MAX_BODY_BYTES", str(64 * 1024 * 1024)))
+KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "15"))
+BODY_TIMEOUT = 30.0
+MAX_THREADS = int(os.getenv("HTTP_THREADS", "64"))
+
+CONNECTIONS = metrics.REGISTRY.gauge("http_connections_open", "Open client connections (asyncio HTTP core)")
+
+
+class ProtocolError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _status_line(status: int) -> bytes:
+    return f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n".encode("latin-1")
+
+
+def _error_response(status: int, message: str) -> bytes:
+    body = json.dumps({"error": message}).encode()
+    return (
+        _status_line(status)
+        + b"Content-Type: application/json\r\n"
+        + b"Access-Control-Allow-Origin: *\r\n"
+        + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+        + body
+    )
+
+
+def _with_headers(head: bytes, extra: Dict[str, str]) -> bytes:
+    """在响应头块（以空行结尾）末尾追加头部"""
+    lines = "".join(f"{key}: {value}\r\n" for key, value in extra.items()).encode("latin-1")
+    return head[:-2] + lines + b"\r\n"
+
+
+class _Workers:
+    """
+    守护线程池，线程按需创建，最多 max_workers 个
+
+    不用 ThreadPoolExecutor：它的线程在解释器退出时会被等待，阻塞中的事件流请求会拖住退出
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._tasks: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._threads = 0
+        self._idle = 0
+        self._pending = 0
+
+    def submit(self, loop: asyncio.AbstractEventLoop, fn, *args) -> asyncio.Future:
+        future = loop.create_future()
+        self._tasks.put((loop, future, fn, args))
+        with self._lock:
+            # 按排队数而不是有无空闲线程判断：同时到达的多个请求只有一个能被空闲线程取走，
+            # 其余若是事件流等长任务就会一直排队
+            self._pending += 1
+            if self._pending > self._idle and self._threads < self.max_workers:
+                self._threads += 1
+                threading.Thread(target=self._run, daemon=True).start()
+        return future
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result, error):
+        if future.cancelled():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._idle += 1
+            loop, future, fn, args = self._tasks.get()
+            with self._lock:
+                self._idle -= 1
+                self._pending -= 1
+            result, error = None, None
+            try:
+                result = fn(*args)
+            except Exception as e:
+                error = e
+            try:
+                loop.call_soon_threadsafe(self._resolve, future, result, error)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+
+class _ResponseWriter:
+    """处理器的 wfile：缓冲响应体；flush 后切换为流式写出（在处理器线程中调用）"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, writer: asyncio.StreamWriter):
+        self.loop = loop
+        self.writer = writer
+        self.head: Optional[bytes] = None
+        self.body = []
+        self.streaming = False
+
+    def write(self, data) -> int:
+        if self.streaming:
+            self._send(bytes(data))
+        else:
+            self.body.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        if self.streaming or self.head is None:
+            return
+        self.streaming = True
+        # 流式响应没有长度，以关闭连接结束
+        self._send(_with_headers(self.head, {"Connection": "close"}) + b"".join(self.body))
+        self.body = []
+
+    def _send(self, data: bytes):
+        if self.writer.is_closing():
+            raise BrokenPipeError("client disconnected")
+        try:
+            future = asyncio.run_coroutine_threadsafe(self._write(data), self.loop)
+        except RuntimeError:
+            raise BrokenPipeError("server shutting down")
+        try:
+            future.result()
+        except (ConnectionError, concurrent.futures.CancelledError):
+            raise BrokenPipeError("client disconnected")
+
+    async def _write(self, data: bytes):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def finish(self, keep_alive: bool) -> bytes:
+        """完整缓冲的响应：补上 Content-Length / Connection"""
+        if self.head is None:
+            return _error_response(500, "Handler sent no response")
+        body = b"".join(self.body)
+        lower = self.head.lower()
+        extra = {}
+        if b"\r\ncontent-length:" not in lower:
+            extra["Content-Length"] = str(len(body))
+        if b"\r\nconnection:" not in lower:
+            extra["Connection"] = "keep-alive" if keep_alive else "close"
+        head = _with_headers(self.head, extra) if extra else self.head
+        return head + body
+
+
+class _AsyncHandlerMixin:
+    """让 BaseHTTPRequestHandler 子类在 asyncio 核心下运行：响应头交给 _ResponseWriter 而不是直接写出"""
+
+    protocol_version = "HTTP/1.1"
+
+    def flush_headers(self):
+        if hasattr(self, "_headers_buffer"):
+            self.wfile.head = b"".join(self._headers_buffer)
+            self._headers_buffer = []
+
+
+class AsyncHTTPServer:
+    """
+    接口与 socketserver 类似：构造时绑定并开始监听，serve_forever() 阻塞运行，shutdown() 停止，
+    子类可覆盖 service_actions()（每 poll_interval 秒在工作线程中调用一次）
+
+    preflight_headers 不为空时，OPTIONS 请求直接返回这些头部（缓存的预检响应）
+    """
+
+    poll_interval = 0.5
+
+    def __init__(
+        self,
+        server_address: Tuple[str, int],
+        handler_class,
+        preflight_headers: Optional[Dict[str, str]] = None
+    ):
+        self.socket = socket.create_server(server_address, backlog=128)
+        self.server_address = self.socket.getsockname()[:2]
+        self.handler_class = type(handler_class.__name__, (_AsyncHandlerMixin, handler_class), {})
+        self._workers = _Workers(MAX_THREADS)
+        self._preflight = None
+        if preflight_headers:
+            head = _status_line(204) + "".join(
+                f"{key}: {value}\r\n" for key, value in preflight_headers.items()
+            ).encode("latin-1") + b"Content-Length: 0\r\n\r\n"
+            self._preflight = {
+                True: _with_headers(head, {"Connection": "keep-alive"}),
+                False: _with_headers(head, {"Connection": "close"}),
+            }
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+    def service_actions(self):
+        pass
+
+    def serve_forever(self):
+        asyncio.run(self.serve())
+
+    def shutdown(self):
+        if self._loop is not None and self._stopping is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._stopping.set)
+            except RuntimeError:
+                pass
+
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        server = await asyncio.start_server(self._handle_connection, sock=self.socket, limit=MAX_HEADER_BYTES)
+        service = asyncio.ensure_future(self._service_loop())
+        try:
+            async with server:
+                await self._stopping.wait()
+        finally:
+            service.cancel()
+
+    async def _service_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._workers.submit(self._loop, self.service_actions)
+            except Exception as e:
+                print(f"[ERROR] service_actions failed: {e}")
+
+    # ========== 连接 ==========
+
+    async def _read_head(self, reader: asyncio.StreamReader) -> Optional[bytes]:
+        """读取请求行和头部；连接空闲关闭时返回 None"""
+        while True:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+            except asyncio.LimitOverrunError:
+                raise ProtocolError(431, "Request header fields too large")
+            except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                return None
+            # 管线化的请求之间可能夹着空行
+            head = head.lstrip(b"\r\n")
+            if head:
+                return head
+
+    async def _read_body(self, reader: asyncio.StreamReader, headers, writer: asyncio.StreamWriter) -> bytes:
+        chunked = "chunked" in (headers.get("Transfer-Encoding") or "").lower()
+        length = headers.get("Content-Length")
+        if not chunked and not length:
+            return b""
+        if headers.get("Expect", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        if chunked:
+            return await asyncio.wait_for(self._read_chunked(reader), BODY_TIMEOUT)
+        try:
+            size = int(length)
+        except ValueError:
+            raise ProtocolError(400, "Invalid Content-Length")
+        if size < 0:
+            raise ProtocolError(400, "Invalid Content-Length")
+        if size > MAX_BODY_BYTES:
+            raise ProtocolError(413, f"Request body larger than {MAX_BODY_BYTES} bytes")
+        return await asyncio.wait_for(reader.readexactly(size), BODY_TIMEOUT)
+
+    async def _read_chunked(self, reader: asyncio.StreamReader) -> bytes:
+        chunks, total = [], 0
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            try:
+                size = int(line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                raise ProtocolError(400, "Invalid chunk size")
+            if size == 0:
+                # 丢弃 trailer
+                while (await reader.readuntil(b"\r\n")) != b"\r\n":
+                    pass
+                return b"".join(chunks)
+            total += size
+            if total > MAX_BODY_BYTES:
+                raise ProtocolError(413, f"Request body larger than {MAX_BODY_BYTES} bytes")
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    def _parse_head(self, head: bytes):
+        request_line, _, header_block = head.partition(b"\r\n")
+        parts = request_line.decode("latin-1").split()
+        if len(parts) != 3:
+            raise ProtocolError(400, "Malformed request line")
+        method, target, version = parts
+        if not version.startswith("HTTP/1."):
+            raise ProtocolError(505, "HTTP version not supported")
+        try:
+            headers = parse_headers(io.BytesIO(header_block))
+        except HTTPException:
+            raise ProtocolError(431, "Too many header fields")
+        return method, target, version, " ".join(parts), headers
+
+    @staticmethod
+    def _wants_keep_alive(version: str, headers) -> bool:
+        connection = (headers.get("Connection") or "").lower()
+        if version == "HTTP/1.0":
+            return "keep-alive" in connection
+        return "close" not in connection
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        CONNECTIONS.inc()
+        peer = writer.get_extra_info("peername") or ("", 0)
+        try:
+            while True:
+                try:
+                    head = await self._read_head(reader)
+                    if head is None:
+                        break
+                    method, target, version, request_line, headers = self._parse_head(head)
+                    keep_alive = self._wants_keep_alive(version, headers)
+                    if method == "OPTIONS" and self._preflight is not None:
+                        writer.write(self._preflight[keep_alive])
+                        await writer.drain()
+                        if not keep_alive:
+                            break
+                        continue
+                    body = await self._read_body(reader, headers, writer)
+                except ProtocolError as e:
+                    writer.write(_error_response(e.status, str(e)))
+                    break
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, asyncio.LimitOverrunError):
+                    writer.write(_error_response(400, "Incomplete request body"))
+                    break
+
+                if "chunked" in (headers.get("Transfer-Encoding") or "").lower():
+                    del headers["Transfer-Encoding"]
+                    headers["Content-Length"] = str(len(body))
+
+                keep_alive = await self._dispatch(
+                    writer, peer, method, target, version, request_line, headers, body, keep_alive
+                )
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            CONNECTIONS.dec()
+            writer.close()
+
+    async def _dispatch(self, writer, peer, method, target, version, request_line, headers, body, keep_alive) -> bool:
+        """在工作线程中运行处理器并写出响应，返回连接是否保持"""
+        handler_method = "do_" + method
+        if not hasattr(self.handler_class, handler_method):
+            writer.write(_error_response(501, f"Unsupported method ({method})"))
+            return False
+
+        response = _ResponseWriter(self._loop, writer)
+        handler = self.handler_class.__new__(self.handler_class)
+        handler.server = self
+        handler.client_address = peer[:2]
+        handler.command = method
+        handler.path = target
+        handler.request_version = version
+        handler.requestline = request_line
+        handler.headers = headers
+        handler.rfile = io.BytesIO(body)
+        handler.wfile = response
+        handler.close_connection = not keep_alive
+
+        try:
+            await self._workers.submit(self._loop, getattr(handler, handler_method))
+        except Exception as e:
+            if response.streaming:
+                return False
+            print(f"[ERROR] {request_line}: {e}")
+            writer.write(_error_response(500, str(e)))
+            return False
+
+        if response.streaming:
+            await writer.drain()
+            return False
+        keep_alive = keep_alive and not handler.close_connection
+        writer.write(response.finish(keep_alive))
+        await writer.drain()
+        return keep_alive
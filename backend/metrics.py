@@ -0,0 +1,324 @@
+"""
+Social Scraper Metrics
+进程内指标与 Prometheus 文本格式导出
+
+热路径只做列表元素自增：桶在创建标签组合时一次性分配，记录时不加锁。
+CPython 下多线程同时自增同一桶偶尔会丢一次计数，对监控统计可以接受；
+标签组合首次出现时用 dict.setdefault 保证只有一份桶。
+
+METRICS=off 且未启用慢查询日志时 TimedConnection 不再计时，/metrics 仍可访问
+"""
+
+import os
+import sys
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+ENABLED = os.getenv("METRICS", "on") != "off"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._children: Dict[Tuple, Any] = {}
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(Metric):
+    """单调递增计数（每个标签组合一个单元素列表）"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, *labels):
+        cell = self._children.get(labels)
+        if cell is None:
+            cell = self._children.setdefault(labels, [0])
+        cell[0] += amount
+
+    def value(self, *labels) -> float:
+        cell = self._children.get(labels)
+        return cell[0] if cell else 0
+
+    def samples(self):
+        for labels, cell in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labels, labels)} {_format_value(cell[0])}"
+
+
+class Gauge(Metric):
+    """
+    瞬时值，可直接 set/inc/dec，也可用 set_function 在导出时取值
+
+    函数返回数值（无标签）或 {标签元组: 数值}；同一 source 重复设置会替换旧函数，
+    传 None 则移除
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._functions: Dict[str, Callable[[], Any]] = {}
+
+    def set(self, value: float, *labels):
+        self._children[labels] = [value]
+
+    def inc(self, amount: float = 1, *labels):
+        cell = self._children.get(labels)
+        if cell is None:
+            cell = self._children.setdefault(labels, [0])
+        cell[0] += amount
+
+    def dec(self, amount: float = 1, *labels):
+        self.inc(-amount, *labels)
+
+    def set_function(self, function: Optional[Callable[[], Any]], source: str = ""):
+        if function is None:
+            self._functions.pop(source, None)
+        else:
+            self._functions[source] = function
+
+    def samples(self):
+        values = {labels: cell[0] for labels, cell in list(self._children.items())}
+        for function in list(self._functions.values()):
+            try:
+                result = function()
+            except Exception:
+                continue
+            if isinstance(result, dict):
+                values.update(result)
+            elif result is not None:
+                values[()] = result
+        for labels, value in values.items():
+            yield f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    """
+    固定桶直方图
+
+    每个标签组合预分配 [各桶计数..., +Inf 计数, 总和]，observe 只做一次二分和两次自增；
+    导出时再累加成 Prometheus 要求的累计桶
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._size = len(self.buckets) + 2
+
+    def observe(self, value: float, *labels):
+        cells = self._children.get(labels)
+        if cells is None:
+            cells = self._children.setdefault(labels, [0] * self._size)
+        # le 语义：等于上界的值落在该桶
+        cells[bisect_left(self.buckets, value)] += 1
+        cells[-1] += value
+
+    def snapshot(self, *labels) -> Tuple[int, float]:
+        """(次数, 总和)"""
+        cells = self._children.get(labels)
+        if cells is None:
+            return 0, 0.0
+        return sum(cells[:-1]), cells[-1]
+
+    def snapshots(self) -> Dict[Tuple, Tuple[int, float]]:
+        """各标签组合的 (次数, 总和)"""
+        return {labels: (sum(cells[:-1]), cells[-1]) for labels, cells in list(self._children.items())}
+
+    def samples(self):
+        for labels, cells in list(self._children.items()):
+            cells = list(cells)
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), cells[:-1]):
+                total += count
+                le = f'le="{_format_value(float(bound))}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {total}"
+            label_text = _format_labels(self.labels, labels)
+            yield f"{self.name}_sum{label_text} {_format_value(cells[-1])}"
+            yield f"{self.name}_count{label_text} {total}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.setdefault(metric.name, metric)
+        return self._metrics[metric.name]
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route and status", ("method", "route", "status")
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "HTTP requests being served or waiting for the database")
+QUERY_SECONDS = REGISTRY.histogram(
+    "kuzu_query_duration_seconds", "Kuzu statement latency by calling query", ("query",)
+)
+QUERY_ERRORS = REGISTRY.counter("kuzu_query_errors_total", "Kuzu statements that raised", ("query",))
+ROWS_WRITTEN = REGISTRY.counter("kuzu_rows_written_total", "Rows written per node / rel table", ("table",))
+BATCH_SIZE = REGISTRY.histogram(
+    "ingest_batch_size", "Items per ingest request", ("kind",), buckets=SIZE_BUCKETS
+)
+QUEUE_DEPTH = REGISTRY.gauge("queue_depth", "Pending items per in-process queue", ("queue",))
+CACHE_REQUESTS = REGISTRY.counter("cache_requests_total", "Cache lookups by result", ("cache", "result"))
+CACHE_HIT_RATIO = REGISTRY.gauge("cache_hit_ratio", "Cache hit ratio since start", ("cache",))
+PROCESS_RSS = REGISTRY.gauge("process_resident_memory_bytes", "Resident set size")
+PROCESS_CPU = REGISTRY.gauge("process_cpu_seconds_total", "User and system CPU time")
+PROCESS_START = REGISTRY.gauge("process_start_time_seconds", "Process start time since epoch")
+PROCESS_START.set(time.time())
+
+
+def _hit_ratios() -> Dict[Tuple, float]:
+    ratios = {}
+    caches = {labels[0] for labels in list(CACHE_REQUESTS._children)}
+    for cache in caches:
+        hits = CACHE_REQUESTS.value(cache, "hit")
+        total = hits + CACHE_REQUESTS.value(cache, "miss")
+        if total:
+            ratios[(cache,)] = hits / total
+    return ratios
+
+
+def resident_memory() -> Optional[int]:
+    """当前 RSS（字节）；没有 /proc 时退回峰值 RSS，Windows 上不可用"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _cpu_seconds() -> float:
+    times = os.times()
+    return times.user + times.system
+
+
+CACHE_HIT_RATIO.set_function(_hit_ratios)
+PROCESS_RSS.set_function(resident_memory)
+PROCESS_CPU.set_function(_cpu_seconds)
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+class TimedConnection:
+    """
+    包装 kuzu.Connection，按调用方函数名（模块.函数）记录每条语句的耗时
+
+    QueryResult 是惰性迭代的，这里只统计 execute 本身（Kuzu 在 execute 中完成执行）。
+    传入 slow_log 时超过其阈值的语句交给 slow_log.record 记录，并跟踪是否处于显式事务中
+    """
+
+    def __init__(self, conn, slow_log=None):
+        self._conn = conn
+        self.slow_log = slow_log
+        self.in_transaction = False
+
+    def execute(self, query, parameters=None):
+        if not ENABLED and self.slow_log is None:
+            return self._conn.execute(query, parameters)
+        frame = sys._getframe(1)
+        name = f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+        started = time.perf_counter()
+        try:
+            result = self._conn.execute(query, parameters)
+        except Exception:
+            QUERY_ERRORS.inc(1, name)
+            QUERY_SECONDS.observe(time.perf_counter() - started, name)
+            raise
+        elapsed = time.perf_counter() - started
+        QUERY_SECONDS.observe(elapsed, name)
+        if self.slow_log is not None:
+            if isinstance(query, str):
+                head = query.lstrip()[:5].upper()
+                if head == "BEGIN":
+                    self.in_transaction = True
+                elif head in ("COMMI", "ROLLB"):
+                    self.in_transaction = False
+            if elapsed >= self.slow_log.threshold:
+                self.slow_log.record(self._conn, name, query, parameters, elapsed, result, self.in_transaction)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def observe_request(method: str, route: str, status: int, started: float):
+    """记录一次 HTTP 请求；started 为 time.perf_counter() 起点"""
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method, route, str(status))
+
+
+def route_label(path: str, routes: Sequence[str]) -> str:
+    """
+    把请求路径归到路由模板（如 /api/authors/{author_id}），控制标签基数
+
+    routes 按顺序逐段匹配，{...} 段匹配任意非空段；都不匹配时记为 other
+    """
+    parts = path.rstrip("/").split("/") if path != "/" else [""]
+    for route in routes:
+        template = route.rstrip("/").split("/") if route != "/" else [""]
+        if len(template) != len(parts):
+            continue
+        if all(t == p or (t.startswith("{") and p) for t, p in zip(template, parts)):
+            return route
+    return "other"
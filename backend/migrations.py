@@ -0,0 +1,428 @@
+"""
+Social Scraper Schema Migrations
+版本化的 Schema 迁移：启动时只做一次版本检查，落后时按顺序执行待迁移项
+
+用法:
+    python migrations.py status --db-path ./database/twitter_scraper
+    python migrations.py upgrade --db-path ./database/twitter_scraper
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List
+
+from loguru import logger
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    apply: Callable
+    # 含 COPY FROM 的迁移不能放进显式事务，须自行保证可重复执行
+    transactional: bool = True
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str, transactional: bool = True):
+    """注册迁移，版本号必须递增"""
+    def decorator(func: Callable) -> Callable:
+        if MIGRATIONS and version <= MIGRATIONS[-1].version:
+            raise ValueError(f"Migration {version} registered out of order")
+        MIGRATIONS.append(Migration(version, description, func, transactional))
+        return func
+    return decorator
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+def current_version(conn) -> int:
+    """读取数据库当前 Schema 版本（无版本表时为 0）"""
+    try:
+        result = conn.execute("MATCH (v:SchemaVersion) RETURN max(v.version)")
+    except RuntimeError:
+        return 0
+    if result.has_next():
+        return result.get_next()[0] or 0
+    return 0
+
+
+def pending_migrations(conn) -> List[Migration]:
+    version = current_version(conn)
+    return [m for m in MIGRATIONS if m.version > version]
+
+
+def _record(conn, m: Migration):
+    conn.execute(
+        "CREATE (:SchemaVersion {version: $version, description: $description, appliedAt: $appliedAt})",
+        {"version": m.version, "description": m.description, "appliedAt": datetime.now()}
+    )
+
+
+def upgrade(conn, target: int = None) -> List[Migration]:
+    """按顺序执行待迁移项，每项在独立事务中提交（transactional=False 的除外）"""
+    applied = []
+    for m in pending_migrations(conn):
+        if target is not None and m.version > target:
+            break
+        logger.info(f"Applying migration {m.version}: {m.description}")
+        if not m.transactional:
+            # 失败时不记录版本，下次启动整体重跑
+            m.apply(conn)
+            _record(conn, m)
+            applied.append(m)
+            continue
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            m.apply(conn)
+            _record(conn, m)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            logger.error(f"Migration {m.version} failed, rolled back")
+            raise
+        applied.append(m)
+    return applied
+
+
+# ========== 迁移定义 ==========
+
+@migration(1, "Base schema")
+def _base_schema(conn):
+    statements = [
+        """
+        CREATE NODE TABLE IF NOT EXISTS SchemaVersion (
+            version INT64,
+            description STRING,
+            appliedAt TIMESTAMP,
+            PRIMARY KEY (version)
+        )
+        """,
+        # Post 表 - 原始抓取池（只存储精选内容）
+        """
+        CREATE NODE TABLE IF NOT EXISTS Post (
+            id STRING,
+            platform STRING,
+            author STRING,
+            authorDisplayName STRING,
+            content STRING,
+            title STRING,
+            url STRING,
+            timestamp TIMESTAMP,
+            score INT64,
+            replies INT64,
+            raw BOOLEAN,
+            scrapedAt TIMESTAMP,
+            metadata STRING,
+            PRIMARY KEY (id)
+        )
+        """,
+        # FilteredPost 表 - LLM 筛选后
+        """
+        CREATE NODE TABLE IF NOT EXISTS FilteredPost (
+            id STRING,
+            postId STRING,
+            relevanceScore DOUBLE,
+            category STRING,
+            subCategory STRING,
+            reason STRING,
+            summary STRING,
+            keywords STRING,
+            filteredAt TIMESTAMP,
+            PRIMARY KEY (id)
+        )
+        """,
+        # DiscoveryResult 表 - 发现性分析结果
+        """
+        CREATE NODE TABLE IF NOT EXISTS DiscoveryResult (
+            id STRING,
+            postId STRING,
+            sentiment STRING,
+            kolProfile STRING,
+            trendData STRING,
+            alertTrigger STRING,
+            analyzedAt TIMESTAMP,
+            PRIMARY KEY (id)
+        )
+        """,
+        # Source 表 - 频道配置
+        """
+        CREATE NODE TABLE IF NOT EXISTS Source (
+            id STRING,
+            name STRING,
+            type STRING,
+            config STRING,
+            enabled BOOLEAN,
+            lastFetched TIMESTAMP,
+            fetchInterval INT64,
+            PRIMARY KEY (id)
+        )
+        """,
+        # CleanupRule 表 - 清理规则
+        """
+        CREATE NODE TABLE IF NOT EXISTS CleanupRule (
+            id STRING,
+            targetType STRING,
+            condition STRING,
+            threshold INT64,
+            action STRING,
+            enabled BOOLEAN,
+            intervalMinutes INT64,
+            lastRun TIMESTAMP,
+            PRIMARY KEY (id)
+        )
+        """,
+        # ArchivedPost 表 - 归档帖子
+        """
+        CREATE NODE TABLE IF NOT EXISTS ArchivedPost (
+            id STRING,
+            originalId STRING,
+            platform STRING,
+            author STRING,
+            content STRING,
+            archivedAt TIMESTAMP,
+            reason STRING,
+            metadata STRING,
+            PRIMARY KEY (id)
+        )
+        """,
+        # 关系表
+        "CREATE REL TABLE IF NOT EXISTS FILTERED_FROM (FROM FilteredPost TO Post)",
+        "CREATE REL TABLE IF NOT EXISTS ANALYZED (FROM DiscoveryResult TO Post)",
+        "CREATE REL TABLE IF NOT EXISTS ARCHIVED_FROM (FROM ArchivedPost TO Post)",
+    ]
+    for statement in statements:
+        conn.execute(statement)
+
+
+@migration(2, "Default cleanup rules")
+def _default_cleanup_rules(conn):
+    default_rules = [
+        {"id": "rule_001", "targetType": "Post", "condition": "age_days",
+         "threshold": 90, "action": "archive", "intervalMinutes": 1440},
+        {"id": "rule_002", "targetType": "FilteredPost", "condition": "relevance_below",
+         "threshold": 3, "action": "delete", "intervalMinutes": 60},
+        {"id": "rule_003", "targetType": "DiscoveryResult", "condition": "age_days",
+         "threshold": 365, "action": "export", "intervalMinutes": 1440},
+    ]
+    for rule in default_rules:
+        # 已存在的规则保留用户修改
+        conn.execute("""
+            MERGE (r:CleanupRule {id: $id})
+            ON CREATE SET r.targetType = $targetType,
+                          r.condition = $condition,
+                          r.threshold = $threshold,
+                          r.action = $action,
+                          r.enabled = true,
+                          r.intervalMinutes = $intervalMinutes
+        """, rule)
+
+
+@migration(3, "Near-duplicate links")
+def _duplicate_links(conn):
+    conn.execute("""
+        CREATE REL TABLE IF NOT EXISTS DUPLICATE_OF (
+            FROM Post TO Post,
+            similarity DOUBLE
+        )
+    """)
+
+
+@migration(4, "Sentiment rollup buckets")
+def _sentiment_rollups(conn):
+    from rollups import backfill
+
+    conn.execute("""
+        CREATE NODE TABLE IF NOT EXISTS SentimentBucket (
+            id STRING,
+            granularity STRING,
+            bucketStart TIMESTAMP,
+            category STRING,
+            platform STRING,
+            positive INT64,
+            negative INT64,
+            neutral INT64,
+            scoreSum DOUBLE,
+            count INT64,
+            PRIMARY KEY (id)
+        )
+    """)
+    backfill(conn)
+
+
+@migration(5, "Keyword alert rules and matches")
+def _keyword_alerts(conn):
+    statements = [
+        """
+        CREATE NODE TABLE IF NOT EXISTS AlertRule (
+            id STRING,
+            name STRING,
+            keywords STRING[],
+            action STRING,
+            enabled BOOLEAN,
+            priority STRING,
+            categories STRING[],
+            platforms STRING[],
+            createdAt TIMESTAMP,
+            triggeredCount INT64,
+            PRIMARY KEY (id)
+        )
+        """,
+        """
+        CREATE NODE TABLE IF NOT EXISTS AlertMatch (
+            id STRING,
+            alertId STRING,
+            postId STRING,
+            matchedKeywords STRING[],
+            priority STRING,
+            platform STRING,
+            matchedAt TIMESTAMP,
+            PRIMARY KEY (id)
+        )
+        """,
+        "CREATE REL TABLE IF NOT EXISTS ALERTED (FROM AlertMatch TO Post)",
+    ]
+    for statement in statements:
+        conn.execute(statement)
+
+
+@migration(6, "Event clusters")
+def _event_clusters(conn):
+    statements = [
+        """
+        CREATE NODE TABLE IF NOT EXISTS Event (
+            id STRING,
+            title STRING,
+            keywords STRING[],
+            status STRING,
+            startedAt TIMESTAMP,
+            lastPostAt TIMESTAMP,
+            postCount INT64,
+            authorCount INT64,
+            platforms STRING[],
+            scoreSum INT64,
+            repliesSum INT64,
+            createdAt TIMESTAMP,
+            PRIMARY KEY (id)
+        )
+        """,
+        """
+        CREATE REL TABLE IF NOT EXISTS CONTAINS_POST (
+            FROM Event TO Post,
+            similarity DOUBLE,
+            addedAt TIMESTAMP
+        )
+        """,
+    ]
+    for statement in statements:
+        conn.execute(statement)
+
+
+@migration(7, "Author mention graph")
+def _author_graph(conn):
+    statements = [
+        # id 为 "平台:小写用户名"
+        """
+        CREATE NODE TABLE IF NOT EXISTS Author (
+            id STRING,
+            handle STRING,
+            platform STRING,
+            displayName STRING,
+            postCount INT64,
+            mentionedCount INT64,
+            influence DOUBLE,
+            firstSeen TIMESTAMP,
+            lastSeen TIMESTAMP,
+            PRIMARY KEY (id)
+        )
+        """,
+        # kind: mention / reply / quote，同一对作者每种关系一条边
+        """
+        CREATE REL TABLE IF NOT EXISTS MENTIONS (
+            FROM Author TO Author,
+            kind STRING,
+            count INT64,
+            firstAt TIMESTAMP,
+            lastAt TIMESTAMP
+        )
+        """,
+    ]
+    for statement in statements:
+        conn.execute(statement)
+
+
+@migration(8, "Hashtag, mention and domain index", transactional=False)
+def _entity_index(conn):
+    from entities import backfill
+
+    statements = [
+        """
+        CREATE NODE TABLE IF NOT EXISTS Hashtag (
+            id STRING,
+            postCount INT64,
+            firstSeen TIMESTAMP,
+            lastSeen TIMESTAMP,
+            PRIMARY KEY (id)
+        )
+        """,
+        """
+        CREATE NODE TABLE IF NOT EXISTS Domain (
+            id STRING,
+            postCount INT64,
+            firstSeen TIMESTAMP,
+            lastSeen TIMESTAMP,
+            PRIMARY KEY (id)
+        )
+        """,
+        # at 为帖子时间，时间窗口查询只读关系表
+        "CREATE REL TABLE IF NOT EXISTS TAGGED (FROM Post TO Hashtag, at TIMESTAMP)",
+        "CREATE REL TABLE IF NOT EXISTS LINKS_TO (FROM Post TO Domain, url STRING, at TIMESTAMP)",
+        "CREATE REL TABLE IF NOT EXISTS MENTIONED (FROM Post TO Author, at TIMESTAMP)",
+    ]
+    for statement in statements:
+        conn.execute(statement)
+    backfill(conn)
+
+
+# ========== CLI ==========
+
+def main():
+    import argparse
+    import kuzu
+
+    parser = argparse.ArgumentParser(description="Social Scraper schema migrations")
+    parser.add_argument("action", choices=["status", "upgrade"], help="Action to perform")
+    parser.add_argument("--db-path", default="./database/twitter_scraper", help="KuzuDB path")
+    parser.add_argument("--target", type=int, help="Upgrade up to this version")
+    args = parser.parse_args()
+
+    from database import configure_checkpoint
+
+    db = kuzu.Database(args.db_path)
+    conn = kuzu.Connection(db)
+    # 与服务使用相同的检查点设置，否则在 Kuzu 0.5 上迁移会触发会写坏数据的自动检查点
+    auto_checkpoint = configure_checkpoint(conn, args.db_path)
+
+    version = current_version(conn)
+    if args.action == "status":
+        print(f"Current version: {version} (latest: {latest_version()})")
+        for m in MIGRATIONS:
+            mark = "x" if m.version <= version else " "
+            print(f"  [{mark}] {m.version:03d} {m.description}")
+        return
+
+    applied = upgrade(conn, target=args.target)
+    if auto_checkpoint:
+        conn.execute("CHECKPOINT")
+    if applied:
+        print(f"Applied {len(applied)} migration(s), now at version {current_version(conn)}")
+    else:
+        print(f"Already at version {version}, nothing to do")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Social Scraper Readiness
+服务就绪通知：start.py 在环境变量 BACKEND_READY_ADDR 中传入一个本地监听地址，
+服务在数据库打开、端口开始监听后连上去发送一行 JSON，launcher 收到即认为启动完成，
+不用轮询 /health
+
+只依赖标准库，未通过 launcher 启动时 notify_ready 什么也不做
+"""
+
+import json
+import os
+import signal
+import socket
+
+READY_ENV = "BACKEND_READY_ADDR"
+
+
+def notify_ready(**info) -> bool:
+    """
+    发送就绪通知（pid 和 info 中的字段）
+
+    地址会从环境变量中移除，服务再启动的子进程不会重复通知
+    """
+    address = os.environ.pop(READY_ENV, None)
+    if not address:
+        return False
+    host, _, port = address.rpartition(":")
+    try:
+        with socket.create_connection((host, int(port)), timeout=2) as sock:
+            sock.sendall((json.dumps({"pid": os.getpid(), **info}) + "\n").encode())
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def interrupt_on_sigterm():
+    """SIGTERM 按 Ctrl+C 处理，launcher 的 stop 走与前台运行相同的关闭流程"""
+    def handler(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, handler)
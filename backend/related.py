@@ -0,0 +1,436 @@
+"""
+Social Scraper Related Posts Index
+离线相似帖子索引：哈希 TF-IDF 向量 + 随机超平面签名粗筛，余弦精排
+
+不依赖网络或外部向量服务。向量与签名以 .npy 落盘，加载时内存映射。
+"""
+
+import bisect
+import functools
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖
+    np = None
+
+from dedup import tokenize
+
+
+SIGNATURE_BITS = 64
+_LATIN_RE = re.compile(r"^[a-z0-9_#]+$")
+
+
+@functools.lru_cache(maxsize=200_000)
+def _bucket(feature: str, dim: int) -> Tuple[int, float]:
+    """特征哈希到 (维度, 符号)，符号位抵消哈希冲突的偏差"""
+    h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+    return h % dim, 1.0 if h >> 63 else -1.0
+
+
+def features(text: str) -> List[str]:
+    """
+    词 / CJK 二元组，外加英文词的字符三元组
+
+    字符 n-gram 让拼写变体、词形变化和截断的转发仍能相互命中
+    """
+    tokens = tokenize(text or "")
+    grams = []
+    for token in tokens:
+        if len(token) > 4 and _LATIN_RE.match(token):
+            padded = f"<{token}>"
+            grams.extend("~" + padded[i:i + 3] for i in range(len(padded) - 2))
+    return tokens + grams
+
+
+def _popcount(values: "np.ndarray") -> "np.ndarray":
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values).astype(np.int16)
+    # numpy < 2.0
+    bits = np.unpackbits(np.ascontiguousarray(values).view(np.uint8)).reshape(-1, SIGNATURE_BITS)
+    return bits.sum(axis=1, dtype=np.int16)
+
+
+class RelatedPostsIndex:
+    """
+    相似帖子索引
+
+    磁盘上是若干只写一次的段：向量以内存映射只读打开，签名、id 和存活标记常驻内存。
+    新入库的帖子进入内存增量，每 save_every 次变更 flush() 把增量写成一个新段
+    （只写新增的行，耗时与索引规模无关）；删除记为墓碑，随下一段落盘。
+    save()（关闭时调用）把所有段合并、剔除墓碑后写成一个段。
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        dim: int = 256,
+        min_features: int = 4,
+        save_every: int = 5000,
+        seed: int = 20240601
+    ):
+        if np is None:
+            raise RuntimeError("Related posts index requires numpy: pip install numpy")
+        self.path = path
+        self.dim = dim
+        self.min_features = min_features
+        self.save_every = save_every
+
+        rng = np.random.default_rng(seed)
+        self._planes = rng.standard_normal((SIGNATURE_BITS, dim)).astype(np.float32)
+        self._weights = (1 << np.arange(SIGNATURE_BITS, dtype=np.uint64)).astype(np.uint64)
+        self._clear()
+
+    def _clear(self):
+        # IDF 统计（按哈希维度）
+        self._df = np.zeros(self.dim, dtype=np.int64)
+        self._docs = 0
+
+        # 已落盘的段：段号、向量（内存映射）、各段起始行号；签名和存活标记按全局行号拼接
+        self._segments: List[int] = []
+        self._segment_vectors: List["np.ndarray"] = []
+        self._offsets: List[int] = []
+        self._signatures = np.zeros(0, dtype=np.uint64)
+        self._alive = np.zeros(0, dtype=bool)
+        self._next_segment = 1
+
+        # 增量段，行号接在已落盘的行之后
+        self._delta_vectors: List["np.ndarray"] = []
+        self._delta_signatures: List[int] = []
+        self._delta_alive: List[bool] = []
+
+        # 全局行号 -> post_id，post_id -> 全局行号
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        # 已落盘的行上待落盘的删除
+        self._removed: List[str] = []
+        self._unsaved = 0
+
+    @property
+    def _flushed(self) -> int:
+        return len(self._signatures)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # ========== 向量化 ==========
+
+    def _encode(self, text: str) -> Optional[Tuple["np.ndarray", "np.ndarray"]]:
+        """特征哈希后的 (维度下标, 带符号的次线性词频)"""
+        feats = features(text)
+        if len(feats) < self.min_features:
+            return None
+        counts = Counter(feats)
+        buckets = [_bucket(feature, self.dim) for feature in counts]
+        index = np.fromiter((b[0] for b in buckets), dtype=np.int64, count=len(buckets))
+        sign = np.fromiter((b[1] for b in buckets), dtype=np.float32, count=len(buckets))
+        tf = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+        return index, sign * tf
+
+    def _weigh(self, index: "np.ndarray", value: "np.ndarray") -> Optional["np.ndarray"]:
+        idf = np.log((1.0 + self._docs) / (1.0 + self._df[index])) + 1.0
+        vector = np.bincount(index, weights=value * idf, minlength=self.dim).astype(np.float32)
+        norm = float(np.sqrt(vector @ vector))
+        if norm == 0:
+            return None
+        return vector / norm
+
+    def vectorize(self, text: str) -> Optional["np.ndarray"]:
+        """L2 归一化的哈希 TF-IDF 向量；特征过少时返回 None"""
+        encoded = self._encode(text)
+        return self._weigh(*encoded) if encoded else None
+
+    def _signature(self, vectors: "np.ndarray") -> "np.ndarray":
+        bits = (vectors.astype(np.float32) @ self._planes.T) > 0
+        return (bits.astype(np.uint64) * self._weights).sum(axis=-1, dtype=np.uint64)
+
+    # ========== 增删 ==========
+
+    def add(self, post_id: str, text: str) -> bool:
+        """入库时调用，返回是否已索引"""
+        encoded = self._encode(text)
+        if encoded is None:
+            return False
+        # 先更新文档频率，新帖子自身也计入 IDF
+        self._df[np.unique(encoded[0])] += 1
+        self._docs += 1
+        vector = self._weigh(*encoded)
+        if vector is None:
+            return False
+
+        self.remove([post_id])
+        self._rows[post_id] = len(self._ids)
+        self._ids.append(post_id)
+        self._delta_vectors.append(vector.astype(np.float16))
+        self._delta_signatures.append(int(self._signature(vector)))
+        self._delta_alive.append(True)
+
+        self._unsaved += 1
+        if self.path and self._unsaved >= self.save_every:
+            self.flush()
+        return True
+
+    def remove(self, post_ids: Iterable[str]) -> int:
+        """帖子被归档/删除时调用，记为墓碑"""
+        removed = 0
+        for post_id in post_ids:
+            row = self._rows.pop(post_id, None)
+            if row is None:
+                continue
+            if row < self._flushed:
+                self._alive[row] = False
+                self._removed.append(post_id)
+            else:
+                self._delta_alive[row - self._flushed] = False
+            removed += 1
+            self._unsaved += 1
+        return removed
+
+    # ========== 查询 ==========
+
+    def _vector(self, row: int) -> "np.ndarray":
+        if row >= self._flushed:
+            return self._delta_vectors[row - self._flushed].astype(np.float32)
+        segment = bisect.bisect_right(self._offsets, row) - 1
+        return np.asarray(self._segment_vectors[segment][row - self._offsets[segment]], dtype=np.float32)
+
+    def _gather(self, rows: "np.ndarray") -> "np.ndarray":
+        """按升序的全局行号批量取向量，每段一次花式索引"""
+        vectors = np.empty((len(rows), self.dim), dtype=np.float16)
+        bounds = np.searchsorted(rows, self._offsets + [self._flushed])
+        for segment, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+            if hi > lo:
+                vectors[lo:hi] = self._segment_vectors[segment][rows[lo:hi] - self._offsets[segment]]
+        for i in range(bounds[-1], len(rows)):
+            vectors[i] = self._delta_vectors[rows[i] - self._flushed]
+        return vectors
+
+    def related(self, post_id: str, k: int = 10, min_similarity: float = 0.2) -> Optional[List[Tuple[str, float]]]:
+        """帖子不在索引中时返回 None"""
+        row = self._rows.get(post_id)
+        if row is None:
+            return None
+        return self.search(self._vector(row), k=k, min_similarity=min_similarity, exclude=post_id)
+
+    def search(
+        self,
+        vector: "np.ndarray",
+        k: int = 10,
+        min_similarity: float = 0.2,
+        exclude: Optional[str] = None,
+        candidates: Optional[int] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        近似最近邻
+
+        先按 64 位签名的汉明距离在全部行上向量化粗筛，再对候选做精确余弦排序
+        """
+        signature = self._signature(vector)
+        candidates = candidates or max(200, k * 20)
+
+        signatures, alive = self._signatures, self._alive
+        if self._delta_signatures:
+            signatures = np.concatenate([signatures, np.array(self._delta_signatures, dtype=np.uint64)])
+            alive = np.concatenate([alive, np.array(self._delta_alive, dtype=bool)])
+        if not len(signatures):
+            return []
+
+        distance = _popcount(signatures ^ signature)
+        distance[~alive] = SIGNATURE_BITS + 1
+        take = min(candidates, len(distance))
+        rows = np.argpartition(distance, take - 1)[:take]
+        rows = np.sort(rows[distance[rows] <= SIGNATURE_BITS])
+        if not len(rows):
+            return []
+
+        scores = self._gather(rows).astype(np.float32) @ vector
+        results: List[Tuple[str, float]] = []
+        for row, score in zip(rows, scores):
+            if score >= min_similarity and self._ids[row] != exclude:
+                results.append((self._ids[row], round(float(score), 4)))
+
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results[:k]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._rows),
+            "base": self._flushed,
+            "delta": len(self._delta_signatures),
+            "segments": len(self._segments),
+            "dim": self.dim
+        }
+
+    # ========== 持久化 ==========
+    #
+    #   index.json          清单：段号列表、文档频率，原子替换，作为整组文件的提交点
+    #   vectors.<n>.npy     段 n 的向量（float16）
+    #   signatures.<n>.npy  段 n 的签名
+    #   ids.<n>.json        段 n 的 post_id，以及此前各段中被删除的 post_id
+    #
+    # 段文件只写一次，不覆盖仍在映射中的文件（Windows 下无法替换已映射的文件）
+
+    def flush(self):
+        """把内存增量和删除写成一个新段，耗时只与新增行数有关"""
+        if not self.path or not self._unsaved:
+            return
+        keep = [i for i, alive in enumerate(self._delta_alive) if alive]
+        vectors = np.stack([self._delta_vectors[i] for i in keep]) if keep else None
+        signatures = np.array([self._delta_signatures[i] for i in keep], dtype=np.uint64)
+        ids = [self._ids[self._flushed + i] for i in keep]
+
+        segment = self._write_segment(vectors, signatures, ids, self._removed)
+        self._write_manifest(self._segments + [segment])
+
+        del self._ids[self._flushed:]
+        self._append_segment(segment, signatures, ids)
+        self._delta_vectors, self._delta_signatures, self._delta_alive = [], [], []
+        self._removed = []
+        self._unsaved = 0
+
+    def save(self):
+        """
+        合并全部段与增量、剔除墓碑后写成一个段，并重新内存映射
+
+        耗时与索引规模成正比，只在关闭时调用；运行中由 flush() 追加新段
+        """
+        if not self.path:
+            return
+        dead = self._flushed - int(self._alive.sum())
+        if len(self._segments) <= 1 and not dead and not self._delta_signatures and not self._unsaved:
+            return
+        rows = np.array(sorted(self._rows.values()), dtype=np.int64)
+        signatures = np.concatenate([
+            self._signatures, np.array(self._delta_signatures, dtype=np.uint64)
+        ])[rows]
+        ids = [self._ids[row] for row in rows]
+
+        segment = self._write_segment(self._gather(rows) if ids else None, signatures, ids, [])
+        self._write_manifest([segment])
+
+        previous = self._segments
+        df, docs = self._df, self._docs
+        self._clear()
+        self._df, self._docs = df, docs
+        self._next_segment = segment + 1
+        self._append_segment(segment, signatures, ids)
+        for old in previous:
+            self._remove_segment(old)
+
+    def _write_segment(self, vectors: Optional["np.ndarray"], signatures: "np.ndarray",
+                       ids: List[str], removed: List[str]) -> int:
+        self.path.mkdir(parents=True, exist_ok=True)
+        segment = self._next_segment
+        self._next_segment += 1
+        if vectors is not None:
+            np.save(self.path / f"vectors.{segment}.npy", vectors)
+            np.save(self.path / f"signatures.{segment}.npy", signatures)
+        with open(self.path / f"ids.{segment}.json", "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "removed": removed}, f)
+        return segment
+
+    def _write_manifest(self, segments: List[int]):
+        tmp = self.path / "index.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "dim": self.dim,
+                "docs": self._docs,
+                "df": self._df.tolist(),
+                "segments": segments
+            }, f)
+        os.replace(tmp, self.path / "index.json")
+
+    def _append_segment(self, segment: int, signatures: "np.ndarray", ids: List[str]):
+        """把已落盘的段接到全局行号之后；段内的行此前在增量中时改记新行号"""
+        offset = self._flushed
+        if ids:
+            vectors = np.load(self.path / f"vectors.{segment}.npy", mmap_mode="r")
+        else:
+            vectors = np.zeros((0, self.dim), dtype=np.float16)
+        self._segments.append(segment)
+        self._segment_vectors.append(vectors)
+        self._offsets.append(offset)
+        self._signatures = np.concatenate([self._signatures, np.asarray(signatures, dtype=np.uint64)])
+        self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+        self._ids.extend(ids)
+        for row, post_id in enumerate(ids, start=offset):
+            previous = self._rows.get(post_id)
+            if previous is not None and previous < offset:
+                self._alive[previous] = False
+            self._rows[post_id] = row
+
+    def _remove_segment(self, segment: int):
+        for name in (f"vectors.{segment}.npy", f"signatures.{segment}.npy", f"ids.{segment}.json"):
+            try:
+                (self.path / name).unlink()
+            except OSError:
+                # 不存在，或仍被映射（Windows），清单不再引用即可
+                pass
+
+    def load(self) -> int:
+        """加载磁盘上的索引（向量内存映射），返回条目数"""
+        if not self.path:
+            return 0
+        try:
+            if not (self.path / "index.json").exists():
+                if (self.path / "ids.json").exists():
+                    self._upgrade_layout()
+                else:
+                    return 0
+            with open(self.path / "index.json", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("dim") != self.dim:
+                logger.warning(f"Related index dim {meta.get('dim')} != {self.dim}, starting empty")
+                return 0
+            self._df = np.array(meta["df"], dtype=np.int64)
+            self._docs = meta.get("docs", 0)
+            for segment in meta["segments"]:
+                with open(self.path / f"ids.{segment}.json", encoding="utf-8") as f:
+                    content = json.load(f)
+                for post_id in content["removed"]:
+                    row = self._rows.pop(post_id, None)
+                    if row is not None:
+                        self._alive[row] = False
+                signatures = (
+                    np.load(self.path / f"signatures.{segment}.npy") if content["ids"]
+                    else np.zeros(0, dtype=np.uint64)
+                )
+                if len(signatures) != len(content["ids"]):
+                    raise ValueError(f"segment {segment} signature count does not match ids")
+                self._append_segment(segment, signatures, content["ids"])
+            self._next_segment = max(meta["segments"], default=0) + 1
+            logger.info(
+                f"Loaded {len(self._rows)} related-post vectors from {self.path} "
+                f"({len(self._segments)} segments)"
+            )
+        except Exception as e:
+            logger.warning(f"Failed to load related posts index: {e}")
+            self._clear()
+        return len(self._rows)
+
+    def _upgrade_layout(self):
+        """旧版布局（ids.json 记录全部 id，每代重写全部文件）转为分段布局，旧的一代即第一个段"""
+        with open(self.path / "ids.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        generation = meta["generation"]
+        with open(self.path / f"ids.{generation}.json", "w", encoding="utf-8") as f:
+            json.dump({"ids": meta["ids"], "removed": []}, f)
+        tmp = self.path / "index.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "dim": meta.get("dim"),
+                "docs": meta.get("docs", 0),
+                "df": np.load(self.path / f"df.{generation}.npy").tolist(),
+                "segments": [generation]
+            }, f)
+        os.replace(tmp, self.path / "index.json")
+        for name in ("ids.json", f"df.{generation}.npy"):
+            (self.path / name).unlink()
@@ -0,0 +1,206 @@
+"""
+Social Scraper Sentiment Rollups
+入库时维护按小时/按天、按分类和平台分桶的情感计数，时间序列查询只读桶
+"""
+
+import ast
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from loguru import logger
+
+import bulk
+
+
+GRANULARITIES = ("hour", "day")
+LABELS = ("positive", "negative", "neutral")
+
+
+def parse_sentiment(value: Any) -> Tuple[str, float]:
+    """
+    解析 DiscoveryResult.sentiment
+
+    扩展发送 SentimentResult 字典；历史数据以 str(dict) 形式存储
+    """
+    if isinstance(value, str):
+        try:
+            value = ast.literal_eval(value) if value.strip() else {}
+        except (ValueError, SyntaxError):
+            lowered = value.lower()
+            label = next((l for l in LABELS if l in lowered), "neutral")
+            return label, 0.0
+    if not isinstance(value, dict):
+        return "neutral", 0.0
+    label = str(value.get("sentiment", "neutral")).lower()
+    if label not in LABELS:
+        label = "neutral"
+    try:
+        score = float(value.get("score", 0) or 0)
+    except (TypeError, ValueError):
+        score = 0.0
+    return label, score
+
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def bucket_rows(
+    analyzed_at: datetime,
+    category: str,
+    platform: str,
+    label: str,
+    score: float,
+    count: int = 1
+) -> List[Dict[str, Any]]:
+    """一条情感结果对应的小时桶和天桶增量"""
+    rows = []
+    for granularity in GRANULARITIES:
+        start = bucket_start(analyzed_at, granularity)
+        rows.append({
+            "id": f"{granularity}|{start.isoformat()}|{category}|{platform}",
+            "granularity": granularity,
+            "bucketStart": start,
+            "category": category,
+            "platform": platform,
+            "positive": count if label == "positive" else 0,
+            "negative": count if label == "negative" else 0,
+            "neutral": count if label == "neutral" else 0,
+            "scoreSum": score * count,
+            "count": count
+        })
+    return rows
+
+
+# COPY 列顺序，须与迁移中的表定义一致
+BUCKET_COLUMNS = ("id", "granularity", "bucketStart", "category", "platform",
+                  "positive", "negative", "neutral", "scoreSum", "count")
+
+UPSERT_BUCKETS = """
+UNWIND $rows AS r
+MERGE (b:SentimentBucket {id: r.id})
+ON CREATE SET b.granularity = r.granularity,
+              b.bucketStart = r.bucketStart,
+              b.category = r.category,
+              b.platform = r.platform,
+              b.positive = r.positive,
+              b.negative = r.negative,
+              b.neutral = r.neutral,
+              b.scoreSum = r.scoreSum,
+              b.count = r.count
+ON MATCH SET b.positive = b.positive + r.positive,
+             b.negative = b.negative + r.negative,
+             b.neutral = b.neutral + r.neutral,
+             b.scoreSum = b.scoreSum + r.scoreSum,
+             b.count = b.count + r.count
+"""
+
+
+class PostContextCache:
+    """
+    postId -> (platform, category) 的有界缓存
+
+    同一批次里帖子和筛选结果先于发现性结果入库，命中缓存即可免去回表查询
+    """
+
+    def __init__(self, capacity: int = 20_000):
+        self.capacity = capacity
+        self._items: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+
+    def update(self, post_id: str, **fields):
+        item = self._items.pop(post_id, {})
+        item.update({k: v for k, v in fields.items() if v})
+        self._items[post_id] = item
+        if len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+
+    def get(self, post_id: str) -> Optional[Dict[str, str]]:
+        return self._items.get(post_id)
+
+
+def aggregate_buckets(
+    rows: List[list],
+    group_by: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    合并桶行为时间序列
+
+    rows: [bucketStart, category, platform, positive, negative, neutral, scoreSum, count]
+    """
+    series: Dict[tuple, Dict[str, Any]] = {}
+    for start, category, platform, positive, negative, neutral, score_sum, count in rows:
+        group = {"category": category, "platform": platform}.get(group_by)
+        key = (group, start)
+        point = series.get(key)
+        if point is None:
+            point = series[key] = {
+                "bucket": start.isoformat(),
+                "positive": 0,
+                "negative": 0,
+                "neutral": 0,
+                "count": 0,
+                "_scoreSum": 0.0
+            }
+            if group_by:
+                point[group_by] = group
+        point["positive"] += positive
+        point["negative"] += negative
+        point["neutral"] += neutral
+        point["count"] += count
+        point["_scoreSum"] += score_sum
+
+    result = []
+    for key in sorted(series, key=lambda k: (str(k[0]), k[1])):
+        point = series[key]
+        score_sum = point.pop("_scoreSum")
+        point["avgScore"] = round(score_sum / point["count"], 4) if point["count"] else 0.0
+        result.append(point)
+    return result
+
+
+def backfill(conn, copy: bool = False) -> int:
+    """
+    从已有 DiscoveryResult 重建桶（迁移时执行一次）
+
+    copy=True 时用 COPY 写入，SentimentBucket 须为空且本次会话没有 CREATE/MERGE（见 bulk.py）
+    """
+    query = """
+    MATCH (dr:DiscoveryResult)
+    OPTIONAL MATCH (dr)-[:ANALYZED]->(p:Post)
+    OPTIONAL MATCH (fp:FilteredPost)-[:FILTERED_FROM]->(p)
+    RETURN dr.sentiment, dr.analyzedAt, p.platform, fp.category
+    """
+    result = conn.execute(query)
+    totals: Dict[str, Dict[str, Any]] = {}
+    processed = 0
+    while result.has_next():
+        sentiment, analyzed_at, platform, category = result.get_next()
+        if analyzed_at is None:
+            continue
+        label, score = parse_sentiment(sentiment)
+        for row in bucket_rows(analyzed_at, category or "other", platform or "unknown", label, score):
+            existing = totals.get(row["id"])
+            if existing is None:
+                totals[row["id"]] = row
+            else:
+                for field in ("positive", "negative", "neutral", "scoreSum", "count"):
+                    existing[field] += row[field]
+        processed += 1
+
+    rows = list(totals.values())
+    if copy:
+        bulk.copy_rows(conn, "SentimentBucket", rows, BUCKET_COLUMNS)
+    else:
+        for i in range(0, len(rows), 1000):
+            conn.execute(UPSERT_BUCKETS, {"rows": rows[i:i + 1000]})
+    if processed:
+        logger.info(f"Backfilled sentiment rollups from {processed} discovery results")
+    return processed
+
+
+def default_range(granularity: str, end: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    end = end or datetime.now()
+    return end - (timedelta(hours=24) if granularity == "hour" else timedelta(days=30)), end
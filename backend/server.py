@@ -5,21 +5,32 @@ Social Scraper FastAPI Backend
 
 import os
 import sys
+import time
 import asyncio
+import threading
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import uvicorn
+from starlette.routing import Match
 from loguru import logger
 
 # 添加项目路径
 sys.path.insert(0, str(Path(__file__).parent))
 
-from database import SocialScraperKG
+from database import SocialScraperKG, parse_timestamp
+from cleanup import CleanupScheduler, estimate_rule
+from events import format_sse, format_dropped
+import metrics
+import admission
+import export
+import readiness
+import backup
+from cluster import SnapshotPublisher, SnapshotWatcher, snapshot_root
 
 # 配置日志
 logger.remove()
@@ -46,10 +57,56 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "Content-Disposition"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """按路由模板和状态码记录请求耗时（事件流是长连接，不计入）"""
+    if request.url.path == "/api/events/stream":
+        return await call_next(request)
+    route = "other"
+    for candidate in app.router.routes:
+        if candidate.matches(request.scope)[0] == Match.FULL:
+            route = candidate.path
+            break
+    started = time.perf_counter()
+    status = 500
+    metrics.HTTP_IN_FLIGHT.inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.HTTP_IN_FLIGHT.dec()
+        metrics.observe_request(request.method, route, status, started)
+
+
+@app.middleware("http")
+async def reject_writes_on_reader(request: Request, call_next):
+    """只读副本不接受写请求（正常情况下 cluster.py 的路由不会转发过来）"""
+    if SERVER_ROLE == "reader" and request.method not in ("GET", "HEAD", "OPTIONS"):
+        return JSONResponse({"detail": "Read-only replica"}, status_code=405)
+    return await call_next(request)
+
+
 # 全局变量
 kg: Optional[SocialScraperKG] = None
+cleanup_scheduler: Optional[CleanupScheduler] = None
+
+# 清理分片在线程中执行并持有此锁；快照补复制和检查点也持有，避免复制到写了一半的文件
+db_lock = threading.Lock()
+
+# 部署角色：standalone 单进程；writer / reader 为 cluster.py 的单写多读模式
+SERVER_ROLE = os.getenv("SERVER_ROLE", "standalone")
+snapshot_publisher: Optional[SnapshotPublisher] = None
+snapshot_watcher: Optional[SnapshotWatcher] = None
+
+# 入库准入控制（INGEST_ADMISSION=off 关闭）
+ingest_admission = admission.AdmissionController.from_env()
+
+# 同一时间只做一个快照
+snapshot_running = False
 
 
 # ========== Pydantic 模型 ==========
@@ -102,24 +159,83 @@ class CleanupRequest(BaseModel):
     dry_run: bool = False  # 只预览，不实际执行
 
 
+class SnapshotRequest(BaseModel):
+    verify: bool = False  # 快照后按清单校验并只读打开统计行数
+
+
+class AlertRule(BaseModel):
+    id: str
+    name: Optional[str] = ""
+    keywords: List[str]
+    action: str = "notify"
+    enabled: bool = True
+    priority: str = "medium"
+    categories: Optional[List[str]] = []
+    platforms: Optional[List[str]] = []
+
+
 # ========== 生命周期管理 ==========
 
 @app.on_event("startup")
 async def startup_event():
     """启动时初始化 KuzuDB"""
-    global kg
+    global kg, cleanup_scheduler, snapshot_publisher, snapshot_watcher
     
     db_path = os.getenv("KUZU_DB_PATH", "./data/knowledge_graph")
+    if SERVER_ROLE == "reader":
+        snapshot_watcher = SnapshotWatcher(
+            snapshot_root(db_path),
+            poll=float(os.getenv("SNAPSHOT_POLL", "1"))
+        )
+        kg = await snapshot_watcher.open_latest()
+        snapshot_watcher.start(use_snapshot)
+        logger.info(f"Social Scraper API started as reader ({snapshot_watcher.name})")
+        return
+    
     kg = SocialScraperKG(db_path)
     await kg.init()
     
-    logger.info("Social Scraper API started")
+    # 后台清理调度
+    cleanup_scheduler = CleanupScheduler(
+        kg,
+        lock=db_lock,
+        max_slice_rows=int(os.getenv("CLEANUP_MAX_SLICE_ROWS", "500")),
+        slice_budget_ms=float(os.getenv("CLEANUP_SLICE_BUDGET_MS", "50"))
+    )
+    cleanup_scheduler.start()
+    
+    if SERVER_ROLE == "writer":
+        snapshot_publisher = SnapshotPublisher(
+            kg,
+            snapshot_root(db_path),
+            interval=float(os.getenv("SNAPSHOT_INTERVAL", "10")),
+            lock=db_lock,
+            checkpoint_mb=float(os.getenv("SNAPSHOT_CHECKPOINT_MB", "8"))
+        )
+        snapshot_publisher.publish()
+        snapshot_publisher.start()
+    
+    logger.info(f"Social Scraper API started ({SERVER_ROLE})")
+
+
+def use_snapshot(snapshot: SocialScraperKG):
+    """读进程切换到新快照"""
+    global kg
+    kg = snapshot
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """关闭时清理资源"""
     global kg
+    if snapshot_watcher:
+        await snapshot_watcher.stop()
+        logger.info("Social Scraper API stopped")
+        return
+    if snapshot_publisher:
+        await snapshot_publisher.stop()
+    if cleanup_scheduler:
+        await cleanup_scheduler.stop()
     if kg:
         await kg.close()
     logger.info("Social Scraper API stopped")
@@ -154,8 +270,20 @@ async def health_check():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus 文本格式指标"""
+    return Response(metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+@app.get("/debug/slow-queries")
+async def get_slow_queries(limit: int = 50, query: Optional[str] = None):
+    """最近超过 SLOW_QUERY_MS 的语句，query 按查询名（如 database.get_filtered_posts）过滤"""
+    return kg.get_slow_queries(limit, query)
+
+
 @app.post("/api/posts/batch")
-async def receive_posts_batch(request: BatchPostRequest):
+async def receive_posts_batch(request: BatchPostRequest, http_request: Request):
     """
     批量接收帖子（精选后的内容）
     
@@ -163,10 +291,31 @@ async def receive_posts_batch(request: BatchPostRequest):
     - posts: 原始帖子（精选后，约 20-30%）
     - filtered: LLM 筛选结果
     - discovery: 发现性分析结果
+    
+    超过准入限额时返回 429，Retry-After 为建议的重试等待秒数
     """
+    rows = len(request.posts) + len(request.filtered) + len(request.discovery)
+    if ingest_admission is not None:
+        # 写入中途不让出，队列深度检查在这里不起作用，只靠令牌桶（见 admission.py）
+        client = admission.client_key(
+            http_request.headers.get(admission.CLIENT_HEADER),
+            http_request.client.host if http_request.client else None
+        )
+        admitted, wait, reason = ingest_admission.admit(client, rows)
+        if not admitted:
+            logger.warning(f"Rejected batch of {rows} rows from {client} ({reason} limit), retry in {wait:.1f}s")
+            raise HTTPException(
+                status_code=429,
+                detail={"error": "Ingest rate limit exceeded", "reason": reason, "retryAfter": round(wait, 2)},
+                headers={"Retry-After": admission.retry_after(wait)}
+            )
+    started = time.perf_counter()
     try:
         logger.info(f"Received batch: {len(request.posts)} posts, {len(request.filtered)} filtered, {len(request.discovery)} discovery")
         
+        metrics.BATCH_SIZE.observe(len(request.filtered), "filtered")
+        metrics.BATCH_SIZE.observe(len(request.discovery), "discovery")
+        
         # 1. 存储原始帖子
         posts_data = [post.dict() for post in request.posts]
         posts_count = await kg.add_posts_batch(posts_data)
@@ -200,6 +349,9 @@ async def receive_posts_batch(request: BatchPostRequest):
     except Exception as e:
         logger.error(f"Failed to store batch: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if ingest_admission is not None:
+            ingest_admission.done(rows, time.perf_counter() - started)
 
 
 @app.get("/api/posts")
@@ -245,6 +397,28 @@ async def get_filtered_posts(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/posts/{post_id}/related")
+async def get_related_posts(post_id: str, k: int = 10, min_similarity: float = 0.2):
+    """
+    相似帖子（本地哈希 TF-IDF 向量，近似最近邻）
+    
+    post_id 也可以是 FilteredPost 的 id，便于筛选时排查协同刷帖
+    """
+    try:
+        posts = await kg.get_related_posts(post_id, k=k, min_similarity=min_similarity)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if posts is None:
+        raise HTTPException(status_code=404, detail=f"Post not indexed: {post_id}")
+    
+    return {
+        "postId": post_id,
+        "related": posts,
+        "count": len(posts),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
 @app.get("/api/discovery/stats")
 async def get_discovery_stats():
     """获取发现性分析统计"""
@@ -260,6 +434,289 @@ async def get_discovery_stats():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/discovery/sentiment/timeseries")
+async def get_sentiment_timeseries(
+    granularity: str = "hour",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    category: Optional[str] = None,
+    platform: Optional[str] = None,
+    group_by: Optional[str] = None
+):
+    """
+    情感时间序列
+    
+    读取入库时维护的小时/天分桶；默认范围为最近 24 小时（hour）或 30 天（day）
+    """
+    if granularity not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="granularity must be hour or day")
+    if group_by not in (None, "category", "platform"):
+        raise HTTPException(status_code=400, detail="group_by must be category or platform")
+    try:
+        series = await kg.get_sentiment_timeseries(
+            granularity=granularity,
+            start=parse_timestamp(start),
+            end=parse_timestamp(end),
+            category=category,
+            platform=platform,
+            group_by=group_by
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid time range: {e}")
+    
+    return {
+        "series": series,
+        "count": len(series),
+        "granularity": granularity,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.get("/api/analytics/engagement")
+async def get_engagement_analytics(
+    hours: int = 24,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    platform: Optional[str] = None,
+    author: Optional[str] = None,
+    group_by: Optional[str] = None,
+    top_k: int = 10,
+    sort_by: str = "score"
+):
+    """
+    互动分布统计
+    
+    时间窗口默认最近 hours 小时；group_by=platform/author 时附带分组 Top-K
+    """
+    if group_by not in (None, "platform", "author"):
+        raise HTTPException(status_code=400, detail="group_by must be platform or author")
+    if sort_by not in ("score", "replies", "posts"):
+        raise HTTPException(status_code=400, detail="sort_by must be score, replies or posts")
+    try:
+        stats = await kg.get_engagement_analytics(
+            hours=hours,
+            start=parse_timestamp(start),
+            end=parse_timestamp(end),
+            platform=platform,
+            author=author,
+            group_by=group_by,
+            top_k=top_k,
+            sort_by=sort_by
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid time range: {e}")
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    return {**stats, "timestamp": datetime.now().isoformat()}
+
+
+@app.get("/api/trends")
+async def get_trends(
+    window: str = "6h",
+    limit: int = 20,
+    kind: Optional[str] = None,
+    topic: Optional[str] = None
+):
+    """获取趋势话题（服务端增量计数，覆盖所有浏览器）"""
+    if window not in ("1h", "6h", "24h"):
+        raise HTTPException(status_code=400, detail="window must be 1h, 6h or 24h")
+    
+    if topic:
+        trend = kg.trends.topic(topic, window)
+        if trend is None:
+            raise HTTPException(status_code=404, detail=f"Unknown topic: {topic}")
+        trends = [dict(trend, timeWindow=window)]
+    else:
+        trends = kg.trends.trending(window=window, limit=limit, kind=kind)
+    
+    return {
+        "trends": trends,
+        "count": len(trends),
+        "window": window,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.get("/api/events/stream")
+async def stream_events(
+    request: Request,
+    platform: Optional[str] = None,
+    category: Optional[str] = None,
+    types: Optional[str] = None,
+    last_event_id: Optional[str] = None
+):
+    """
+    SSE 实时推送：post / filtered / alert / stats 事件
+    
+    断线重连时浏览器自动带 Last-Event-ID 头，也可用 last_event_id 参数指定
+    """
+    sub = kg.events.subscribe(
+        last_event_id=request.headers.get("last-event-id") or last_event_id,
+        platform=platform,
+        category=category,
+        types=types.split(",") if types else None
+    )
+    
+    async def event_generator():
+        last_id = None
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                events = await sub.aget(timeout=15)
+                for event in events:
+                    yield format_sse(event)
+                    last_id = event.id or last_id
+                if sub.dropped:
+                    yield format_dropped(last_id)
+                    break
+                if not events:
+                    yield ": keepalive\n\n"
+        finally:
+            sub.close()
+    
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/events")
+async def get_events(
+    status: Optional[str] = None,
+    min_posts: int = 2,
+    limit: int = 20,
+    offset: int = 0
+):
+    """事件聚类结果（分页，按最近帖子时间倒序）"""
+    if status not in (None, "open", "closed"):
+        raise HTTPException(status_code=400, detail="status must be open or closed")
+    page = await kg.get_events(status=status, min_posts=min_posts, limit=limit, offset=offset)
+    return {
+        "events": page["events"],
+        "count": len(page["events"]),
+        "total": page["total"],
+        "limit": limit,
+        "offset": offset,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.get("/api/events/{event_id}")
+async def get_event(event_id: str, limit: int = 50):
+    """事件详情及其帖子"""
+    event = await kg.get_event(event_id, limit=limit)
+    if event is None:
+        raise HTTPException(status_code=404, detail=f"Unknown event: {event_id}")
+    return {**event, "timestamp": datetime.now().isoformat()}
+
+
+@app.get("/api/hashtags/top")
+async def get_top_hashtags(hours: int = 24, platform: Optional[str] = None, limit: int = 20):
+    """时间窗口内帖子数最多的话题标签"""
+    items = await kg.get_top_entities("hashtag", hours=hours, platform=platform, limit=limit)
+    return {"hashtags": items, "count": len(items), "hours": hours, "timestamp": datetime.now().isoformat()}
+
+
+@app.get("/api/hashtags/{tag}/posts")
+async def get_hashtag_posts(tag: str, hours: int = 6, limit: int = 50):
+    """带某话题标签的近期帖子（tag 可省略 #，大小写和全角不敏感）"""
+    posts = await kg.get_entity_posts("hashtag", tag, hours=hours, limit=limit)
+    return {"tag": tag, "posts": posts, "count": len(posts), "hours": hours, "timestamp": datetime.now().isoformat()}
+
+
+@app.get("/api/mentions/{handle}/posts")
+async def get_mention_posts(handle: str, platform: str = "twitter", hours: int = 24, limit: int = 50):
+    """提及某作者的近期帖子"""
+    posts = await kg.get_entity_posts("mention", handle, hours=hours, platform=platform, limit=limit)
+    return {"handle": handle, "posts": posts, "count": len(posts), "hours": hours, "timestamp": datetime.now().isoformat()}
+
+
+@app.get("/api/domains/top")
+async def get_top_domains(hours: int = 24, platform: Optional[str] = None, limit: int = 20):
+    """时间窗口内被链接最多的域名"""
+    items = await kg.get_top_entities("domain", hours=hours, platform=platform, limit=limit)
+    return {"domains": items, "count": len(items), "hours": hours, "timestamp": datetime.now().isoformat()}
+
+
+@app.get("/api/domains/{domain}/posts")
+async def get_domain_posts(domain: str, hours: int = 24, limit: int = 50):
+    """链接到某域名的近期帖子"""
+    posts = await kg.get_entity_posts("domain", domain, hours=hours, limit=limit)
+    return {"domain": domain, "posts": posts, "count": len(posts), "hours": hours, "timestamp": datetime.now().isoformat()}
+
+
+@app.get("/api/authors")
+async def get_authors(
+    platform: Optional[str] = None,
+    sort_by: str = "influence",
+    limit: int = 20,
+    offset: int = 0
+):
+    """
+    作者排行（提及/回复/引用图上的增量 PageRank）
+    
+    sort_by: influence / mentioned / posts
+    """
+    if sort_by not in ("influence", "mentioned", "posts"):
+        raise HTTPException(status_code=400, detail="sort_by must be influence, mentioned or posts")
+    page = await kg.get_authors(platform=platform, sort_by=sort_by, limit=limit, offset=offset)
+    return {
+        "authors": page["authors"],
+        "count": len(page["authors"]),
+        "total": page["total"],
+        "limit": limit,
+        "offset": offset,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.get("/api/authors/{author_id}")
+async def get_author(author_id: str, limit: int = 20):
+    """作者详情（author_id 形如 twitter:elonmusk）"""
+    author = await kg.get_author(author_id, limit=limit)
+    if author is None:
+        raise HTTPException(status_code=404, detail=f"Unknown author: {author_id}")
+    return {**author, "timestamp": datetime.now().isoformat()}
+
+
+@app.get("/api/export")
+async def export_rows(
+    entity: str = "posts",
+    format: str = "jsonl",
+    compress: str = "gzip",
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    platform: Optional[str] = None,
+    category: Optional[str] = None,
+    join: bool = False
+):
+    """
+    流式导出 Post / FilteredPost / DiscoveryResult（entity=posts|filtered|discovery）
+    
+    按分页读取、边编码边压缩，内存占用与总行数无关；join=true 时附带关联节点的列
+    """
+    try:
+        job = export.ExportJob(
+            entity=entity, fmt=format, compress=compress, since=since, until=until,
+            platform=platform, category=category, join=join
+        )
+        chunks = export.stream(lambda: kg, job)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    async def body():
+        # 每页一次查询（与其他请求一样在事件循环中执行），页之间让出事件循环
+        for chunk in chunks:
+            yield chunk
+            await asyncio.sleep(0)
+    
+    return StreamingResponse(body(), media_type=job.content_type, headers=job.headers())
+
+
 @app.get("/api/stats")
 async def get_stats():
     """获取总体统计信息"""
@@ -275,6 +732,11 @@ async def get_stats():
             "sentiments": discovery_stats.get("sentiments", {}),
             "kols": discovery_stats.get("kols", 0),
             "trends": discovery_stats.get("trends", 0),
+            "dedup": kg.dedup.stats() if kg.dedup is not None else None,
+            "events": kg.events.stats(),
+            "related": kg.related.stats() if kg.related is not None else None,
+            "clustering": kg.clusterer.stats() if kg.clusterer is not None else None,
+            "authors": kg.authors.stats() if kg.authors is not None else None,
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
@@ -283,49 +745,33 @@ async def get_stats():
 
 
 @app.post("/api/cleanup/run")
-async def run_cleanup(
-    request: CleanupRequest,
-    background_tasks: BackgroundTasks
-):
+async def run_cleanup(request: CleanupRequest):
     """
     运行清理任务
     
-    可以后台执行或立即返回预览结果
+    dry_run 时返回精确的影响行数；否则交给后台调度器分片执行
     """
     try:
         rules = await kg.get_cleanup_rules(enabled_only=True)
-        logger.info(f"Running cleanup with {len(rules)} rules")
+        logger.info(f"Running cleanup with {len(rules)} rules (dry_run={request.dry_run})")
         
         results = []
         
         for rule in rules:
-            rule_result = {
+            results.append({
                 "rule_id": rule["id"],
                 "targetType": rule["targetType"],
                 "condition": rule["condition"],
                 "action": rule["action"],
-                "affected": 0,
-                "executed": not request.dry_run
-            }
-            
-            # 执行清理动作
-            if not request.dry_run:
-                if rule["targetType"] == "Post" and rule["condition"] == "age_days":
-                    rule_result["affected"] = await kg.archive_old_posts(
-                        days=rule["threshold"]
-                    )
-                elif rule["targetType"] == "FilteredPost" and rule["condition"] == "relevance_below":
-                    rule_result["affected"] = await kg.delete_low_relevance_posts(
-                        threshold=rule["threshold"]
-                    )
-            else:
-                # Dry run - 只统计数量，不实际删除
-                rule_result["affected"] = 0  # TODO: 实现预览逻辑
-            
-            results.append(rule_result)
+                "affected": await estimate_rule(kg, rule),
+                "scheduled": not request.dry_run
+            })
+        
+        if not request.dry_run:
+            cleanup_scheduler.trigger([rule["id"] for rule in rules])
         
         return {
-            "status": "success",
+            "status": "success" if request.dry_run else "scheduled",
             "dry_run": request.dry_run,
             "results": results,
             "timestamp": datetime.now().isoformat()
@@ -336,6 +782,15 @@ async def run_cleanup(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/cleanup/status")
+async def get_cleanup_status():
+    """获取后台清理调度状态"""
+    return {
+        "scheduler": cleanup_scheduler.status(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
 @app.get("/api/cleanup/rules")
 async def get_cleanup_rules():
     """获取清理规则"""
@@ -352,6 +807,96 @@ async def get_cleanup_rules():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/alerts/rules")
+async def get_alert_rules():
+    """获取关键词警报规则"""
+    rules = await kg.get_alert_rules()
+    return {
+        "rules": rules,
+        "count": len(rules),
+        "automaton": kg.alerts.stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.post("/api/alerts/rules")
+async def save_alert_rule(rule: AlertRule):
+    """新建或更新关键词警报规则（保存后立即重建自动机）"""
+    if not any(k.strip() for k in rule.keywords):
+        raise HTTPException(status_code=400, detail="keywords must not be empty")
+    if not await kg.save_alert_rule(rule.dict()):
+        raise HTTPException(status_code=500, detail=f"Failed to save alert rule {rule.id}")
+    return {
+        "status": "success",
+        "id": rule.id,
+        "automaton": kg.alerts.stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.delete("/api/alerts/rules/{rule_id}")
+async def delete_alert_rule(rule_id: str):
+    """删除关键词警报规则"""
+    if not await kg.delete_alert_rule(rule_id):
+        raise HTTPException(status_code=500, detail=f"Failed to delete alert rule {rule_id}")
+    return {
+        "status": "success",
+        "id": rule_id,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.get("/api/alerts")
+async def get_alert_matches(alert_id: Optional[str] = None, limit: int = 50):
+    """获取最近的警报触发记录"""
+    matches = await kg.get_alert_matches(alert_id=alert_id, limit=limit)
+    return {
+        "alerts": matches,
+        "count": len(matches),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.post("/api/snapshots")
+async def create_snapshot(request: Optional[SnapshotRequest] = None):
+    """
+    在线快照（增量，未变化的文件硬链接上一代）
+
+    复制在线程中进行，入库和清理分片只在补复制 WAL 尾部时暂停（持有 db_lock），见 backup.py
+    """
+    global snapshot_running
+    if snapshot_running:
+        raise HTTPException(status_code=409, detail="Snapshot already in progress")
+    snapshot_running = True
+    root = backup.backup_root(str(kg.db_path))
+    try:
+        result = await backup.take_snapshot_async(
+            str(kg.db_path), root, lock=db_lock, keep=int(os.getenv("BACKUP_KEEP", "0"))
+        )
+        if request is not None and request.verify:
+            result["verification"] = await asyncio.get_running_loop().run_in_executor(
+                None, backup.verify_snapshot, root / result["name"]
+            )
+        return {**result, "timestamp": datetime.now().isoformat()}
+    except Exception as e:
+        logger.error(f"Snapshot failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        snapshot_running = False
+
+
+@app.get("/api/snapshots")
+async def get_snapshots():
+    """列出快照"""
+    root = backup.backup_root(str(kg.db_path))
+    return {
+        "root": str(root),
+        "current": backup.current_snapshot(root),
+        "snapshots": backup.list_snapshots(root),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
 # ========== 主程序 ==========
 
 def main():
@@ -371,13 +916,21 @@ def main():
     
     logger.info(f"Starting Twitter Scraper API on {args.host}:{args.port}")
     
-    uvicorn.run(
-        "server:app",
-        host=args.host,
-        port=args.port,
-        reload=args.reload,
-        log_level="info"
-    )
+    import uvicorn
+    
+    if args.reload:
+        uvicorn.run("server:app", host=args.host, port=args.port, reload=True, log_level="info")
+        return
+    
+    class ReadyServer(uvicorn.Server):
+        """端口开始监听后发出就绪通知（startup 事件早于端口绑定）"""
+        
+        async def startup(self, sockets=None):
+            await super().startup(sockets=sockets)
+            if self.started:
+                readiness.notify_ready(variant="full", host=args.host, port=args.port)
+    
+    ReadyServer(uvicorn.Config("server:app", host=args.host, port=args.port, log_level="info")).run()
 
 
 if __name__ == "__main__":
@@ -4,19 +4,60 @@ Twitter Scraper Backend - 轻量级版本
 """
 
 import json
+import os
 import sys
+import threading
+import time
 from datetime import datetime
 from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs, unquote
 from pathlib import Path
 
 # 添加当前目录到路径
 sys.path.insert(0, str(Path(__file__).parent))
 
 from database import SocialScraperKG
+from cleanup import CleanupScheduler, estimate_rule
+from events import serve_sse
+import metrics
+import export
+import backup
+import admission
+import readiness
+import httpcore
 
 # 全局变量
 kg: SocialScraperKG = None
+cleanup_scheduler: CleanupScheduler = None
+
+# 请求线程共用同一个 Kuzu 连接，数据库访问串行化（事件流不持有锁）
+db_lock = threading.Lock()
+
+# 同一时间只做一个快照
+snapshot_lock = threading.Lock()
+
+# 入库准入控制（INGEST_ADMISSION=off 关闭）
+ingest_admission = admission.AdmissionController.from_env()
+
+# CORS 预检响应头（asyncio 核心直接返回缓存的预检响应，浏览器按 Max-Age 缓存）
+PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, X-Client-Id',
+    'Access-Control-Max-Age': '7200'
+}
+
+# 指标中的路由标签
+ROUTES = (
+    '/', '/health', '/metrics', '/debug/slow-queries',
+    '/api/stats', '/api/posts', '/api/posts/filtered',
+    '/api/posts/batch', '/api/posts/{post_id}/related', '/api/discovery/stats',
+    '/api/trends', '/api/analytics/engagement', '/api/hashtags/top', '/api/domains/top',
+    '/api/hashtags/{tag}/posts', '/api/mentions/{handle}/posts', '/api/domains/{domain}/posts',
+    '/api/authors', '/api/authors/{author_id}', '/api/events', '/api/events/{event_id}',
+    '/api/alerts', '/api/cleanup/run', '/api/export', '/api/snapshots'
+)
 
 
 class TwitterScraperHandler(BaseHTTPRequestHandler):
@@ -26,22 +67,49 @@ class TwitterScraperHandler(BaseHTTPRequestHandler):
         """自定义日志格式"""
         print(f"[{datetime.now().strftime('%H:%M:%S')}] {args[0]}")
     
-    def send_json(self, data: dict, status: int = 200):
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+    
+    def send_metrics(self):
+        """发送 Prometheus 文本格式指标"""
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', metrics.CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _serve(self, method, path, handler, *args):
+        """持锁处理请求并记录耗时（包含等待数据库锁的时间）"""
+        started = time.perf_counter()
+        self._status = 500
+        metrics.HTTP_IN_FLIGHT.inc()
+        try:
+            with db_lock:
+                handler(*args)
+        finally:
+            metrics.HTTP_IN_FLIGHT.dec()
+            metrics.observe_request(method, metrics.route_label(path, ROUTES), self._status, started)
+    
+    def send_json(self, data: dict, status: int = 200, headers: dict = None):
         """发送 JSON 响应"""
         self.send_response(status)
         self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Client-Id')
+        self.send_header('Access-Control-Expose-Headers', 'Retry-After')
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
         self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode())
+        self.wfile.write(json.dumps(data, ensure_ascii=False, default=str).encode())
     
     def do_OPTIONS(self):
-        """处理 CORS 预检请求"""
+        """处理 CORS 预检请求（仅 --threaded 模式，asyncio 核心直接返回缓存的响应）"""
         self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        for key, value in PREFLIGHT_HEADERS.items():
+            self.send_header(key, value)
         self.end_headers()
     
     def do_GET(self):
@@ -50,6 +118,64 @@ class TwitterScraperHandler(BaseHTTPRequestHandler):
         path = parsed.path
         params = parse_qs(parsed.query)
         
+        if path == '/api/events/stream':
+            serve_sse(self, kg.events, params)
+            return
+        
+        if path == '/metrics':
+            self.send_metrics()
+            return
+        
+        if path == '/api/export':
+            self._export(path, params)
+            return
+        
+        if path == '/debug/slow-queries':
+            self.send_json(kg.get_slow_queries(
+                int(params.get('limit', [50])[0]),
+                params.get('query', [None])[0]
+            ))
+            return
+        
+        self._serve('GET', path, self._handle_get, path, params)
+    
+    def _export(self, path: str, params: dict):
+        """流式导出：数据库锁只在每页查询时持有，写出时其他请求可以访问数据库"""
+        started = time.perf_counter()
+        self._status = 500
+        metrics.HTTP_IN_FLIGHT.inc()
+        try:
+            try:
+                job = export.ExportJob.from_query({key: values[0] for key, values in params.items()})
+                chunks = export.stream(lambda: kg, job, db_lock)
+            except ValueError as e:
+                self.send_json({"error": str(e)}, 400)
+                return
+            except RuntimeError as e:
+                self.send_json({"error": str(e)}, 503)
+                return
+            
+            self.send_response(200)
+            self.send_header('Content-Type', job.content_type)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Access-Control-Expose-Headers', 'Content-Disposition')
+            for key, value in job.headers().items():
+                self.send_header(key, value)
+            self.end_headers()
+            # 切换为流式写出（没有 Content-Length，写完关闭连接）
+            self.wfile.flush()
+            try:
+                for chunk in chunks:
+                    self.wfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            except Exception as e:
+                print(f"[ERROR] Export failed: {e}")
+        finally:
+            metrics.HTTP_IN_FLIGHT.dec()
+            metrics.observe_request('GET', metrics.route_label(path, ROUTES), self._status, started)
+    
+    def _handle_get(self, path: str, params: dict):
         try:
             if path == '/':
                 self.send_json({
@@ -88,10 +214,120 @@ class TwitterScraperHandler(BaseHTTPRequestHandler):
                 posts = asyncio_run(kg.get_filtered_posts(category, limit))
                 self.send_json({"posts": posts, "count": len(posts)})
             
+            elif path.startswith('/api/posts/') and path.endswith('/related'):
+                post_id = unquote(path[len('/api/posts/'):-len('/related')])
+                k = int(params.get('k', [10])[0])
+                posts = asyncio_run(kg.get_related_posts(post_id, k=k))
+                if posts is None:
+                    self.send_json({"error": f"Post not indexed: {post_id}"}, 404)
+                else:
+                    self.send_json({"postId": post_id, "related": posts, "count": len(posts)})
+            
             elif path == '/api/discovery/stats':
                 stats = asyncio_run(kg.get_discovery_stats())
                 self.send_json({"stats": stats})
             
+            elif path == '/api/trends':
+                window = params.get('window', ['6h'])[0]
+                limit = int(params.get('limit', [20])[0])
+                kind = params.get('kind', [None])[0]
+                if window not in ('1h', '6h', '24h'):
+                    self.send_json({"error": "window must be 1h, 6h or 24h"}, 400)
+                    return
+                trends = kg.trends.trending(window=window, limit=limit, kind=kind)
+                self.send_json({"trends": trends, "count": len(trends), "window": window})
+            
+            elif path == '/api/analytics/engagement':
+                group_by = params.get('group_by', [None])[0]
+                if group_by not in (None, 'platform', 'author'):
+                    self.send_json({"error": "group_by must be platform or author"}, 400)
+                    return
+                stats = asyncio_run(kg.get_engagement_analytics(
+                    hours=int(params.get('hours', [24])[0]),
+                    platform=params.get('platform', [None])[0],
+                    author=params.get('author', [None])[0],
+                    group_by=group_by,
+                    top_k=int(params.get('top_k', [10])[0]),
+                    sort_by=params.get('sort_by', ['score'])[0]
+                ))
+                self.send_json(stats)
+            
+            elif path in ('/api/hashtags/top', '/api/domains/top'):
+                kind = 'hashtag' if path == '/api/hashtags/top' else 'domain'
+                hours = int(params.get('hours', [24])[0])
+                items = asyncio_run(kg.get_top_entities(
+                    kind,
+                    hours=hours,
+                    platform=params.get('platform', [None])[0],
+                    limit=int(params.get('limit', [20])[0])
+                ))
+                self.send_json({f"{kind}s": items, "count": len(items), "hours": hours})
+            
+            elif path.endswith('/posts') and path.split('/')[2:3] in (['hashtags'], ['mentions'], ['domains']):
+                collection = path.split('/')[2]
+                key = unquote(path[len(f'/api/{collection}/'):-len('/posts')])
+                hours = int(params.get('hours', [6 if collection == 'hashtags' else 24])[0])
+                posts = asyncio_run(kg.get_entity_posts(
+                    collection[:-1],
+                    key,
+                    hours=hours,
+                    platform=params.get('platform', [None])[0],
+                    limit=int(params.get('limit', [50])[0])
+                ))
+                self.send_json({"key": key, "posts": posts, "count": len(posts), "hours": hours})
+            
+            elif path == '/api/authors':
+                sort_by = params.get('sort_by', ['influence'])[0]
+                if sort_by not in ('influence', 'mentioned', 'posts'):
+                    self.send_json({"error": "sort_by must be influence, mentioned or posts"}, 400)
+                    return
+                page = asyncio_run(kg.get_authors(
+                    platform=params.get('platform', [None])[0],
+                    sort_by=sort_by,
+                    limit=int(params.get('limit', [20])[0]),
+                    offset=int(params.get('offset', [0])[0])
+                ))
+                self.send_json({**page, "count": len(page["authors"])})
+            
+            elif path.startswith('/api/authors/'):
+                author_id = unquote(path[len('/api/authors/'):])
+                author = asyncio_run(kg.get_author(author_id, limit=int(params.get('limit', [20])[0])))
+                if author is None:
+                    self.send_json({"error": f"Unknown author: {author_id}"}, 404)
+                else:
+                    self.send_json(author)
+            
+            elif path == '/api/events':
+                page = asyncio_run(kg.get_events(
+                    status=params.get('status', [None])[0],
+                    min_posts=int(params.get('min_posts', [2])[0]),
+                    limit=int(params.get('limit', [20])[0]),
+                    offset=int(params.get('offset', [0])[0])
+                ))
+                self.send_json({**page, "count": len(page["events"])})
+            
+            elif path.startswith('/api/events/'):
+                event_id = unquote(path[len('/api/events/'):])
+                event = asyncio_run(kg.get_event(event_id, limit=int(params.get('limit', [50])[0])))
+                if event is None:
+                    self.send_json({"error": f"Unknown event: {event_id}"}, 404)
+                else:
+                    self.send_json(event)
+            
+            elif path == '/api/snapshots':
+                root = backup.backup_root(str(kg.db_path))
+                self.send_json({
+                    "root": str(root),
+                    "current": backup.current_snapshot(root),
+                    "snapshots": backup.list_snapshots(root)
+                })
+            
+            elif path == '/api/alerts':
+                alert_id = params.get('alert_id', [None])[0]
+                limit = int(params.get('limit', [50])[0])
+                matches = asyncio_run(kg.get_alert_matches(alert_id, limit))
+                self.send_json({"alerts": matches, "count": len(matches)})
+            
             else:
                 self.send_json({"error": "Not found"}, 404)
         
@@ -100,19 +336,80 @@ class TwitterScraperHandler(BaseHTTPRequestHandler):
     
     def do_POST(self):
         """处理 POST 请求"""
-        parsed = urlparse(self.path)
-        path = parsed.path
-        
+        path = urlparse(self.path).path
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode() if length else ''
+        if path == '/api/posts/batch' and ingest_admission is not None:
+            self._post_batch(path, body)
+        elif path == '/api/snapshots':
+            self._snapshot(path, body)
+        else:
+            self._serve('POST', path, self._handle_post, path, body)
+    
+    def _post_batch(self, path, body):
+        """准入判断在获取数据库锁之前完成，被拒绝的批次不用排队等锁"""
+        started = time.perf_counter()
         try:
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = self.rfile.read(content_length).decode()
             data = json.loads(body) if body else {}
+        except ValueError:
+            # 解析错误交给 _handle_post 按原样报告
+            self._serve('POST', path, self._handle_post, path, body)
+            return
+        rows = admission.batch_rows(data)
+        client = admission.client_key(self.headers.get(admission.CLIENT_HEADER), self.client_address[0])
+        admitted, wait, reason = ingest_admission.admit(client, rows)
+        if not admitted:
+            self.send_json(
+                {"error": "Ingest rate limit exceeded", "reason": reason, "retryAfter": round(wait, 2)},
+                429,
+                {'Retry-After': admission.retry_after(wait)}
+            )
+            metrics.observe_request('POST', path, 429, started)
+            return
+        try:
+            self._serve('POST', path, self._handle_post, path, body, data)
+        finally:
+            ingest_admission.done(rows, time.perf_counter() - started)
+    
+    def _snapshot(self, path: str, body: str):
+        """在线快照：复制时不持有数据库锁，只在补复制 WAL 尾部时持有（见 backup.py）"""
+        started = time.perf_counter()
+        self._status = 500
+        metrics.HTTP_IN_FLIGHT.inc()
+        try:
+            if not snapshot_lock.acquire(blocking=False):
+                self.send_json({"error": "Snapshot already in progress"}, 409)
+                return
+            try:
+                data = json.loads(body) if body else {}
+                root = backup.backup_root(str(kg.db_path))
+                result = backup.take_snapshot(
+                    str(kg.db_path), root, lock=db_lock, keep=int(os.getenv("BACKUP_KEEP", "0"))
+                )
+                if data.get('verify'):
+                    result['verification'] = backup.verify_snapshot(root / result['name'])
+                self.send_json(result)
+            except Exception as e:
+                self.send_json({"error": str(e)}, 500)
+            finally:
+                snapshot_lock.release()
+        finally:
+            metrics.HTTP_IN_FLIGHT.dec()
+            metrics.observe_request('POST', path, self._status, started)
+    
+    def _handle_post(self, path: str, body: str, data: dict = None):
+        try:
+            if data is None:
+                data = json.loads(body) if body else {}
             
             if path == '/api/posts/batch':
                 posts = data.get('posts', [])
                 filtered = data.get('filtered', [])
                 discovery = data.get('discovery', [])
                 
+                metrics.BATCH_SIZE.observe(len(filtered), "filtered")
+                metrics.BATCH_SIZE.observe(len(discovery), "discovery")
+                
                 # 存储帖子
                 posts_count = asyncio_run(kg.add_posts_batch(posts))
                 
@@ -140,14 +437,16 @@ class TwitterScraperHandler(BaseHTTPRequestHandler):
                 rules = asyncio_run(kg.get_cleanup_rules())
                 
                 results = []
+                for rule in rules:
+                    affected = asyncio_run(estimate_rule(kg, rule))
+                    results.append({"rule": rule['id'], "affected": affected})
+                
+                # 实际执行交给后台调度器分片处理
                 if not dry_run:
-                    for rule in rules:
-                        if rule['targetType'] == 'Post' and rule['condition'] == 'age_days':
-                            affected = asyncio_run(kg.archive_old_posts(rule['threshold']))
-                            results.append({"rule": rule['id'], "affected": affected})
+                    cleanup_scheduler.trigger([rule['id'] for rule in rules])
                 
                 self.send_json({
-                    "status": "success",
+                    "status": "success" if dry_run else "scheduled",
                     "dry_run": dry_run,
                     "results": results
                 })
@@ -159,6 +458,38 @@ class TwitterScraperHandler(BaseHTTPRequestHandler):
             self.send_json({"error": str(e)}, 500)
 
 
+class CleanupServiceMixin:
+    """在 serve_forever 的空闲轮询中执行清理调度的时间片"""
+    
+    def service_actions(self):
+        if cleanup_scheduler is None:
+            return
+        now = time.monotonic()
+        if now < getattr(self, '_next_cleanup_tick', 0):
+            return
+        try:
+            # 调度器只在每个分片期间持有数据库锁，分片之间请求可以插入
+            busy = asyncio_run(cleanup_scheduler.tick())
+        except Exception as e:
+            print(f"[ERROR] Cleanup tick failed: {e}")
+            busy = False
+        interval = cleanup_scheduler.busy_interval if busy else cleanup_scheduler.poll_interval
+        self._next_cleanup_tick = now + interval
+
+
+class LiteHTTPServer(CleanupServiceMixin, httpcore.AsyncHTTPServer):
+    """asyncio HTTP/1.1 服务器（持久连接，请求在工作线程中处理，SSE 长连接各占一个线程）"""
+    
+    def __init__(self, server_address, handler_class):
+        super().__init__(server_address, handler_class, preflight_headers=PREFLIGHT_HEADERS)
+
+
+class ThreadedLiteHTTPServer(CleanupServiceMixin, ThreadingMixIn, HTTPServer):
+    """原来的多线程 HTTP/1.0 服务器（每个请求一个连接），--threaded 时使用"""
+    
+    daemon_threads = True
+
+
 def asyncio_run(coro):
     """兼容不同 Python 版本的 asyncio 运行"""
     import asyncio
@@ -178,27 +509,35 @@ def main():
     parser.add_argument("--host", default="127.0.0.1", help="Host")
     parser.add_argument("--port", type=int, default=8769, help="Port")
     parser.add_argument("--db-path", default="./database/twitter_scraper", help="Database path")
+    parser.add_argument("--threaded", action="store_true", help="Use the thread-per-request HTTP/1.0 server")
     
     args = parser.parse_args()
     
-    global kg
+    global kg, cleanup_scheduler
     print(f"[INFO] Initializing database at {args.db_path}...")
     kg = SocialScraperKG(args.db_path)
     asyncio_run(kg.init())
+    cleanup_scheduler = CleanupScheduler(kg, lock=db_lock)
     
     print(f"[OK] Database initialized")
     print(f"[INFO] Starting server on {args.host}:{args.port}")
     
-    server = HTTPServer((args.host, args.port), TwitterScraperHandler)
+    server_class = ThreadedLiteHTTPServer if args.threaded else LiteHTTPServer
+    server = server_class((args.host, args.port), TwitterScraperHandler)
     print(f"[OK] Server running - http://{args.host}:{args.port}")
     print("[INFO] Press Ctrl+C to stop")
+    readiness.notify_ready(variant="lite", host=args.host, port=args.port)
+    readiness.interrupt_on_sigterm()
     
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         print("\n[INFO] Shutting down...")
-        asyncio_run(kg.close())
         server.shutdown()
+        # 等正在执行的分片结束后关闭导出文件，再关闭数据库
+        with db_lock:
+            cleanup_scheduler.close()
+            asyncio_run(kg.close())
         print("[OK] Server stopped")
 
 
@@ -7,8 +7,11 @@ import json
 import sys
 import asyncio
 import logging
+import threading
+import time
 from datetime import datetime
 from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
 from urllib.parse import urlparse, parse_qs
 from pathlib import Path
 
@@ -23,28 +26,83 @@ logger = logging.getLogger(__name__)
 # 导入数据库
 sys.path.insert(0, str(Path(__file__).parent))
 from database import SocialScraperKG
+from events import serve_sse
+import metrics
+import admission
+import readiness
+import httpcore
 
 kg: SocialScraperKG = None
 
+# 数据库访问串行化，事件流不持有锁
+db_lock = threading.Lock()
+
+# 入库准入控制（INGEST_ADMISSION=off 关闭）
+ingest_admission = admission.AdmissionController.from_env()
+
+# CORS 预检响应头（asyncio 核心直接返回缓存的预检响应）
+PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, X-Client-Id',
+    'Access-Control-Max-Age': '7200'
+}
+
+# 指标中的路由标签
+ROUTES = (
+    '/', '/health', '/metrics', '/debug/slow-queries',
+    '/api/stats', '/api/posts', '/api/posts/filtered',
+    '/api/posts/batch', '/api/discovery/stats'
+)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
 
 class Handler(BaseHTTPRequestHandler):
     def log_message(self, format, *args):
         logger.info(args[0])
     
-    def send_json(self, data, status=200):
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+    
+    def send_metrics(self):
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', metrics.CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _serve(self, method, path, handler, *args):
+        started = time.perf_counter()
+        self._status = 500
+        metrics.HTTP_IN_FLIGHT.inc()
+        try:
+            with db_lock:
+                handler(*args)
+        finally:
+            metrics.HTTP_IN_FLIGHT.dec()
+            metrics.observe_request(method, metrics.route_label(path, ROUTES), self._status, started)
+    
+    def send_json(self, data, status=200, headers=None):
         self.send_response(status)
         self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Client-Id')
+        self.send_header('Access-Control-Expose-Headers', 'Retry-After')
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
         self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode())
+        self.wfile.write(json.dumps(data, ensure_ascii=False, default=str).encode())
     
     def do_OPTIONS(self):
         self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        for key, value in PREFLIGHT_HEADERS.items():
+            self.send_header(key, value)
         self.end_headers()
     
     def do_GET(self):
@@ -52,6 +110,24 @@ class Handler(BaseHTTPRequestHandler):
         path = parsed.path
         params = parse_qs(parsed.query)
         
+        if path == '/api/events/stream':
+            serve_sse(self, kg.events, params)
+            return
+        
+        if path == '/metrics':
+            self.send_metrics()
+            return
+        
+        if path == '/debug/slow-queries':
+            self.send_json(kg.get_slow_queries(
+                int(params.get('limit', [50])[0]),
+                params.get('query', [None])[0]
+            ))
+            return
+        
+        self._serve('GET', path, self._handle_get, path, params)
+    
+    def _handle_get(self, path, params):
         try:
             if path == '/':
                 self.send_json({"service": "Twitter Scraper", "version": "2.2-minimal"})
@@ -89,16 +165,50 @@ class Handler(BaseHTTPRequestHandler):
     
     def do_POST(self):
         path = urlparse(self.path).path
-        
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode() if length else ''
+        if path == '/api/posts/batch' and ingest_admission is not None:
+            self._post_batch(path, body)
+        else:
+            self._serve('POST', path, self._handle_post, path, body)
+    
+    def _post_batch(self, path, body):
+        """准入判断在获取数据库锁之前完成，被拒绝的批次不用排队等锁"""
+        started = time.perf_counter()
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            # 解析错误交给 _handle_post 按原样报告
+            self._serve('POST', path, self._handle_post, path, body)
+            return
+        rows = admission.batch_rows(data)
+        client = admission.client_key(self.headers.get(admission.CLIENT_HEADER), self.client_address[0])
+        admitted, wait, reason = ingest_admission.admit(client, rows)
+        if not admitted:
+            self.send_json(
+                {"error": "Ingest rate limit exceeded", "reason": reason, "retryAfter": round(wait, 2)},
+                429,
+                {'Retry-After': admission.retry_after(wait)}
+            )
+            metrics.observe_request('POST', path, 429, started)
+            return
+        try:
+            self._serve('POST', path, self._handle_post, path, body, data)
+        finally:
+            ingest_admission.done(rows, time.perf_counter() - started)
+    
+    def _handle_post(self, path, body, data=None):
         try:
-            length = int(self.headers.get('Content-Length', 0))
-            data = json.loads(self.rfile.read(length).decode()) if length else {}
+            if data is None:
+                data = json.loads(body) if body else {}
             
             if path == '/api/posts/batch':
                 posts = data.get('posts', [])
                 filtered = data.get('filtered', [])
                 discovery = data.get('discovery', [])
                 
+                metrics.BATCH_SIZE.observe(len(filtered), "filtered")
+                metrics.BATCH_SIZE.observe(len(discovery), "discovery")
                 posts_count = asyncio.run(kg.add_posts_batch(posts))
                 filtered_count = sum(1 for fp in filtered if asyncio.run(kg.add_filtered_post(fp)))
                 discovery_count = sum(1 for dr in discovery if asyncio.run(kg.add_discovery_result(dr)))
@@ -123,6 +233,7 @@ def main():
     parser.add_argument("--host", default="127.0.0.1", help="Host")
     parser.add_argument("--port", type=int, default=8769, help="Port")
     parser.add_argument("--db-path", default="./database/twitter_scraper", help="DB path")
+    parser.add_argument("--threaded", action="store_true", help="Use the thread-per-request HTTP/1.0 server")
     args = parser.parse_args()
     
     global kg
@@ -131,8 +242,13 @@ def main():
     asyncio.run(kg.init())
     
     logger.info(f"Starting server on {args.host}:{args.port}")
-    server = HTTPServer((args.host, args.port), Handler)
+    if args.threaded:
+        server = ThreadingHTTPServer((args.host, args.port), Handler)
+    else:
+        server = httpcore.AsyncHTTPServer((args.host, args.port), Handler, preflight_headers=PREFLIGHT_HEADERS)
     logger.info(f"Server running - http://{args.host}:{args.port}")
+    readiness.notify_ready(variant="minimal", host=args.host, port=args.port)
+    readiness.interrupt_on_sigterm()
     
     try:
         server.serve_forever()
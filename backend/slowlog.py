@@ -0,0 +1,146 @@
+"""
+Social Scraper Slow Query Log
+慢查询记录：超过阈值的语句写入结构化日志（JSONL），并抽样附上执行计划
+
+只读语句用 PROFILE 重跑拿到各算子的实际耗时和行数；写语句重跑会重复写入，
+只用 EXPLAIN 取计划。同一查询名在 profile_interval 秒内只抓一次计划。
+显式事务内不抓计划（计划语句出错会中止整个事务），DDL / COPY / 事务控制语句也不抓
+"""
+
+import json
+import os
+import re
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+WRITE_PATTERN = re.compile(r"\b(CREATE|MERGE|SET|DELETE)\b", re.IGNORECASE)
+NO_PLAN_PATTERN = re.compile(
+    r"^\s*(BEGIN|COMMIT|ROLLBACK|CHECKPOINT|CALL|COPY|EXPLAIN|PROFILE|DROP|ALTER|CREATE\s+(NODE|REL))\b",
+    re.IGNORECASE
+)
+
+MAX_STATEMENT_CHARS = 2000
+
+
+def param_shape(value: Any) -> Any:
+    """参数的结构描述（类型和长度），不记录具体取值"""
+    if isinstance(value, dict):
+        return {key: param_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shape = f"list[{len(value)}]"
+        if value and isinstance(value[0], dict):
+            shape += " of {" + ", ".join(value[0]) + "}"
+        return shape
+    if isinstance(value, str):
+        return f"str[{len(value)}]"
+    return type(value).__name__
+
+
+def _row_count(result) -> Optional[int]:
+    try:
+        return result.get_num_tuples()
+    except Exception:
+        return None
+
+
+class SlowQueryLog:
+    """由 metrics.TimedConnection 在语句超过阈值时回调"""
+
+    def __init__(
+        self,
+        threshold_ms: float = 500.0,
+        profile_interval: float = 60.0,
+        path: Optional[Path] = None,
+        capacity: int = 200
+    ):
+        self.threshold = threshold_ms / 1000
+        self.profile_interval = profile_interval
+        self.path = Path(path) if path else None
+        self.recent: deque = deque(maxlen=capacity)
+        self.total = 0
+        self._last_profiled: Dict[str, float] = {}
+
+    @classmethod
+    def from_env(cls, path: Optional[Path] = None) -> Optional["SlowQueryLog"]:
+        """SLOW_QUERY_MS=off 时返回 None"""
+        threshold = os.getenv("SLOW_QUERY_MS", "500")
+        if threshold == "off":
+            return None
+        return cls(
+            threshold_ms=float(threshold),
+            profile_interval=float(os.getenv("SLOW_QUERY_PROFILE_INTERVAL", "60")),
+            path=path
+        )
+
+    def _should_profile(self, name: str) -> bool:
+        now = time.monotonic()
+        if now - self._last_profiled.get(name, float("-inf")) < self.profile_interval:
+            return False
+        self._last_profiled[name] = now
+        return True
+
+    def record(
+        self,
+        conn,
+        name: str,
+        query: str,
+        parameters: Optional[Dict],
+        elapsed: float,
+        result,
+        in_transaction: bool = False
+    ):
+        """记录一条慢查询；conn 为未包装的 kuzu.Connection（抓计划的语句不再计时）"""
+        plan, plan_mode = None, None
+        if (
+            isinstance(query, str)
+            and not in_transaction
+            and not NO_PLAN_PATTERN.match(query)
+            and self._should_profile(name)
+        ):
+            plan_mode = "EXPLAIN" if WRITE_PATTERN.search(query) else "PROFILE"
+            try:
+                explained = conn.execute(f"{plan_mode} {query}", parameters)
+                if explained.has_next():
+                    # 计划是带边框的文本，行尾有大量补齐空格
+                    plan = "\n".join(line.rstrip() for line in explained.get_next()[0].splitlines())
+            except Exception as e:
+                plan = f"<{plan_mode} failed: {e}>"
+
+        entry = {
+            "at": datetime.now().isoformat(timespec="milliseconds"),
+            "query": name,
+            "durationMs": round(elapsed * 1000, 2),
+            "rows": _row_count(result),
+            "params": param_shape(parameters or {}),
+            "statement": " ".join(str(query).split())[:MAX_STATEMENT_CHARS],
+            "planMode": plan_mode,
+            "plan": plan
+        }
+        self.recent.append(entry)
+        self.total += 1
+        logger.warning(f"Slow query {name}: {entry['durationMs']}ms, {entry['rows']} rows")
+        if self.path is not None:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            except OSError as e:
+                logger.error(f"Failed to write slow query log: {e}")
+
+    def entries(self, limit: int = 50, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """最近的慢查询，新的在前"""
+        items = [e for e in reversed(self.recent) if name is None or e["query"] == name]
+        return items[:limit]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "thresholdMs": self.threshold * 1000,
+            "profileIntervalSeconds": self.profile_interval,
+            "total": self.total,
+            "log": str(self.path) if self.path else None
+        }
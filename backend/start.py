@@ -1,54 +1,129 @@
 """
 Social Scraper Backend Launcher
 按需启动后台服务
+
+- 启动时给服务传一个本地就绪地址（见 readiness.py），服务打开数据库并开始监听后回报，
+  收到即返回，不再轮询 /health（/health 会做全表计数）
+- PID 文件记录进程号，stop / status 直接按 PID 操作，不扫描进程表
+- 只依赖标准库，fastapi / uvicorn / loguru / kuzu 只在服务进程里加载
 """
 
+import json
 import os
-import sys
+import signal
+import socket
 import subprocess
+import sys
 import time
-import requests
 from pathlib import Path
+from typing import Any, Dict, Optional
+
+from readiness import READY_ENV
+
+BACKEND_DIR = Path(__file__).parent
+
+# 服务版本 -> 脚本
+VARIANTS = {
+    "full": "server.py",
+    "lite": "server_lite.py",
+    "minimal": "server_minimal.py",
+}
+
+RUN_DIR = Path(os.getenv("BACKEND_RUN_DIR", str(BACKEND_DIR / "run")))
+LOG_DIR = BACKEND_DIR / "logs"
+
+
+def pid_file(port: int) -> Path:
+    return RUN_DIR / f"backend-{port}.pid"
+
+
+def log_file(port: int) -> Path:
+    return LOG_DIR / f"backend-{port}.out"
+
 
 def check_port_available(port: int) -> bool:
     """检查端口是否可用"""
-    import socket
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     try:
         result = sock.connect_ex(('127.0.0.1', port))
-        sock.close()
         return result != 0
-    except:
+    except OSError:
         return False
+    finally:
+        sock.close()
+
 
-def is_backend_running(port: int = 8768) -> bool:
-    """检查后台服务是否已在运行"""
+def process_alive(pid: int) -> bool:
+    """进程是否存在（Windows 上 os.kill(pid, 0) 会结束进程，改用 tasklist）"""
+    if os.name == "nt":
+        result = subprocess.run(
+            ["tasklist", "/FI", f"PID eq {pid}", "/NH"],
+            capture_output=True, text=True
+        )
+        return str(pid) in result.stdout
     try:
-        response = requests.get(f"http://localhost:{port}/health", timeout=2)
-        return response.status_code == 200
-    except:
+        os.kill(pid, 0)
+    except ProcessLookupError:
         return False
+    except PermissionError:
+        return True
+    return True
+
+
+def running_pid(port: int) -> Optional[int]:
+    """PID 文件中仍在运行的进程号；进程已不存在时清理 PID 文件"""
+    path = pid_file(port)
+    try:
+        pid = int(path.read_text().strip())
+    except (OSError, ValueError):
+        return None
+    if process_alive(pid):
+        return pid
+    path.unlink(missing_ok=True)
+    return None
+
+
+def _wait_ready(listener: socket.socket, process: subprocess.Popen, timeout: float) -> Optional[Dict[str, Any]]:
+    """等待服务的就绪通知；服务提前退出或超时返回 None"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn, _ = listener.accept()
+        except socket.timeout:
+            if process.poll() is not None:
+                return None
+            continue
+        with conn:
+            conn.settimeout(2)
+            try:
+                line = conn.makefile("r", encoding="utf-8").readline()
+                return json.loads(line)
+            except (OSError, ValueError):
+                continue
+    return None
+
 
 def start_backend(
     port: int = 8768,
     host: str = "127.0.0.1",
     db_path: str = None,
-    background: bool = True
-) -> subprocess.Popen:
-    """启动后台服务"""
-    
-    if is_backend_running(port):
-        print(f"✅ Backend already running on port {port}")
-        return None
-    
-    # 查找后端脚本
-    script_dir = Path(__file__).parent
-    backend_script = script_dir / "social_scraper_backend.py"
-    
-    if not backend_script.exists():
-        print(f"❌ Backend script not found: {backend_script}")
+    variant: str = "full",
+    background: bool = True,
+    timeout: float = 60.0
+) -> Optional[int]:
+    """启动后台服务，返回进程号（前台运行时返回 None）"""
+
+    pid = running_pid(port)
+    if pid:
+        print(f"✅ Backend already running on port {port} (PID: {pid})")
+        return pid
+
+    if not check_port_available(port):
+        print(f"❌ Port {port} is in use by another process")
         sys.exit(1)
-    
+
+    backend_script = BACKEND_DIR / VARIANTS[variant]
+
     # 构建命令
     cmd = [
         sys.executable,
@@ -56,125 +131,121 @@ def start_backend(
         "--host", host,
         "--port", str(port)
     ]
-    
+
     if db_path:
         cmd.extend(["--db-path", db_path])
-    
-    print(f"🚀 Starting Social Scraper Backend on {host}:{port}")
-    print(f"   Database: {db_path or './data/knowledge_graph'}")
-    
-    # 启动进程
-    if background:
+
+    print(f"🚀 Starting Social Scraper Backend ({variant}) on {host}:{port}")
+    print(f"   Database: {db_path or './database/twitter_scraper'}")
+
+    if not background:
+        # 前台运行
+        subprocess.run(cmd, cwd=str(BACKEND_DIR))
+        return None
+
+    started = time.monotonic()
+    listener = socket.create_server(("127.0.0.1", 0))
+    listener.settimeout(0.1)
+    env = {**os.environ, READY_ENV: f"127.0.0.1:{listener.getsockname()[1]}"}
+
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    with open(log_file(port), "ab") as log:
         process = subprocess.Popen(
             cmd,
-            cwd=str(script_dir),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+            cwd=str(BACKEND_DIR),
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
             start_new_session=True
         )
-        
-        # 等待服务启动
-        print("   Waiting for service to start...")
-        for i in range(30):  # 最多等待 30 秒
-            time.sleep(1)
-            if is_backend_running(port):
-                print(f"✅ Backend started successfully (PID: {process.pid})")
-                return process
-            if process.poll() is not None:
-                # 进程已退出
-                stdout, stderr = process.communicate()
-                print(f"❌ Backend failed to start:")
-                print(f"   STDOUT: {stdout.decode()}")
-                print(f"   STDERR: {stderr.decode()}")
-                sys.exit(1)
-        
-        print(f"⚠️  Backend may still be starting (PID: {process.pid})")
-        return process
-    else:
-        # 前台运行
-        subprocess.run(cmd, cwd=str(script_dir))
-        return None
+    RUN_DIR.mkdir(parents=True, exist_ok=True)
+    pid_file(port).write_text(str(process.pid))
 
-def stop_backend(port: int = 8768):
-    """停止后台服务"""
-    import signal
-    
-    # 查找进程
     try:
-        import psutil
-        for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-            try:
-                cmdline = ' '.join(proc.info['cmdline'] or [])
-                if 'social_scraper_backend' in cmdline and str(port) in cmdline:
-                    print(f"Stopping backend process {proc.info['pid']}...")
-                    proc.send_signal(signal.SIGTERM)
-                    proc.wait(timeout=5)
-                    print(f"✅ Backend stopped")
-                    return True
-            except:
-                continue
-        
-        print("⚠️  No running backend found")
-        return False
-        
-    except ImportError:
-        print("⚠️  psutil not installed, cannot stop backend automatically")
-        print("   Please stop it manually")
+        ready = _wait_ready(listener, process, timeout)
+    finally:
+        listener.close()
+
+    if ready is not None:
+        print(f"✅ Backend ready in {time.monotonic() - started:.2f}s (PID: {process.pid})")
+        return process.pid
+
+    if process.poll() is not None:
+        pid_file(port).unlink(missing_ok=True)
+        print(f"❌ Backend exited with code {process.returncode}, last output:")
+        lines = log_file(port).read_text(encoding="utf-8", errors="replace").splitlines()
+        for line in lines[-20:]:
+            print(f"   {line}")
+        sys.exit(1)
+
+    print(f"⚠️  Backend not ready after {timeout:.0f}s (PID: {process.pid}), see {log_file(port)}")
+    return process.pid
+
+
+def stop_backend(port: int = 8768, timeout: float = 30.0) -> bool:
+    """停止后台服务：SIGTERM，超时后强制结束"""
+    pid = running_pid(port)
+    if pid is None:
+        print(f"⚠️  No running backend found on port {port}")
         return False
 
+    print(f"Stopping backend process {pid}...")
+    os.kill(pid, signal.SIGTERM)
+    deadline = time.monotonic() + timeout
+    while process_alive(pid):
+        if time.monotonic() >= deadline:
+            print(f"⚠️  Backend did not exit within {timeout:.0f}s, killing it")
+            os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+            break
+        time.sleep(0.05)
+
+    pid_file(port).unlink(missing_ok=True)
+    print(f"✅ Backend stopped")
+    return True
+
+
 def main():
     import argparse
-    
+
     parser = argparse.ArgumentParser(description="Social Scraper Backend Launcher")
     parser.add_argument("action", choices=["start", "stop", "restart", "status"],
                        help="Action to perform")
     parser.add_argument("--port", type=int, default=8768, help="Port number")
     parser.add_argument("--host", default="127.0.0.1", help="Host to bind to")
     parser.add_argument("--db-path", help="KuzuDB path")
+    parser.add_argument("--variant", choices=sorted(VARIANTS), default="full",
+                       help="Server variant (full: FastAPI, lite / minimal: standard library HTTP server)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for readiness / shutdown")
     parser.add_argument("--foreground", action="store_true", help="Run in foreground")
-    
+
     args = parser.parse_args()
-    
-    if args.action == "start":
-        if is_backend_running(args.port):
-            print(f"✅ Backend already running on port {args.port}")
-        else:
-            start_backend(
-                port=args.port,
-                host=args.host,
-                db_path=args.db_path,
-                background=not args.foreground
-            )
-    
-    elif args.action == "stop":
-        stop_backend(args.port)
-    
-    elif args.action == "restart":
-        stop_backend(args.port)
-        time.sleep(2)
+
+    if args.action in ("stop", "restart"):
+        stopped = stop_backend(args.port, args.timeout)
+        if args.action == "stop":
+            sys.exit(0 if stopped else 1)
+
+    if args.action in ("start", "restart"):
         start_backend(
             port=args.port,
             host=args.host,
             db_path=args.db_path,
-            background=not args.foreground
+            variant=args.variant,
+            background=not args.foreground,
+            timeout=args.timeout
         )
-    
+
     elif args.action == "status":
-        if is_backend_running(args.port):
-            try:
-                response = requests.get(f"http://localhost:{args.port}/health")
-                health = response.json()
-                print(f"✅ Backend is running on port {args.port}")
-                print(f"   Status: {health.get('status')}")
-                print(f"   Database: {health.get('database')}")
-                if 'stats' in health:
-                    print(f"   Stats:")
-                    for key, value in health['stats'].items():
-                        print(f"     - {key}: {value}")
-            except:
-                print(f"✅ Backend is running on port {args.port}")
-        else:
+        pid = running_pid(args.port)
+        if pid is None:
             print(f"❌ Backend is not running on port {args.port}")
+            sys.exit(1)
+        listening = not check_port_available(args.port)
+        print(f"✅ Backend is running on port {args.port} (PID: {pid})")
+        print(f"   Listening: {'yes' if listening else 'no'}")
+        print(f"   Log: {log_file(args.port)}")
+
 
 if __name__ == "__main__":
     main()
@@ -141,6 +141,106 @@ def test_api_endpoints():
         process.kill()
         return False
 
+def test_http_core():
+    """测试 asyncio HTTP 核心（轻量版 / 最小版使用）：持久连接、管线化、chunked 请求体、大小上限"""
+    print("\n🧪 Testing HTTP Core...")
+
+    import socket
+    import threading
+    from http.server import BaseHTTPRequestHandler
+    import httpcore
+
+    class EchoHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self._reply(self.path.encode())
+
+        def do_POST(self):
+            self._reply(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+
+        def _reply(self, body):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    def read_response(stream):
+        """读取一个响应，返回 (状态码, 头部, 响应体)"""
+        status = int(stream.readline().split()[1])
+        headers = {}
+        while True:
+            line = stream.readline().decode('latin-1').strip()
+            if not line:
+                break
+            key, _, value = line.partition(':')
+            headers[key.strip().lower()] = value.strip()
+        return status, headers, stream.read(int(headers.get('content-length', 0)))
+
+    def open_connection():
+        conn = socket.create_connection(server.server_address, timeout=5)
+        return conn, conn.makefile('rb')
+
+    server = httpcore.AsyncHTTPServer(("127.0.0.1", 0), EchoHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    time.sleep(0.2)
+
+    try:
+        checks = []
+
+        # 持久连接 + 管线化：三个请求一次发出，按顺序回复，连接保持
+        conn, stream = open_connection()
+        conn.sendall(b"".join(f"GET /{name} HTTP/1.1\r\nHost: x\r\n\r\n".encode() for name in "abc"))
+        bodies = []
+        for _ in range(3):
+            status, headers, body = read_response(stream)
+            bodies.append((status, headers.get('connection'), body))
+        checks.append(("Keep-alive pipelining", bodies == [(200, 'keep-alive', f"/{name}".encode()) for name in "abc"]))
+
+        # 同一连接上的 chunked POST（带 chunk 扩展和 trailer），之后连接仍可用
+        conn.sendall(
+            b"POST /echo HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: chunked\r\n\r\n"
+            b"5\r\nhello\r\n6;ext=1\r\n world\r\n0\r\nX-Trailer: 1\r\n\r\n"
+            b"GET /after HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n"
+        )
+        chunked = read_response(stream)
+        after = read_response(stream)
+        checks.append(("Chunked POST", chunked[0] == 200 and chunked[2] == b"hello world"))
+        checks.append(("Request after chunked body", after[0] == 200 and after[2] == b"/after" and stream.read() == b""))
+        conn.close()
+
+        # 超过上限时不读请求体，直接回复并关闭连接
+        oversized = {
+            "413 Content-Length": f"POST / HTTP/1.1\r\nHost: x\r\nContent-Length: {httpcore.MAX_BODY_BYTES + 1}\r\n\r\n".encode(),
+            "413 chunked": b"POST / HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: chunked\r\n\r\n"
+                           + format(httpcore.MAX_BODY_BYTES + 1, "x").encode() + b"\r\n",
+            "431 header size": b"GET / HTTP/1.1\r\nHost: x\r\nX-Big: " + b"a" * (httpcore.MAX_HEADER_BYTES + 1) + b"\r\n\r\n",
+            "431 header count": b"GET / HTTP/1.1\r\n" + b"".join(f"X-{i}: 1\r\n".encode() for i in range(200)) + b"\r\n",
+        }
+        for name, request in oversized.items():
+            conn, stream = open_connection()
+            try:
+                conn.sendall(request)
+            except ConnectionError:
+                # 服务器可能在请求发完之前就已回复并关闭
+                pass
+            status, headers, _ = read_response(stream)
+            checks.append((name, status == int(name[:3]) and headers.get('connection') == 'close'))
+            conn.close()
+
+        for name, ok in checks:
+            print(f"{'✅' if ok else '❌'} {name}")
+        return all(ok for _, ok in checks)
+
+    except Exception as e:
+        print(f"❌ HTTP core test failed: {e}")
+        return False
+    finally:
+        server.shutdown()
+        thread.join(timeout=5)
+
 def main():
     """运行所有测试"""
     print("=" * 60)
@@ -150,7 +250,8 @@ def main():
     results = {
         "Database": test_database(),
         "Backend Startup": test_backend_start(),
-        "API Endpoints": test_api_endpoints()
+        "API Endpoints": test_api_endpoints(),
+        "HTTP Core": test_http_core()
     }
     
     print("\n" + "=" * 60)
@@ -0,0 +1,279 @@
+"""
+Social Scraper Trend Engine
+服务端增量趋势检测：入库时更新按分钟/小时分桶的关键词与话题标签计数
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from loguru import logger
+
+
+# 与扩展 TrendDetector.extractKeywords 保持一致
+STOP_WORDS = {
+    'the', 'a', 'an', 'is', 'are', 'was', 'were', 'be', 'been', 'being',
+    'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could',
+    'and', 'or', 'but', 'if', 'then', 'else', 'when', 'where', 'what',
+    'this', 'that', 'these', 'those', 'it', 'its', 'of', 'to', 'in', 'for',
+    '我', '的', '了', '是', '在', '和', '有', '就', '都', '而', '及', '与'
+}
+
+_WORD_RE = re.compile(r"[^\W_]+")
+_HASHTAG_RE = re.compile(r"#([^\W_][\w]*)|#([^#\s]{1,30})#")
+_URL_RE = re.compile(r"https?://\S+")
+
+MINUTE_SLOTS = 120   # 当前 1h + 上一个 1h
+HOUR_SLOTS = 48      # 当前 24h + 上一个 24h
+WINDOWS = {"1h": 1, "6h": 6, "24h": 24}
+MAX_KEYWORDS_PER_POST = 10
+
+
+def extract_topics(text: str) -> List[Tuple[str, str]]:
+    """返回 [(kind, topic)]，kind 为 hashtag 或 keyword"""
+    text = _URL_RE.sub(" ", text or "")
+    topics = []
+    seen = set()
+    for match in _HASHTAG_RE.finditer(text):
+        tag = (match.group(1) or match.group(2)).lower()
+        if tag not in seen:
+            seen.add(tag)
+            topics.append(("hashtag", "#" + tag))
+
+    keywords = 0
+    for word in _WORD_RE.findall(_HASHTAG_RE.sub(" ", text.lower())):
+        if len(word) <= 2 or word in STOP_WORDS or word in seen:
+            continue
+        seen.add(word)
+        topics.append(("keyword", word))
+        keywords += 1
+        if keywords >= MAX_KEYWORDS_PER_POST:
+            break
+    return topics
+
+
+class TopicCounter:
+    """
+    单个话题的分钟桶与小时桶环形计数
+
+    保存快照直接引用桶列表并标记 shared，之后第一次修改前才复制（写时复制）
+    """
+
+    __slots__ = ("kind", "minutes", "hours", "last_minute", "shared")
+
+    def __init__(self, kind: str, minute: int):
+        self.kind = kind
+        self.minutes = [0] * MINUTE_SLOTS
+        self.hours = [0] * HOUR_SLOTS
+        self.last_minute = minute
+        self.shared = False
+
+    def _own(self):
+        if self.shared:
+            self.minutes, self.hours = self.minutes[:], self.hours[:]
+            self.shared = False
+
+    def advance(self, minute: int):
+        """把环形缓冲推进到 minute，清空其间过期的桶"""
+        if minute <= self.last_minute:
+            return
+        self._own()
+        for m in range(self.last_minute + 1, min(minute, self.last_minute + MINUTE_SLOTS) + 1):
+            self.minutes[m % MINUTE_SLOTS] = 0
+        last_hour, hour = self.last_minute // 60, minute // 60
+        for h in range(last_hour + 1, min(hour, last_hour + HOUR_SLOTS) + 1):
+            self.hours[h % HOUR_SLOTS] = 0
+        self.last_minute = minute
+
+    def add(self, minute: int, count: int = 1):
+        """minute 不晚于 last_minute（迟到数据）时写入对应的历史桶"""
+        self._own()
+        if self.last_minute - minute < MINUTE_SLOTS:
+            self.minutes[minute % MINUTE_SLOTS] += count
+        if self.last_minute // 60 - minute // 60 < HOUR_SLOTS:
+            self.hours[(minute // 60) % HOUR_SLOTS] += count
+
+    def window(self, hours: int) -> Tuple[int, int]:
+        """返回 (当前窗口计数, 上一窗口计数)，代价只与窗口分辨率有关"""
+        if hours == 1:
+            now = self.last_minute
+            current = sum(self.minutes[(now - i) % MINUTE_SLOTS] for i in range(60))
+            previous = sum(self.minutes[(now - i) % MINUTE_SLOTS] for i in range(60, 120))
+            return current, previous
+        now = self.last_minute // 60
+        current = sum(self.hours[(now - i) % HOUR_SLOTS] for i in range(hours))
+        previous = sum(self.hours[(now - i) % HOUR_SLOTS] for i in range(hours, 2 * hours))
+        return current, previous
+
+
+class TrendEngine:
+    """
+    增量趋势引擎
+
+    每条帖子入库时只更新其话题的计数桶；查询时按窗口汇总桶计数计算
+    热度与增长率（公式与扩展 TrendDetector 一致），跨所有浏览器的数据。
+    定期保存由 maybe_save 在入库批次之后触发：入库线程只取写时复制的快照，
+    JSON 序列化和写文件在后台线程中完成。
+    """
+
+    ALL = "__all__"
+
+    def __init__(self, max_topics: int = 50_000, path: Optional[Path] = None, save_interval: float = 300.0):
+        self.max_topics = max_topics
+        self.path = path
+        self.save_interval = save_interval
+        self._topics: Dict[str, TopicCounter] = {}
+        self._last_save = time.monotonic()
+        self._write_lock = threading.Lock()
+        self._saver: Optional[ThreadPoolExecutor] = None
+        self._saving: Optional[Future] = None
+
+    @staticmethod
+    def _minute(ts: Optional[datetime] = None) -> int:
+        return int((ts or datetime.now()).timestamp() // 60)
+
+    def observe(self, content: str, timestamp: Optional[datetime] = None):
+        """入库时调用：更新帖子中出现的话题计数"""
+        now = self._minute()
+        minute = min(self._minute(timestamp), now) if timestamp else now
+        # 超出 48h 的历史数据（回填）不影响趋势
+        if now - minute >= HOUR_SLOTS * 60:
+            return
+
+        for kind, topic in [("total", self.ALL)] + extract_topics(content):
+            counter = self._topics.get(topic)
+            if counter is None:
+                counter = self._topics[topic] = TopicCounter(kind, now)
+            counter.advance(now)
+            counter.add(minute)
+
+        if len(self._topics) > self.max_topics:
+            self._evict(now)
+
+    def _evict(self, now: int):
+        """淘汰最久未出现的话题"""
+        stale = sorted(
+            (t for t in self._topics if t != self.ALL),
+            key=lambda t: self._topics[t].last_minute
+        )
+        for topic in stale[:len(self._topics) - int(self.max_topics * 0.9)]:
+            del self._topics[topic]
+
+    def topic(self, topic: str, window: str = "6h") -> Optional[Dict[str, Any]]:
+        counter = self._topics.get(topic)
+        if counter is None:
+            return None
+        return self._score(topic, counter, WINDOWS[window], self._total(WINDOWS[window]))
+
+    def _total(self, hours: int) -> int:
+        counter = self._topics.get(self.ALL)
+        if counter is None:
+            return 0
+        counter.advance(self._minute())
+        return counter.window(hours)[0]
+
+    def _score(self, topic: str, counter: TopicCounter, hours: int, total: int) -> Dict[str, Any]:
+        counter.advance(self._minute())
+        current, previous = counter.window(hours)
+        growth_rate = (current - previous) / previous * 100 if previous > 0 else current * 10
+        heat_score = min(current / total * 100 * (1 + growth_rate / 100), 100) if total else 0
+        return {
+            "topic": topic,
+            "kind": counter.kind,
+            "heatScore": round(max(heat_score, 0)),
+            "growthRate": round(growth_rate),
+            "postCount": current,
+            "previousCount": previous
+        }
+
+    def trending(
+        self,
+        window: str = "6h",
+        limit: int = 20,
+        kind: Optional[str] = None,
+        min_count: int = 2
+    ) -> List[Dict[str, Any]]:
+        """按热度排序的趋势话题"""
+        hours = WINDOWS[window]
+        total = self._total(hours)
+        results = []
+        for topic, counter in self._topics.items():
+            if topic == self.ALL or (kind and counter.kind != kind):
+                continue
+            scored = self._score(topic, counter, hours, total)
+            if scored["postCount"] >= min_count:
+                results.append(scored)
+        results.sort(key=lambda t: (t["heatScore"], t["postCount"]), reverse=True)
+        return [dict(t, timeWindow=window) for t in results[:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"topics": len(self._topics) - (self.ALL in self._topics)}
+
+    # ========== 持久化 ==========
+
+    def snapshot(self) -> Dict[str, list]:
+        """计数桶的快照：引用现有桶列表，计数器下次修改前自行复制，之后的 observe 不会改动它"""
+        data = {}
+        for topic, c in self._topics.items():
+            c.shared = True
+            data[topic] = [c.kind, c.last_minute, c.minutes, c.hours]
+        return data
+
+    def _write(self, data: Dict[str, list]):
+        with self._write_lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+
+    def _write_logged(self, data: Dict[str, list]):
+        try:
+            self._write(data)
+        except Exception as e:
+            logger.warning(f"Failed to save trend counters: {e}")
+
+    def maybe_save(self) -> Optional[Future]:
+        """距上次保存超过 save_interval 时拷贝计数桶，交给后台线程写入；上一次还没写完时跳过"""
+        if not self.path or time.monotonic() - self._last_save <= self.save_interval:
+            return None
+        if self._saving is not None and not self._saving.done():
+            return None
+        if self._saver is None:
+            self._saver = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trends-save")
+        self._last_save = time.monotonic()
+        self._saving = self._saver.submit(self._write_logged, self.snapshot())
+        return self._saving
+
+    def save(self):
+        """同步保存（关闭时调用），先等后台写入结束"""
+        if not self.path:
+            return
+        if self._saving is not None:
+            self._saving.result()
+        self._write(self.snapshot())
+        self._last_save = time.monotonic()
+        if self._saver is not None:
+            self._saver.shutdown()
+            self._saver = None
+
+    def load(self) -> int:
+        if not self.path or not self.path.exists():
+            return 0
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            for topic, (kind, last_minute, minutes, hours) in data.items():
+                counter = TopicCounter(kind, last_minute)
+                counter.minutes, counter.hours = minutes, hours
+                self._topics[topic] = counter
+            logger.info(f"Loaded {len(self._topics)} trend counters from {self.path}")
+        except Exception as e:
+            logger.warning(f"Failed to load trend counters: {e}")
+        return len(self._topics)
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Social Scraper Native Messaging Host
+Chrome 原生消息宿主：stdin / stdout 上每条消息为 4 字节长度前缀（本机字节序）+ UTF-8 JSON
+
+请求：{"id": 1, "type": "batch", "posts": [...], "filtered": [...], "discovery": [...]}
+      {"id": 2, "type": "stats" | "posts" | "filtered" | "discovery_stats" | "ping", ...}
+回复：{"id": 1, "ok": true, "result": {...}} 或 {"id": 1, "ok": false, "error": "..."}
+      后端限流 / 过载时错误回复带 "retryAfter"（后端的 Retry-After），由扩展安排重试
+
+- 读线程持续读入消息；排队中的 batch 消息合并成一次写入（最多 NATIVE_BATCH_ROWS 行，
+  最多再等 NATIVE_LINGER_MS 毫秒凑批），写完后逐条回复，结果为合并写入的计数
+- 已有后端在运行（start.py 的 PID 文件或 BACKEND_PORT 端口在监听）时经本地 HTTP 转发，
+  不打开第二个 Kuzu 写连接；没有时才在进程内打开数据库
+- stdout 只用于消息，日志写 stderr
+"""
+
+import asyncio
+import http.client
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlencode
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+import admission
+import start
+
+# Chrome 限制宿主发出的单条消息不超过 1MB
+MAX_OUTGOING = 1024 * 1024
+MAX_INCOMING = 64 * 1024 * 1024
+
+BATCH_ROWS = int(os.getenv("NATIVE_BATCH_ROWS", "2000"))
+LINGER = float(os.getenv("NATIVE_LINGER_MS", "10")) / 1000
+DB_PATH = os.getenv("NATIVE_DB_PATH", str(BACKEND_DIR / "database" / "twitter_scraper"))
+CLIENT_ID = "native-host"
+
+# _collect_batch 没有取到多余消息
+NO_MESSAGE = object()
+
+
+def log(message: str):
+    print(f"[{time.strftime('%H:%M:%S')}] {message}", file=sys.stderr, flush=True)
+
+
+# ========== 消息帧 ==========
+
+def read_message(stream) -> Optional[Dict[str, Any]]:
+    """读取一条消息，输入结束时返回 None"""
+    header = stream.read(4)
+    if len(header) < 4:
+        return None
+    length = struct.unpack("@I", header)[0]
+    if length > MAX_INCOMING:
+        raise ValueError(f"Message too large: {length} bytes")
+    body = stream.read(length)
+    if len(body) < length:
+        return None
+    return json.loads(body.decode("utf-8"))
+
+
+class Writer:
+    """回复可能来自不同线程，整帧写入需要加锁"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def send(self, message: Dict[str, Any]):
+        body = json.dumps(message, ensure_ascii=False, default=str).encode("utf-8")
+        if len(body) > MAX_OUTGOING:
+            body = json.dumps({
+                "id": message.get("id"),
+                "ok": False,
+                "error": f"Response too large ({len(body)} bytes), request fewer rows"
+            }).encode("utf-8")
+        with self._lock:
+            self.stream.write(struct.pack("@I", len(body)) + body)
+            self.stream.flush()
+
+
+# ========== 后端 ==========
+
+class LocalBackend:
+    """进程内打开数据库（没有正在运行的后端时）"""
+
+    mode = "local"
+
+    def __init__(self, db_path: str):
+        from database import SocialScraperKG
+
+        self.kg = SocialScraperKG(db_path)
+        asyncio.run(self.kg.init())
+
+    def ingest(self, posts: List[Dict], filtered: List[Dict], discovery: List[Dict]) -> Dict[str, Any]:
+        async def write():
+            posts_count = await self.kg.add_posts_batch(posts)
+            filtered_count = sum([1 for fp in filtered if await self.kg.add_filtered_post(fp)])
+            discovery_count = sum([1 for dr in discovery if await self.kg.add_discovery_result(dr)])
+            return {
+                "status": "success",
+                "posts_stored": posts_count,
+                "filtered_stored": filtered_count,
+                "discovery_stored": discovery_count
+            }
+
+        return asyncio.run(write())
+
+    def query(self, kind: str, message: Dict[str, Any]) -> Dict[str, Any]:
+        kg = self.kg
+        if kind == "stats":
+            stats = asyncio.run(kg.get_stats())
+            discovery = asyncio.run(kg.get_discovery_stats())
+            return {
+                **stats,
+                "sentiments": discovery.get("sentiments", {}),
+                "kols": discovery.get("kols", 0),
+                "trends": discovery.get("trends", 0)
+            }
+        if kind == "posts":
+            posts = asyncio.run(kg.get_recent_posts(int(message.get("hours", 24)), int(message.get("limit", 100))))
+            return {"posts": posts, "count": len(posts)}
+        if kind == "filtered":
+            posts = asyncio.run(kg.get_filtered_posts(message.get("category"), int(message.get("limit", 50))))
+            return {"posts": posts, "count": len(posts)}
+        if kind == "discovery_stats":
+            return {"stats": asyncio.run(kg.get_discovery_stats())}
+        raise ValueError(f"Unknown message type: {kind}")
+
+    def close(self):
+        asyncio.run(self.kg.close())
+
+
+class Throttled(RuntimeError):
+    """后端限流（429）或过载（503）"""
+
+    def __init__(self, status: int, retry_after: str, data: Any):
+        super().__init__(f"Backend returned {status}: {data}")
+        self.retry_after = retry_after
+
+
+class HttpBackend:
+    """转发给已在运行的后端（keep-alive 连接，非浏览器请求没有 CORS 预检）"""
+
+    mode = "http"
+
+    def __init__(self, port: int):
+        self.port = port
+        self.conn: Optional[http.client.HTTPConnection] = None
+
+    def _request(self, method: str, path: str, body: Optional[Dict] = None):
+        headers = {admission.CLIENT_HEADER: CLIENT_ID}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=120)
+            try:
+                self.conn.request(method, path, payload, headers)
+                response = self.conn.getresponse()
+                data = response.read()
+            except (ConnectionError, http.client.HTTPException):
+                # 后端关闭了空闲连接或重启过，重连一次
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+                continue
+            return response.status, response.getheader("Retry-After"), json.loads(data or b"null")
+
+    def ingest(self, posts: List[Dict], filtered: List[Dict], discovery: List[Dict]) -> Dict[str, Any]:
+        body = {"posts": posts, "filtered": filtered, "discovery": discovery}
+        status, retry_after, data = self._request("POST", "/api/posts/batch", body)
+        # 不在宿主中等待：等待时间可能超过扩展的请求超时，超时后扩展会改走 HTTP 重复提交
+        if status in (429, 503) and retry_after:
+            raise Throttled(status, retry_after, data)
+        if status != 200:
+            raise RuntimeError(f"Backend returned {status}: {data}")
+        return data
+
+    def query(self, kind: str, message: Dict[str, Any]) -> Dict[str, Any]:
+        if kind == "stats":
+            path = "/api/stats"
+        elif kind == "posts":
+            path = "/api/posts?" + urlencode({"hours": message.get("hours", 24), "limit": message.get("limit", 100)})
+        elif kind == "filtered":
+            params = {"limit": message.get("limit", 50)}
+            if message.get("category"):
+                params["category"] = message["category"]
+            path = "/api/posts/filtered?" + urlencode(params)
+        elif kind == "discovery_stats":
+            path = "/api/discovery/stats"
+        else:
+            raise ValueError(f"Unknown message type: {kind}")
+        status, _, data = self._request("GET", path)
+        if status != 200:
+            raise RuntimeError(f"Backend returned {status}: {data}")
+        return data
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+def find_running_backend() -> Optional[int]:
+    """正在监听的后端端口：BACKEND_PORT、start.py 记录的进程（不猜测端口，以免连到无关的服务）"""
+    ports = []
+    if os.getenv("BACKEND_PORT"):
+        ports.append(int(os.environ["BACKEND_PORT"]))
+    for path in sorted(start.RUN_DIR.glob("backend-*.pid")):
+        port = int(path.stem.split("-", 1)[1])
+        if start.running_pid(port):
+            ports.append(port)
+    for port in ports:
+        if not start.check_port_available(port):
+            return port
+    return None
+
+
+def connect_backend():
+    port = find_running_backend()
+    if port is not None:
+        log(f"Attached to running backend on port {port}")
+        return HttpBackend(port)
+    log(f"No running backend, opening {DB_PATH}")
+    return LocalBackend(DB_PATH)
+
+
+# ========== 分发 ==========
+
+class Host:
+    def __init__(self, writer: Writer):
+        self.writer = writer
+        self.inbox: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self.backend = None
+        self.backend_error: Optional[str] = None
+        try:
+            self.backend = connect_backend()
+        except Exception as e:
+            self.backend_error = f"Backend unavailable: {e}"
+            log(self.backend_error)
+
+    def reply(self, message: Dict[str, Any], result: Any = None, error: Optional[str] = None,
+              retry_after: Optional[str] = None):
+        if error is None:
+            self.writer.send({"id": message.get("id"), "ok": True, "result": result})
+        elif retry_after is None:
+            self.writer.send({"id": message.get("id"), "ok": False, "error": error})
+        else:
+            self.writer.send({"id": message.get("id"), "ok": False, "error": error, "retryAfter": retry_after})
+
+    def read_loop(self, stream):
+        """读线程：消息入队，输入结束（浏览器断开）时放入 None"""
+        try:
+            while True:
+                message = read_message(stream)
+                if message is None:
+                    break
+                self.inbox.put(message)
+        except Exception as e:
+            log(f"Failed to read message: {e}")
+        finally:
+            self.inbox.put(None)
+
+    def _collect_batch(self, first: Dict[str, Any]):
+        """从队列中继续取 batch 消息凑批，返回 (批内消息, 打断凑批的下一条消息)"""
+        group = [first]
+        rows = admission.batch_rows(first)
+        deadline = time.monotonic() + LINGER
+        while rows < BATCH_ROWS:
+            try:
+                message = self.inbox.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                return group, NO_MESSAGE
+            if message is None or message.get("type") != "batch":
+                return group, message
+            group.append(message)
+            rows += admission.batch_rows(message)
+        return group, NO_MESSAGE
+
+    def write_batch(self, group: List[Dict[str, Any]]):
+        posts, filtered, discovery = [], [], []
+        for message in group:
+            posts.extend(message.get("posts") or [])
+            filtered.extend(message.get("filtered") or [])
+            discovery.extend(message.get("discovery") or [])
+        try:
+            result = self.backend.ingest(posts, filtered, discovery)
+        except Throttled as e:
+            log(f"Backend throttled batch of {len(group)} messages, retry after {e.retry_after}s")
+            for message in group:
+                self.reply(message, error=str(e), retry_after=e.retry_after)
+            return
+        except Exception as e:
+            log(f"Batch of {len(group)} messages failed: {e}")
+            for message in group:
+                self.reply(message, error=str(e))
+            return
+        result = {**result, "coalesced": len(group)}
+        for message in group:
+            self.reply(message, result)
+
+    def handle(self, message: Dict[str, Any]):
+        kind = message.get("type")
+        if kind == "ping":
+            self.reply(message, {"pong": True, "mode": self.backend.mode if self.backend else None})
+            return
+        if self.backend is None:
+            self.reply(message, error=self.backend_error)
+            return
+        try:
+            self.reply(message, self.backend.query(kind, message))
+        except Exception as e:
+            self.reply(message, error=str(e))
+
+    def run(self):
+        message = self.inbox.get()
+        while message is not None:
+            following = NO_MESSAGE
+            if message.get("type") == "batch" and self.backend is not None:
+                group, following = self._collect_batch(message)
+                self.write_batch(group)
+            else:
+                self.handle(message)
+            message = self.inbox.get() if following is NO_MESSAGE else following
+
+    def close(self):
+        if self.backend is not None:
+            self.backend.close()
+
+
+def main():
+    # 数据库等模块里的 print 不能混进消息流
+    stdout = sys.stdout.buffer
+    sys.stdout = sys.stderr
+    host = Host(Writer(stdout))
+    reader = threading.Thread(target=host.read_loop, args=(sys.stdin.buffer,), daemon=True)
+    reader.start()
+    try:
+        host.run()
+    finally:
+        host.close()
+
+
+if __name__ == "__main__":
+    main()
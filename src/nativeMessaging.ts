@@ -3,6 +3,7 @@
  */
 
 import { Post, SyncResult } from './sync/types';
+import { CLIENT_ID_HEADER, getClientId } from './sync/clientId';
 
 const BACKEND_PORT = 8770;
 const BACKEND_HOST = 'http://localhost';
@@ -33,7 +34,10 @@ export async function sendBatchToBackend(
   try {
     const response = await fetch(`${BACKEND_HOST}:${BACKEND_PORT}/api/posts/batch`, {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
+      headers: {
+        'Content-Type': 'application/json',
+        [CLIENT_ID_HEADER]: await getClientId()
+      },
       mode: 'cors',
       body: JSON.stringify({ posts, filtered })
     });
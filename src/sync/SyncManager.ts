@@ -1,19 +1,33 @@
 /**
  * SyncManager - 同步管理器
  * 负责检查后端状态、自动同步、错误重试
+ *
+ * 后端限流时返回 429（或过载时 503）和 Retry-After，按该时间安排下一次同步，
+ * 之前的定时检查直接跳过，避免在限流窗口内反复提交
+ *
+ * 安装了原生消息宿主时优先经宿主发送，不可用时退回 HTTP
  */
 
 import { SyncStatus, SyncResult, Post, FilteredPost } from './types';
+import { CLIENT_ID_HEADER, getClientId, parseRetryAfter } from './clientId';
+import { NativeHostBusyError, nativeRequest, pingNativeHost } from './nativeHost';
 
 const BACKEND_HOST = 'http://localhost';
 const BACKEND_PORT = 8770;
 
 type StatusChangeListener = (status: SyncStatus) => void;
 
+interface SendResult {
+  ok: boolean;
+  retryAfterMs: number | null;  // 后端要求的等待时间（仅限流 / 过载时）
+}
+
 export class SyncManager {
   private retryCount = 0;
   private maxRetries = 5;
   private checkInterval = 5 * 60 * 1000; // 5 分钟
+  private nextAttemptAt = 0;
+  private retryTimer: ReturnType<typeof setTimeout> | null = null;
   private listeners: StatusChangeListener[] = [];
   private currentStatus: SyncStatus = {
     status: 'online',
@@ -26,6 +40,10 @@ export class SyncManager {
    * 检查后端服务状态
    */
   async checkBackendStatus(): Promise<boolean> {
+    if (await pingNativeHost()) {
+      return true;
+    }
+    
     try {
       const response = await fetch(`${BACKEND_HOST}:${BACKEND_PORT}/health`, {
         method: 'GET',
@@ -49,11 +67,27 @@ export class SyncManager {
   /**
    * 发送数据到后端
    */
-  async sendToBackend(posts: Post[], filtered?: FilteredPost[]): Promise<boolean> {
+  async sendToBackend(posts: Post[], filtered?: FilteredPost[]): Promise<SendResult> {
+    try {
+      const native = await nativeRequest('batch', { posts, filtered: filtered || [] });
+      if (native) {
+        return { ok: true, retryAfterMs: null };
+      }
+    } catch (error) {
+      // 宿主已连上后端，只是被限流：不再经 HTTP 重复提交
+      if (error instanceof NativeHostBusyError) {
+        return { ok: false, retryAfterMs: error.retryAfterMs };
+      }
+      throw error;
+    }
+    
     try {
       const response = await fetch(`${BACKEND_HOST}:${BACKEND_PORT}/api/posts/batch`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: {
+          'Content-Type': 'application/json',
+          [CLIENT_ID_HEADER]: await getClientId()
+        },
         mode: 'cors',
         body: JSON.stringify({
           posts,
@@ -61,12 +95,28 @@ export class SyncManager {
         })
       });
       
-      return response.ok;
+      if (response.status === 429 || response.status === 503) {
+        return { ok: false, retryAfterMs: parseRetryAfter(response.headers.get('Retry-After')) };
+      }
+      return { ok: response.ok, retryAfterMs: null };
     } catch {
-      return false;
+      return { ok: false, retryAfterMs: null };
     }
   }
 
+  /**
+   * 按 Retry-After 安排下一次同步
+   */
+  private scheduleRetry(delayMs: number) {
+    this.nextAttemptAt = Date.now() + delayMs;
+    if (this.retryTimer) clearTimeout(this.retryTimer);
+    this.retryTimer = setTimeout(() => {
+      this.retryTimer = null;
+      this.syncPendingData();
+    }, delayMs);
+    console.log(`[Sync] Backend busy, retrying in ${Math.ceil(delayMs / 1000)}s`);
+  }
+
   /**
    * 标记为已同步
    */
@@ -120,6 +170,10 @@ export class SyncManager {
    * 同步待处理数据
    */
   async syncPendingData() {
+    if (Date.now() < this.nextAttemptAt) {
+      return;
+    }
+    
     const isAvailable = await this.checkBackendStatus();
     
     if (!isAvailable) {
@@ -139,14 +193,17 @@ export class SyncManager {
       this.currentStatus.status = 'syncing';
       this.notifyListeners();
       
-      const success = await this.sendToBackend(pending);
+      const result = await this.sendToBackend(pending);
       
-      if (success) {
+      if (result.ok) {
         await this.markAsSynced(pending);
         this.retryCount = 0;
         this.currentStatus.status = 'online';
         this.currentStatus.lastSync = Date.now();
         console.log(`[Sync] Synced ${pending.length} posts to backend`);
+      } else if (result.retryAfterMs !== null) {
+        this.currentStatus.status = 'online';
+        this.scheduleRetry(result.retryAfterMs);
       } else {
         console.log('[Sync] Failed to sync posts');
       }
@@ -181,14 +238,23 @@ export class SyncManager {
       return { status: 'synced', remote: true };
     }
 
-    const success = await this.sendToBackend(pending);
+    const result = await this.sendToBackend(pending);
     
-    if (success) {
+    if (result.ok) {
       await this.markAsSynced(pending);
       this.currentStatus.status = 'online';
       this.currentStatus.lastSync = Date.now();
       this.notifyListeners();
       return { status: 'synced', remote: true };
+    } else if (result.retryAfterMs !== null) {
+      this.scheduleRetry(result.retryAfterMs);
+      this.currentStatus.status = 'online';
+      this.notifyListeners();
+      return {
+        status: 'pending',
+        remote: true,
+        error: `Backend busy, retrying in ${Math.ceil(result.retryAfterMs / 1000)}s`
+      };
     } else {
       this.currentStatus.status = 'offline';
       this.notifyListeners();
@@ -0,0 +1,37 @@
+/**
+ * 客户端标识与 Retry-After 解析
+ * 后端按 X-Client-Id 做入库限流，被拒绝时通过 Retry-After 告知何时重试
+ */
+
+export const CLIENT_ID_HEADER = 'X-Client-Id';
+
+let cachedClientId: string | null = null;
+
+/**
+ * 获取本扩展实例的客户端 ID（首次调用时生成并持久化）
+ */
+export async function getClientId(): Promise<string> {
+  if (cachedClientId) return cachedClientId;
+
+  const result = await chrome.storage.local.get('clientId');
+  cachedClientId = result.clientId || crypto.randomUUID();
+  if (!result.clientId) {
+    await chrome.storage.local.set({ clientId: cachedClientId });
+  }
+  return cachedClientId as string;
+}
+
+/**
+ * 解析 Retry-After（秒数或 HTTP 日期），返回需要等待的毫秒数；无法解析时返回 null
+ */
+export function parseRetryAfter(value: string | null): number | null {
+  if (!value) return null;
+
+  const seconds = Number(value);
+  if (Number.isFinite(seconds)) {
+    return Math.max(0, seconds * 1000);
+  }
+
+  const date = Date.parse(value);
+  return Number.isNaN(date) ? null : Math.max(0, date - Date.now());
+}
@@ -0,0 +1,108 @@
+/**
+ * Native Host - 通过原生消息宿主（native/launcher.py）与后端通信
+ * 宿主不可用（未安装或启动失败）时返回 null，调用方退回 HTTP
+ * 后端限流时宿主不等待，直接回复 retryAfter，这里抛出 NativeHostBusyError
+ */
+
+import { parseRetryAfter } from './clientId';
+
+const HOST_NAME = 'com.socialscraper.native';
+const REQUEST_TIMEOUT = 30 * 1000;
+const UNAVAILABLE_BACKOFF = 5 * 60 * 1000; // 宿主未安装时 5 分钟内不再尝试
+
+/**
+ * 后端限流 / 过载：调用方应按 retryAfterMs 重试，而不是改走 HTTP 重复提交
+ */
+export class NativeHostBusyError extends Error {
+  readonly retryAfterMs: number;
+
+  constructor(message: string, retryAfterMs: number) {
+    super(message);
+    this.name = 'NativeHostBusyError';
+    this.retryAfterMs = retryAfterMs;
+  }
+}
+
+interface PendingRequest {
+  resolve: (value: any) => void;
+  reject: (error: Error) => void;
+  timer: ReturnType<typeof setTimeout>;
+}
+
+let port: chrome.runtime.Port | null = null;
+let nextId = 1;
+let unavailableUntil = 0;
+const pending = new Map<number, PendingRequest>();
+
+function connect(): chrome.runtime.Port | null {
+  if (port) return port;
+  if (Date.now() < unavailableUntil) return null;
+
+  try {
+    port = chrome.runtime.connectNative(HOST_NAME);
+  } catch {
+    unavailableUntil = Date.now() + UNAVAILABLE_BACKOFF;
+    return null;
+  }
+
+  port.onMessage.addListener((message: { id: number; ok: boolean; result?: any; error?: string; retryAfter?: string }) => {
+    const request = pending.get(message.id);
+    if (!request) return;
+    pending.delete(message.id);
+    clearTimeout(request.timer);
+    if (message.ok) {
+      request.resolve(message.result);
+    } else if (message.retryAfter !== undefined) {
+      const error = message.error || 'Backend busy';
+      request.reject(new NativeHostBusyError(error, parseRetryAfter(String(message.retryAfter)) ?? 0));
+    } else {
+      request.reject(new Error(message.error || 'Native host error'));
+    }
+  });
+
+  port.onDisconnect.addListener(() => {
+    const error = chrome.runtime.lastError?.message || 'Native host disconnected';
+    console.log(`[NativeHost] ${error}`);
+    unavailableUntil = Date.now() + UNAVAILABLE_BACKOFF;
+    pending.forEach(request => {
+      clearTimeout(request.timer);
+      request.reject(new Error(error));
+    });
+    pending.clear();
+    port = null;
+  });
+
+  return port;
+}
+
+/**
+ * 发送一条消息并等待回复；宿主不可用时返回 null，后端限流时抛出 NativeHostBusyError
+ */
+export async function nativeRequest<T = any>(type: string, payload: Record<string, unknown> = {}): Promise<T | null> {
+  const connection = connect();
+  if (!connection) return null;
+
+  const id = nextId++;
+  try {
+    return await new Promise<T>((resolve, reject) => {
+      const timer = setTimeout(() => {
+        pending.delete(id);
+        reject(new Error('Native host timeout'));
+      }, REQUEST_TIMEOUT);
+      pending.set(id, { resolve, reject, timer });
+      connection.postMessage({ id, type, ...payload });
+    });
+  } catch (error) {
+    if (error instanceof NativeHostBusyError) throw error;
+    console.log('[NativeHost] Request failed:', error);
+    return null;
+  }
+}
+
+/**
+ * 宿主是否可用（可连接且能访问数据库）
+ */
+export async function pingNativeHost(): Promise<boolean> {
+  const result = await nativeRequest<{ pong: boolean; mode: string | null }>('ping');
+  return !!result && result.mode !== null;
+}